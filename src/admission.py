@@ -0,0 +1,225 @@
+"""
+Admission control module
+上流（Gemini / Google Sheets）ごとに同時実行数と待ち行列の長さを制限し、過負荷時はすぐに429を返す
+
+- 同時に実行できるのは max_concurrent 件まで。超えた分は待ち行列に入り、空きが出た順に実行する
+- 待ち行列が一杯、または max_wait_seconds 待っても空かなければ AdmissionRejected（429 + Retry-After）
+- 画面（/ のPWA）からのリクエスト（X-Client-Priority: interactive）はバッチ（スクリプト等）より優先する
+  - 待ち行列では常にバッチより先に実行する
+  - バッチは同時実行枠のうち1つを使えない（画面からのリクエストのために空けておく）
+  - バッチが待ち行列に入れるのは半分まで
+
+バックフィルや月末の集中で上流の呼び出しがタイムアウトするまで積み上がるのを防ぎ、
+受け付けた分は期限内に処理し、残りはすぐに断って再送してもらう。
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from threading import Lock
+from typing import Dict, List, Optional
+
+from .config import Config
+from .metrics import REGISTRY, Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+# 待ち行列での順序（小さいほど先）
+_PRIORITY_ORDER = {INTERACTIVE: 0, BATCH: 1}
+
+PRIORITY_HEADER = "X-Client-Priority"
+
+# 上流ごとの実行中・待機中の件数
+ADMISSION_IN_FLIGHT = REGISTRY.register(Gauge(
+    "limit_admission_in_flight", "Admitted calls in flight", ["upstream"]
+))
+ADMISSION_WAITING = REGISTRY.register(Gauge(
+    "limit_admission_waiting", "Calls waiting for admission", ["upstream"]
+))
+# 断った回数（reason: queue_full / timeout）
+ADMISSION_REJECTIONS = REGISTRY.register(Counter(
+    "limit_admission_rejections_total", "Calls rejected by admission control", ["upstream", "priority", "reason"]
+))
+# 実行までの待ち時間
+ADMISSION_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "limit_admission_wait_seconds", "Time spent waiting for admission", ["upstream", "priority"]
+))
+
+
+class AdmissionRejected(RuntimeError):
+    """The upstream is saturated; retry after retry_after seconds"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"混み合っています（{name}）。{math.ceil(retry_after)} 秒後に再試行してください")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def client_priority(header_value: Optional[str]) -> str:
+    """X-Client-Priority ヘッダーの値から優先度を決める（interactive 以外はバッチ扱い）"""
+    return INTERACTIVE if (header_value or "").strip().lower() == INTERACTIVE else BATCH
+
+
+class AdmissionController:
+    """Bounded concurrency with a bounded, priority-ordered wait queue (one event loop)"""
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrent: int = 8,
+        max_queue: int = 32,
+        max_wait_seconds: float = 10.0
+    ):
+        """
+        Initialize admission controller
+
+        Args:
+            name: 上流名（メトリクスのラベル）
+            max_concurrent: 同時実行数の上限
+            max_queue: 待ち行列の長さの上限（バッチはこの半分まで）
+            max_wait_seconds: 待ち行列で待つ時間の上限（秒）
+        """
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.max_wait_seconds = max_wait_seconds
+        # バッチが使える同時実行枠（1枠は画面からのリクエスト用に空けておく）
+        self.batch_concurrent = max(1, self.max_concurrent - 1)
+        self.active: Dict[str, int] = {INTERACTIVE: 0, BATCH: 0}
+        self._waiters: List[tuple] = []  # (順序, 到着順, 優先度, future)
+        self._sequence = itertools.count()
+        self._average_seconds = 1.0  # 1件の実行時間（指数移動平均、Retry-After の見積もり用）
+
+    @property
+    def in_flight(self) -> int:
+        return self.active[INTERACTIVE] + self.active[BATCH]
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter[3].done())
+
+    def _has_room(self, priority: str) -> bool:
+        if self.in_flight >= self.max_concurrent:
+            return False
+        return priority == INTERACTIVE or self.active[BATCH] < self.batch_concurrent
+
+    def _first_waiter(self) -> Optional[tuple]:
+        """待ち行列の先頭（期限切れで取り消された分は捨てる）"""
+        while self._waiters and self._waiters[0][3].done():
+            heapq.heappop(self._waiters)
+        return self._waiters[0] if self._waiters else None
+
+    def retry_after(self) -> float:
+        """空きが出るまでのおおよその秒数（最低1秒）"""
+        rounds = math.ceil((self.waiting + 1) / self.max_concurrent)
+        return max(1.0, self._average_seconds * rounds)
+
+    def _reject(self, priority: str, reason: str):
+        ADMISSION_REJECTIONS.inc(upstream=self.name, priority=priority, reason=reason)
+        logger.warning(f"[流量制御] {self.name}: {priority} のリクエストを断りました（{reason}、"
+                       f"実行中 {self.in_flight} / 待機 {self.waiting}）")
+        raise AdmissionRejected(self.name, self.retry_after())
+
+    def _update_gauges(self):
+        ADMISSION_IN_FLIGHT.set(self.in_flight, upstream=self.name)
+        ADMISSION_WAITING.set(self.waiting, upstream=self.name)
+
+    async def _acquire(self, priority: str):
+        first = self._first_waiter()
+        ahead = first is not None and first[0] <= _PRIORITY_ORDER[priority]
+        if not ahead and self._has_room(priority):
+            self.active[priority] += 1
+            self._update_gauges()
+            return
+
+        queue_limit = self.max_queue if priority == INTERACTIVE else self.max_queue // 2
+        if self.waiting >= queue_limit:
+            self._reject(priority, "queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (_PRIORITY_ORDER[priority], next(self._sequence), priority, future))
+        self._update_gauges()
+        start = time.monotonic()
+        try:
+            await asyncio.wait({future}, timeout=self.max_wait_seconds)
+        except BaseException:
+            # リクエストが中断された: 割り当て済みなら枠を返し、未割り当てなら待ち行列から外す
+            if future.done() and not future.cancelled():
+                self._release(priority)
+            else:
+                future.cancel()
+                self._update_gauges()
+            raise
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start, upstream=self.name, priority=priority)
+        if not future.done():
+            future.cancel()
+            self._update_gauges()
+            self._reject(priority, "timeout")
+        # 枠は _release() で割り当て済み（active に計上済み）
+
+    def _release(self, priority: str, elapsed: Optional[float] = None):
+        self.active[priority] -= 1
+        if elapsed is not None:
+            self._average_seconds = 0.8 * self._average_seconds + 0.2 * elapsed
+        # 空いた枠を待ち行列の先頭（画面からのリクエストが先）から割り当てる
+        while True:
+            first = self._first_waiter()
+            if first is None or not self._has_room(first[2]):
+                break
+            heapq.heappop(self._waiters)
+            self.active[first[2]] += 1
+            first[3].set_result(None)
+        self._update_gauges()
+
+    @asynccontextmanager
+    async def admit(self, priority: str = INTERACTIVE):
+        """
+        実行枠を確保してから処理する
+
+        Raises:
+            AdmissionRejected: 待ち行列が一杯、または max_wait_seconds 以内に枠が空かなかった
+        """
+        await self._acquire(priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(priority, time.monotonic() - start)
+
+
+# 上流名 -> 流量制御（lazy initialization）
+_controllers: Dict[str, AdmissionController] = {}
+_controllers_lock = Lock()
+
+
+def get_admission(name: str) -> AdmissionController:
+    """Get or create the admission controller of an upstream ("gemini" / "sheets")"""
+    controller = _controllers.get(name)
+    if controller is None:
+        with _controllers_lock:
+            controller = _controllers.get(name)
+            if controller is None:
+                concurrency = {
+                    "gemini": Config.ADMISSION_GEMINI_CONCURRENCY,
+                    "sheets": Config.ADMISSION_SHEETS_CONCURRENCY,
+                }[name]
+                controller = AdmissionController(
+                    name,
+                    max_concurrent=concurrency,
+                    max_queue=Config.ADMISSION_QUEUE_SIZE,
+                    max_wait_seconds=Config.ADMISSION_MAX_WAIT_SECONDS
+                )
+                _controllers[name] = controller
+    return controller
+
+
+def retry_after_header(error: AdmissionRejected) -> Dict[str, str]:
+    """429応答に付ける Retry-After ヘッダー（整数秒）"""
+    return {"Retry-After": str(max(1, math.ceil(error.retry_after)))}
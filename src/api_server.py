@@ -3,32 +3,94 @@ REST API Server for Google AI Studio Integration
 Gemini APIのFunction Callingから呼び出すためのREST APIサーバー
 """
 
+import asyncio
 import logging
 import os
 import json
-from typing import Dict
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
 
-from fastapi import FastAPI, HTTPException
+import gspread
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-import google.generativeai as genai
 
+from .admission import AdmissionRejected, client_priority, get_admission
+from .admission import retry_after_header as admission_retry_after
+from .call_accounting import CALLS_HEADER, call_budget, current_ledger, track_calls
+from .circuit_breaker import CircuitOpenError, retry_after_header
 from .config import Config
-from .google_sheets import GoogleSheetsClient
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from .export import CONTENT_TYPES as EXPORT_CONTENT_TYPES, ExportFormatError, export_months, stream_export
+from .gemini_client import GeminiClient, GeminiUnavailableError, record_usage
+from .line_replies import flush_confirmations, get_confirmation_sender
+from .google_sheets import GoogleSheetsClient, TRAINER_COLUMN, month_sheet_name
+from .sale_previews import get_sale_previews
+from .sales_outbox import OutboxDrainer
+from .row_lock import get_row_lock
+from .sale_index import get_sale_index
+from .sales_ledger import get_sales_ledger
+from .sheet_mirror import row_to_sale
+from .sheets_service import get_sheet_mirror, get_sheets_client, get_trainer_roster, get_write_queue
+from .metrics import CONTENT_TYPE, REGISTRY, REQUEST_SECONDS, record_cache, stage
+from .profiling import (
+    PROFILE_HEADER, get_profile_store, is_admin, profiling_enabled, should_profile, start_profile, stop_profile
 )
+from .readiness import ReadinessMonitor, report_failure, report_success
+from .replay import ledger_row_values
+from .schema import KNOWN_CUSTOMERS, SALE_FUNCTION_SCHEMA, build_sale_function_schema
+from .static_assets import StaticAsset, build_frontend_assets
+from .stores import StoreConfig, UnknownStoreError, get_store_registry
+from .sale_prompt import SALE_GENERATION_CONFIG, build_sale_instruction
+from .sheet_provisioning import SheetProvisioner
+from .structured_logging import annotate, configure_logging, current_request, log_payload, new_request_id, request_scope
+from .text_parser import normalize_message, parse_sale_text_regex
+from .trainers import UnknownTrainerError, get_trainer_index
+from .ttl_cache import TTLCache
+
+# Configure logging（出力はQueueListenerのスレッドで行い、リクエスト処理を待たせない）
+configure_logging()
 logger = logging.getLogger(__name__)
 
+REQUEST_ID_HEADER = "X-Request-ID"
+
+def warm_up():
+    """
+    Load heavy SDKs in the background after startup
+    起動直後にバックグラウンドでGemini SDKを読み込み、最初の解析リクエストの待ち時間を減らす
+    """
+    if not Config.GEMINI_API_KEY:
+        return
+    try:
+        get_gemini_model()
+    except Exception as e:
+        logger.warning(f"[ウォームアップ] Geminiの初期化に失敗: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """起動時に上流の接続確認（/readyz 用）・ウォームアップ・月度シートの事前作成を開始し、終了時に停止"""
+    readiness.ensure_started()
+    provisioner.ensure_started()
+    outbox_drainer.ensure_started()
+    # 待たずに起動を完了させる（リクエストの受け付けはすぐ始まる）
+    warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up))
+    yield
+    warm_up_task.cancel()
+    await flush_confirmations()
+    await outbox_drainer.stop()
+    await provisioner.stop()
+    await readiness.stop()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Limit Yotsuya Sales API",
     description="売上管理AI「コクピット」API - Google AI Studio連携用",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS設定（Google AI Studioからのアクセスを許可）
@@ -40,58 +102,165 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Google Sheets client (lazy initialization)
-sheets_client = None
-
-# Gemini model (lazy initialization)
-gemini_model = None
-
-# 顧客リスト（最新）
-KNOWN_CUSTOMERS = [
-    "岩佐将平",
-    "堀内さやか",
-    "坂上明彦",
-    "河村直子",
-    "金子弘美",
-    "平安彦",
-    "西島優樹",
-    "桜井彰人",
-    "花田幸典",
-    "大塚由美",
-    "新津七海",
-    "冨田博信",
-    "竹内優馬",
-    "荻野悠加"
-]
+async def profile_requests(request: Request, call_next):
+    """
+    X-Profile ヘッダー（PROFILE_TOKEN）または PROFILE_SAMPLE_RATE で選ばれたリクエストをプロファイルし、
+    リクエストID・処理段階ごとの所要時間とともに PROFILE_DIR に保存する
+
+    PROFILE_TOKEN・PROFILE_SAMPLE_RATE のどちらも未設定なら登録しない（通常の処理には影響しない）。
+    """
+    if not should_profile(request.headers.get(PROFILE_HEADER)):
+        return await call_next(request)
+    profiler = start_profile()
+    if profiler is None:
+        return await call_next(request)
+
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        stop_profile(profiler)
+        context = current_request()
+        ledger = current_ledger()
+        route = request.scope.get("route")
+        summary = {
+            "request_id": context.request_id if context is not None else new_request_id(),
+            "method": request.method,
+            "path": getattr(route, "path", request.url.path),
+            "status": status,
+            "duration_ms": round(profiler.elapsed * 1000, 2),
+            "sheets_calls": dict(ledger.calls) if ledger is not None else None,
+            **({key: value for key, value in context.as_dict().items() if key != "request_id"} if context else {})
+        }
+        try:
+            await asyncio.to_thread(get_profile_store().save, summary, profiler)
+        except OSError as e:
+            logger.warning(f"[プロファイル] 保存に失敗しました: {e}")
+
+
+# record_request_metrics（リクエストID・処理段階）の内側で実行するため、先に登録する
+if profiling_enabled():
+    app.middleware("http")(profile_requests)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    リクエストごとの処理時間を記録し、1件の構造化ログ（"request"）を出力
+
+    ログには処理段階ごとの所要時間（stage()）、Sheets API呼び出し回数、annotate() で
+    追加された項目（Geminiのモデル・トークン数など）を含める。
+    """
+    start = time.perf_counter()
+    status = 500
+    with request_scope(request.headers.get(REQUEST_ID_HEADER)) as context:
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            response.headers[REQUEST_ID_HEADER] = context.request_id
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            # パスはルート定義（例: /api/record_sale）単位で集計し、ラベルの種類が増えすぎないようにする
+            route = request.scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            REQUEST_SECONDS.observe(elapsed, method=request.method, path=path, status=status)
+            ledger = current_ledger()
+            logger.info("request", extra={
+                "method": request.method,
+                "path": path,
+                "status": status,
+                "duration_ms": round(elapsed * 1000, 2),
+                "sheets_calls": ledger.total if ledger is not None else None,
+                **context.as_dict()
+            })
+
+
+@app.middleware("http")
+async def account_sheets_calls(request: Request, call_next):
+    """リクエストごとのSheets API呼び出し回数を集計（上限は各エンドポイントの @call_budget で宣言）"""
+    with track_calls(request.url.path) as ledger:
+        response = await call_next(request)
+        ledger.endpoint = getattr(request.scope.get("route"), "path", "unmatched")
+        if Config.SHEETS_CALLS_HEADER:
+            response.headers[CALLS_HEADER] = ledger.header_value()
+        return response
+
+
+@app.exception_handler(CircuitOpenError)
+async def sheets_unavailable(request: Request, exc: CircuitOpenError):
+    """Sheetsのサーキットブレーカーが開いている間は、タイムアウトを待たずに503を返す"""
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers=retry_after_header(exc))
+
+
+@app.exception_handler(AdmissionRejected)
+async def upstream_saturated(request: Request, exc: AdmissionRejected):
+    """上流の同時実行数・待ち行列が一杯なら、積み上げずに429を返す"""
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers=admission_retry_after(exc))
+
+
+# Gemini client (lazy initialization)
+gemini_client: Optional[GeminiClient] = None
+
+# フロントエンド（PWA一式）・スキーマ（起動時に一度だけ生成・圧縮）
+STATIC_ASSETS = build_frontend_assets(SALE_FUNCTION_SCHEMA)
+
+# 顧客リストが標準と異なる店舗のスキーマ（店舗ID -> StaticAsset、初回リクエスト時に生成）
+store_schema_assets: Dict[str, StaticAsset] = {}
+
+# 一括処理の上限件数と、再送時の二重記帳を防ぐための処理済み結果（client_id -> 結果）
+MAX_BATCH_ITEMS = 20
+batch_results = TTLCache(max_items=1000, ttl_seconds=24 * 60 * 60)
+# 処理中の client_id -> 結果（ページとService Workerが同じ項目を同時に送信しても、後から来た方は結果を待つ）
+batch_in_flight: Dict[str, asyncio.Future] = {}
+
+
+def _create_gemini_model(model_name: str, system_instruction: Optional[str] = None):
+    """Create a GenerativeModel (GeminiClient の model_factory)"""
+    # APIキーの読み込み確認
+    api_key = Config.GEMINI_API_KEY
+    if not api_key:
+        logger.error("[Gemini初期化失敗] GEMINI_API_KEY が設定されていません")
+        raise ValueError("GEMINI_API_KEY environment variable is not set")
+
+    logger.info(f"[Gemini初期化] APIキー読み込み成功（先頭8文字: {api_key[:8]}...）")
+    # google.generativeai はインポートに1秒前後かかるため、初回利用時（または起動後のwarm_up）に読み込む
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+
+    logger.info(f"[Gemini初期化] モデル: {model_name}")
+    return genai.GenerativeModel(model_name, system_instruction=system_instruction)
+
+
+def get_gemini_client() -> GeminiClient:
+    """Get or create the Gemini client (deadline, retry and model fallback)"""
+    global gemini_client
+    if gemini_client is None:
+        gemini_client = GeminiClient(
+            Config.GEMINI_MODELS,
+            _create_gemini_model,
+            deadline_seconds=Config.GEMINI_DEADLINE_SECONDS,
+            total_deadline_seconds=Config.GEMINI_TOTAL_DEADLINE_SECONDS,
+            max_retries=Config.GEMINI_MAX_RETRIES,
+            hedge=Config.GEMINI_HEDGE
+        )
+    return gemini_client
 
 
 def get_gemini_model():
-    """Get or create Gemini model"""
-    global gemini_model
-    if gemini_model is None:
-        # APIキーの読み込み確認
-        api_key = Config.GEMINI_API_KEY
-        if not api_key:
-            logger.error("[Gemini初期化失敗] GEMINI_API_KEY が設定されていません")
-            raise ValueError("GEMINI_API_KEY environment variable is not set")
-
-        logger.info(f"[Gemini初期化] APIキー読み込み成功（先頭8文字: {api_key[:8]}...）")
-        genai.configure(api_key=api_key)
-
-        # gemini-2.5-flash: 2025年6月リリースの安定版、最新のFlashモデル
-        model_name = 'gemini-2.5-flash'
-        logger.info(f"[Gemini初期化] モデル: {model_name}")
-        gemini_model = genai.GenerativeModel(model_name)
-    return gemini_model
-
-
-def get_sheets_client() -> GoogleSheetsClient:
-    """Get or create Google Sheets client"""
-    global sheets_client
-    if sheets_client is None:
-        sheets_client = GoogleSheetsClient()
-        sheets_client.connect()
-    return sheets_client
+    """Get the primary Gemini model (for warm-up and readiness checks)"""
+    client = get_gemini_client()
+    return client.model(client.model_names[0])
+
+
+def resolve_store(store: Optional[str]) -> StoreConfig:
+    """store パラメータから店舗設定を取得（未登録なら404）"""
+    try:
+        return get_store_registry().get(store)
+    except UnknownStoreError:
+        raise HTTPException(status_code=404, detail=f"店舗 '{store}' は登録されていません")
 
 
 # Request models
@@ -103,19 +272,55 @@ class RecordSaleRequest(BaseModel):
     product_name: str
     quantity: int
     unit_price_excl_tax: int
+    trainer: Optional[str] = None  # 担当トレーナー（L列。名簿（M列）にない名前は400）
 
 
 class ProcessTextRequest(BaseModel):
     """テキスト処理リクエスト"""
     text: str
+    line_user_id: Optional[str] = None  # 指定すると記帳結果をLINEで返信する
+
+
+class SaleEditRequest(BaseModel):
+    """売上の修正（指定した項目だけ変更する）"""
+    day: Optional[int] = None
+    seller: Optional[str] = None
+    payment_method: Optional[str] = None
+    product_name: Optional[str] = None
+    quantity: Optional[int] = None
+    unit_price_incl_tax: Optional[int] = None
+    trainer: Optional[str] = None  # 空文字で担当なしに戻す
+
+
+class CommitRequest(SaleEditRequest):
+    """プレビューの記帳リクエスト（指定した項目だけ解析結果を修正する）"""
+    line_user_id: Optional[str] = None  # 指定すると記帳結果をLINEで返信する
+
+
+class BatchItem(BaseModel):
+    """一括処理の1件（client_idはクライアント側で採番する冪等キー）"""
+    client_id: str
+    text: str
+
+
+class ProcessBatchRequest(BaseModel):
+    """一括テキスト処理リクエスト"""
+    items: List[BatchItem]
+    line_user_id: Optional[str] = None  # 指定すると記帳結果をLINEで返信する（まとめて1回）
 
 
-def parse_sale_text_with_gemini(text: str) -> Dict:
+def parse_sale_text_with_gemini(text: str, store: Optional[StoreConfig] = None) -> Dict:
     """
     Gemini APIを使ってLINEメッセージから売上情報を抽出
 
+    指示・顧客リスト・商品カタログは店舗ごとの system_instruction としてモデルに持たせ、
+    リクエストごとには正規化したメッセージだけを送る。
+    Geminiのすべてのモデルが期限内に応答しない場合、GEMINI_MODEL_CHAIN に "regex" があれば
+    正規表現による解析に切り替える。
+
     Args:
         text: LINEメッセージ（例：「12/28 PayPalで月4回プラン 35,200円 販売しました。顧客: 服部誉也」）
+        store: 店舗設定（顧客名・商品名の候補）
 
     Returns:
         dict: {
@@ -127,34 +332,55 @@ def parse_sale_text_with_gemini(text: str) -> Dict:
             "unit_price_incl_tax": int  # 税込
         }
     """
-    logger.info(f"[Gemini解析開始] 入力テキスト: {text}")
+    log_payload("[Gemini解析開始]", {"text": text})
+    store = store or get_store_registry().default
 
-    model = get_gemini_model()
+    message = normalize_message(text)
+    instruction = build_sale_instruction(store.customers, store.catalog)
 
-    prompt = f"""
-以下のテキストから売上情報を抽出してください。
-
-テキスト: {text}
-
-以下のJSON形式で回答してください（JSONのみを返し、他の文章は不要です）:
-{{
-    "day": 日付（数値のみ、例：28）,
-    "seller": "顧客名",
-    "payment_method": "決済方法（PayPal, PayPay, 現金, クレジットカードのいずれか）",
-    "product_name": "商品・サービス名",
-    "quantity": 数量（数値、通常は1）,
-    "unit_price_incl_tax": 税込単価（数値のみ、カンマなし）
-}}
-
-重要:
-- sellerは「顧客名」を指します（販売者名ではありません）
-- unit_price_incl_taxは税込金額です
-- quantityが明示されていない場合は1を返してください
-"""
+    try:
+        # 期限・リトライ・モデルのフォールバック付きで呼び出す（GeminiClient）
+        response, model_name = get_gemini_client().generate_content(
+            message,
+            system_instruction=instruction,
+            generation_config=SALE_GENERATION_CONFIG
+        )
+    except GeminiUnavailableError as e:
+        report_failure("gemini", e)
+        logger.error(f"[Gemini API失敗] {e}")
+        if not Config.GEMINI_REGEX_FALLBACK:
+            raise HTTPException(status_code=503, detail=f"Gemini APIエラー: {e}")
+
+        # 最後の手段: 正規表現で解析（定型的な書き方のみ対応）
+        regex_error = None
+        with stage("regex_parse"):
+            try:
+                result = parse_sale_text_regex(message, store.customers, store.catalog)
+                logger.warning("[正規表現で解析] Geminiが応答しないため正規表現で解析しました")
+                annotate(parser="regex")
+                log_payload("[正規表現解析結果]", result)
+                return result
+            except ValueError as parse_error:
+                regex_error = parse_error
+        # GeminiUnavailableError を原因として送出し、一括処理では再送対象にする
+        raise HTTPException(
+            status_code=503,
+            detail=f"Gemini APIが応答せず、正規表現でも解析できませんでした: {regex_error}"
+        )
 
+    report_success("gemini")
+    usage = record_usage(model_name, getattr(response, "usage_metadata", None))
+    # モデル・トークン数・費用はリクエストのログ（1件）にまとめる
+    annotate(parser="gemini", gemini_model=model_name)
+    if usage is not None:
+        annotate(
+            gemini_prompt_tokens=usage["prompt_tokens"],
+            gemini_cached_tokens=usage["cached_tokens"],
+            gemini_output_tokens=usage["output_tokens"],
+            gemini_cost_usd=usage["cost_usd"]
+        )
     try:
-        response = model.generate_content(prompt)
-        logger.info(f"[Gemini応答] {response.text}")
+        log_payload("[Gemini応答]", {"model": model_name, "response": response.text})
 
         # JSONを抽出（```json ... ``` の形式に対応）
         response_text = response.text.strip()
@@ -166,16 +392,17 @@ def parse_sale_text_with_gemini(text: str) -> Dict:
             response_text = response_text[:-3]  # ``` を削除
 
         result = json.loads(response_text.strip())
-        logger.info(f"[Gemini解析成功] {result}")
+        log_payload("[Gemini解析成功]", result)
         return result
 
     except json.JSONDecodeError as e:
         logger.error(f"[JSON解析失敗] Geminiの応答がJSONではありません: {e}")
-        logger.error(f"[生の応答] {response.text if 'response' in locals() else 'N/A'}")
+        # 応答本文には顧客名が含まれるため、マスクした詳細ログにだけ出す
+        log_payload("[生の応答]", {"model": model_name, "response": response.text})
         raise HTTPException(status_code=500, detail=f"Gemini応答のJSON解析に失敗: {str(e)}")
     except AttributeError as e:
         logger.error(f"[Gemini応答エラー] レスポンスオブジェクトが不正: {e}")
-        logger.error(f"[レスポンス詳細] {response if 'response' in locals() else 'N/A'}")
+        log_payload("[レスポンス詳細]", {"model": model_name, "response": repr(response)})
         raise HTTPException(status_code=500, detail=f"Gemini APIからの応答が不正です: {str(e)}")
     except Exception as e:
         # HTTPステータスコードが含まれる場合は抽出
@@ -186,249 +413,119 @@ def parse_sale_text_with_gemini(text: str) -> Dict:
         raise HTTPException(status_code=500, detail=f"Gemini APIエラー: {error_message}")
 
 
-@app.get("/", response_class=HTMLResponse)
-async def root():
+@app.get("/")
+async def root(request: Request):
     """売上記録専用フロントエンド"""
-    html_content = """
-<!DOCTYPE html>
-<html lang="ja">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>リミット四ツ谷店 売上記帳</title>
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            display: flex;
-            justify-content: center;
-            align-items: center;
-            padding: 20px;
-        }
-        .container {
-            background: white;
-            border-radius: 16px;
-            box-shadow: 0 20px 60px rgba(0, 0, 0, 0.3);
-            max-width: 500px;
-            width: 100%;
-            padding: 30px;
-        }
-        h1 {
-            color: #333;
-            font-size: 24px;
-            margin-bottom: 8px;
-            text-align: center;
-        }
-        .subtitle {
-            color: #666;
-            font-size: 14px;
-            text-align: center;
-            margin-bottom: 24px;
-        }
-        label {
-            display: block;
-            color: #555;
-            font-weight: 600;
-            margin-bottom: 8px;
-            font-size: 14px;
-        }
-        textarea {
-            width: 100%;
-            min-height: 120px;
-            padding: 12px;
-            border: 2px solid #e0e0e0;
-            border-radius: 8px;
-            font-size: 16px;
-            font-family: inherit;
-            resize: vertical;
-            transition: border-color 0.3s;
-        }
-        textarea:focus {
-            outline: none;
-            border-color: #667eea;
-        }
-        .button-container {
-            margin-top: 20px;
-        }
-        button {
-            width: 100%;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            border: none;
-            padding: 16px;
-            border-radius: 8px;
-            font-size: 18px;
-            font-weight: 600;
-            cursor: pointer;
-            transition: transform 0.2s, box-shadow 0.2s;
-        }
-        button:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 10px 20px rgba(102, 126, 234, 0.4);
-        }
-        button:active {
-            transform: translateY(0);
-        }
-        button:disabled {
-            background: #ccc;
-            cursor: not-allowed;
-            transform: none;
-        }
-        .result {
-            margin-top: 20px;
-            padding: 16px;
-            border-radius: 8px;
-            font-size: 16px;
-            display: none;
-        }
-        .result.success {
-            background: #d4edda;
-            border: 1px solid #c3e6cb;
-            color: #155724;
-        }
-        .result.error {
-            background: #f8d7da;
-            border: 1px solid #f5c6cb;
-            color: #721c24;
-        }
-        .loading {
-            text-align: center;
-            color: #667eea;
-            font-weight: 600;
-            margin-top: 12px;
-            display: none;
-        }
-        .example {
-            background: #f8f9fa;
-            border-left: 4px solid #667eea;
-            padding: 12px;
-            margin-top: 16px;
-            border-radius: 4px;
-            font-size: 13px;
-            color: #555;
-        }
-        .example-title {
-            font-weight: 600;
-            margin-bottom: 8px;
-            color: #333;
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>🏋️ リミット四ツ谷店</h1>
-        <div class="subtitle">売上記帳 AIコクピット</div>
-
-        <form id="saleForm">
-            <label for="saleText">LINEメッセージを貼り付け:</label>
-            <textarea
-                id="saleText"
-                name="text"
-                placeholder="例: 12/28 PayPalで月4回プラン 35,200円 販売しました。顧客: 服部誉也"
-                required
-            ></textarea>
-
-            <div class="example">
-                <div class="example-title">📝 入力例:</div>
-                12/28 PayPalで月4回プラン 35,200円 販売しました。顧客: 服部誉也
-            </div>
-
-            <div class="button-container">
-                <button type="submit" id="submitBtn">記帳実行</button>
-            </div>
-        </form>
-
-        <div class="loading" id="loading">処理中...</div>
-        <div class="result" id="result"></div>
-    </div>
-
-    <script>
-        const form = document.getElementById('saleForm');
-        const submitBtn = document.getElementById('submitBtn');
-        const loading = document.getElementById('loading');
-        const result = document.getElementById('result');
-
-        form.addEventListener('submit', async (e) => {
-            e.preventDefault();
-
-            const text = document.getElementById('saleText').value.trim();
-            if (!text) {
-                showResult('テキストを入力してください', 'error');
-                return;
-            }
+    return STATIC_ASSETS["/"].response(request)
 
-            // UI状態を更新
-            submitBtn.disabled = true;
-            loading.style.display = 'block';
-            result.style.display = 'none';
-
-            try {
-                const response = await fetch('/api/process_and_record', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify({ text })
-                });
-
-                const data = await response.json();
-
-                if (response.ok && data.success) {
-                    showResult(data.message, 'success');
-                    // 成功したらテキストエリアをクリア
-                    document.getElementById('saleText').value = '';
-                } else {
-                    showResult(data.detail || data.message || '記帳に失敗しました', 'error');
-                }
-            } catch (error) {
-                showResult('通信エラーが発生しました: ' + error.message, 'error');
-            } finally {
-                submitBtn.disabled = false;
-                loading.style.display = 'none';
-            }
-        });
 
-        function showResult(message, type) {
-            result.textContent = message;
-            result.className = 'result ' + type;
-            result.style.display = 'block';
-        }
-    </script>
-</body>
-</html>
-    """
-    return HTMLResponse(content=html_content)
+@app.get("/sw.js")
+async def service_worker(request: Request):
+    """オフラインシェル・バックグラウンド送信用Service Worker"""
+    return STATIC_ASSETS["/sw.js"].response(request)
+
+
+@app.get("/queue.js")
+async def queue_script(request: Request):
+    """IndexedDB送信キュー（ページとService Workerで共有）"""
+    return STATIC_ASSETS["/queue.js"].response(request)
+
+
+@app.get("/manifest.webmanifest")
+async def web_manifest(request: Request):
+    """PWAマニフェスト"""
+    return STATIC_ASSETS["/manifest.webmanifest"].response(request)
+
+
+@app.get("/icon.svg")
+async def app_icon(request: Request):
+    """PWAアイコン"""
+    return STATIC_ASSETS["/icon.svg"].response(request)
+
+
+def _check_sheets():
+    """Sheetsの接続確認（タイトルのみ取得）"""
+    get_sheets_client().ping()
+
+
+def _check_gemini():
+    """Geminiの接続確認（モデル情報のみ取得、生成は行わない）"""
+    model = get_gemini_model()
+    import google.generativeai as genai
+    genai.get_model(model.model_name)
+
+
+# 上流の接続状態（バックグラウンドで更新し、プローブはメモリ上の状態を返すだけ）
+# Geminiが落ちていても手入力の記帳（/api/record_sale）はできるため、readyの判定はSheetsのみ
+readiness = ReadinessMonitor(
+    {"sheets": _check_sheets, "gemini": _check_gemini},
+    interval_seconds=Config.READINESS_INTERVAL_SECONDS
+)
+
+# 月度シートの事前作成（月末前に翌月のシートを作っておく）
+provisioner = SheetProvisioner(
+    interval_seconds=Config.SHEET_PROVISION_INTERVAL_SECONDS,
+    lead_days=Config.SHEET_PROVISION_LEAD_DAYS
+)
+
+# Sheetsの障害中に保留した売上の記帳（ブレーカーが閉じたら書き込む）
+outbox_drainer = OutboxDrainer(interval_seconds=Config.SHEETS_OUTBOX_DRAIN_INTERVAL_SECONDS)
+
+
+@app.get("/livez")
+async def livez():
+    """Liveness: プロセスが応答できるか（外部への呼び出しなし）"""
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+@call_budget(0)
+async def readyz():
+    """Readiness: バックグラウンドで確認済みの上流の接続状態（API呼び出しなし）"""
+    readiness.ensure_started()
+    snapshot = readiness.snapshot()
+    return JSONResponse(
+        status_code=200 if snapshot["ready"] else 503,
+        content={"status": "ready" if snapshot["ready"] else "not_ready", **snapshot}
+    )
 
 
 @app.get("/health")
+@call_budget(0)
 async def health():
-    """ヘルスチェック"""
-    try:
-        # Google Sheets接続確認
-        client = get_sheets_client()
-        return {
-            "status": "healthy",
-            "google_sheets": "connected",
-            "spreadsheet": client.spreadsheet.title if client.spreadsheet else "not connected"
-        }
-    except Exception as e:
-        logger.error(f"Health check failed: {e}")
-        return {
-            "status": "unhealthy",
-            "error": str(e)
-        }
+    """ヘルスチェック（互換用。/readyz と同じくキャッシュ済みの状態を返す）"""
+    readiness.ensure_started()
+    snapshot = readiness.snapshot()
+    return {"status": "healthy" if snapshot["ready"] else "unhealthy", **snapshot}
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus形式のメトリクス（段階別レイテンシ・Sheets API呼び出し回数など）"""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/api/admin/profiles")
+@call_budget(0)
+async def list_profiles(limit: int = 20, x_profile: Optional[str] = Header(None)) -> Dict:
+    """
+    最近保存したリクエストのプロファイル（新しい順）を返す（X-Profile ヘッダーに PROFILE_TOKEN が必要）
+
+    Returns:
+        dict: {"success": bool, "profiles": [{"request_id", "method", "path", "status", "duration_ms",
+               "stages_ms", "sheets_calls", "samples", "top", "folded", ...}, ...]}
+    """
+    if not is_admin(x_profile):
+        raise HTTPException(status_code=403, detail="X-Profile ヘッダーに PROFILE_TOKEN を指定してください")
+    profiles = await asyncio.to_thread(get_profile_store().recent, max(1, min(limit, 100)))
+    return {"success": True, "profiles": profiles}
 
 
 @app.get("/api/list_models")
 async def list_models():
     """利用可能なGeminiモデルを一覧表示（診断用）"""
     try:
+        import google.generativeai as genai
         genai.configure(api_key=Config.GEMINI_API_KEY)
         models = []
         for model in genai.list_models():
@@ -452,12 +549,24 @@ async def list_models():
 
 
 @app.post("/api/record_sale")
-async def record_sale(request: RecordSaleRequest) -> Dict:
+@call_budget(4)
+async def record_sale(
+    request: RecordSaleRequest,
+    response: Response,
+    store: Optional[str] = None,
+    x_client_priority: Optional[str] = Header(None)
+) -> Dict:
     """
     売上情報をスプレッドシートに記録
 
+    Google Sheetsの障害中は売上を保留して 202（"queued": true、row は null）を返し、復旧後に記帳する。
+    保留が無効（SHEETS_OUTBOX_FILE が空）なら 503 と Retry-After を返す。
+    Sheetsへの書き込みが混み合っていれば 429 と Retry-After を返す。
+
     Args:
         request: 売上記録リクエスト
+        store: 店舗ID（省略時はデフォルト店舗）
+        x_client_priority: "interactive" なら画面からのリクエストとして優先（それ以外はバッチ扱い）
 
     Returns:
         dict: {
@@ -467,182 +576,767 @@ async def record_sale(request: RecordSaleRequest) -> Dict:
             "sheet_name": str
         }
     """
-    logger.info("=" * 80)
-    logger.info("[API] POST /api/record_sale - リクエスト受信")
-    logger.info(f"[リクエストデータ] {request.dict()}")
+    log_payload("[record_sale]", request.dict())
+    store_config = resolve_store(store)
+    sale = request.dict()
+    if request.trainer:
+        # 担当トレーナーは名簿の表記に揃える（名簿はキャッシュ済みなら読まない）
+        try:
+            sale["trainer"] = await asyncio.to_thread(get_trainer_roster(store).resolve, request.trainer)
+        except UnknownTrainerError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
     try:
-        client = get_sheets_client()
-
-        logger.info("[処理開始] Google Sheetsクライアントを取得しました")
-
         # 顧客名の検証（警告のみ、処理は続行）
-        if request.seller not in KNOWN_CUSTOMERS:
+        if request.seller not in store_config.customers:
             logger.warning(f"[顧客名警告] '{request.seller}' は既知の顧客リストにありません。新規顧客の可能性があります。")
 
-        result = client.record_sale(
-            day=request.day,
-            seller=request.seller,
-            payment_method=request.payment_method,
-            product_name=request.product_name,
-            quantity=request.quantity,
-            unit_price_excl_tax=request.unit_price_excl_tax
-        )
+        # 店舗の書き込みキュー経由で記帳（同時リクエストは1回の書き込みにまとめられる）
+        async with get_admission("sheets").admit(client_priority(x_client_priority)):
+            result = await get_write_queue(store).submit(sale)
 
         if result.get("success"):
-            logger.info(f"[API成功] {result.get('message')} (シート: {result.get('sheet_name')})")
+            annotate(sheet_name=result.get("sheet_name"), row=result.get("row"), queued=result.get("queued", False))
+            if result.get("queued"):
+                response.status_code = 202
         else:
             logger.error(f"[API失敗] {result.get('message')}")
 
-        logger.info("=" * 80)
         return result
 
+    except (CircuitOpenError, AdmissionRejected):
+        raise
     except Exception as e:
         logger.error(f"[API例外] エラーが発生しました: {e}", exc_info=True)
-        logger.info("=" * 80)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def build_sale_from_text(text: str, store: Optional[StoreConfig] = None) -> Dict:
+    """
+    テキストを解析し、税抜単価を付けた売上データを返す
+
+    Args:
+        text: LINEメッセージ
+        store: 店舗設定（顧客リスト・税率。省略時はデフォルト店舗）
+
+    Returns:
+        dict: parse_sale_text_with_gemini の結果 + "unit_price_excl_tax"
+    """
+    store = store or get_store_registry().default
+
+    # 1. Gemini APIでテキスト解析
+    with stage("gemini_parse"):
+        parsed_data = parse_sale_text_with_gemini(text, store)
+
+    # 2. 税抜単価を計算
+    return apply_tax(parsed_data, store)
+
+
+def apply_tax(parsed_data: Dict, store: StoreConfig) -> Dict:
+    """
+    解析済みの売上に税抜単価を付け、顧客名・商品名を検証する（警告のみ）
+
+    Args:
+        parsed_data: parse_sale_text_with_gemini の結果（またはプレビューを修正したもの）
+        store: 店舗設定（顧客リスト・税率）
+
+    Returns:
+        dict: parsed_data + "unit_price_excl_tax"
+    """
+    # floor(税込 / (1 + 税率))
+    with stage("tax"):
+        unit_price_incl_tax = parsed_data["unit_price_incl_tax"]
+        tax_rate = store.tax_rate_for(parsed_data.get("product_name"))
+        unit_price_excl_tax = store.price_excl_tax(parsed_data.get("product_name"), unit_price_incl_tax)
+    logger.debug(f"[税抜計算] floor({unit_price_incl_tax} / {1 + tax_rate:g}) = {unit_price_excl_tax}")
+
+    # 顧客名・商品名の検証（警告のみ、処理は続行）
+    seller = parsed_data["seller"]
+    if seller not in store.customers:
+        logger.warning(f"[顧客名警告] '{seller}' は既知の顧客リストにありません。新規顧客の可能性があります。")
+    if store.catalog and parsed_data.get("product_name") not in store.catalog:
+        logger.warning(f"[商品名警告] '{parsed_data.get('product_name')}' は店舗 '{store.store_id}' のカタログにありません。")
+
+    return {
+        **parsed_data,
+        "unit_price_excl_tax": unit_price_excl_tax
+    }
+
+
+def format_success_message(sale: Dict, sheet_name: str, row: Optional[int]) -> str:
+    """記帳成功時のユーザー向けメッセージ（row が None なら保留中）"""
+    if row is None:
+        return (f"🕒 {sale['seller']}様の売上 {sale['unit_price_incl_tax']:,}円を受け付けました"
+                f"（Google Sheetsの復旧後に {sheet_name} に記帳します）")
+    return f"✅ {sale['seller']}様の売上 {sale['unit_price_incl_tax']:,}円を記帳しました（{sheet_name} {row}行目）"
+
+
+async def send_line_confirmation(user_id: Optional[str], text: str):
+    """
+    記帳結果をLINEで送信（user_id 指定時のみ）
+
+    すぐには送らず、同じユーザー宛ての確認を LINE_CONFIRMATION_WINDOW_SECONDS 秒まとめて
+    Webhookの返信トークンで1回の返信にする（返信トークンがなければプッシュ）。
+    """
+    if not user_id:
+        return
+    sender = get_confirmation_sender()
+    if sender is None:
+        logger.warning("[LINE確認] LINE_CHANNEL_ACCESS_TOKEN が未設定のため記帳結果を送信しません")
+        return
+    await sender.send(user_id, text)
+
+
 @app.post("/api/process_and_record")
-async def process_and_record(request: ProcessTextRequest) -> Dict:
+@call_budget(4)
+async def process_and_record(
+    request: ProcessTextRequest,
+    response: Response,
+    store: Optional[str] = None,
+    x_client_priority: Optional[str] = Header(None)
+) -> Dict:
     """
     テキストを解析して売上を記帳（ワンストップ処理）
 
+    Gemini・Sheetsそれぞれの同時実行数を制限し、混み合っていれば 429 と Retry-After を返す
+    （画面からのリクエストはバッチより優先）。
+
     Args:
         request: テキスト処理リクエスト
+        store: 店舗ID（省略時はデフォルト店舗）
+        x_client_priority: "interactive" なら画面からのリクエストとして優先（それ以外はバッチ扱い）
 
     Returns:
         dict: {
             "success": bool,
+            "queued": bool,  # Trueなら保留中（Sheetsの復旧後に記帳。row は None、HTTP 202）
             "message": str,
             "row": int,
             "sheet_name": str,
             "parsed_data": dict
         }
     """
-    logger.info("=" * 80)
-    logger.info("[API] POST /api/process_and_record - リクエスト受信")
-    logger.info(f"[入力テキスト] {request.text}")
+    log_payload("[process_and_record]", {"text": request.text})
+    store_config = resolve_store(store)
+    priority = client_priority(x_client_priority)
 
     try:
-        # 1. Gemini APIでテキスト解析
-        parsed_data = parse_sale_text_with_gemini(request.text)
-
-        # 2. 税抜単価を計算: floor(税込 / 1.1)
-        unit_price_incl_tax = parsed_data["unit_price_incl_tax"]
-        unit_price_excl_tax = int(unit_price_incl_tax / 1.1)  # floor関数として動作
-        logger.info(f"[税抜計算] floor({unit_price_incl_tax} / 1.1) = {unit_price_excl_tax}")
+        # Gemini呼び出しはブロッキングなのでスレッドで実行し、同時リクエストを直列化しない
+        async with get_admission("gemini").admit(priority):
+            sale = await asyncio.to_thread(build_sale_from_text, request.text, store_config)
 
-        # 3. Google Sheetsに記帳
-        client = get_sheets_client()
-        logger.info("[処理開始] Google Sheetsクライアントを取得しました")
-
-        # 顧客名の検証（警告のみ、処理は続行）
-        seller = parsed_data["seller"]
-        if seller not in KNOWN_CUSTOMERS:
-            logger.warning(f"[顧客名警告] '{seller}' は既知の顧客リストにありません。新規顧客の可能性があります。")
-
-        result = client.record_sale(
-            day=parsed_data["day"],
-            seller=seller,
-            payment_method=parsed_data["payment_method"],
-            product_name=parsed_data["product_name"],
-            quantity=parsed_data["quantity"],
-            unit_price_excl_tax=unit_price_excl_tax,
-            unit_price_incl_tax=unit_price_incl_tax  # I列表示用（税込金額）
-        )
+        # 3. Google Sheetsに記帳（店舗の書き込みキュー経由）
+        async with get_admission("sheets").admit(priority):
+            result = await get_write_queue(store).submit(sale)
 
         if result.get("success"):
             # 成功メッセージをカスタマイズ
-            custom_message = f"✅ {seller}様の売上 {unit_price_incl_tax:,}円を記帳しました（{result.get('sheet_name')} {result.get('row')}行目）"
-            logger.info(f"[API成功] {custom_message}")
+            custom_message = format_success_message(sale, result.get("sheet_name"), result.get("row"))
+            annotate(sheet_name=result.get("sheet_name"), row=result.get("row"), queued=result.get("queued", False))
+            await send_line_confirmation(request.line_user_id, custom_message)
+            if result.get("queued"):
+                response.status_code = 202
 
-            logger.info("=" * 80)
             return {
                 "success": True,
+                "queued": result.get("queued", False),
                 "message": custom_message,
                 "row": result.get("row"),
                 "sheet_name": result.get("sheet_name"),
-                "parsed_data": {
-                    **parsed_data,
-                    "unit_price_excl_tax": unit_price_excl_tax
-                }
+                "sale_id": result.get("sale_id"),
+                "parsed_data": sale
             }
         else:
             logger.error(f"[API失敗] {result.get('message')}")
-            logger.info("=" * 80)
             raise HTTPException(status_code=500, detail=result.get("message"))
 
-    except HTTPException:
-        # HTTPExceptionはそのまま再スロー
-        logger.info("=" * 80)
+    except (HTTPException, CircuitOpenError, AdmissionRejected):
+        # HTTPException・ブレーカーによる失敗（503）・流量制御（429）はそのまま再スロー
         raise
     except Exception as e:
         logger.error(f"[API例外] エラーが発生しました: {e}", exc_info=True)
-        logger.info("=" * 80)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.get("/api/schema")
-async def get_schema():
+@app.post("/api/preview")
+@call_budget(2)
+async def preview_sale(
+    request: ProcessTextRequest,
+    store: Optional[str] = None,
+    x_client_priority: Optional[str] = Header(None)
+) -> Dict:
     """
-    Google AI Studio用のFunction Calling JSONスキーマを返す
+    テキストを解析し、記帳せずに結果を返す（確認用）
+
+    解析結果と税抜単価を保存し、短時間だけ有効なコミットトークンを返す。
+    POST /api/commit/{token} で（必要なら修正して）記帳する。解析はやり直さない。
+
+    Args:
+        request: テキスト処理リクエスト
+        store: 店舗ID（省略時はデフォルト店舗）
+        x_client_priority: "interactive" なら画面からのリクエストとして優先（それ以外はバッチ扱い）
 
     Returns:
-        dict: OpenAPI形式のスキーマ
+        dict: {
+            "success": bool,
+            "token": str,
+            "parsed_data": dict,
+            "sheet_name": str,
+            "tentative_row": int,  # 仮の書き込み先（実際の行はコミット時に決まる）
+            "expires_in": float
+        }
     """
+    log_payload("[preview]", {"text": request.text})
+    store_config = resolve_store(store)
+
+    async with get_admission("gemini").admit(client_priority(x_client_priority)):
+        sale = await asyncio.to_thread(build_sale_from_text, request.text, store_config)
+
+    # 仮の書き込み先はミラーの空行から割り当てる（キャッシュが有効ならSheetsは読まない）
+    month = datetime.now().month
+    try:
+        values = await asyncio.to_thread(get_sheet_mirror(store).get_month_values, month)
+    except gspread.WorksheetNotFound:
+        values = []  # 今月のシートはコミット時にテンプレートから作成される
+    preview = get_sale_previews().create(store, sale, month_sheet_name(month), values)
+    annotate(sheet_name=preview["sheet_name"], tentative_row=preview["tentative_row"])
+
     return {
-        "name": "record_gym_sale",
-        "description": "リミット四ツ谷店の売上情報をGoogleスプレッドシートに記録します。税抜単価は既に計算済みの値を受け取ります。",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "day": {
-                    "type": "integer",
-                    "description": "日付（数値のみ、例：28）"
-                },
-                "seller": {
-                    "type": "string",
-                    "description": "顧客名（D列）",
-                    "enum": [
-                        "岩佐将平",
-                        "堀内さやか",
-                        "坂上明彦",
-                        "河村直子",
-                        "金子弘美",
-                        "平安彦",
-                        "西島優樹",
-                        "桜井彰人",
-                        "花田幸典",
-                        "大塚由美",
-                        "新津七海",
-                        "冨田博信",
-                        "竹内優馬",
-                        "荻野悠加"
-                    ]
-                },
-                "payment_method": {
-                    "type": "string",
-                    "description": "決済方法（例：PayPal, PayPay, 現金, クレジットカード）"
-                },
-                "product_name": {
-                    "type": "string",
-                    "description": "商品・サービス名（例：月4回プラン, 月8回プラン, プロテイン）"
-                },
-                "quantity": {
-                    "type": "integer",
-                    "description": "数量（通常は1）"
+        "success": True,
+        "token": preview["token"],
+        "parsed_data": sale,
+        "sheet_name": preview["sheet_name"],
+        "tentative_row": preview["tentative_row"],
+        "expires_in": preview["expires_in"]
+    }
+
+
+@app.post("/api/commit/{token}")
+@call_budget(4)
+async def commit_sale(
+    token: str,
+    response: Response,
+    request: Optional[CommitRequest] = None,
+    x_client_priority: Optional[str] = Header(None)
+) -> Dict:
+    """
+    プレビューした売上を記帳（Geminiの解析はやり直さない）
+
+    Args:
+        token: /api/preview が返したコミットトークン（1回限り）
+        request: 修正する項目（省略時は解析結果のまま記帳）
+        x_client_priority: "interactive" なら画面からのリクエストとして優先（それ以外はバッチ扱い）
+
+    Returns:
+        dict: /api/process_and_record と同じ形式 + "tentative_row"
+    """
+    previews = get_sale_previews()
+    entry = previews.take(token)
+    if entry is None:
+        raise HTTPException(
+            status_code=404,
+            detail="コミットトークンが無効か期限切れです。もう一度プレビューしてください"
+        )
+    store_config = resolve_store(entry["store"])
+
+    sale = entry["sale"]
+    edits = request.dict(exclude_none=True, exclude={"line_user_id"}) if request else {}
+    if edits:
+        # 単価・商品名（税率）が変わりうるため税抜単価を計算し直す
+        sale = apply_tax({**sale, **edits}, store_config)
+
+    try:
+        async with get_admission("sheets").admit(client_priority(x_client_priority)):
+            result = await get_write_queue(entry["store"]).submit(sale)
+    except (CircuitOpenError, AdmissionRejected):
+        # 同じトークンで再試行できるよう戻す
+        previews.restore(entry)
+        raise
+    except Exception as e:
+        previews.restore(entry)
+        logger.error(f"[API例外] エラーが発生しました: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not result.get("success"):
+        # 同じトークンで再試行できるよう戻す
+        previews.restore(entry)
+        logger.error(f"[API失敗] {result.get('message')}")
+        raise HTTPException(status_code=500, detail=result.get("message"))
+
+    custom_message = format_success_message(sale, result.get("sheet_name"), result.get("row"))
+    annotate(sheet_name=result.get("sheet_name"), row=result.get("row"), edited=sorted(edits),
+             queued=result.get("queued", False))
+    await send_line_confirmation(request.line_user_id if request else None, custom_message)
+    if result.get("queued"):
+        response.status_code = 202
+
+    return {
+        "success": True,
+        "queued": result.get("queued", False),
+        "message": custom_message,
+        "row": result.get("row"),
+        "sheet_name": result.get("sheet_name"),
+        "sale_id": result.get("sale_id"),
+        "tentative_row": entry["tentative_row"],
+        "parsed_data": sale
+    }
+
+
+def _is_retryable_parse_error(error: BaseException) -> bool:
+    """
+    解析エラーが再送で解決しうるか判定
+
+    Geminiが応答したが内容が不正（JSON不正・項目欠落）な場合は再送しても同じ結果になるため、
+    テキストの修正が必要なエラーとして扱う。通信エラー等は再送対象。
+    """
+    cause = error.__context__ if isinstance(error, HTTPException) else error
+    return not isinstance(cause, (ValueError, KeyError, TypeError))
+
+
+@app.post("/api/process_and_record_batch")
+@call_budget(4)
+async def process_and_record_batch(
+    request: ProcessBatchRequest,
+    store: Optional[str] = None,
+    x_client_priority: Optional[str] = Header(None)
+) -> Dict:
+    """
+    オフラインキューに溜まった複数の売上テキストを1リクエストで記帳
+
+    解析は並列に行い、記帳はスプレッドシートへの1回の書き込みにまとめる。
+    client_id ごとに結果を一定時間保持するため、応答を受け取れずに再送された
+    項目は二重記帳されず、前回の結果がそのまま返る。処理中の項目が同時に届いた場合
+    （ページとService Workerの同時送信など）は、先に受け付けた側の結果を待って返す。
+    混み合っていて受け付けられなかった項目は retryable として返す。
+
+    Args:
+        request: 一括処理リクエスト
+        store: 店舗ID（省略時はデフォルト店舗）
+        x_client_priority: "interactive" なら画面（PWA）からの送信として優先（それ以外はバッチ扱い）
+
+    Returns:
+        dict: {
+            "success": bool,  # 全件成功したか
+            "results": [
+                {
+                    "client_id": str,
+                    "success": bool,
+                    "retryable": bool,  # Trueならクライアントはキューに残して再送する
+                    "message": str,
+                    "row": int,
+                    "sheet_name": str,
+                    "parsed_data": dict
                 },
-                "unit_price_excl_tax": {
-                    "type": "integer",
-                    "description": "単価（税抜・整数値）。税込金額から floor(税込/1.1) で計算した値。"
+                ...
+            ]
+        }
+    """
+    annotate(batch_items=len(request.items))
+
+    if len(request.items) > MAX_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"一度に送信できるのは {MAX_BATCH_ITEMS} 件までです"
+        )
+    store_config = resolve_store(store)
+
+    results: Dict[str, Dict] = {}
+    pending: List[BatchItem] = []
+    # 解析を始める前に client_id を処理中として登録し、同時に届いた同じ項目は登録した側の結果を待つ
+    owned: Dict[str, asyncio.Future] = {}
+    waiting: Dict[str, asyncio.Future] = {}
+    loop = asyncio.get_running_loop()
+    for item in request.items:
+        if item.client_id in results or item.client_id in owned or item.client_id in waiting:
+            continue  # 同一リクエスト内の重複
+        cached = batch_results.get(item.client_id)
+        record_cache("batch_results", cached is not None)
+        if cached is not None:
+            logger.debug(f"[一括処理] client_id={item.client_id} は処理済みのため前回の結果を返します")
+            results[item.client_id] = cached
+        elif item.client_id in batch_in_flight:
+            logger.debug(f"[一括処理] client_id={item.client_id} は処理中のため結果を待ちます")
+            waiting[item.client_id] = batch_in_flight[item.client_id]
+        else:
+            owned[item.client_id] = batch_in_flight[item.client_id] = loop.create_future()
+            pending.append(item)
+
+    sales: List[Dict] = []
+    sale_items: List[BatchItem] = []
+    try:
+        priority = client_priority(x_client_priority)
+        gemini_admission = get_admission("gemini")
+
+        async def parse(item: BatchItem) -> Dict:
+            # 1項目ごとにGeminiの実行枠を確保する（受け付けられなかった項目だけ再送してもらう）
+            async with gemini_admission.admit(priority):
+                return await asyncio.to_thread(build_sale_from_text, item.text, store_config)
+
+        # 1. テキスト解析（並列）
+        parsed = await asyncio.gather(*(parse(item) for item in pending), return_exceptions=True)
+
+        for item, sale in zip(pending, parsed):
+            if isinstance(sale, BaseException):
+                if isinstance(sale, HTTPException):
+                    detail = sale.detail
+                elif isinstance(sale, AdmissionRejected):
+                    detail = str(sale)
+                else:
+                    detail = f"解析に失敗しました: {sale!r}"
+                logger.error(f"[一括処理] client_id={item.client_id} の解析に失敗: {detail}")
+                results[item.client_id] = {
+                    "client_id": item.client_id,
+                    "success": False,
+                    "retryable": _is_retryable_parse_error(sale),
+                    "message": detail
                 }
-            },
-            "required": ["day", "seller", "payment_method", "product_name", "quantity", "unit_price_excl_tax"]
+            else:
+                sales.append(sale)
+                sale_items.append(item)
+
+        # 2. まとめて記帳（書き込みキューで空行検索1回・書き込み1回にまとめる）
+        if sales:
+            try:
+                async with get_admission("sheets").admit(priority):
+                    records = await get_write_queue(store).submit_many(sales)
+            except Exception as e:
+                logger.error(f"[一括処理] 記帳に失敗: {e}", exc_info=True)
+                records = [{"success": False, "message": str(e)}] * len(sales)
+
+            for item, sale, record in zip(sale_items, sales, records):
+                if record.get("success"):
+                    result = {
+                        "client_id": item.client_id,
+                        "success": True,
+                        "retryable": False,
+                        "message": format_success_message(sale, record.get("sheet_name"), record.get("row")),
+                        "queued": record.get("queued", False),
+                        "row": record.get("row"),
+                        "sheet_name": record.get("sheet_name"),
+                        "sale_id": record.get("sale_id"),
+                        "parsed_data": sale
+                    }
+                    batch_results.set(item.client_id, result)
+                else:
+                    result = {
+                        "client_id": item.client_id,
+                        "success": False,
+                        "retryable": True,
+                        "message": record.get("message")
+                    }
+                results[item.client_id] = result
+    finally:
+        for client_id, future in owned.items():
+            batch_in_flight.pop(client_id, None)
+            if not future.done():
+                future.set_result(results.get(client_id) or {
+                    "client_id": client_id,
+                    "success": False,
+                    "retryable": True,
+                    "message": "処理が中断されました"
+                })
+
+    for client_id, future in waiting.items():
+        results[client_id] = await asyncio.shield(future)
+
+    ordered = [results[item.client_id] for item in request.items if item.client_id in results]
+    # 同一client_idの重複を除く
+    unique = list({result["client_id"]: result for result in ordered}.values())
+
+    # 今回記帳した分の確認（再送で前回の結果を返した分は送信済み）
+    for item, sale in zip(sale_items, sales):
+        result = results[item.client_id]
+        if result["success"]:
+            await send_line_confirmation(request.line_user_id, result["message"])
+
+    annotate(batch_succeeded=sum(1 for r in unique if r['success']))
+    return {
+        "success": all(result["success"] for result in unique),
+        "results": unique
+    }
+
+
+def _locate_sale(sale_id: str) -> tuple:
+    """
+    売上IDの店舗・シート・現在の行・C〜Kの値を取得（見つからなければ404）
+
+    索引で行を特定し、その行だけを読む（行がずれていればK列だけを読んで探し直し、索引を更新）。
+    """
+    index = get_sale_index()
+    entry = index.get(sale_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"売上 '{sale_id}' は見つかりません")
+    client = get_sheets_client(entry["store"])
+    try:
+        row, values = client.locate_sale(entry["sheet"], entry["row"], sale_id)
+    except gspread.WorksheetNotFound:
+        row = None
+    if row is None:
+        index.remove(sale_id)
+        raise HTTPException(status_code=404, detail=f"売上 '{sale_id}' はシートから削除されています")
+    if row != entry["row"]:
+        logger.info(f"[売上索引] {sale_id} の行がずれていたため更新しました（{entry['row']} -> {row}）")
+        index.move(sale_id, row)
+    return entry, client, row, values
+
+
+def _sale_response(sale_id: str, sheet_name: str, row: int, values: List) -> Dict:
+    return {"success": True, "sale_id": sale_id, "sheet_name": sheet_name, "row": row, "sale": row_to_sale(values)}
+
+
+def _get_sale(sale_id: str) -> Dict:
+    entry, _, row, values = _locate_sale(sale_id)
+    return _sale_response(sale_id, entry["sheet"], row, values)
+
+
+def _edit_sale(sale_id: str, edits: Dict) -> Dict:
+    index_entry = get_sale_index().get(sale_id)
+    store = index_entry["store"] if index_entry else None
+    # 空行の割り当て（記帳）と同じロックの中で、行の特定から書き換えまでを行う
+    with get_row_lock(store).hold():
+        entry, client, row, values = _locate_sale(sale_id)
+        if not edits:
+            return _sale_response(sale_id, entry["sheet"], row, values)
+
+        sale = {**row_to_sale(values), **edits}
+        if "product_name" in edits or "unit_price_incl_tax" in edits:
+            # 単価・商品名（税率）が変わったら税抜単価を計算し直す
+            sale = apply_tax(sale, resolve_store(entry["store"]))
+        if edits.get("trainer"):
+            try:
+                sale["trainer"] = get_trainer_roster(entry["store"]).resolve(edits["trainer"])
+            except UnknownTrainerError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        # L列（担当トレーナー）まで書き換える（空文字なら担当なしに戻す）
+        new_values = GoogleSheetsClient._build_row_data(
+            sale["day"], sale["seller"], sale["payment_method"], sale["product_name"],
+            sale["quantity"], sale["unit_price_excl_tax"], sale["unit_price_incl_tax"]
+        ) + [sale_id, sale.get("trainer") or ""]
+        # 台帳に記録してからシートを書き換える
+        get_sales_ledger().edited(sale_id, row_to_sale(new_values))
+        client.update_sale_row(entry["sheet"], row, new_values)
+    get_sheet_mirror(entry["store"]).apply_rows(entry["sheet"], [row], [new_values])
+    get_trainer_index().record(entry["store"], client.spreadsheet_id, entry["sheet"],
+                               [{**row_to_sale(new_values), "sale_id": sale_id}])
+    return _sale_response(sale_id, entry["sheet"], row, new_values)
+
+
+def _void_sale(sale_id: str) -> Dict:
+    index_entry = get_sale_index().get(sale_id)
+    store = index_entry["store"] if index_entry else None
+    blank = [""] * (TRAINER_COLUMN - 2)
+    with get_row_lock(store).hold():
+        entry, client, row, values = _locate_sale(sale_id)
+        get_sales_ledger().voided(sale_id)
+        client.update_sale_row(entry["sheet"], row, blank)
+        get_sale_index().remove(sale_id)
+        get_trainer_index().remove(sale_id)
+    get_sheet_mirror(entry["store"]).apply_rows(entry["sheet"], [row], [blank])
+    result = _sale_response(sale_id, entry["sheet"], row, values)
+    result["message"] = f"売上を取り消しました（{entry['sheet']} {row}行目）"
+    return result
+
+
+@app.get("/api/sales/{sale_id}")
+@call_budget(3)
+async def get_sale(sale_id: str) -> Dict:
+    """
+    売上IDで記帳済みの売上を取得
+
+    Returns:
+        dict: {"success": bool, "sale_id": str, "sheet_name": str, "row": int, "sale": dict}
+    """
+    return await asyncio.to_thread(_get_sale, sale_id)
+
+
+@app.patch("/api/sales/{sale_id}")
+@call_budget(4)
+async def edit_sale(sale_id: str, request: SaleEditRequest) -> Dict:
+    """
+    記帳済みの売上を修正（指定した項目だけ。1行分の範囲を1回だけ書き換える）
+
+    Returns:
+        dict: GET /api/sales/{sale_id} と同じ形式（修正後の値）
+    """
+    edits = request.dict(exclude_none=True)
+    result = await asyncio.to_thread(_edit_sale, sale_id, edits)
+    annotate(sale_id=sale_id, edited=sorted(edits))
+    return result
+
+
+@app.delete("/api/sales/{sale_id}")
+@call_budget(4)
+async def void_sale(sale_id: str) -> Dict:
+    """
+    記帳済みの売上を取り消す（行のC列〜L列を空にする）
+
+    Returns:
+        dict: GET /api/sales/{sale_id} と同じ形式（取り消した値）+ "message"
+    """
+    result = await asyncio.to_thread(_void_sale, sale_id)
+    annotate(sale_id=sale_id, voided=True)
+    return result
+
+
+@app.get("/api/trainers/report")
+@call_budget(0)
+async def trainer_report(month: Optional[int] = None, store: Optional[str] = None, rate: Optional[float] = None) -> Dict:
+    """
+    トレーナー別の売上（歩合の集計用）を返す
+
+    記帳・修正・取り消しのたびに更新しているトレーナー索引（TRAINER_INDEX_FILE）を返すだけで、
+    Google Sheetsは読まない。索引に載るのはAPI経由で記帳した売上のみ。
+
+    Args:
+        month: 月（1-12、省略時は今月）
+        store: 店舗ID（省略時はデフォルト店舗）
+        rate: 歩合率（例: 0.1）。指定すると合計（税抜）に掛けた "commission"（切り捨て）を付ける
+
+    Returns:
+        dict: {
+            "success": bool,
+            "sheet_name": str,
+            "trainers": [{"trainer", "count", "subtotal_excl_tax", "subtotal_incl_tax", "commission"}, ...],
+            "unassigned": {"count", "subtotal_excl_tax", "subtotal_incl_tax"}  # 担当なしの売上
+        }
+    """
+    store_config = resolve_store(store)
+    month = month or datetime.now().month
+    if not 1 <= month <= 12:
+        raise HTTPException(status_code=400, detail="month は1〜12で指定してください")
+    store_id = None if get_store_registry().is_default(store) else store
+    sheet_name = month_sheet_name(month)
+    # 今年のスプレッドシートに記帳した売上だけ（前年の同じ月は含めない）
+    report = get_trainer_index().report(store_id, store_config.spreadsheet_id, sheet_name)
+    if rate is not None:
+        for line in report["trainers"]:
+            line["commission"] = int(line["subtotal_excl_tax"] * rate)
+    return {"success": True, "sheet_name": sheet_name, **report}
+
+
+@app.get("/api/ledger/sales")
+@call_budget(0)
+async def ledger_sales(month: Optional[int] = None, store: Optional[str] = None) -> Dict:
+    """
+    売上台帳（SALES_LEDGER_FILE）にある月の売上を返す
+
+    Google Sheetsは読まない（シートの障害中でも使える）。取り消した売上は含まない。
+    "unwritten" はシートへの書き込みが記録されていない件数（python -m src.replay で書き直せる）。
+
+    Args:
+        month: 月（1-12、省略時は今月）
+        store: 店舗ID（省略時はデフォルト店舗）
+
+    Returns:
+        dict: {
+            "success": bool,
+            "sheet_name": str,
+            "count": int,
+            "subtotal_excl_tax": int, "subtotal_incl_tax": int,
+            "unwritten": int,
+            "sales": [{"sale_id", "sale", "sheet", "row", "failed", "recorded_at"}, ...]
         }
+    """
+    store_config = resolve_store(store)
+    month = month or datetime.now().month
+    if not 1 <= month <= 12:
+        raise HTTPException(status_code=400, detail="month は1〜12で指定してください")
+    store_id = None if get_store_registry().is_default(store) else store
+    # 今年のスプレッドシートに記帳した売上だけ（前年の同じ月は含めない）
+    entries = get_sales_ledger().entries(store_id, store_config.spreadsheet_id, month)
+    sales = [
+        {key: entry[key] for key in ("sale_id", "sale", "sheet", "row", "failed", "recorded_at")}
+        for entry in entries
+    ]
+    # 書き込みに失敗した売上は呼び出し元が再送するため、合計に含めない
+    totals = [
+        row_to_sale(ledger_row_values(entry["sale_id"], entry["sale"])) for entry in entries if not entry["failed"]
+    ]
+    return {
+        "success": True,
+        "sheet_name": month_sheet_name(month),
+        "count": len(totals),
+        "subtotal_excl_tax": sum(sale["subtotal_excl_tax"] for sale in totals),
+        "subtotal_incl_tax": sum(sale["subtotal_incl_tax"] for sale in totals),
+        "unwritten": sum(1 for entry in entries if entry["row"] is None and not entry["failed"]),
+        "sales": sales
     }
 
 
+@app.get("/api/export")
+async def export_sales(
+    from_month: Optional[int] = Query(None, alias="from"),
+    to_month: Optional[int] = Query(None, alias="to"),
+    format: str = "csv",
+    store: Optional[str] = None
+):
+    """
+    月度シートの売上をCSV / Parquetで書き出す（ストリーミング）
+
+    各月をC列〜J列（売上IDのK列まで）だけ EXPORT_CHUNK_ROWS 行ずつ読み、EXPORT_CONCURRENCY か月を同時に
+    読みながら、読んだ分から順に送信する。シート全体をメモリに載せないため、期間が長くてもメモリ使用量は一定。
+    読み取りはレスポンスの送信中に行われるため、@call_budget の対象外。
+
+    Args:
+        from_month: 最初の月（省略時は会計年度の開始月 FISCAL_YEAR_START_MONTH）
+        to_month: 最後の月（省略時は会計年度の最終月）。from より前の月なら年をまたぐ
+        format: "csv"（UTF-8 BOM付き）または "parquet"（pyarrow が必要）
+        store: 店舗ID（省略時はデフォルト店舗）
+    """
+    store_config = resolve_store(store)
+    start_month = Config.FISCAL_YEAR_START_MONTH
+    try:
+        months = export_months(
+            from_month or start_month,
+            to_month or (start_month + 10) % 12 + 1,
+            start_month
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    client = await asyncio.to_thread(get_sheets_client, store)
+    try:
+        body = stream_export(
+            client, months, format,
+            chunk_rows=Config.EXPORT_CHUNK_ROWS,
+            concurrency=Config.EXPORT_CONCURRENCY,
+            queue_chunks=Config.EXPORT_QUEUE_CHUNKS,
+            with_sale_ids=Config.SALE_IDS
+        )
+    except ExportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    annotate(export_format=format, export_months=months)
+    filename = f"sales_{store_config.store_id}_{months[0]}-{months[-1]}.{format}"
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_CONTENT_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@app.get("/api/schema")
+async def get_schema(request: Request, store: Optional[str] = None):
+    """
+    Google AI Studio用のFunction Calling JSONスキーマを返す
+
+    Args:
+        store: 店舗ID（顧客名の候補が店舗ごとに変わる。省略時はデフォルト店舗）
+
+    Returns:
+        dict: OpenAPI形式のスキーマ（生成済みのバイト列）
+    """
+    store_config = resolve_store(store)
+    if store_config.customers == KNOWN_CUSTOMERS:
+        return STATIC_ASSETS["/api/schema"].response(request)
+
+    asset = store_schema_assets.get(store_config.store_id)
+    if asset is None:
+        asset = StaticAsset.from_json(build_sale_function_schema(store_config.customers))
+        store_schema_assets[store_config.store_id] = asset
+    return asset.response(request)
+
+
 def run_server(host: str = "0.0.0.0", port: int = None):
     """
     Run the API server
@@ -0,0 +1,467 @@
+"""
+Backfill module
+過去のLINEトーク履歴（エクスポートした .txt）や JSONL をまとめてスプレッドシートに取り込む
+
+    python -m src.backfill chat.txt --year 2024
+    python -m src.backfill sales.jsonl --store shinjuku --concurrency 16 --dry-run
+
+- 入力は1行ずつ読み込む（ファイル全体をメモリに載せない）
+- 解析は正規表現（fast path）を先に試し、解析できないメッセージだけGeminiを並列に呼ぶ。
+  金額が書かれていないメッセージ（雑談など）は解析しない
+- シートに既にある行（同じ日・顧客・決済方法・商品・数量・税抜単価）は書き込まない。
+  同じ内容の売上が複数あっても、シート上の件数を超えた分だけを書き込む
+- chunk_size 件ごとに月度別の一括書き込み（record_sales）を行い、チェックポイントに進捗を保存する。
+  中断しても同じコマンドで続きから再開できる（書き込み後・保存前に中断した分は重複として除外される）
+- 解析できなかったメッセージは <入力>.failed.jsonl に書き出す
+- 書き込む売上は、書き込む前に売上台帳（src/sales_ledger.py）にも記録する
+
+月度シート（「N 月度」）は年を持たないため、年ごとのスプレッドシート（店舗）に --year を指定して取り込む。
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import gspread
+
+from .config import Config
+from .google_sheets import FIRST_DATA_ROW, GoogleSheetsClient, new_sale_id, sale_row_values
+from .row_lock import get_row_lock
+from .sale_index import get_sale_index
+from .sales_ledger import get_sales_ledger
+from .sheet_mirror import _to_number, row_to_sale
+from .stores import StoreConfig, get_store_registry
+from .structured_logging import configure_logging
+from .text_parser import DATE_PATTERN, PRICE_PATTERN, normalize_message, parse_sale_text_regex
+from .trainers import get_trainer_index
+
+logger = logging.getLogger(__name__)
+
+# LINEのトーク履歴: 日付の見出し（例: "2024/12/28(土)"）と メッセージ行（"10:15\t名前\t本文"）
+LINE_DATE_HEADER = re.compile(r"^(\d{4})[/.](\d{1,2})[/.](\d{1,2})\s*[(（][^)）]*[)）]\s*$")
+LINE_MESSAGE = re.compile(r"^(\d{1,2}):(\d{2})\t([^\t]*)\t(.*)$")
+
+# 1回の書き込みにまとめる売上の上限（月度ごと）
+MAX_ROWS_PER_WRITE = 500
+
+# 書き込みに必要な売上の項目（unit_price_incl_tax / unit_price_excl_tax はどちらか一方）
+REQUIRED_FIELDS = ("day", "seller", "payment_method", "product_name")
+
+# 取り込み結果の件数の内訳
+STAT_KEYS = ("messages", "fast_path", "gemini", "structured", "skipped", "other_year",
+             "failed", "duplicates", "written")
+
+
+def read_line_export(path: str) -> Iterator[Dict]:
+    """
+    Stream messages from a LINE chat export (.txt)
+
+    Yields:
+        dict: {"posted_at": datetime, "sender": str, "text": str}
+    """
+    current_date = None
+    message = None
+
+    def finish(message):
+        text = message["text"]
+        # 改行を含むメッセージは "..." で囲まれて出力される
+        if len(text) >= 2 and text.startswith('"') and text.endswith('"'):
+            message["text"] = text[1:-1].replace('""', '"')
+        return message
+
+    with open(path, encoding="utf-8-sig") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            header = LINE_DATE_HEADER.match(line)
+            if header:
+                if message is not None:
+                    yield finish(message)
+                    message = None
+                current_date = tuple(int(value) for value in header.groups())
+                continue
+
+            match = LINE_MESSAGE.match(line)
+            if match and current_date is not None:
+                if message is not None:
+                    yield finish(message)
+                hour, minute, sender, text = match.groups()
+                message = {
+                    "posted_at": datetime(*current_date, int(hour), int(minute)),
+                    "sender": sender,
+                    "text": text
+                }
+            elif message is not None and line:
+                message["text"] += "\n" + line  # 複数行メッセージの続き
+
+    if message is not None:
+        yield finish(message)
+
+
+def _parse_time(value) -> Optional[datetime]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        # LINEのタイムスタンプはミリ秒
+        return datetime.fromtimestamp(value / 1000 if value > 10 ** 11 else value)
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+
+
+def read_jsonl(path: str) -> Iterator[Dict]:
+    """
+    Stream messages or sales from a JSONL file
+
+    1行1件。次のどちらかの形式:
+        {"text": "12/28 PayPalで...", "timestamp": "2024-12-28T10:15:00"}   # メッセージ（data/messages.json と同じキー）
+        {"day": 28, "seller": "...", ..., "month": 12}                       # 解析済みの売上（/api/record_sale と同じキー）
+
+    Yields:
+        dict: {"posted_at": datetime | None, "text": str | None, "sale": dict | None}
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            data = json.loads(line)
+            posted_at = _parse_time(data.get("timestamp") or data.get("date"))
+            if "seller" in data:
+                yield {"posted_at": posted_at, "text": None, "sale": data}
+            else:
+                yield {"posted_at": posted_at, "text": data.get("text") or "", "sale": None}
+
+
+def read_messages(path: str, source_format: str = "auto") -> Iterator[Dict]:
+    """入力ファイルの形式（auto: 拡張子で判定）に応じてメッセージを読み込む"""
+    if source_format == "auto":
+        source_format = "jsonl" if Path(path).suffix in (".jsonl", ".json") else "line"
+    return read_jsonl(path) if source_format == "jsonl" else read_line_export(path)
+
+
+def sale_period(text: str, posted_at: Optional[datetime]) -> Tuple[Optional[int], Optional[int]]:
+    """
+    売上の (年, 月)
+
+    本文に「12/28」のような日付があればその月、なければ投稿日の月。
+    1月に「12/28」の売上を報告した場合などは前年として扱う。
+    """
+    month = posted_at.month if posted_at else None
+    match = DATE_PATTERN.search(text or "")
+    if match and 1 <= int(match.group(1)) <= 12:
+        month = int(match.group(1))
+    if posted_at is None:
+        return None, month
+    year = posted_at.year - 1 if month > posted_at.month else posted_at.year
+    return year, month
+
+
+def row_key(cells: List) -> Tuple:
+    """C〜H列（日・顧客名・決済方法・商品名・数量・単価（税抜））から重複判定用のキーを作る"""
+    day, seller, payment_method, product_name, quantity, unit_price_excl_tax = cells[:6]
+    return (
+        int(_to_number(day)),
+        str(seller).strip(),
+        str(payment_method).strip(),
+        str(product_name).strip(),
+        int(_to_number(quantity)),
+        int(_to_number(unit_price_excl_tax))
+    )
+
+
+def sale_key(sale: Dict) -> Tuple:
+    """売上（record_sales の1件）の重複判定用のキー"""
+    return row_key(GoogleSheetsClient._build_row_data(
+        sale["day"], sale["seller"], sale["payment_method"], sale["product_name"],
+        sale["quantity"], sale["unit_price_excl_tax"], sale.get("unit_price_incl_tax")
+    ))
+
+
+def load_checkpoint(path: str) -> Dict:
+    """チェックポイント（{"position": 次に処理する入力の番号, "stats": {...}}）を読み込む"""
+    if not os.path.exists(path):
+        return {"position": 0, "stats": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(path: str, position: int, stats: Dict):
+    """チェックポイントを保存（書き込み途中で中断しても壊れないよう、一時ファイルから置き換える）"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"position": position, "stats": stats, "saved_at": datetime.now().isoformat()},
+                  f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[List]:
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _parse_with_gemini(text: str, store: StoreConfig) -> Dict:
+    # api_server（FastAPI・Geminiクライアント）は正規表現で解析できないメッセージがあったときだけ読み込む
+    from .api_server import parse_sale_text_with_gemini
+    return parse_sale_text_with_gemini(text, store)
+
+
+class Backfill:
+    """Imports historical messages into month sheets"""
+
+    def __init__(
+        self,
+        client: GoogleSheetsClient,
+        store: StoreConfig,
+        year: Optional[int] = None,
+        concurrency: int = 8,
+        chunk_size: int = 200,
+        checkpoint_path: Optional[str] = None,
+        failed_path: Optional[str] = None,
+        dry_run: bool = False,
+        parse_with_gemini: Callable[[str, StoreConfig], Dict] = _parse_with_gemini
+    ):
+        """
+        Initialize backfill
+
+        Args:
+            client: 書き込み先のSheetsクライアント
+            store: 店舗設定（顧客名・商品名の候補、税率）
+            year: 取り込む年（それ以外の年の売上は書き込まない。None: すべて）
+            concurrency: 並列に解析するメッセージ数（Gemini呼び出しの並列数）
+            chunk_size: 何件ごとに書き込み・チェックポイント保存を行うか
+            checkpoint_path: チェックポイントファイル（None: 保存しない）
+            failed_path: 解析できなかったメッセージの出力先（None: 出力しない）
+            dry_run: True の場合、解析と重複判定のみ行い書き込まない
+            parse_with_gemini: 正規表現で解析できないメッセージの解析（テスト用に差し替え可能）
+        """
+        self.client = client
+        self.store = store
+        self.year = year
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.checkpoint_path = checkpoint_path
+        self.failed_path = failed_path
+        self.dry_run = dry_run
+        self.parse_with_gemini = parse_with_gemini
+        self.stats: Counter = Counter({key: 0 for key in STAT_KEYS})
+        # 月 -> シート上の行のうち、まだ取り込み対象と突き合わせていない行のキー（件数付き）
+        self._unmatched: Dict[int, Counter] = {}
+
+    def parse(self, message: Dict) -> Dict:
+        """
+        Parse one message into a sale
+
+        Returns:
+            dict: {"status": "sale" | "skipped" | "failed", "sale": dict, "month": int, "path": str, "error": str}
+        """
+        sale = message.get("sale")
+        text = message.get("text")
+        posted_at = message.get("posted_at")
+
+        if sale is not None:
+            if not isinstance(sale, dict):
+                return {"status": "failed", "error": f"売上の形式が不正です: {sale!r}"}
+            sale = dict(sale)
+            path = "structured"
+            year, month = sale_period("", posted_at)
+            month = sale.pop("month", None) or month
+            year = sale.pop("year", None) or year
+        else:
+            text = normalize_message(text or "")
+            if not PRICE_PATTERN.search(text):
+                return {"status": "skipped"}  # 金額がないメッセージは売上報告ではない
+            year, month = sale_period(text, posted_at)
+            try:
+                sale = parse_sale_text_regex(text, self.store.customers, self.store.catalog, today=posted_at)
+                path = "fast_path"
+            except ValueError:
+                try:
+                    sale = self.parse_with_gemini(text, self.store)
+                    path = "gemini"
+                except Exception as e:
+                    return {"status": "failed", "error": str(e)}
+
+        if month is None:
+            return {"status": "failed", "error": "月を特定できません（投稿日時がありません）"}
+        if self.year is not None and year is not None and year != self.year:
+            return {"status": "other_year"}
+
+        # JSONLの売上・Geminiの解析結果に項目が欠けていても、取り込み全体は止めずにこのメッセージだけ失敗にする
+        if not isinstance(sale, dict):
+            return {"status": "failed", "error": f"売上の形式が不正です: {sale!r}"}
+        missing = [key for key in REQUIRED_FIELDS if sale.get(key) is None]
+        if sale.get("unit_price_incl_tax") is None and sale.get("unit_price_excl_tax") is None:
+            missing.append("unit_price_incl_tax")
+        if missing:
+            return {"status": "failed", "error": f"売上の項目がありません: {', '.join(missing)}"}
+        if sale.get("unit_price_excl_tax") is None:
+            try:
+                sale["unit_price_excl_tax"] = self.store.price_excl_tax(
+                    sale.get("product_name"), sale["unit_price_incl_tax"]
+                )
+            except (TypeError, ValueError) as e:
+                return {"status": "failed", "error": f"税抜単価を計算できません: {e}"}
+        sale.setdefault("quantity", 1)
+        return {"status": "sale", "sale": sale, "month": month, "path": path}
+
+    def _unmatched_rows(self, month: int) -> Counter:
+        """シート上の既存行のキー（月ごとに初回だけ読み込む）"""
+        rows = self._unmatched.get(month)
+        if rows is None:
+            try:
+                values = self.client.get_month_values(month)
+            except gspread.WorksheetNotFound:
+                values = []
+            rows = Counter(
+                row_key(row[2:8]) for row in values[FIRST_DATA_ROW - 1:]
+                if len(row) >= 8 and row[2]
+            )
+            self._unmatched[month] = rows
+        return rows
+
+    def _dedupe(self, month: int, sales: List[Dict]) -> List[Dict]:
+        """シートに既にある売上を除く（同じ内容の売上は、シート上の件数を超えた分だけ残す）"""
+        unmatched = self._unmatched_rows(month)
+        new_sales = []
+        for sale in sales:
+            key = sale_key(sale)
+            if unmatched[key] > 0:
+                unmatched[key] -= 1
+                self.stats["duplicates"] += 1
+            else:
+                new_sales.append(sale)
+        return new_sales
+
+    def _write(self, by_month: Dict[int, List[Dict]]):
+        # デフォルト店舗は None として扱う（書き込みキューと同じ行ロック・台帳・索引のキーにする）
+        store_key = None if get_store_registry().is_default(self.store.store_id) else self.store.store_id
+        for month in sorted(by_month):
+            sales = self._dedupe(month, by_month[month])
+            if self.dry_run:
+                self.stats["would_write"] += len(sales)
+                continue
+            for batch in _chunks(sales, MAX_ROWS_PER_WRITE):
+                batch = [{**sale, "sale_id": sale.get("sale_id") or new_sale_id()} for sale in batch]
+                get_sales_ledger().record(store_key, self.client.spreadsheet_id, month, batch)
+                # 稼働中のサーバーの書き込みと空行の割り当てが衝突しないよう、店舗のロックの中で書き込む
+                try:
+                    with get_row_lock(store_key).hold():
+                        result = self.client.record_sales(batch, month=month)
+                except Exception:
+                    # CircuitOpenError などで中断した売上を失敗として記録する（未記帳のまま残すと、
+                    # replay とチェックポイントからの再開の両方で書き込まれて二重になる）
+                    get_sales_ledger().failed(sale["sale_id"] for sale in batch)
+                    raise
+                if not result["success"]:
+                    get_sales_ledger().failed(sale["sale_id"] for sale in batch)
+                    raise RuntimeError(f"{month} 月度への書き込みに失敗しました: {result['message']}")
+                get_sales_ledger().written(result["sheet_name"], result["rows"], [sale["sale_id"] for sale in batch])
+                sale_ids = result.get("sale_ids") or [None] * len(batch)
+                if result.get("sale_ids"):
+                    get_sale_index().add(store_key, result["sheet_name"], result["rows"], sale_ids)
+                # トレーナー別の集計も書き込みキューと同じく差分で更新する
+                get_trainer_index().record(store_key, self.client.spreadsheet_id, result["sheet_name"], [
+                    {**row_to_sale(sale_row_values(GoogleSheetsClient._build_row_data(
+                        sale["day"], sale["seller"], sale["payment_method"], sale["product_name"],
+                        sale["quantity"], sale["unit_price_excl_tax"], sale.get("unit_price_incl_tax")
+                    ), sale_id, sale.get("trainer"))), "sale_id": sale_id}
+                    for sale, sale_id in zip(batch, sale_ids)
+                ])
+                self.stats["written"] += len(batch)
+
+    def _record_failure(self, position: int, message: Dict, error: str):
+        if not self.failed_path:
+            return
+        with open(self.failed_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "position": position,
+                "posted_at": message["posted_at"].isoformat() if message.get("posted_at") else None,
+                "text": message.get("text"),
+                "sale": message.get("sale"),
+                "error": error
+            }, ensure_ascii=False) + "\n")
+
+    def run(self, messages: Iterable[Dict], start: int = 0) -> Dict:
+        """
+        Import messages (resuming after the first `start` messages)
+
+        Returns:
+            dict: 件数の内訳（STAT_KEYS。dry_run では written の代わりに would_write）
+        """
+        numbered = ((position, message) for position, message in enumerate(messages) if position >= start)
+        position = start
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="backfill") as executor:
+            for chunk in _chunks(numbered, self.chunk_size):
+                by_month = defaultdict(list)
+                results = executor.map(lambda item: self.parse(item[1]), chunk)
+                for (item_position, message), result in zip(chunk, results):
+                    self.stats["messages"] += 1
+                    status = result["status"]
+                    if status == "sale":
+                        self.stats[result["path"]] += 1
+                        by_month[result["month"]].append(result["sale"])
+                    else:
+                        self.stats[status] += 1
+                        if status == "failed":
+                            self._record_failure(item_position, message, result["error"])
+
+                self._write(by_month)
+                position = chunk[-1][0] + 1
+                if self.checkpoint_path and not self.dry_run:
+                    save_checkpoint(self.checkpoint_path, position, dict(self.stats))
+                logger.info(f"[取り込み] {position} 件目まで処理: {dict(self.stats)}")
+        return dict(self.stats)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Import a LINE chat export or a JSONL file from the command line"""
+    parser = argparse.ArgumentParser(description="過去の売上メッセージをスプレッドシートに取り込む")
+    parser.add_argument("input", help="LINEのトーク履歴（.txt）または JSONL")
+    parser.add_argument("--format", choices=["auto", "line", "jsonl"], default="auto", help="入力形式")
+    parser.add_argument("--store", default=None, help="店舗ID（省略時はデフォルト店舗）")
+    parser.add_argument("--year", type=int, default=None, help="取り込む年（それ以外の年の売上は書き込まない）")
+    parser.add_argument("--concurrency", type=int, default=8, help="Geminiで並列に解析する件数")
+    parser.add_argument("--chunk-size", type=int, default=200, help="何件ごとに書き込み・チェックポイント保存を行うか")
+    parser.add_argument("--checkpoint", default=None, help="チェックポイントファイル（省略時は <入力>.checkpoint.json）")
+    parser.add_argument("--restart", action="store_true", help="チェックポイントを無視して最初から取り込む")
+    parser.add_argument("--dry-run", action="store_true", help="解析と重複判定のみ行い、書き込まない")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+
+    from .sheets_service import get_sheets_client
+
+    store = get_store_registry().get(args.store)
+    checkpoint_path = args.checkpoint or f"{args.input}.checkpoint.json"
+    checkpoint = {"position": 0, "stats": {}} if args.restart else load_checkpoint(checkpoint_path)
+    if checkpoint["position"]:
+        logger.info(f"[取り込み再開] {checkpoint['position']} 件目から再開します（{checkpoint_path}）")
+
+    backfill = Backfill(
+        get_sheets_client(args.store),
+        store,
+        year=args.year,
+        concurrency=args.concurrency,
+        chunk_size=args.chunk_size,
+        checkpoint_path=checkpoint_path,
+        failed_path=f"{args.input}.failed.jsonl",
+        dry_run=args.dry_run
+    )
+    backfill.stats.update(checkpoint.get("stats", {}))
+    stats = backfill.run(read_messages(args.input, args.format), start=checkpoint["position"])
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
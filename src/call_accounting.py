@@ -0,0 +1,176 @@
+"""
+Sheets API call accounting module
+リクエスト（エンドポイント）単位でGoogle Sheets API呼び出しを記録し、上限（バジェット）を検査する
+
+- track_calls(): 呼び出しを集計するスコープを開始（HTTPミドルウェア・MCPツールで使用）
+- call_budget(): エンドポイント関数に呼び出し回数の上限を宣言するデコレータ
+- record_call(): GoogleSheetsClient._call から呼ばれ、現在のスコープに1回分を加算
+
+上限を超えた場合、SHEETS_CALL_BUDGET_MODE=warn（デフォルト）なら警告ログのみ、
+raise なら CallBudgetExceeded を送出する（テストで使用）。
+"""
+
+import contextvars
+import functools
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Optional
+
+from .config import Config
+from .metrics import REGISTRY, Counter as MetricCounter
+
+logger = logging.getLogger(__name__)
+
+# エンドポイント別のSheets API呼び出し回数（リクエスト終了時に加算）
+ENDPOINT_SHEETS_CALLS = REGISTRY.register(MetricCounter(
+    "limit_endpoint_sheets_api_calls_total", "Google Sheets API calls by originating endpoint", ["endpoint", "method"]
+))
+# バジェット超過回数
+BUDGET_EXCEEDED = REGISTRY.register(MetricCounter(
+    "limit_sheets_call_budget_exceeded_total", "Requests that exceeded their Sheets API call budget", ["endpoint"]
+))
+
+# デバッグ用レスポンスヘッダー名
+CALLS_HEADER = "X-Sheets-Calls"
+
+
+class CallBudgetExceeded(RuntimeError):
+    """Raised in raise mode when a scope uses more Sheets API calls than declared"""
+
+
+class CallLedger:
+    """Sheets API calls made on behalf of one request"""
+
+    def __init__(self, endpoint: str, budget: Optional[int] = None):
+        """
+        Initialize call ledger
+
+        Args:
+            endpoint: 呼び出し元（例: "/api/record_sale", "mcp.record_gym_sale"）
+            budget: 許容するAPI呼び出し回数の上限（Noneなら無制限）
+        """
+        self.endpoint = endpoint
+        self.budget = budget
+        self.calls: Counter = Counter()
+        self._warned = False
+        self.lock = Lock()
+
+    @property
+    def total(self) -> int:
+        with self.lock:
+            return sum(self.calls.values())
+
+    def add(self, method: str, count: int = 1):
+        """Record calls and check the budget"""
+        with self.lock:
+            self.calls[method] += count
+        self._check()
+
+    def merge(self, other: "CallLedger"):
+        """他のスコープ（書き込みキューのバッチ等）で発生した呼び出しを加算"""
+        with other.lock:
+            calls = dict(other.calls)
+        for method, count in calls.items():
+            self.add(method, count)
+
+    def _check(self):
+        if self.budget is None or self.total <= self.budget:
+            return
+        message = (f"[API呼び出し上限超過] {self.endpoint}: {self.total} 回 "
+                   f"(上限 {self.budget} 回) {dict(self.calls)}")
+        if Config.SHEETS_CALL_BUDGET_MODE == "raise":
+            raise CallBudgetExceeded(message)
+        if not self._warned:
+            self._warned = True
+            BUDGET_EXCEEDED.inc(endpoint=self.endpoint)
+            logger.warning(message)
+
+    def header_value(self) -> str:
+        """X-Sheets-Calls ヘッダー値（例: "total=4; get_all_values=1; update=1"）"""
+        with self.lock:
+            parts = [f"total={sum(self.calls.values())}"]
+            parts += [f"{method}={count}" for method, count in sorted(self.calls.items())]
+        if self.budget is not None:
+            parts.append(f"budget={self.budget}")
+        return "; ".join(parts)
+
+    def as_dict(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.calls)
+
+
+_current_ledger: contextvars.ContextVar[Optional[CallLedger]] = contextvars.ContextVar(
+    "sheets_call_ledger", default=None
+)
+
+
+def current_ledger() -> Optional[CallLedger]:
+    """Ledger of the request being processed (None outside a tracked scope)"""
+    return _current_ledger.get()
+
+
+def record_call(method: str):
+    """Count one Sheets API call against the current scope"""
+    ledger = _current_ledger.get()
+    if ledger is not None:
+        ledger.add(method)
+
+
+@contextmanager
+def track_calls(endpoint: str, budget: Optional[int] = None):
+    """
+    Start a call accounting scope
+
+    スコープ終了時にエンドポイント別の合計をメトリクスへ加算する。
+    すでにスコープ内の場合は新しいスコープを作らず、既存のものを返す。
+    """
+    existing = _current_ledger.get()
+    if existing is not None:
+        if budget is not None:
+            existing.budget = budget
+        yield existing
+        return
+
+    ledger = CallLedger(endpoint, budget)
+    token = _current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _current_ledger.reset(token)
+        for method, count in ledger.as_dict().items():
+            ENDPOINT_SHEETS_CALLS.inc(count, endpoint=ledger.endpoint, method=method)
+
+
+@contextmanager
+def use_ledger(ledger: Optional[CallLedger]):
+    """別スレッド・別タスクで指定のledgerに記録する"""
+    token = _current_ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _current_ledger.reset(token)
+
+
+def call_budget(max_calls: int):
+    """
+    Declare the maximum Sheets API calls for an endpoint
+
+    Example:
+        @app.post("/api/record_sale")
+        @call_budget(4)
+        async def record_sale(...): ...
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            ledger = _current_ledger.get()
+            if ledger is not None:
+                ledger.budget = max_calls
+            return await func(*args, **kwargs)
+
+        wrapper.sheets_call_budget = max_calls
+        return wrapper
+
+    return decorator
@@ -0,0 +1,174 @@
+"""
+Circuit breaker module
+上流（Google Sheets）の障害時に、タイムアウトを待たずにすぐ失敗させるサーキットブレーカー
+
+- closed: 通常どおり呼び出す。連続 failure_threshold 回失敗したら open にする
+- open: 呼び出さずに CircuitOpenError を送出する（数ミリ秒で失敗するため、障害中も応答が詰まらない）
+- half_open: open から reset_seconds 経過後、1回だけ試しに呼び出す。成功すれば closed、失敗すれば open に戻す
+
+状態は limit_circuit_breaker_state（0: closed, 1: half_open, 2: open）として /metrics に出力する。
+"""
+
+import logging
+import math
+import time
+from threading import Lock
+from typing import Callable, Dict, Optional
+
+from .config import Config
+from .metrics import REGISTRY, Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# 上流ごとのブレーカーの状態
+CIRCUIT_STATE = REGISTRY.register(Gauge(
+    "limit_circuit_breaker_state", "Circuit breaker state (0: closed, 1: half-open, 2: open)", ["upstream"]
+))
+# open の間に呼び出さずに失敗させた回数
+CIRCUIT_REJECTIONS = REGISTRY.register(Counter(
+    "limit_circuit_breaker_rejections_total", "Calls rejected by an open circuit breaker", ["upstream"]
+))
+# 状態の遷移回数
+CIRCUIT_TRANSITIONS = REGISTRY.register(Counter(
+    "limit_circuit_breaker_transitions_total", "Circuit breaker state transitions", ["upstream", "state"]
+))
+
+
+class CircuitOpenError(RuntimeError):
+    """The upstream is considered down; the call was not made"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} は一時的に利用できません（{retry_after:.0f} 秒後に再試行してください）")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open trial"""
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize circuit breaker
+
+        Args:
+            name: 上流名（メトリクスのラベル）
+            failure_threshold: open にする連続失敗回数
+            reset_seconds: open から試しの呼び出しを許すまでの秒数
+            clock: 現在時刻を返す関数（テスト用）
+        """
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.lock = Lock()
+        CIRCUIT_STATE.set(_STATE_VALUES[CLOSED], upstream=name)
+
+    def _set_state(self, state: str):
+        """状態を変更してメトリクスに反映（lock を保持して呼ぶ）"""
+        if state == self.state:
+            return
+        logger.warning(f"[サーキットブレーカー] {self.name}: {self.state} -> {state}")
+        self.state = state
+        CIRCUIT_STATE.set(_STATE_VALUES[state], upstream=self.name)
+        CIRCUIT_TRANSITIONS.inc(upstream=self.name, state=state)
+
+    def retry_after(self) -> float:
+        """試しの呼び出しが許されるまでの秒数（closed なら0）"""
+        with self.lock:
+            if self.state != OPEN:
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_seconds - self.clock())
+
+    @property
+    def is_open(self) -> bool:
+        """呼び出しても拒否される状態か（open かつ試しの呼び出しをまだ許さない、または試し中）"""
+        with self.lock:
+            if self.state == OPEN:
+                return self.clock() - self.opened_at < self.reset_seconds
+            return self.state == HALF_OPEN and self._trial_in_flight
+
+    def before_call(self):
+        """
+        呼び出し前に確認する
+
+        Raises:
+            CircuitOpenError: open（または他の呼び出しが試し中の half_open）
+        """
+        with self.lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and self.clock() - self.opened_at >= self.reset_seconds:
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            # half_open で他の呼び出しが試し中なら、結果はすぐ出るので短く待たせる
+            retry_after = 1.0 if self.state == HALF_OPEN else self.opened_at + self.reset_seconds - self.clock()
+        CIRCUIT_REJECTIONS.inc(upstream=self.name)
+        raise CircuitOpenError(self.name, max(0.0, retry_after))
+
+    def record_success(self):
+        """呼び出しが成功した（half_open なら closed に戻す）"""
+        with self.lock:
+            self.failures = 0
+            self._trial_in_flight = False
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        """呼び出しが失敗した（連続失敗が閾値に達するか、試しの呼び出しが失敗したら open）"""
+        with self.lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+                self._set_state(OPEN)
+
+    def reset(self):
+        """closed に戻す（テスト用）"""
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+            self._set_state(CLOSED)
+
+
+# 上流名 -> ブレーカー（プロセス内で共有。店舗が違っても上流は同じ）
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = Lock()
+
+
+def get_breaker(name: str = "sheets") -> CircuitBreaker:
+    """Get or create the shared circuit breaker of an upstream"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    name,
+                    failure_threshold=Config.SHEETS_BREAKER_FAILURES,
+                    reset_seconds=Config.SHEETS_BREAKER_RESET_SECONDS
+                )
+                _breakers[name] = breaker
+    return breaker
+
+
+def retry_after_header(error: CircuitOpenError) -> Dict[str, str]:
+    """503応答に付ける Retry-After ヘッダー（整数秒、最低1秒）"""
+    return {"Retry-After": str(max(1, math.ceil(error.retry_after)))}
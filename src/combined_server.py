@@ -0,0 +1,100 @@
+"""
+Combined ASGI server
+REST API・LINE Webhook・MCP（SSE）を1つのuvicornプロセスで提供する
+
+3つのアプリが同一プロセスで動くため、Sheetsクライアント・書き込みキュー・
+シートミラー・Geminiモデルはすべて共有される（sheets_service / api_server のシングルトン）。
+
+マウント構成:
+- /         REST API（api_server.app）
+- /line     LINE Webhook（webhook_server.app、例: /line/webhook）
+- /mcp      MCP SSE（例: /mcp/sse）
+
+ヘルスチェック: /livez（プロセスのみ）・/readyz（キャッシュ済みの上流接続状態）
+
+ワーカーは1プロセスに固定する（WEB_CONCURRENCY > 1 は警告して1にする）。一括記帳の冪等性
+（batch_results / batch_in_flight）・売上プレビューのトークン・LINEの返信トークンはプロセス内にしか
+ないため、複数ワーカーでは再送や確定が別のワーカーに届くと二重記帳・期限切れになる。
+これらを共有ストアに移すまでは、同時実行数はワーカー内のスレッド・非同期処理で確保する。
+"""
+
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.routing import Mount
+
+from .api_server import app as api_app, lifespan as api_lifespan
+from .config import Config
+from .mcp_server import mcp
+
+logger = logging.getLogger(__name__)
+
+
+def create_app() -> Starlette:
+    """
+    Build the combined ASGI application
+
+    Returns:
+        Starlette: REST API・Webhook・MCPをマウントしたアプリ
+    """
+    routes = []
+    warm_ups = []
+
+    if Config.LINE_CHANNEL_SECRET:
+        from .webhook_server import app as webhook_app, warm_up as webhook_warm_up
+        routes.append(Mount("/line", app=webhook_app))
+        warm_ups.append(webhook_warm_up)
+    else:
+        logger.warning("[統合サーバー] LINE_CHANNEL_SECRET が未設定のため /line（Webhook）はマウントしません")
+
+    routes.append(Mount("/mcp", app=mcp.sse_app("/mcp")))
+
+    # REST APIは "/" 配下すべてを受けるため最後にマウント
+    routes.append(Mount("/", app=api_app))
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # マウントしたアプリのlifespanは実行されないため、REST APIの起動・終了処理をここで行う
+        async with api_lifespan(app):
+            # linebot SDKの読み込みは最初のWebhookを待たずにバックグラウンドで済ませる
+            tasks = [asyncio.create_task(asyncio.to_thread(warm_up)) for warm_up in warm_ups]
+            yield
+            for task in tasks:
+                task.cancel()
+
+    return Starlette(routes=routes, lifespan=lifespan)
+
+
+app = create_app()
+
+
+def run_server(host: str = "0.0.0.0", port: int = None):
+    """
+    Run the combined server (always one worker process)
+
+    Args:
+        host: Host to bind to
+        port: Port to bind to (defaults to PORT env var or 8080)
+    """
+    import uvicorn
+
+    if port is None:
+        port = int(os.getenv("PORT", 8080))
+
+    # Validate configuration
+    Config.validate()
+    logger.info("Configuration validated successfully")
+
+    workers = int(os.getenv("WEB_CONCURRENCY", 1))
+    if workers > 1:
+        logger.warning(f"[統合サーバー] WEB_CONCURRENCY={workers} は指定できません。1ワーカーで起動します"
+                       "（一括記帳の冪等性・売上プレビュー・返信トークンがプロセス内にしかないため）")
+
+    logger.info(f"Starting combined server on {host}:{port}")
+    uvicorn.run(app, host=host, port=port)
+
+if __name__ == "__main__":
+    run_server()
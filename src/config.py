@@ -7,10 +7,23 @@ import os
 import json
 import base64
 from pathlib import Path
-from dotenv import load_dotenv
 
-# Load environment variables from .env file
-load_dotenv()
+
+def _load_env_file():
+    """
+    Load environment variables from .env file
+
+    .env があるとき（ローカル開発）だけ python-dotenv を読み込む。
+    クラウド環境（.envなし）では探索・インポート自体を省き、起動を速くする。
+    """
+    for candidate in (Path.cwd() / ".env", Path(__file__).resolve().parent.parent / ".env"):
+        if candidate.is_file():
+            from dotenv import load_dotenv
+            load_dotenv(candidate)
+            return
+
+
+_load_env_file()
 
 
 class Config:
@@ -19,16 +32,130 @@ class Config:
     # LINE Messaging API
     LINE_CHANNEL_ACCESS_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
     LINE_CHANNEL_SECRET = os.getenv("LINE_CHANNEL_SECRET")
+    # 返信トークンを使える時間（秒）。過ぎたらプッシュメッセージで送る
+    LINE_REPLY_TOKEN_TTL_SECONDS = float(os.getenv("LINE_REPLY_TOKEN_TTL_SECONDS", "50"))
+    # 同じユーザーへの記帳確認をまとめて1回の返信にする待ち時間（秒）
+    LINE_CONFIRMATION_WINDOW_SECONDS = float(os.getenv("LINE_CONFIRMATION_WINDOW_SECONDS", "1.0"))
 
     # Google Sheets API
     GOOGLE_SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
     SERVICE_ACCOUNT_FILE = os.getenv("SERVICE_ACCOUNT_FILE")
 
+    # Multi-store: 店舗ID -> スプレッドシート等の対応を記述したJSON（未設定なら GOOGLE_SHEET_ID の1店舗）
+    STORES_FILE = os.getenv("STORES_FILE")
+    # store パラメータを省略したときの店舗ID
+    DEFAULT_STORE_ID = os.getenv("DEFAULT_STORE_ID", "default")
+    # 同時に保持する店舗ごとのSheetsクライアント・書き込みキューの上限（超えたら最も使われていない店舗から破棄）
+    MAX_ACTIVE_STORES = int(os.getenv("MAX_ACTIVE_STORES", "8"))
+    # この秒数使われなかった店舗のクライアント・書き込みキューは破棄
+    STORE_IDLE_SECONDS = float(os.getenv("STORE_IDLE_SECONDS", "1800"))
+
     # Gemini API
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    # 試す順のモデル（カンマ区切り）。"regex" はGeminiを使わない正規表現による解析（最後の手段）
+    GEMINI_MODEL_CHAIN = [
+        name.strip() for name in
+        os.getenv("GEMINI_MODEL_CHAIN", "gemini-2.5-flash,gemini-2.5-flash-lite,regex").split(",")
+        if name.strip()
+    ]
+    GEMINI_MODELS = [name for name in GEMINI_MODEL_CHAIN if name != "regex"] or ["gemini-2.5-flash"]
+    GEMINI_REGEX_FALLBACK = "regex" in GEMINI_MODEL_CHAIN
+    # 1回の呼び出しの期限と、リトライ・フォールバックを含めた全体の期限（秒）
+    GEMINI_DEADLINE_SECONDS = float(os.getenv("GEMINI_DEADLINE_SECONDS", "8"))
+    GEMINI_TOTAL_DEADLINE_SECONDS = float(os.getenv("GEMINI_TOTAL_DEADLINE_SECONDS", "15"))
+    # 1モデルあたりのリトライ回数
+    GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "1"))
+    # true: 応答がp90を超えたら同じリクエストをもう1本送る（API呼び出しは最大2倍）
+    GEMINI_HEDGE = os.getenv("GEMINI_HEDGE", "false").lower() == "true"
+
+    # Sale IDs
+    # true: 売上行のK列（非表示）に売上IDを書き込み、/api/sales/{id} で参照・修正・取り消しできるようにする
+    # テンプレートのK列が空いている必要があるため、デフォルトは無効
+    SALE_IDS = os.getenv("SALE_IDS", "false").lower() == "true"
+    # 売上ID -> シート・行 の索引（追記のみのJSON Lines。空ならメモリ上のみ）
+    SALE_INDEX_FILE = os.getenv("SALE_INDEX_FILE", "data/sale_index.jsonl")
+
+    # Sales ledger
+    # 売上イベントの台帳（追記のみのJSON Lines。Sheetsに書き込む前に記録する売上の正本。空ならメモリ上のみ）
+    SALES_LEDGER_FILE = os.getenv("SALES_LEDGER_FILE", "data/sales_ledger.jsonl")
+
+    # Trainers
+    # 月度シートのM列（トレーナー名簿）を読み直す間隔（秒）。記帳のたびには読まない
+    TRAINER_ROSTER_TTL_SECONDS = float(os.getenv("TRAINER_ROSTER_TTL_SECONDS", "600"))
+    # トレーナー別の売上集計の索引（追記のみのJSON Lines。空ならメモリ上のみ）
+    TRAINER_INDEX_FILE = os.getenv("TRAINER_INDEX_FILE", "data/trainer_index.jsonl")
+
+    # Export（GET /api/export）
+    # 1回の読み取りの行数・同時に読む月の数・月ごとに先読みするチャンク数
+    EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+    EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "4"))
+    EXPORT_QUEUE_CHUNKS = int(os.getenv("EXPORT_QUEUE_CHUNKS", "2"))
+
+    # Preview / commit
+    # /api/preview のコミットトークンの有効期限（秒）
+    PREVIEW_TTL_SECONDS = float(os.getenv("PREVIEW_TTL_SECONDS", "600"))
 
     # Logging
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    # ログの形式: json（1行1オブジェクト）/ text
+    LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+    # 入力テキスト・解析結果などの詳細ログを出力する割合（0〜1。DEBUGレベルでは常に出力）
+    LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+    # 詳細ログの顧客名・ユーザーID・本文をマスクするか
+    LOG_REDACT = os.getenv("LOG_REDACT", "true").lower() == "true"
+
+    # Profiling（どちらも未設定ならプロファイラのミドルウェアを登録しない）
+    # X-Profile ヘッダーにこの値を付けたリクエストをプロファイルする（/api/admin/profiles の認証にも使う）
+    PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+    # ヘッダーなしでプロファイルするリクエストの割合（0〜1）
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    # プロファイルの保存先・保持する件数・スタックを採取する間隔（ミリ秒）
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "data/profiles")
+    PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
+    PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+
+    # Sheets API call accounting
+    # warn: 上限超過時に警告ログ / raise: 例外（テスト用）
+    SHEETS_CALL_BUDGET_MODE = os.getenv("SHEETS_CALL_BUDGET_MODE", "warn").lower()
+    # true にするとレスポンスに X-Sheets-Calls ヘッダー（API呼び出し内訳）を付与
+    SHEETS_CALLS_HEADER = os.getenv("SHEETS_CALLS_HEADER", "false").lower() == "true"
+
+    # Sheets write strategy
+    # scan: 全セルを読んで空行を探して書き込む（途中の空行も埋める）
+    # append: values.append（OVERWRITE）で表の末尾に追記し、読み取りを行わない
+    SHEETS_WRITE_STRATEGY = os.getenv("SHEETS_WRITE_STRATEGY", "scan").lower()
+    # append時に書き込まれてよい最終行（表のデータ領域の最終行）。append ではこれが必須
+    # （0 のままではフッター・数式行の下への書き込みを検出できないため、起動時にエラー・書き込みは scan 方式）
+    SHEETS_APPEND_MAX_ROW = int(os.getenv("SHEETS_APPEND_MAX_ROW", "0"))
+
+    # Sheets API の接続・応答待ちのタイムアウト（秒。gspreadの既定は無制限）
+    SHEETS_CONNECT_TIMEOUT_SECONDS = float(os.getenv("SHEETS_CONNECT_TIMEOUT_SECONDS", "3.05"))
+    SHEETS_READ_TIMEOUT_SECONDS = float(os.getenv("SHEETS_READ_TIMEOUT_SECONDS", "10"))
+    # サーキットブレーカー: 連続でこの回数失敗したら呼び出しを止め、この秒数後に1回だけ試す
+    SHEETS_BREAKER_FAILURES = int(os.getenv("SHEETS_BREAKER_FAILURES", "5"))
+    SHEETS_BREAKER_RESET_SECONDS = float(os.getenv("SHEETS_BREAKER_RESET_SECONDS", "30"))
+    # ブレーカーが開いている間の売上を保留するファイル（追記のみのJSON Lines。空なら保留せず503を返す）
+    SHEETS_OUTBOX_FILE = os.getenv("SHEETS_OUTBOX_FILE", "data/sales_outbox.jsonl")
+    # 保留中の売上を記帳し直せるか確認する間隔（秒）
+    SHEETS_OUTBOX_DRAIN_INTERVAL_SECONDS = float(os.getenv("SHEETS_OUTBOX_DRAIN_INTERVAL_SECONDS", "5"))
+
+    # Admission control: 上流ごとの同時実行数・待ち行列の長さ・待ち時間の上限（超えたら429）
+    ADMISSION_GEMINI_CONCURRENCY = int(os.getenv("ADMISSION_GEMINI_CONCURRENCY", "16"))
+    ADMISSION_SHEETS_CONCURRENCY = int(os.getenv("ADMISSION_SHEETS_CONCURRENCY", "16"))
+    ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "128"))
+    ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "10"))
+
+    # シート一覧（シート名 -> Worksheet）のキャッシュを取り直す間隔（秒）
+    SHEET_INDEX_TTL_SECONDS = float(os.getenv("SHEET_INDEX_TTL_SECONDS", "3600"))
+    # 月末の何日前から翌月の月度シートを事前作成するか
+    SHEET_PROVISION_LEAD_DAYS = int(os.getenv("SHEET_PROVISION_LEAD_DAYS", "7"))
+    # 月度シートの事前作成を確認する間隔（秒、0で無効）
+    SHEET_PROVISION_INTERVAL_SECONDS = float(os.getenv("SHEET_PROVISION_INTERVAL_SECONDS", "21600"))
+    # 会計年度の開始月（一括作成 --fiscal-year で使用）
+    FISCAL_YEAR_START_MONTH = int(os.getenv("FISCAL_YEAR_START_MONTH", "1"))
+
+    # Readiness (/readyz): 上流の接続状態をバックグラウンドで確認する間隔（秒）
+    READINESS_INTERVAL_SECONDS = float(os.getenv("READINESS_INTERVAL_SECONDS", "60"))
 
     @classmethod
     def get_google_credentials(cls):
@@ -74,6 +201,9 @@ class Config:
             "GOOGLE_SHEET_ID",
             "GEMINI_API_KEY"
         ]
+        if cls.STORES_FILE:
+            # 複数店舗構成ではスプレッドシートIDは STORES_FILE に記述する
+            required_vars.remove("GOOGLE_SHEET_ID")
 
         missing_vars = [var for var in required_vars if not getattr(cls, var)]
 
@@ -88,3 +218,9 @@ class Config:
             cls.get_google_credentials()
         except ValueError as e:
             raise ValueError(f"Google credentials validation failed: {e}")
+
+        if cls.SHEETS_WRITE_STRATEGY == "append" and cls.SHEETS_APPEND_MAX_ROW <= 0:
+            raise ValueError(
+                "SHEETS_WRITE_STRATEGY=append requires SHEETS_APPEND_MAX_ROW "
+                "(the last data row of the month sheet template, above any footer)"
+            )
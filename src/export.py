@@ -0,0 +1,250 @@
+"""
+Sales export module
+月度シートの売上をCSV / Parquetで書き出す（GET /api/export）
+
+- 各月度シートはC列〜J列（売上IDがあればK列まで）を EXPORT_CHUNK_ROWS 行ずつ読む（get_all_values は使わない）
+- 複数の月は EXPORT_CONCURRENCY 本まで同時に読み、出力は月の順に並べる
+- 読んだ分から順にクライアントへ送る。月ごとのキューは EXPORT_QUEUE_CHUNKS 件までしか溜めないため、
+  メモリ使用量は期間の長さによらず一定（同時に読む月数 × キューの長さ × チャンク）
+
+Parquetは任意依存（pyarrow）。未インストールなら ExportFormatError を送出する。
+"""
+
+import csv
+import io
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List
+
+import gspread
+
+from .google_sheets import GoogleSheetsClient, SALE_ID_COLUMN, fiscal_year_months
+from .sheet_mirror import _to_number
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = [
+    "month", "day", "seller", "payment_method", "product_name", "quantity",
+    "unit_price_excl_tax", "subtotal_excl_tax", "subtotal_incl_tax", "sale_id"
+]
+
+CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+_DONE = object()
+
+
+class ExportFormatError(ValueError):
+    """Unsupported export format (or its optional dependency is missing)"""
+
+
+def export_months(from_month: int, to_month: int, start_month: int = 1) -> List[int]:
+    """
+    from_month から to_month までの月（会計年度の順。例: 4〜3 なら 4,5,…,12,1,2,3）
+
+    Raises:
+        ValueError: 1〜12以外の月
+    """
+    for month in (from_month, to_month):
+        if not 1 <= month <= 12:
+            raise ValueError(f"月は1〜12で指定してください: {month}")
+    months = fiscal_year_months(start_month)
+    first, last = months.index(from_month), months.index(to_month)
+    if first <= last:
+        return months[first:last + 1]
+    # 会計年度をまたぐ指定（例: 開始月が1で 11〜2）はカレンダーの順につなぐ
+    return months[first:] + months[:last + 1]
+
+
+def _to_record(month: int, row: List[str]) -> Dict:
+    return {
+        "month": month,
+        "day": _to_number(row[0]),
+        "seller": row[1],
+        "payment_method": row[2],
+        "product_name": row[3],
+        "quantity": _to_number(row[4]),
+        "unit_price_excl_tax": _to_number(row[5]),
+        "subtotal_excl_tax": _to_number(row[6]),
+        "subtotal_incl_tax": _to_number(row[7]),
+        "sale_id": row[8] if len(row) > 8 and row[8] else None,
+    }
+
+
+def iter_sale_records(
+    client: GoogleSheetsClient,
+    months: List[int],
+    chunk_rows: int = 1000,
+    concurrency: int = 4,
+    queue_chunks: int = 2,
+    with_sale_ids: bool = True
+) -> Iterator[List[Dict]]:
+    """
+    Read several month sheets concurrently and yield their sales in month order
+
+    月ごとに読み取りスレッドを起動し（最大 concurrency 本）、チャンクを月ごとのキューに入れる。
+    呼び出し側は先頭の月から順にキューを読むため、先の月は読み終えていても送信を待つ。
+    キューが一杯になった読み取りスレッドは待機するので、メモリ使用量は一定に保たれる。
+
+    Args:
+        client: GoogleSheetsClient
+        months: 書き出す月（この順に出力）
+        chunk_rows: 1回の読み取りの行数
+        concurrency: 同時に読む月の数
+        queue_chunks: 月ごとに先読みして溜めるチャンクの数
+        with_sale_ids: K列（売上ID）も読むか
+
+    Yields:
+        List[Dict]: 1チャンク分の売上（COLUMNS の辞書）
+    """
+    width = SALE_ID_COLUMN - 2 if with_sale_ids else 8
+    queues = {month: queue.Queue(maxsize=queue_chunks) for month in months}
+    cancelled = threading.Event()
+
+    def put(month_queue: queue.Queue, item) -> bool:
+        while not cancelled.is_set():
+            try:
+                month_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read(month: int):
+        month_queue = queues[month]
+        try:
+            for rows in client.iter_month_rows(month, chunk_rows=chunk_rows, width=width):
+                if not put(month_queue, [_to_record(month, row) for row in rows]):
+                    return
+        except gspread.WorksheetNotFound:
+            logger.info(f"[書き出し] {month} 月度のシートがないため読み飛ばします")
+        except Exception as e:
+            put(month_queue, e)
+            return
+        put(month_queue, _DONE)
+
+    # 月の順にスレッドへ割り当てるため、出力待ちの先頭の月は必ず読み取り中（待ち合わせで止まらない）
+    executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="export")
+    try:
+        for month in months:
+            executor.submit(read, month)
+        for month in months:
+            while True:
+                item = queues[month].get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        # クライアントが切断した場合も読み取りスレッドを止める
+        cancelled.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_csv(chunks: Iterable[List[Dict]]) -> Iterator[bytes]:
+    """売上のチャンクをCSV（UTF-8 BOM付き、Excelでそのまま開ける）のバイト列にして順に返す"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS, lineterminator="\r\n")
+    writer.writeheader()
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+    for records in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(records)
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only stream that hands out what has been written so far"""
+
+    def __init__(self):
+        super().__init__()
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _import_pyarrow() -> tuple:
+    """pyarrow（任意依存）を読み込む。起動時間に影響しないよう、Parquetを書き出すときだけ読み込む"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ExportFormatError("Parquetの書き出しには pyarrow が必要です（pip install pyarrow）")
+    return pyarrow, pyarrow.parquet
+
+
+def iter_parquet(chunks: Iterable[List[Dict]]) -> Iterator[bytes]:
+    """売上のチャンクを1つずつParquetの行グループにし、書き出した分から順に返す"""
+    pa, pq = _import_pyarrow()
+
+    schema = pa.schema([
+        ("month", pa.int8()),
+        ("day", pa.int8()),
+        ("seller", pa.string()),
+        ("payment_method", pa.string()),
+        ("product_name", pa.string()),
+        ("quantity", pa.float64()),
+        ("unit_price_excl_tax", pa.float64()),
+        ("subtotal_excl_tax", pa.float64()),
+        ("subtotal_incl_tax", pa.float64()),
+        ("sale_id", pa.string()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        for records in chunks:
+            writer.write_table(pa.Table.from_pylist(records, schema=schema))
+            data = sink.take()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def stream_export(
+    client: GoogleSheetsClient,
+    months: List[int],
+    export_format: str = "csv",
+    chunk_rows: int = 1000,
+    concurrency: int = 4,
+    queue_chunks: int = 2,
+    with_sale_ids: bool = True
+) -> Iterator[bytes]:
+    """
+    Stream the sales of several months as CSV or Parquet bytes
+
+    Raises:
+        ExportFormatError: 未対応の形式・pyarrow未インストール（読み取りを始める前に送出）
+    """
+    if export_format not in CONTENT_TYPES:
+        raise ExportFormatError(f"未対応の形式です: {export_format}（csv / parquet）")
+    encode = iter_csv if export_format == "csv" else iter_parquet
+    if export_format == "parquet":
+        _import_pyarrow()
+    return encode(iter_sale_records(
+        client, months, chunk_rows=chunk_rows, concurrency=concurrency,
+        queue_chunks=queue_chunks, with_sale_ids=with_sale_ids
+    ))
@@ -0,0 +1,308 @@
+"""
+Gemini client module
+Gemini API呼び出しに期限・リトライ・モデルのフォールバック・ヘッジ（投機的な再送）を付ける
+
+- 1回の呼び出しごとに deadline_seconds の期限を設け、超えたら待たずに次の試行へ進む
+- 通信エラー・429・5xx・タイムアウトはバックオフ付きでリトライし、同じモデルで失敗が続けば
+  次のモデル（例: gemini-2.5-flash → gemini-2.5-flash-lite）にフォールバックする
+- hedge=True の場合、応答がそのモデルの直近p90レイテンシを超えたら同じリクエストをもう1本送り、
+  先に返ってきた方を使う（遅い1本に引きずられないため、p99が安定する）
+
+全体の所要時間は total_deadline_seconds で上限を決めるため、最悪でもその時間で
+GeminiUnavailableError が返り、呼び出し側は正規表現による解析などに切り替えられる。
+
+静的な指示（顧客リスト・商品カタログなど）は system_instruction としてモデルに持たせ、
+リクエストごとにはメッセージ本文だけを送る。先頭が毎回同じになるため、Gemini 2.5 の
+暗黙的キャッシュ（implicit caching）が効き、入力トークンの課金と処理時間が減る。
+record_usage() で1リクエストごとのトークン数と概算費用を記録する。
+"""
+
+import logging
+import random
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .metrics import ERRORS, REGISTRY, RETRIES, Counter, Histogram, trace_span
+
+logger = logging.getLogger(__name__)
+
+# モデル・結果（success / error / timeout）ごとの呼び出し回数
+GEMINI_REQUESTS = REGISTRY.register(Counter(
+    "limit_gemini_requests_total", "Gemini generate_content attempts", ["model", "outcome"]
+))
+# ヘッジ（2本目のリクエスト）を送った回数
+GEMINI_HEDGES = REGISTRY.register(Counter(
+    "limit_gemini_hedged_requests_total", "Hedged second Gemini requests", ["model"]
+))
+# モデルごとの応答時間
+GEMINI_SECONDS = REGISTRY.register(Histogram(
+    "limit_gemini_request_duration_seconds", "Gemini generate_content latency", ["model"]
+))
+
+# 入力・キャッシュ済み入力・出力トークン数
+GEMINI_TOKENS = REGISTRY.register(Counter(
+    "limit_gemini_tokens_total", "Gemini tokens by kind (prompt / cached / output)", ["model", "kind"]
+))
+# 概算費用（USD）
+GEMINI_COST = REGISTRY.register(Counter(
+    "limit_gemini_cost_usd_total", "Estimated Gemini cost in USD", ["model"]
+))
+
+# 100万トークンあたりの価格（USD）: (入力, キャッシュ済み入力, 出力)。2025年時点の公開価格（有料枠・200k以下）
+GEMINI_PRICES_PER_MILLION = {
+    "gemini-2.5-flash": (0.30, 0.075, 2.50),
+    "gemini-2.5-flash-lite": (0.10, 0.025, 0.40),
+}
+
+# リトライ対象のHTTPステータス（google.api_core の例外は .code に持つ）
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class GeminiUnavailableError(RuntimeError):
+    """Raised when every model in the fallback list failed within the deadline"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """一時的なエラー（再試行・フォールバックで回復しうる）か判定"""
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and code in RETRYABLE_CODES
+
+
+def _model_key(model_name: str) -> str:
+    return model_name[len("models/"):] if model_name.startswith("models/") else model_name
+
+
+def record_usage(model_name: str, usage_metadata) -> Optional[Dict]:
+    """
+    1回の応答のトークン数と概算費用をメトリクスに記録
+
+    Args:
+        model_name: 応答したモデル名
+        usage_metadata: レスポンスの usage_metadata（なければ何もしない）
+
+    Returns:
+        dict | None: {"prompt_tokens", "cached_tokens", "output_tokens", "total_tokens", "cost_usd"}
+            cost_usd は価格表にないモデルではNone
+    """
+    if usage_metadata is None:
+        return None
+    prompt_tokens = getattr(usage_metadata, "prompt_token_count", 0) or 0
+    cached_tokens = getattr(usage_metadata, "cached_content_token_count", 0) or 0
+    output_tokens = getattr(usage_metadata, "candidates_token_count", 0) or 0
+    total_tokens = getattr(usage_metadata, "total_token_count", 0) or prompt_tokens + output_tokens
+
+    key = _model_key(model_name)
+    GEMINI_TOKENS.inc(prompt_tokens - cached_tokens, model=key, kind="prompt")
+    GEMINI_TOKENS.inc(cached_tokens, model=key, kind="cached")
+    GEMINI_TOKENS.inc(output_tokens, model=key, kind="output")
+
+    cost = None
+    prices = GEMINI_PRICES_PER_MILLION.get(key)
+    if prices is not None:
+        input_price, cached_price, output_price = prices
+        cost = ((prompt_tokens - cached_tokens) * input_price
+                + cached_tokens * cached_price
+                + output_tokens * output_price) / 1_000_000
+        GEMINI_COST.inc(cost, model=key)
+
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "output_tokens": output_tokens,
+        "total_tokens": total_tokens,
+        "cost_usd": cost
+    }
+
+
+class LatencyWindow:
+    """Recent latencies of one model (for the hedging threshold)"""
+
+    def __init__(self, size: int = 200):
+        self._values = deque(maxlen=size)
+        self.lock = Lock()
+
+    def add(self, seconds: float):
+        with self.lock:
+            self._values.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """q（0〜100）パーセンタイル。記録がなければNone"""
+        with self.lock:
+            ordered = sorted(self._values)
+        if not ordered:
+            return None
+        index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._values)
+
+
+class GeminiClient:
+    """Deadline-, retry- and fallback-aware wrapper around GenerativeModel instances"""
+
+    def __init__(
+        self,
+        model_names: List[str],
+        model_factory: Callable[[str, Optional[str]], Any],
+        deadline_seconds: float = 8.0,
+        total_deadline_seconds: float = 20.0,
+        max_retries: int = 1,
+        backoff_seconds: float = 0.5,
+        hedge: bool = False,
+        hedge_min_samples: int = 20,
+        max_workers: int = 16,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        """
+        Initialize Gemini client
+
+        Args:
+            model_names: 試す順のモデル名（例: ["gemini-2.5-flash", "gemini-2.5-flash-lite"]）
+            model_factory: (モデル名, system_instruction) から GenerativeModel
+                （generate_content を持つオブジェクト）を作る関数
+            deadline_seconds: 1回の呼び出しの期限（秒）
+            total_deadline_seconds: リトライ・フォールバックを含めた全体の期限（秒）
+            max_retries: 1モデルあたりのリトライ回数
+            backoff_seconds: リトライ間隔の基準（指数バックオフ + ジッター）
+            hedge: p90を超えたら2本目のリクエストを送るか
+            hedge_min_samples: ヘッジを始めるのに必要なレイテンシの記録数
+            max_workers: 呼び出しに使うスレッド数（期限切れで放置した呼び出しも含む）
+            clock / sleep: テスト用
+        """
+        if not model_names:
+            raise ValueError("model_names must not be empty")
+        self.model_names = list(model_names)
+        self.model_factory = model_factory
+        self.deadline_seconds = deadline_seconds
+        self.total_deadline_seconds = total_deadline_seconds
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.clock = clock
+        self.sleep = sleep
+        self._models: Dict[Tuple[str, Optional[str]], Any] = {}
+        self._latency: Dict[str, LatencyWindow] = {name: LatencyWindow() for name in self.model_names}
+        self._lock = Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini")
+
+    def model(self, name: str, system_instruction: Optional[str] = None):
+        """モデルを取得（モデル名・system_instruction の組み合わせごとに初回のみ作成）"""
+        key = (name, system_instruction)
+        with self._lock:
+            model = self._models.get(key)
+            if model is None:
+                model = self.model_factory(name, system_instruction)
+                self._models[key] = model
+            return model
+
+    def latency_percentile(self, name: str, q: float) -> Optional[float]:
+        return self._latency[name].percentile(q)
+
+    def generate_content(self, contents, system_instruction: Optional[str] = None, **kwargs) -> Tuple[Any, str]:
+        """
+        Call generate_content with deadlines, retries and model fallback
+
+        Args:
+            contents: リクエストごとの入力
+            system_instruction: モデルに持たせる静的な指示（同じ指示のモデルは使い回す）
+            **kwargs: generate_content にそのまま渡す（generation_config など）
+
+        Returns:
+            tuple: (レスポンス, 応答したモデル名)
+
+        Raises:
+            GeminiUnavailableError: すべてのモデルが期限内に応答しなかった
+        """
+        deadline = self.clock() + self.total_deadline_seconds
+        last_error: Optional[BaseException] = None
+
+        for name in self.model_names:
+            for attempt in range(self.max_retries + 1):
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    break
+                if attempt > 0:
+                    RETRIES.inc(upstream="gemini")
+                    delay = min(self.backoff_seconds * (2 ** (attempt - 1)) * (0.5 + random.random()), remaining)
+                    logger.info(f"[Geminiリトライ] {name} {attempt}回目（{delay:.2f}秒後）")
+                    self.sleep(delay)
+                    remaining = deadline - self.clock()
+                    if remaining <= 0:
+                        break
+
+                try:
+                    timeout = min(self.deadline_seconds, remaining)
+                    return self._attempt(name, system_instruction, contents, kwargs, timeout), name
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"[Gemini失敗] {name}: {e!r}")
+                    if not is_retryable(e):
+                        break  # 同じモデルで再試行しても変わらないため次のモデルへ
+
+            if self.clock() >= deadline:
+                break
+            if name != self.model_names[-1]:
+                logger.warning(f"[Geminiフォールバック] {name} から次のモデルに切り替えます")
+
+        raise GeminiUnavailableError(f"Gemini APIが応答しませんでした: {last_error!r}") from last_error
+
+    def _attempt(self, name: str, system_instruction: Optional[str], contents, kwargs: Dict, timeout: float):
+        """1回の呼び出し（必要ならヘッジ付き）。期限切れは TimeoutError"""
+        model = self.model(name, system_instruction)
+        window = self._latency[name]
+        start = self.clock()
+
+        def call():
+            # 期限を過ぎたら SDK 側でも打ち切り、ワーカースレッドを解放する（待つのをやめるだけでは残り続ける）
+            remaining = max(timeout - (self.clock() - start), 0.001)
+            options = {**(kwargs.get("request_options") or {}), "timeout": remaining}
+            with trace_span("gemini.generate_content", model=name):
+                return model.generate_content(contents, **{**kwargs, "request_options": options})
+
+        pending = {self._executor.submit(call)}
+
+        hedge_after = None
+        if self.hedge and len(window) >= self.hedge_min_samples:
+            hedge_after = window.percentile(90)
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = wait(pending, timeout=hedge_after)
+            if not done:
+                GEMINI_HEDGES.inc(model=name)
+                logger.info(f"[Geminiヘッジ] {name} の応答がp90（{hedge_after:.2f}秒）を超えたため2本目を送信")
+                pending.add(self._executor.submit(call))
+
+        error: Optional[BaseException] = None
+        while pending:
+            remaining = timeout - (self.clock() - start)
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    elapsed = self.clock() - start
+                    window.add(elapsed)
+                    GEMINI_SECONDS.observe(elapsed, model=name)
+                    GEMINI_REQUESTS.inc(model=name, outcome="success")
+                    return future.result()
+                error = future.exception()
+
+        if error is not None and not pending:
+            GEMINI_REQUESTS.inc(model=name, outcome="error")
+            ERRORS.inc(stage=f"gemini.{name}")
+            raise error
+
+        # 期限切れ: 実行中の呼び出しは放置する（結果は使わない）
+        GEMINI_REQUESTS.inc(model=name, outcome="timeout")
+        ERRORS.inc(stage=f"gemini.{name}")
+        # 遅い応答も次回のヘッジ判定に反映されるよう、期限を記録しておく
+        window.add(timeout)
+        raise TimeoutError(f"{name} が {timeout:.1f} 秒以内に応答しませんでした")
@@ -4,16 +4,132 @@ Googleスプレッドシートへの読み書き機能
 """
 
 import logging
+import time
+import uuid
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional
 
 import gspread
 from google.oauth2.service_account import Credentials
+from gspread.utils import InsertDataOption, a1_to_rowcol, rowcol_to_a1
 
+from .call_accounting import record_call
+from .circuit_breaker import CircuitBreaker, CircuitOpenError, get_breaker
 from .config import Config
+from .metrics import ERRORS, SHEETS_API_CALLS, stage, trace_span
+from .readiness import report_failure, report_success
+from .structured_logging import log_payload
 
 logger = logging.getLogger(__name__)
 
+# データ行は5行目から（1〜4行目はタイトル・ヘッダー）
+FIRST_DATA_ROW = 5
+
+# append APIで表を検出する範囲（売上表のC列〜J列、5行目以降）
+APPEND_TABLE_RANGE = f"C{FIRST_DATA_ROW}:J"
+
+
+# 月度シートの複製元
+TEMPLATE_SHEET_NAME = "テンプレート"
+
+# 売上ID（SALE_IDS=true のとき J列の右隣に書き込む。テンプレートでは非表示にしておく）
+SALE_ID_COLUMN = 11  # K列
+
+# 売上の担当トレーナー（売上IDの右隣。名簿は M列の5行目以降）
+TRAINER_COLUMN = 12  # L列
+TRAINER_ROSTER_COLUMN = 13  # M列
+
+
+def new_sale_id() -> str:
+    """Generate a sale ID (stable across row insertions, unlike the row number)"""
+    return uuid.uuid4().hex[:12]
+
+
+def row_range(row: int, width: int) -> str:
+    """C列から width 列分の範囲（例: row_range(7, 9) -> "C7:K7"）"""
+    return f"C{row}:{rowcol_to_a1(row, 2 + width)}"
+
+
+def sale_row_values(row_data: List, sale_id: Optional[str] = None, trainer: Optional[str] = None) -> List:
+    """C〜Jの値に売上ID（K列）と担当トレーナー（L列）を付ける（トレーナーがなければK列まで）"""
+    values = list(row_data)
+    if sale_id or trainer:
+        values.append(sale_id or "")
+    if trainer:
+        values.append(trainer)
+    return values
+
+
+def roster_names(column: Iterable[str]) -> List[str]:
+    """M列の値（1行目から）からトレーナー名簿を取り出す（5行目以降、空欄を除く）"""
+    return [name.strip() for name in list(column)[FIRST_DATA_ROW - 1:] if name and name.strip()]
+
+
+def month_sheet_name(month: int) -> str:
+    """月度シート名（例：「12 月度」）"""
+    return f"{month} 月度"
+
+
+def fiscal_year_months(start_month: int = 1) -> List[int]:
+    """会計年度の月を順に並べる（例: start_month=4 -> [4, 5, ..., 12, 1, 2, 3]）"""
+    return [(start_month - 1 + offset) % 12 + 1 for offset in range(12)]
+
+
+def find_empty_rows(all_values: List[List[str]], count: int = 1) -> List[int]:
+    """
+    Find the first empty rows (C column blank) from row 5
+    C列（日付）が空の行を5行目から順に count 件探す
+
+    Args:
+        all_values: get_all_values() の結果
+        count: 必要な行数
+
+    Returns:
+        List[int]: 書き込み先の行番号（1始まり）
+    """
+    rows = []
+    for i, row in enumerate(all_values[FIRST_DATA_ROW - 1:], start=FIRST_DATA_ROW):
+        # C列（日付）が空なら、その行が次の書き込み先
+        if len(row) < 3 or not row[2]:  # C列 = index 2
+            rows.append(i)
+            if len(rows) == count:
+                return rows
+
+    # 足りない分はシート末尾の次の行から
+    next_row = max(len(all_values) + 1, FIRST_DATA_ROW)
+    while len(rows) < count:
+        rows.append(next_row)
+        next_row += 1
+    return rows
+
+
+def parse_updated_range(updated_range: str) -> tuple:
+    """
+    Parse the updatedRange of an append response
+    append APIの updatedRange（例: "'12 月度'!C10:J11"）から行番号と開始列を取り出す
+
+    Returns:
+        tuple: (行番号のリスト, 開始列番号)。解析できない場合は ([], 0)
+    """
+    cells = updated_range.rsplit("!", 1)[-1]
+    if not cells:
+        return [], 0
+    start, _, end = cells.partition(":")
+    try:
+        start_row, start_col = a1_to_rowcol(start)
+        end_row, _ = a1_to_rowcol(end or start)
+    except gspread.exceptions.IncorrectCellLabel:
+        return [], 0
+    return list(range(start_row, end_row + 1)), start_col
+
+
+def _is_outage(error: Exception) -> bool:
+    """上流の障害とみなすエラーか（429・5xx・タイムアウト・通信エラー。それ以外の4xxはリクエスト側の問題）"""
+    if isinstance(error, gspread.exceptions.APIError):
+        status = getattr(error.response, "status_code", None)
+        return status is None or status == 429 or status >= 500
+    return True
+
 
 class GoogleSheetsClient:
     """Google Sheets API client for 2025年店舗管理シート"""
@@ -24,54 +140,189 @@ class GoogleSheetsClient:
         'https://www.googleapis.com/auth/drive'
     ]
 
-    def __init__(self):
-        """Initialize Google Sheets client"""
+    def __init__(
+        self,
+        gspread_client: Optional[gspread.Client] = None,
+        spreadsheet_id: Optional[str] = None,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        """
+        Initialize Google Sheets client
+
+        Args:
+            gspread_client: 認証済みのgspreadクライアント（店舗間で共有する場合・テストで差し替える場合に指定）
+            spreadsheet_id: 接続するスプレッドシートID（省略時は GOOGLE_SHEET_ID）
+            breaker: API呼び出しに使うサーキットブレーカー（省略時は全店舗で共有する "sheets"）
+        """
+        if gspread_client is not None:
+            self.credentials = None
+            self.client = gspread_client
+        else:
+            self.credentials, self.client = self.authorize()
+        self.spreadsheet_id = spreadsheet_id or Config.GOOGLE_SHEET_ID
+        self.breaker = breaker or get_breaker("sheets")
+        self.spreadsheet = None
+        self.current_sheet = None
+        # シート名 -> Worksheet（worksheets() 1回で取得。シートの存在確認はここを見るだけでAPIを呼ばない）
+        self._sheet_index: Optional[Dict[str, gspread.Worksheet]] = None
+        self._sheet_index_loaded_at = 0.0
+        # append APIの表検出が想定外の行を返したシート（以降は scan 方式で書き込む）
+        self._append_unsafe = set()
+
+    @classmethod
+    def authorize(cls) -> tuple:
+        """
+        Authorize gspread with the service account
+        サービスアカウントで認証し (credentials, gspread.Client) を返す
+
+        gspreadの既定ではタイムアウトがなく、障害時はリクエストが数十秒以上待たされるため、
+        接続・応答待ちのタイムアウト（SHEETS_CONNECT_TIMEOUT_SECONDS / SHEETS_READ_TIMEOUT_SECONDS）を設定する。
+        """
         # 認証情報を取得（環境変数またはファイルから）
         credentials_dict = Config.get_google_credentials()
 
         # gspread認証
-        self.credentials = Credentials.from_service_account_info(
+        credentials = Credentials.from_service_account_info(
             credentials_dict,
-            scopes=self.SCOPES
+            scopes=cls.SCOPES
         )
-        self.client = gspread.authorize(self.credentials)
-        self.spreadsheet = None
-        self.current_sheet = None
+        client = gspread.authorize(credentials)
+        client.set_timeout((Config.SHEETS_CONNECT_TIMEOUT_SECONDS, Config.SHEETS_READ_TIMEOUT_SECONDS))
+        return credentials, client
+
+    def _call(self, method: str, func, *args, **kwargs):
+        """
+        Call a gspread method with accounting
+        gspreadの呼び出しを1回のAPI呼び出しとして計測（回数・スパン・エラー）
+
+        サーキットブレーカーが開いていれば呼び出さずに CircuitOpenError を送出する。
+        タイムアウト・通信エラー・429・5xx をブレーカーの失敗として数える（4xxは上流の障害ではない）。
+
+        Args:
+            method: メトリクス上のメソッド名（例: "get_all_values"）
+            func: 呼び出すgspreadのメソッド
+        """
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError as e:
+            report_failure("sheets", e)
+            raise
+        SHEETS_API_CALLS.inc(method=method)
+        record_call(method)
+        with trace_span(f"sheets.{method}"):
+            try:
+                result = func(*args, **kwargs)
+            except gspread.WorksheetNotFound:
+                self.breaker.record_success()
+                report_success("sheets")  # APIとしては応答している
+                raise
+            except Exception as e:
+                ERRORS.inc(stage=f"sheets.{method}")
+                # readiness もブレーカーと同じく、上流の障害のときだけ失敗とする（不正な範囲の400などは応答している）
+                if _is_outage(e):
+                    self.breaker.record_failure()
+                    report_failure("sheets", e)
+                else:
+                    self.breaker.record_success()
+                    report_success("sheets")
+                raise
+        self.breaker.record_success()
+        report_success("sheets")
+        return result
 
     def connect(self):
         """Connect to the Google Spreadsheet"""
         try:
-            self.spreadsheet = self.client.open_by_key(Config.GOOGLE_SHEET_ID)
+            self.spreadsheet = self._call("open_by_key", self.client.open_by_key, self.spreadsheet_id)
             logger.info(f"Connected to spreadsheet: {self.spreadsheet.title}")
         except Exception as e:
             logger.error(f"Failed to connect to spreadsheet: {e}")
             raise
 
+    def ping(self):
+        """
+        Lightweight connectivity check
+        接続確認用にスプレッドシートのタイトルだけを取得（セルは読まない）
+        """
+        if self.spreadsheet is None:
+            self.connect()
+            return
+        self._call("fetch_sheet_metadata", self.spreadsheet.fetch_sheet_metadata, {"fields": "properties.title"})
+
+    def refresh_sheet_index(self) -> Dict[str, gspread.Worksheet]:
+        """
+        Reload the sheet index
+        スプレッドシートのシート一覧を1回のAPI呼び出しで取得し、シート名 -> Worksheet を更新
+        """
+        if not self.spreadsheet:
+            self.connect()
+        worksheets = self._call("worksheets", self.spreadsheet.worksheets)
+        self._sheet_index = {worksheet.title: worksheet for worksheet in worksheets}
+        self._sheet_index_loaded_at = time.monotonic()
+        return self._sheet_index
+
+    def find_sheet(self, sheet_name: str) -> Optional[gspread.Worksheet]:
+        """
+        Look up a worksheet in the cached index
+        シート一覧のキャッシュからシートを探す（見つからなければNone）
+
+        キャッシュが SHEET_INDEX_TTL_SECONDS より古い場合と、見つからない場合
+        （手作業・他のワーカーで追加された可能性がある）だけ一覧を取り直す。
+        """
+        index = self._sheet_index
+        if index is None or time.monotonic() - self._sheet_index_loaded_at > Config.SHEET_INDEX_TTL_SECONDS:
+            index = self.refresh_sheet_index()
+        elif sheet_name not in index:
+            index = self.refresh_sheet_index()
+        return index.get(sheet_name)
+
     def get_current_month_sheet(self) -> gspread.Worksheet:
         """
         Get the worksheet for the current month
         現在の月に応じたシートを取得（例：「12 月度」）
         シートが存在しない場合は「テンプレート」から自動作成
 
+        通常は SheetProvisioner が月末前に翌月のシートを作成しておくため、
+        ここでの作成は事前作成が間に合わなかった場合のみ。
+
         Returns:
             gspread.Worksheet: Current month's worksheet
         """
-        if not self.spreadsheet:
-            self.connect()
-
         # Get current month (1-12)
         current_month = datetime.now().month
-        sheet_name = f"{current_month} 月度"
+        sheet_name = month_sheet_name(current_month)
+
+        if self.current_sheet is not None and self.current_sheet.title == sheet_name:
+            return self.current_sheet
 
-        logger.info(f"[シート取得] 対象シート名: {sheet_name}")
+        logger.debug(f"[シート取得] 対象シート名: {sheet_name}")
 
-        try:
-            self.current_sheet = self.spreadsheet.worksheet(sheet_name)
-            logger.info(f"[シート取得成功] シート '{sheet_name}' を開きました")
+        worksheet = self.find_sheet(sheet_name)
+        if worksheet is not None:
+            self.current_sheet = worksheet
+            logger.debug(f"[シート取得成功] シート '{sheet_name}' を開きました")
             return self.current_sheet
-        except gspread.WorksheetNotFound:
+
+        logger.warning(f"[シート未検出] シート '{sheet_name}' が見つかりません。テンプレートから作成します。")
+        self.current_sheet = self._create_sheet_from_template(sheet_name)
+        return self.current_sheet
+
+    def get_month_sheet(self, month: int) -> gspread.Worksheet:
+        """
+        Get the worksheet of a month
+        指定した月度シートを取得（なければ「テンプレート」から作成）。過去分の取り込み用
+
+        Args:
+            month: 月（1-12）
+        """
+        if month == datetime.now().month:
+            return self.get_current_month_sheet()
+        sheet_name = month_sheet_name(month)
+        worksheet = self.find_sheet(sheet_name)
+        if worksheet is None:
             logger.warning(f"[シート未検出] シート '{sheet_name}' が見つかりません。テンプレートから作成します。")
-            return self._create_sheet_from_template(sheet_name)
+            worksheet = self._create_sheet_from_template(sheet_name)
+        return worksheet
 
     def _create_sheet_from_template(self, sheet_name: str) -> gspread.Worksheet:
         """
@@ -88,15 +339,15 @@ class GoogleSheetsClient:
         """
         try:
             # テンプレートシートを取得
-            template = self.spreadsheet.worksheet("テンプレート")
+            template = self.find_sheet(TEMPLATE_SHEET_NAME)
+            if template is None:
+                raise gspread.WorksheetNotFound(TEMPLATE_SHEET_NAME)
             logger.info(f"[テンプレート取得成功] 'テンプレート' シートを取得しました")
 
             # テンプレートを複製
-            new_sheet = template.duplicate(new_sheet_name=sheet_name)
+            new_sheet = self._call("duplicate", template.duplicate, new_sheet_name=sheet_name)
             logger.info(f"[シート作成成功] '{sheet_name}' シートを作成しました（テンプレートID: {template.id}）")
-
-            # 作成したシートをcurrent_sheetとして設定
-            self.current_sheet = new_sheet
+            self._sheet_index[sheet_name] = new_sheet
             return new_sheet
 
         except gspread.WorksheetNotFound:
@@ -106,51 +357,94 @@ class GoogleSheetsClient:
             logger.error(f"[シート作成失敗] シート '{sheet_name}' の作成に失敗しました: {e}")
             raise
 
-    def get_sheet_info(self) -> Dict:
+    def provision_month_sheets(self, months: Iterable[int]) -> List[str]:
+        """
+        Create missing month sheets from the template in one batch_update
+        まだない月度シートを「テンプレート」から1回の batch_update（duplicateSheet）でまとめて作成
+
+        Args:
+            months: 作成する月（1-12）。既にあるシートは作成しない
+
+        Returns:
+            List[str]: 作成したシート名
+        """
+        # 他のワーカー・手作業で作成済みのシートを作り直さないよう、最新の一覧で判定する
+        index = self.refresh_sheet_index()
+        missing = []
+        for month in months:
+            name = month_sheet_name(month)
+            if name not in index and name not in missing:
+                missing.append(name)
+        if not missing:
+            return []
+
+        template = index.get(TEMPLATE_SHEET_NAME)
+        if template is None:
+            raise ValueError("テンプレートシートが見つかりません。スプレッドシートに 'テンプレート' という名前のシートを作成してください。")
+
+        body = {"requests": [
+            {"duplicateSheet": {"sourceSheetId": template.id, "newSheetName": name}}
+            for name in missing
+        ]}
+        self._call("spreadsheet_batch_update", self.spreadsheet.batch_update, body)
+        logger.info(f"[シート事前作成] {missing} を作成しました")
+
+        self.refresh_sheet_index()
+        return missing
+
+    def get_sheet_info(self, count: int = 1, sheet: Optional[gspread.Worksheet] = None) -> Dict:
         """
         Get sheet information: headers and next empty row
         ヘッダー情報と次に書き込むべき空行の番号を取得
 
+        Args:
+            count: 必要な空行の数（一括記録用）
+            sheet: 対象のシート（省略時は今月のシート）
+
         Returns:
             dict: {
                 "headers": List[str],
                 "next_row": int,
+                "empty_rows": List[int],
                 "trainers": List[str]
             }
         """
-        if not self.current_sheet:
-            self.get_current_month_sheet()
+        sheet = sheet or self.get_current_month_sheet()
 
         # ヘッダー行（4行目）を取得
-        headers = self.current_sheet.row_values(4)
-
-        # M列のトレーナー名リストを取得（5行目以降）
-        trainers_column = self.current_sheet.col_values(13)  # M列 = 13
-        trainers = [name for name in trainers_column[4:] if name]  # 4行目以降、空でないもの
+        headers = self._call("row_values", sheet.row_values, 4)
 
         # 次の空行を見つける（5行目以降）
-        all_values = self.current_sheet.get_all_values()
-        next_row = 5  # デフォルトは5行目から開始
+        all_values = self._call("get_all_values", sheet.get_all_values)
+        empty_rows = find_empty_rows(all_values, count)
+        next_row = empty_rows[0]
 
-        for i, row in enumerate(all_values[4:], start=5):  # 5行目から検索
-            # C列（日付）が空なら、その行が次の書き込み先
-            if not row[2]:  # C列 = index 2
-                next_row = i
-                break
-        else:
-            # 全ての行が埋まっている場合は、最後の行の次
-            next_row = len(all_values) + 1
+        logger.debug(f"Next empty row: {next_row}")
 
-        logger.info(f"Next empty row: {next_row}")
+        # M列のトレーナー名簿は読み取り済みのセルから取り出す（M列だけを別に読まない）
+        trainers = roster_names(
+            row[TRAINER_ROSTER_COLUMN - 1] if len(row) >= TRAINER_ROSTER_COLUMN else "" for row in all_values
+        )
 
         return {
             "headers": headers,
             "next_row": next_row,
+            "empty_rows": empty_rows,
             "trainers": trainers
         }
 
-    def record_sale(
-        self,
+    def read_trainers(self, sheet: Optional[gspread.Worksheet] = None) -> List[str]:
+        """
+        Read the trainer roster (column M) of a month sheet
+        M列のトレーナー名簿を読む（1回。省略時は今月のシート）
+
+        記帳のたびには呼ばない。TrainerRoster がキャッシュし、期限切れのときだけ読み直す。
+        """
+        sheet = sheet or self.get_current_month_sheet()
+        return roster_names(self._call("col_values", sheet.col_values, TRAINER_ROSTER_COLUMN))
+
+    @staticmethod
+    def _build_row_data(
         day: int,
         seller: str,
         payment_method: str,
@@ -158,36 +452,14 @@ class GoogleSheetsClient:
         quantity: int,
         unit_price_excl_tax: float,
         unit_price_incl_tax: float = None
-    ) -> Dict:
+    ) -> List:
         """
-        Record a sale to the spreadsheet
-        売上情報をスプレッドシートに記録
-
-        Args:
-            day: 日付（数値のみ）
-            seller: 顧客名（D列）
-            payment_method: 決済方法
-            product_name: 商品・サービス名
-            quantity: 数量
-            unit_price_excl_tax: 単価（税抜）
-            unit_price_incl_tax: 単価（税込） - I列表示用
+        Build the C〜J column values for one sale
+        1件の売上からC列〜J列の値を組み立てる
 
         Returns:
-            dict: {"success": bool, "row": int, "message": str}
+            list: [日, 顧客名, 決済方法, 商品名, 数量, 単価（税抜）, 合計（税抜）, 合計（税込）]
         """
-        logger.info(f"[売上記録開始] day={day}, seller={seller}, payment_method={payment_method}, product_name={product_name}, quantity={quantity}, unit_price_excl_tax={unit_price_excl_tax}, unit_price_incl_tax={unit_price_incl_tax}")
-
-        if not self.current_sheet:
-            self.get_current_month_sheet()
-
-        # スプレッドシートとシート名をログ出力
-        logger.info(f"[接続先] スプレッドシート: '{self.spreadsheet.title}', シート名: '{self.current_sheet.title}'")
-
-        # 次の空行を取得
-        sheet_info = self.get_sheet_info()
-        next_row = sheet_info["next_row"]
-        logger.info(f"[書き込み先] 次の空行: {next_row} 行目")
-
         # I列・J列の計算
         subtotal_excl_tax = quantity * unit_price_excl_tax  # I列: 合計（税抜）
 
@@ -211,30 +483,317 @@ class GoogleSheetsClient:
             subtotal_incl_tax       # J列: 合計（税込）
         ]
 
-        logger.info(f"[書き込みデータ] C列〜J列: {row_data}")
-        logger.info(f"[計算結果] 合計（税抜）={subtotal_excl_tax}, 合計（税込）={subtotal_incl_tax}")
+        return row_data
 
-        try:
-            # C列から始めて、J列まで書き込み
-            # range_nameは "C{row}:J{row}" の形式
-            range_name = f"C{next_row}:J{next_row}"
-            logger.info(f"[書き込み範囲] {range_name}")
+    def record_sale(
+        self,
+        day: int,
+        seller: str,
+        payment_method: str,
+        product_name: str,
+        quantity: int,
+        unit_price_excl_tax: float,
+        unit_price_incl_tax: float = None,
+        trainer: Optional[str] = None
+    ) -> Dict:
+        """
+        Record a sale to the spreadsheet
+        売上情報をスプレッドシートに記録
 
-            self.current_sheet.update(range_name, [row_data])
+        Args:
+            day: 日付（数値のみ）
+            seller: 顧客名（D列）
+            payment_method: 決済方法
+            product_name: 商品・サービス名
+            quantity: 数量
+            unit_price_excl_tax: 単価（税抜）
+            unit_price_incl_tax: 単価（税込） - I列表示用
+            trainer: 担当トレーナー（L列。名簿との照合は呼び出し側で行う）
+
+        Returns:
+            dict: {"success": bool, "row": int, "message": str, "sheet_name": str, "sale_id": str | None}
+        """
+        # 月が変わっていれば新しい月度シートに切り替える（シート一覧のキャッシュを見るだけ）
+        with stage("sheet_lookup"):
+            sheet = self.get_current_month_sheet()
 
-            logger.info(f"[書き込み成功] {next_row} 行目に売上を記録しました")
+        row_data = self._build_row_data(
+            day, seller, payment_method, product_name, quantity, unit_price_excl_tax, unit_price_incl_tax
+        )
+        # 書き込む値は一部のリクエストだけ（顧客名はマスクして）出力する
+        log_payload("[書き込みデータ]", {
+            "sheet": sheet.title,
+            "day": day,
+            "seller": seller,
+            "product_name": product_name,
+            "quantity": quantity,
+            "subtotal_excl_tax": row_data[6],
+            "subtotal_incl_tax": row_data[7]
+        })
+
+        sale_id = new_sale_id() if Config.SALE_IDS else None
+        row_data = sale_row_values(row_data, sale_id, trainer)
+
+        next_row = 0
+        try:
+            next_row = self._write_rows([row_data], sheet)[0]
 
             return {
                 "success": True,
                 "row": next_row,
                 "message": f"売上を {next_row} 行目に記録しました",
-                "sheet_name": self.current_sheet.title
+                "sheet_name": sheet.title,
+                "sale_id": sale_id
             }
+        except CircuitOpenError:
+            raise  # 書き込んでいないので、呼び出し側で保留・503にできるようそのまま送出
         except Exception as e:
             logger.error(f"[書き込み失敗] エラー: {e}")
             return {
                 "success": False,
                 "row": next_row,
                 "message": f"エラー: {str(e)}",
-                "sheet_name": self.current_sheet.title if self.current_sheet else "不明"
+                "sheet_name": sheet.title
+            }
+
+    def _write_rows(self, values: List[List], sheet: gspread.Worksheet) -> List[int]:
+        """
+        Write C〜J (C〜K with sale IDs, C〜L with trainers) rows using the configured strategy
+        設定された方式（SHEETS_WRITE_STRATEGY）で売上行を書き込み、書き込んだ行番号を返す
+
+        append 方式は読み取りなしの1回の呼び出しで済む。表の検出が想定外だったシートは
+        scan 方式（全セルを読み、途中の空行も含めて空行を探す）に切り替える。
+        SHEETS_APPEND_MAX_ROW が未設定なら、フッターの下への書き込みを検出できないため append 方式は使わない。
+        """
+        if (Config.SHEETS_WRITE_STRATEGY == "append" and Config.SHEETS_APPEND_MAX_ROW > 0
+                and sheet.title not in self._append_unsafe):
+            with stage("write"):
+                rows = self._append_rows(values, sheet)
+            if rows is not None:
+                return rows
+
+        # 次の空行を取得
+        with stage("next_row_scan"):
+            rows = self.get_sheet_info(count=len(values), sheet=sheet)["empty_rows"]
+        logger.debug(f"[書き込み先] 空行: {rows}")
+
+        with stage("write"):
+            if len(values) == 1:
+                # C列から始めて、J列まで書き込み
+                range_name = row_range(rows[0], len(values[0]))
+                logger.debug(f"[書き込み範囲] {range_name}")
+                self._call("update", sheet.update, range_name, values)
+            else:
+                # 空行が連続しているとは限らないため、行ごとの範囲を1回のbatch_updateで書き込む
+                data = [
+                    {"range": row_range(row, len(row_values)), "values": [row_values]}
+                    for row, row_values in zip(rows, values)
+                ]
+                logger.debug(f"[書き込み範囲] {[item['range'] for item in data]}")
+                self._call("batch_update", sheet.batch_update, data)
+        return rows
+
+    def _append_rows(self, values: List[List], sheet: gspread.Worksheet) -> Optional[List[int]]:
+        """
+        Append rows after the sales table with values.append (no read)
+        C5:J の表の末尾に OVERWRITE で追記し、書き込まれた範囲をレスポンスから得る
+
+        テンプレートのフッター・数式などで表の検出がずれ、想定外の位置（C列以外、
+        ヘッダー行、SHEETS_APPEND_MAX_ROW より下）に書き込まれた場合は、書き込んだセルを
+        消去してシートを scan 方式に切り替え、None を返す。
+
+        Returns:
+            List[int] | None: 書き込んだ行番号
+        """
+        response = self._call(
+            "append_rows", sheet.append_rows, values,
+            insert_data_option=InsertDataOption.overwrite,
+            table_range=APPEND_TABLE_RANGE
+        )
+        updated_range = (response or {}).get("updates", {}).get("updatedRange", "")
+        rows, first_col = parse_updated_range(updated_range)
+
+        if (first_col == 3 and len(rows) == len(values) and rows[0] >= FIRST_DATA_ROW
+                and rows[-1] <= Config.SHEETS_APPEND_MAX_ROW):
+            logger.debug(f"[追記成功] {updated_range}")
+            return rows
+
+        logger.warning(
+            f"[追記位置が想定外] シート '{sheet.title}' の表を正しく検出できませんでした（{updated_range}）。"
+            f"以降このシートは空行検索で書き込みます"
+        )
+        self._append_unsafe.add(sheet.title)
+        if rows and first_col:
+            # 想定外の位置に書き込んだセルを元に戻す（OVERWRITE は表の外側の空セルに書き込む）
+            width = len(values[0])
+            self._call("update", sheet.update, updated_range.rsplit("!", 1)[-1], [[""] * width for _ in rows])
+        return None
+
+    def record_sales(self, sales: List[Dict], month: Optional[int] = None) -> Dict:
+        """
+        Record several sales with one read and one write
+        複数の売上を、空行の検索1回・書き込み1回でまとめて記録（append方式では書き込み1回のみ）
+
+        Args:
+            sales: record_sale と同じキーを持つ辞書のリスト
+                （day, seller, payment_method, product_name, quantity,
+                unit_price_excl_tax, unit_price_incl_tax）
+                sale_id を指定した売上はそのIDで記録する（省略時は生成）
+                trainer を指定した売上は担当トレーナーをL列に記録する
+            month: 書き込む月度（省略時は今月。過去分の取り込み用）
+
+        Returns:
+            dict: {"success": bool, "rows": List[int], "message": str, "sheet_name": str,
+                   "sale_ids": List[str] | None}
+        """
+        if not sales:
+            return {"success": True, "rows": [], "message": "記録する売上がありません", "sheet_name": None,
+                    "sale_ids": []}
+
+        # 月が変わっていれば新しい月度シートに切り替える（シート一覧のキャッシュを見るだけ）
+        with stage("sheet_lookup"):
+            sheet = self.get_current_month_sheet() if month is None else self.get_month_sheet(month)
+
+        values = [
+            self._build_row_data(
+                sale["day"],
+                sale["seller"],
+                sale["payment_method"],
+                sale["product_name"],
+                sale["quantity"],
+                sale["unit_price_excl_tax"],
+                sale.get("unit_price_incl_tax")
+            )
+            for sale in sales
+        ]
+        sale_ids = [sale.get("sale_id") or new_sale_id() for sale in sales] if Config.SALE_IDS else None
+        values = [
+            sale_row_values(row_values, sale_id, sale.get("trainer"))
+            for row_values, sale_id, sale in zip(values, sale_ids or [None] * len(sales), sales)
+        ]
+
+        rows = []
+        try:
+            rows = self._write_rows(values, sheet)
+            return {
+                "success": True,
+                "rows": rows,
+                "message": f"売上 {len(sales)} 件を {rows[0]}〜{rows[-1]} 行目に記録しました",
+                "sheet_name": sheet.title,
+                "sale_ids": sale_ids
+            }
+        except CircuitOpenError:
+            raise  # 書き込んでいないので、呼び出し側で保留・503にできるようそのまま送出
+        except Exception as e:
+            logger.error(f"[一括書き込み失敗] エラー: {e}")
+            return {
+                "success": False,
+                "rows": rows,
+                "message": f"エラー: {str(e)}",
+                "sheet_name": sheet.title,
+                "sale_ids": sale_ids
             }
+
+    def get_month_values(self, month: int) -> List[List[str]]:
+        """
+        Get all cell values of a month sheet
+        指定した月度シートの全セルを取得（集計用）
+
+        Args:
+            month: 月（1-12）
+
+        Returns:
+            List[List[str]]: get_all_values() の結果
+        """
+        sheet_name = month_sheet_name(month)
+        worksheet = self.find_sheet(sheet_name)
+        if worksheet is None:
+            raise gspread.WorksheetNotFound(sheet_name)
+        return self._call("get_all_values", worksheet.get_all_values)
+
+    def iter_month_rows(self, month: int, chunk_rows: int = 1000, width: int = 8) -> Iterator[List[List[str]]]:
+        """
+        Read the sale rows of a month sheet in chunks
+        月度シートの売上行（C列から width 列）を chunk_rows 行ずつ読み、C列が入っている行だけを返す
+
+        get_all_values() と違い、シート全体をメモリに載せない（1回の読み取りは chunk_rows 行まで）。
+
+        Args:
+            month: 月（1-12）
+            chunk_rows: 1回の読み取りの行数
+            width: C列から読む列数（8: C〜J、9: 売上ID（K列）まで）
+
+        Yields:
+            List[List[str]]: 1回の読み取りに含まれる売上行
+        """
+        worksheet = self._sale_sheet(month_sheet_name(month))
+        # シートの行数が分かれば最後まで読む（途中の空行を挟んで売上が続く場合に備える）
+        row_count = getattr(worksheet, "row_count", None)
+        start = FIRST_DATA_ROW
+        while row_count is None or start <= row_count:
+            end = start + chunk_rows - 1
+            values = self._call("get", worksheet.get, f"C{start}:{rowcol_to_a1(end, 2 + width)}")
+            rows = [(list(row) + [""] * width)[:width] for row in values if row and row[0]]
+            if rows:
+                yield rows
+            if row_count is None and len(values) < chunk_rows:
+                break
+            start = end + 1
+
+    def _sale_sheet(self, sheet_name: str) -> gspread.Worksheet:
+        worksheet = self.find_sheet(sheet_name)
+        if worksheet is None:
+            raise gspread.WorksheetNotFound(sheet_name)
+        return worksheet
+
+    def locate_sale(self, sheet_name: str, row: int, sale_id: str) -> tuple:
+        """
+        Find the current row of a sale and read its C〜L values
+        売上IDの行を特定し、C列〜L列（担当トレーナーまで）の値を読む
+
+        まず記録時の行（索引の値）だけを読み、K列のIDが一致すればそれを返す（1回）。
+        行の挿入・削除でずれていた場合はK列だけを読んで探し直す（シート全体は読まない）。
+
+        Args:
+            sheet_name: シート名
+            row: 索引に記録されている行番号
+            sale_id: 売上ID
+
+        Returns:
+            tuple: (行番号, C〜Lの値)。シートから消えていれば (None, None)
+        """
+        worksheet = self._sale_sheet(sheet_name)
+        width = TRAINER_COLUMN - 2
+        values = self._call("get", worksheet.get, row_range(row, width))
+        line = (values[0] if values else []) + [""] * width
+        if line[SALE_ID_COLUMN - 3] == sale_id:
+            return row, line[:width]
+
+        ids = self._call("col_values", worksheet.col_values, SALE_ID_COLUMN)
+        if sale_id not in ids:
+            return None, None
+        row = ids.index(sale_id) + 1
+        values = self._call("get", worksheet.get, row_range(row, width))
+        return row, ((values[0] if values else []) + [""] * width)[:width]
+
+    def update_sale_row(self, sheet_name: str, row: int, row_values: List):
+        """
+        Overwrite one sale row (C〜K, or C〜L with a trainer) with a single targeted update
+        1行分（C列〜K列、担当トレーナーがあればL列まで）だけを書き換える。空文字の行を渡すと取り消し（行を空にする）
+        """
+        worksheet = self._sale_sheet(sheet_name)
+        self._call("update", worksheet.update, row_range(row, len(row_values)), [row_values])
+
+    def update_sale_rows(self, sheet_name: str, rows: Dict[int, List]):
+        """
+        Overwrite several rows (C〜) with one batch_update
+        行番号 -> C列からの値 をまとめて書き換える（売上台帳からの書き直し用。空なら呼び出さない）
+        """
+        if not rows:
+            return
+        worksheet = self._sale_sheet(sheet_name)
+        data = [
+            {"range": row_range(row, len(row_values)), "values": [row_values]}
+            for row, row_values in sorted(rows.items())
+        ]
+        self._call("batch_update", worksheet.batch_update, data)
@@ -4,13 +4,15 @@ LINE APIからメッセージを取得する機能
 """
 
 import logging
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 from linebot import LineBotApi
 from linebot.exceptions import LineBotApiError
-from linebot.models import MessageEvent, TextMessage
+from linebot.models import TextSendMessage
 
 from .config import Config
+from .line_replies import LINE_API_CALLS, LINE_MESSAGES, ReplyTokenStore, get_reply_tokens, pack_messages
+from .structured_logging import log_payload
 
 logger = logging.getLogger(__name__)
 
@@ -18,12 +20,21 @@ logger = logging.getLogger(__name__)
 class LineClient:
     """LINE Messaging API client"""
 
-    def __init__(self):
-        """Initialize LINE Bot API client"""
-        if not Config.LINE_CHANNEL_ACCESS_TOKEN:
-            raise ValueError("LINE_CHANNEL_ACCESS_TOKEN is not set")
+    def __init__(self, api: Optional[LineBotApi] = None, reply_tokens: Optional[ReplyTokenStore] = None):
+        """
+        Initialize LINE Bot API client
 
-        self.api = LineBotApi(Config.LINE_CHANNEL_ACCESS_TOKEN)
+        Args:
+            api: LineBotApi（テストで差し替える場合に指定）
+            reply_tokens: 返信トークンの保持先（省略時は webhook_server と共有のストア）
+        """
+        if api is None:
+            if not Config.LINE_CHANNEL_ACCESS_TOKEN:
+                raise ValueError("LINE_CHANNEL_ACCESS_TOKEN is not set")
+            api = LineBotApi(Config.LINE_CHANNEL_ACCESS_TOKEN)
+
+        self.api = api
+        self.reply_tokens = reply_tokens or get_reply_tokens()
 
     def fetch_messages(self, limit: int = 10) -> List[Dict]:
         """
@@ -65,9 +76,54 @@ class LineClient:
             user_id: LINE user ID
             text: メッセージ本文
         """
+        self.send_messages(user_id, [text])
+
+    def send_messages(self, user_id: str, texts: List[str]) -> str:
+        """
+        Send messages with the user's reply token, falling back to push
+        有効な返信トークンがあれば返信（月間のメッセージ数に数えない）、なければプッシュで送信
+
+        Args:
+            user_id: LINE user ID
+            texts: メッセージ本文（5件を超える分は最後のメッセージにまとめる）
+
+        Returns:
+            str: "reply" または "push"
+        """
+        messages = [TextSendMessage(text=text) for text in pack_messages(texts)]
+
+        reply_token = self.reply_tokens.take(user_id)
+        if reply_token is not None:
+            try:
+                LINE_API_CALLS.inc(method="reply")
+                self.api.reply_message(reply_token, messages)
+                LINE_MESSAGES.inc(len(messages), method="reply")
+                logger.info(f"Replied with {len(messages)} messages")
+                log_payload("[LINE返信]", {"user_id": user_id, "text": texts})
+                return "reply"
+            except LineBotApiError as e:
+                # 期限切れ・使用済みのトークン（400 Invalid reply token）はプッシュで送り直す
+                logger.warning(f"Reply failed ({e.status_code}), falling back to push: {e}")
+
         try:
-            self.api.push_message(user_id, TextMessage(text=text))
-            logger.info(f"Message sent to {user_id}: {text}")
+            LINE_API_CALLS.inc(method="push")
+            self.api.push_message(user_id, messages)
+            LINE_MESSAGES.inc(len(messages), method="push")
+            logger.info(f"Pushed {len(messages)} messages")
+            log_payload("[LINEプッシュ]", {"user_id": user_id, "text": texts})
+            return "push"
         except LineBotApiError as e:
             logger.error(f"Failed to send message: {e}")
             raise
+
+
+# Global LINE client (lazy initialization)
+_line_client: Optional[LineClient] = None
+
+
+def get_line_client() -> LineClient:
+    """Get or create the shared LINE client"""
+    global _line_client
+    if _line_client is None:
+        _line_client = LineClient()
+    return _line_client
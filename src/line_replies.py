@@ -0,0 +1,161 @@
+"""
+LINE reply module
+記帳確認のLINEメッセージを、Webhookイベントの返信トークンでまとめて返信する
+
+- ReplyTokenStore: Webhookで受け取った返信トークンをユーザーごとに保持（使えるのは1回・一定時間のみ）
+- ConfirmationSender: 同じユーザーへの確認メッセージを window 秒だけ待って1回の返信（最大5件）にまとめる
+
+返信（reply）はプッシュ（push）と違い月間のメッセージ数にカウントされない。返信トークンがない・
+期限切れ・使用済みの場合だけプッシュで送る。返信トークンは受信したプロセスにしかないため、
+Webhookと同じプロセス（combined_server）で記帳した場合に返信になる。
+
+linebot SDKはインポートに時間がかかるため、このモジュールでは読み込まない（送信時に line_api が読み込む）。
+"""
+
+import asyncio
+import logging
+import time
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .config import Config
+from .metrics import REGISTRY, Counter
+
+logger = logging.getLogger(__name__)
+
+# 送信方法（reply / push）ごとのLINE API呼び出し回数と送信したメッセージ数
+LINE_API_CALLS = REGISTRY.register(Counter(
+    "limit_line_api_calls_total", "LINE Messaging API send calls", ["method"]
+))
+LINE_MESSAGES = REGISTRY.register(Counter(
+    "limit_line_messages_total", "LINE messages sent", ["method"]
+))
+
+# 1回の返信・プッシュで送れるメッセージ数の上限（LINE Messaging APIの仕様）
+MAX_MESSAGES_PER_CALL = 5
+
+
+def pack_messages(texts: List[str], limit: int = MAX_MESSAGES_PER_CALL) -> List[str]:
+    """上限を超える場合は最後のメッセージに残りを改行でつなげて limit 件以内にする"""
+    if len(texts) <= limit:
+        return list(texts)
+    return list(texts[:limit - 1]) + ["\n".join(texts[limit - 1:])]
+
+
+class ReplyTokenStore:
+    """Latest unused reply token per LINE user"""
+
+    def __init__(self, ttl_seconds: float = 50.0, clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize reply token store
+
+        Args:
+            ttl_seconds: 受信から何秒まで返信トークンを使うか（LINEの有効期限より短くする）
+            clock: 現在時刻を返す関数（テスト用）
+        """
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._tokens: Dict[str, Tuple[str, float]] = {}
+        self._lock = Lock()
+
+    def put(self, user_id: str, reply_token: str):
+        """Webhookで受け取った返信トークンを記録（同じユーザーの古いトークンは新しい方で置き換える）"""
+        if not user_id or not reply_token:
+            return
+        now = self.clock()
+        with self._lock:
+            self._tokens[user_id] = (reply_token, now)
+            # 期限切れのトークンを掃除
+            expired = [uid for uid, (_, at) in self._tokens.items() if now - at > self.ttl_seconds]
+            for uid in expired:
+                del self._tokens[uid]
+
+    def take(self, user_id: str) -> Optional[str]:
+        """有効な返信トークンを取り出す（1回しか使えないため、取り出したら削除する）"""
+        with self._lock:
+            entry = self._tokens.pop(user_id, None)
+        if entry is None:
+            return None
+        reply_token, received_at = entry
+        if self.clock() - received_at > self.ttl_seconds:
+            return None
+        return reply_token
+
+
+class ConfirmationSender:
+    """Coalesces confirmations per user into one multi-message reply"""
+
+    def __init__(self, deliver: Callable[[str, List[str]], None], window_seconds: float = 1.0):
+        """
+        Initialize confirmation sender
+
+        Args:
+            deliver: (ユーザーID, メッセージのリスト) を送信する関数（ブロッキング、スレッドで実行）
+            window_seconds: 最初の確認メッセージから送信までの待ち時間（秒）
+        """
+        self.deliver = deliver
+        self.window_seconds = window_seconds
+        self._pending: Dict[str, List[str]] = {}
+        self._timers: Dict[str, asyncio.Task] = {}
+
+    async def send(self, user_id: str, text: str):
+        """確認メッセージを送信予約（window 秒以内の同じユーザー宛てはまとめて送る）"""
+        self._pending.setdefault(user_id, []).append(text)
+        if user_id not in self._timers:
+            self._timers[user_id] = asyncio.get_running_loop().create_task(self._flush_later(user_id))
+
+    async def _flush_later(self, user_id: str):
+        await asyncio.sleep(self.window_seconds)
+        await self.flush(user_id)
+
+    async def flush(self, user_id: str):
+        """ユーザー宛ての確認メッセージをすぐに送信"""
+        self._timers.pop(user_id, None)
+        texts = self._pending.pop(user_id, [])
+        if not texts:
+            return
+        try:
+            await asyncio.to_thread(self.deliver, user_id, texts)
+        except Exception as e:
+            logger.error(f"[LINE確認送信失敗] {user_id}: {e}")
+
+    async def close(self):
+        """送信待ちの確認メッセージをすべて送信（終了時）"""
+        for task in list(self._timers.values()):
+            task.cancel()
+        for user_id in list(self._pending):
+            await self.flush(user_id)
+
+
+# Global instances (lazy initialization)
+_reply_tokens: Optional[ReplyTokenStore] = None
+_confirmation_sender: Optional[ConfirmationSender] = None
+
+
+def get_reply_tokens() -> ReplyTokenStore:
+    """Get or create the reply token store"""
+    global _reply_tokens
+    if _reply_tokens is None:
+        _reply_tokens = ReplyTokenStore(ttl_seconds=Config.LINE_REPLY_TOKEN_TTL_SECONDS)
+    return _reply_tokens
+
+
+def _deliver(user_id: str, texts: List[str]):
+    from .line_api import get_line_client
+    get_line_client().send_messages(user_id, texts)
+
+
+def get_confirmation_sender() -> Optional[ConfirmationSender]:
+    """Get or create the confirmation sender (None if LINE_CHANNEL_ACCESS_TOKEN is not set)"""
+    global _confirmation_sender
+    if not Config.LINE_CHANNEL_ACCESS_TOKEN:
+        return None
+    if _confirmation_sender is None:
+        _confirmation_sender = ConfirmationSender(_deliver, window_seconds=Config.LINE_CONFIRMATION_WINDOW_SECONDS)
+    return _confirmation_sender
+
+
+async def flush_confirmations():
+    """送信待ちの確認メッセージをすべて送信（サーバー終了時）"""
+    if _confirmation_sender is not None:
+        await _confirmation_sender.close()
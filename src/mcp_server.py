@@ -7,47 +7,50 @@ FastMCPを使用したMCPサーバー実装
 - 環境変数 PORT でリッスンポートを指定（デフォルト: 8080）
 """
 
+import asyncio
 import logging
 import os
-from typing import Dict
+from datetime import datetime
+from typing import Dict, List, Optional
 
 from mcp.server.fastmcp import FastMCP
+from pydantic import BaseModel
 
+from .call_accounting import track_calls
 from .config import Config
-from .google_sheets import GoogleSheetsClient
+from .sheet_mirror import summarize_month
+from .sheets_service import get_sheet_mirror, get_write_queue
+from .structured_logging import configure_logging
 
 # Configure logging to stderr (IMPORTANT: avoid stdout for STDIO servers)
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler()]  # Uses stderr by default
-)
+configure_logging()  # QueueListener -> StreamHandler(stderr)
 logger = logging.getLogger(__name__)
 
 # Create MCP server instance
 mcp = FastMCP("LimitYotsuya")
 
-# Initialize Google Sheets client (will be initialized on first use)
-sheets_client = None
 
-
-def get_sheets_client() -> GoogleSheetsClient:
-    """Get or create Google Sheets client"""
-    global sheets_client
-    if sheets_client is None:
-        sheets_client = GoogleSheetsClient()
-        sheets_client.connect()
-    return sheets_client
+class SaleInput(BaseModel):
+    """record_gym_sales の1件分"""
+    day: int
+    seller: str
+    payment_method: str
+    product_name: str
+    quantity: int
+    unit_price_excl_tax: float
+    trainer: Optional[str] = None
 
 
 @mcp.tool()
-def record_gym_sale(
+async def record_gym_sale(
     day: int,
     seller: str,
     payment_method: str,
     product_name: str,
     quantity: int,
-    unit_price_excl_tax: float
+    unit_price_excl_tax: float,
+    trainer: Optional[str] = None,
+    store: Optional[str] = None
 ) -> Dict:
     """
     売上情報をスプレッドシートに記録
@@ -59,6 +62,8 @@ def record_gym_sale(
         product_name: 商品・サービス名（例：月4回プラン）
         quantity: 数量
         unit_price_excl_tax: 単価（税抜）
+        trainer: 担当トレーナー（名簿（M列）にない名前は担当なしで記録）
+        store: 店舗ID（省略時はデフォルト店舗）
 
     Returns:
         dict: {
@@ -68,17 +73,17 @@ def record_gym_sale(
         }
     """
     try:
-        client = get_sheets_client()
-        result = client.record_sale(
-            day=day,
-            seller=seller,
-            payment_method=payment_method,
-            product_name=product_name,
-            quantity=quantity,
-            unit_price_excl_tax=unit_price_excl_tax
-        )
-
-        return result
+        # REST APIサーバーと共有の書き込みキュー経由で記録
+        with track_calls("mcp.record_gym_sale", budget=4):
+            return await get_write_queue(store).submit({
+                "day": day,
+                "seller": seller,
+                "payment_method": payment_method,
+                "product_name": product_name,
+                "quantity": quantity,
+                "unit_price_excl_tax": unit_price_excl_tax,
+                "trainer": trainer
+            })
     except Exception as e:
         logger.error(f"Error recording sale: {e}")
         return {
@@ -88,6 +93,76 @@ def record_gym_sale(
         }
 
 
+@mcp.tool()
+async def record_gym_sales(sales: List[SaleInput], store: Optional[str] = None) -> Dict:
+    """
+    複数の売上情報を1回の書き込みでまとめて記録
+
+    Args:
+        sales: record_gym_sale と同じ項目を持つ売上のリスト
+        store: 店舗ID（省略時はデフォルト店舗）
+
+    Returns:
+        dict: {
+            "success": bool,
+            "results": [{"success": bool, "row": int, "message": str, "sheet_name": str}, ...]
+        }
+    """
+    try:
+        with track_calls("mcp.record_gym_sales", budget=4):
+            results = await get_write_queue(store).submit_many([sale.dict() for sale in sales])
+        return {
+            "success": all(result["success"] for result in results),
+            "results": results
+        }
+    except Exception as e:
+        logger.error(f"Error recording sales: {e}")
+        return {
+            "success": False,
+            "results": [],
+            "message": f"エラー: {str(e)}"
+        }
+
+
+@mcp.tool()
+async def month_summary(month: Optional[int] = None, store: Optional[str] = None) -> Dict:
+    """
+    月度シートの売上を集計（読み取り専用、キャッシュ済みのミラーを使用）
+
+    Args:
+        month: 月（1-12、省略時は今月）
+        store: 店舗ID（省略時はデフォルト店舗）
+
+    Returns:
+        dict: {
+            "success": bool,
+            "month": int,
+            "count": int,
+            "total_excl_tax": number,
+            "total_incl_tax": number,
+            "by_payment_method": dict,
+            "by_product": dict
+        }
+    """
+    month = month or datetime.now().month
+    try:
+        # キャッシュが新しければAPI呼び出しなし、期限切れなら1回だけ読み直す
+        with track_calls("mcp.month_summary", budget=1):
+            values = await asyncio.to_thread(get_sheet_mirror(store).get_month_values, month)
+        return {
+            "success": True,
+            "month": month,
+            **summarize_month(values)
+        }
+    except Exception as e:
+        logger.error(f"Error summarizing month {month}: {e}")
+        return {
+            "success": False,
+            "month": month,
+            "message": f"エラー: {str(e)}"
+        }
+
+
 def main():
     """Main entry point for the MCP server"""
     try:
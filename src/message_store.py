@@ -57,7 +57,7 @@ class MessageStore:
             if len(self.messages) > self.max_messages:
                 self.messages = self.messages[:self.max_messages]
 
-            logger.info(f"Message added: {text[:50]}... (total: {len(self.messages)})")
+            logger.debug(f"Message added (total: {len(self.messages)})")
 
             # Persist if configured
             if self.persist_file:
@@ -0,0 +1,242 @@
+"""
+Metrics module
+処理段階ごとのレイテンシ・API呼び出し回数などを集計し、Prometheusテキスト形式で出力する
+
+外部ライブラリに依存しない最小実装。OpenTelemetry（opentelemetry-api）がインストール
+されていれば、trace_span() / stage() はスパンも記録する。
+"""
+
+import math
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .structured_logging import add_stage
+
+try:
+    from opentelemetry import trace as _otel_trace
+except ImportError:  # OpenTelemetryは任意依存
+    _otel_trace = None
+
+# レイテンシ用のバケット（秒）: Sheets/GeminiのAPI呼び出しは数十ms〜数十秒
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    """ラベルを {a="x",b="y"} 形式に整形"""
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonically increasing counter with labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.lock = Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        """Increase the counter for a label set"""
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self.lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        """Current value for a label set (0 if never incremented)"""
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self.lock:
+            return self._values.get(key, 0)
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+    def reset(self):
+        with self.lock:
+            self._values.clear()
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    def set(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self.lock:
+            self._values[key] = value
+
+    def collect(self) -> List[str]:
+        lines = super().collect()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    """Cumulative histogram with labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # ラベル -> [各バケットの件数, 合計, 件数]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self.lock = Lock()
+
+    def observe(self, value: float, **labels):
+        """Record one observation"""
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self.lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = [[0] * len(self.buckets), 0.0, 0]
+                self._values[key] = entry
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, **labels) -> int:
+        """Number of observations for a label set"""
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self.lock:
+            entry = self._values.get(key)
+            return entry[2] if entry else 0
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = sorted((key, (list(entry[0]), entry[1], entry[2])) for key, entry in self._values.items())
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+    def reset(self):
+        with self.lock:
+            self._values.clear()
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Clear all values (for tests)"""
+        for metric in self._metrics:
+            metric.reset()
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 処理段階ごとの所要時間（gemini_parse, tax, sheet_lookup, next_row_scan, write）
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "limit_stage_duration_seconds", "Duration of each processing stage", ["stage"]
+))
+# エンドポイントごとのリクエスト処理時間
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "limit_request_duration_seconds", "HTTP request duration", ["method", "path", "status"]
+))
+# Google Sheets API呼び出し回数（gspreadのメソッド単位）
+SHEETS_API_CALLS = REGISTRY.register(Counter(
+    "limit_sheets_api_calls_total", "Google Sheets API calls", ["method"]
+))
+# キャッシュのヒット・ミス
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "limit_cache_requests_total", "Cache lookups", ["cache", "result"]
+))
+# 上流（gemini / sheets）へのリトライ回数
+RETRIES = REGISTRY.register(Counter(
+    "limit_retries_total", "Retried upstream calls", ["upstream"]
+))
+# 段階・上流ごとのエラー回数
+ERRORS = REGISTRY.register(Counter(
+    "limit_errors_total", "Errors by stage", ["stage"]
+))
+
+
+def record_cache(cache: str, hit: bool):
+    """キャッシュのヒット/ミスを記録"""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+@contextmanager
+def trace_span(name: str, **attributes):
+    """
+    OpenTelemetryのスパンを開始（opentelemetry未インストール時は何もしない）
+
+    Args:
+        name: スパン名（例: "sheets.get_all_values"）
+        attributes: スパン属性
+    """
+    if _otel_trace is None:
+        yield None
+        return
+    tracer = _otel_trace.get_tracer("limit_keiri")
+    with tracer.start_as_current_span(name, attributes=attributes) as span:
+        yield span
+
+
+@contextmanager
+def stage(name: str):
+    """
+    処理段階の所要時間を計測し、STAGE_SECONDS と現在のリクエストのログに記録する
+
+    例外が発生した場合は ERRORS にも記録して再送出する。
+    """
+    start = time.perf_counter()
+    try:
+        with trace_span(f"stage.{name}"):
+            yield
+    except Exception:
+        ERRORS.inc(stage=name)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        add_stage(name, elapsed)
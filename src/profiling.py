@@ -0,0 +1,249 @@
+"""
+Profiling module
+リクエスト単位のプロファイラ（遅いリクエストの時間がGemini呼び出し・トークン更新・get_all_values・ログ出力の
+どこで使われたかを調べる）
+
+- X-Profile ヘッダーに PROFILE_TOKEN を付けたリクエスト、または PROFILE_SAMPLE_RATE の割合のリクエストだけを対象にする
+- 対象のリクエストの間、全スレッドのスタックを PROFILE_INTERVAL_MS ごとに採取する（サンプリング方式）。
+  Gemini・Sheetsの呼び出しは to_thread のワーカースレッドで行うため、呼び出したスレッドしか計測しない
+  cProfile ではなく、スレッドをまたいで見られるサンプリングにしている。待機中のスレッド（空のワーカー・
+  イベントループの select・ログ出力待ち）は数えない
+- 結果は PROFILE_DIR に <時刻>-<リクエストID>.json（処理段階ごとの所要時間・よく出た関数）と
+  .folded（flamegraph.pl・speedscope で読める折りたたみスタック）として保存し、新しい PROFILE_MAX_FILES 件だけ残す
+- 同時にプロファイルするのは1リクエストまで（実行中なら次の対象はプロファイルせずに処理する）
+
+PROFILE_TOKEN・PROFILE_SAMPLE_RATE のどちらも設定していなければミドルウェアを登録しないため、通常の処理には影響しない。
+プロファイル中に並行して処理された他のリクエストのスタックも含まれる点に注意。
+"""
+
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .config import Config
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-Profile"
+
+# ファイル名に使えない文字（リクエストIDはクライアントが X-Request-ID で指定できる）
+UNSAFE_NAME = re.compile(r"[^A-Za-z0-9_-]")
+
+# 待機中とみなすスタックの先頭（ファイル名, 関数名）
+IDLE_FRAMES = {
+    ("thread.py", "_worker"),     # concurrent.futures のワーカーが次の処理を待っている
+    ("selectors.py", "select"),   # イベントループが入出力を待っている
+    ("threading.py", "wait"),
+    ("queue.py", "get"),          # ログ出力（QueueListener）などが次の項目を待っている
+}
+
+# 1つだけのプロファイラ（cProfile と同様、同時に複数を動かすと互いの計測に混ざるため）
+_active = threading.Lock()
+
+
+def profiling_enabled() -> bool:
+    """ミドルウェアを登録するか（起動時に1回だけ判定する）"""
+    return bool(Config.PROFILE_TOKEN) or Config.PROFILE_SAMPLE_RATE > 0
+
+
+def is_admin(header_value: Optional[str]) -> bool:
+    """X-Profile ヘッダーが PROFILE_TOKEN と一致するか（未設定なら常に False）"""
+    token = Config.PROFILE_TOKEN
+    return bool(token) and header_value is not None and hmac.compare_digest(header_value.encode(), token.encode())
+
+
+def should_profile(header_value: Optional[str], sample: Callable[[], float] = random.random) -> bool:
+    """このリクエストをプロファイルするか"""
+    if is_admin(header_value):
+        return True
+    return Config.PROFILE_SAMPLE_RATE > 0 and sample() < Config.PROFILE_SAMPLE_RATE
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Wall-clock stack sampler over all threads (stdlib only)"""
+
+    def __init__(self, interval_seconds: float = 0.005):
+        """
+        Initialize sampling profiler
+
+        Args:
+            interval_seconds: スタックを採取する間隔（秒）
+        """
+        self.interval_seconds = interval_seconds
+        self.stacks: Counter = Counter()  # "スレッド名;外側の関数;...;内側の関数" -> サンプル数
+        self.samples = 0  # 採取した回数
+        self.started_at = 0.0
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sample(self):
+        """全スレッドのスタックを1回採取（待機中のスレッドは数えない）"""
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(ident, str(ident)))
+            self.stacks[";".join(reversed(labels))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            self.sample()
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.elapsed = time.perf_counter() - self.started_at
+
+    def top_functions(self, limit: int = 20) -> Dict[str, List[Dict]]:
+        """
+        Functions seen most often
+
+        Returns:
+            dict: {"self": [...], "total": [...]}。各項目は {"function", "samples", "ms"}
+                self は実行中だった（スタックの先頭の）関数、total は呼び出し中の関数も含む
+        """
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for function in set(frames):
+                total[function] += count
+        ms_per_sample = self.elapsed * 1000 / self.samples if self.samples else 0.0
+        return {
+            key: [
+                {"function": function, "samples": count, "ms": round(count * ms_per_sample, 2)}
+                for function, count in counter.most_common(limit)
+            ]
+            for key, counter in (("self", own), ("total", total))
+        }
+
+
+def start_profile() -> Optional[SamplingProfiler]:
+    """
+    Start profiling the current request
+    プロファイルを開始する（他のリクエストをプロファイル中なら None）
+    """
+    if not _active.acquire(blocking=False):
+        logger.debug("[プロファイル] 他のリクエストをプロファイル中のため省略します")
+        return None
+    profiler = SamplingProfiler(Config.PROFILE_INTERVAL_MS / 1000)
+    profiler.start()
+    return profiler
+
+
+def stop_profile(profiler: SamplingProfiler):
+    """プロファイルを終了する（start_profile で開始したもの）"""
+    try:
+        profiler.stop()
+    finally:
+        _active.release()
+
+
+class ProfileStore:
+    """Directory of saved request profiles (newest max_files are kept)"""
+
+    def __init__(self, directory: str, max_files: int = 100):
+        self.directory = Path(directory)
+        self.max_files = max(max_files, 1)
+        self.lock = threading.Lock()
+
+    def save(self, summary: Dict, profiler: SamplingProfiler) -> str:
+        """
+        Save a profile as <time>-<request ID>.json and .folded
+
+        Args:
+            summary: リクエストの情報（request_id, method, path, status, duration_ms, stages_ms など）
+
+        Returns:
+            str: 保存した .json のパス
+        """
+        request_id = UNSAFE_NAME.sub("_", str(summary["request_id"]))[:64]
+        name = f"{datetime.now().strftime('%Y%m%dT%H%M%S_%f')}-{request_id}"
+        record = {
+            **summary,
+            "name": name,
+            "saved_at": datetime.now().isoformat(timespec="seconds"),
+            "samples": profiler.samples,
+            "interval_ms": round(profiler.interval_seconds * 1000, 3),
+            "top": profiler.top_functions()
+        }
+        with self.lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / f"{name}.folded", "w", encoding="utf-8") as f:
+                for stack, count in profiler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            path = self.directory / f"{name}.json"
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False, indent=2)
+            self._prune()
+        logger.info(f"[プロファイル] {path} に保存しました（{profiler.samples} サンプル）")
+        return str(path)
+
+    def _prune(self):
+        """古いプロファイルを削除（lock を保持して呼ぶ）"""
+        for path in sorted(self.directory.glob("*.json"))[:-self.max_files]:
+            path.unlink(missing_ok=True)
+            path.with_suffix(".folded").unlink(missing_ok=True)
+
+    def recent(self, limit: int = 20) -> List[Dict]:
+        """
+        Newest profiles first (without the stacks)
+
+        Returns:
+            List[dict]: 保存したリクエストの情報 + "top"（よく出た関数）+ "folded"（折りたたみスタックのパス）
+        """
+        with self.lock:
+            paths = sorted(self.directory.glob("*.json"), reverse=True)[:limit] if self.directory.exists() else []
+        profiles = []
+        for path in paths:
+            try:
+                with open(path, encoding="utf-8") as f:
+                    record = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue  # 削除・書き込み中のファイル
+            profiles.append({**record, "folded": str(path.with_suffix(".folded"))})
+        return profiles
+
+
+# Global profile store (lazy initialization)
+_store: Optional[ProfileStore] = None
+
+
+def get_profile_store() -> ProfileStore:
+    """Get or create the profile store (PROFILE_DIR is read at first use)"""
+    global _store
+    if _store is None:
+        _store = ProfileStore(Config.PROFILE_DIR, max_files=Config.PROFILE_MAX_FILES)
+    return _store
@@ -0,0 +1,189 @@
+"""
+Readiness module
+上流（Google Sheets / Gemini）への接続状態を保持し、ヘルスチェックをAPI呼び出しなしで返す
+
+- report_success() / report_failure(): 通常の処理でAPI呼び出しが成功・失敗するたびに記録（受動的な確認）
+- ReadinessMonitor: 一定間隔ごとにバックグラウンドで状態を更新。直近 interval 秒以内に
+  通常の処理で成功していればAPIは呼ばず、そうでない上流だけ軽い確認用の呼び出しを行う
+
+/readyz・/livez はメモリ上の状態を読むだけなので、何度呼ばれてもAPIクォータを消費しない。
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Callable, Dict, Iterable, Optional
+
+from .call_accounting import track_calls, use_ledger
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamStatus:
+    """Last known state of one upstream"""
+
+    def __init__(self):
+        self.ok: Optional[bool] = None  # None: まだ一度も確認していない
+        self.last_success: Optional[float] = None
+        self.last_failure: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def as_dict(self) -> Dict:
+        return {
+            "ok": self.ok,
+            "last_success": _isoformat(self.last_success),
+            "last_failure": _isoformat(self.last_failure),
+            "last_error": self.last_error
+        }
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+
+# 上流名（"sheets", "gemini"）-> 状態
+_statuses: Dict[str, UpstreamStatus] = {}
+_status_lock = Lock()
+
+
+def _status(name: str) -> UpstreamStatus:
+    status = _statuses.get(name)
+    if status is None:
+        status = _statuses.setdefault(name, UpstreamStatus())
+    return status
+
+
+def report_success(name: str, at: Optional[float] = None):
+    """上流へのAPI呼び出しが成功したことを記録"""
+    with _status_lock:
+        status = _status(name)
+        status.ok = True
+        status.last_success = time.time() if at is None else at
+        status.last_error = None
+
+
+def report_failure(name: str, error, at: Optional[float] = None):
+    """上流へのAPI呼び出しが失敗したことを記録"""
+    with _status_lock:
+        status = _status(name)
+        status.ok = False
+        status.last_failure = time.time() if at is None else at
+        status.last_error = str(error)[:200]
+
+
+def upstream_status(name: str) -> Dict:
+    """上流の状態（コピー）"""
+    with _status_lock:
+        return _status(name).as_dict()
+
+
+def reset_statuses():
+    """Clear all upstream states (for tests)"""
+    with _status_lock:
+        _statuses.clear()
+
+
+class ReadinessMonitor:
+    """Refreshes upstream connectivity in the background and answers probes from memory"""
+
+    def __init__(
+        self,
+        checks: Dict[str, Callable[[], None]],
+        interval_seconds: float = 60.0,
+        required: Iterable[str] = ("sheets",),
+        clock: Callable[[], float] = time.time
+    ):
+        """
+        Initialize readiness monitor
+
+        Args:
+            checks: 上流名 -> 確認用の関数（失敗時は例外を送出）
+            interval_seconds: 状態を更新する間隔（秒）
+            required: readyの判定に必要な上流（それ以外は状態の表示のみ）
+            clock: 現在時刻を返す関数（テスト用）
+        """
+        self.checks = checks
+        self.interval_seconds = interval_seconds
+        self.required = tuple(required)
+        self.clock = clock
+        self.checked_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _needs_check(self, name: str) -> bool:
+        """直近 interval 秒以内に成功していれば確認用の呼び出しは不要"""
+        with _status_lock:
+            last_success = _status(name).last_success
+        return last_success is None or self.clock() - last_success >= self.interval_seconds
+
+    def refresh(self):
+        """Run the checks of upstreams without a recent success (blocking)"""
+        # 確認用のAPI呼び出しはプローブではなく "readiness" として計上する
+        with use_ledger(None), track_calls("readiness"):
+            for name, check in self.checks.items():
+                if not self._needs_check(name):
+                    continue
+                try:
+                    check()
+                    report_success(name, at=self.clock())
+                except Exception as e:
+                    logger.warning(f"[レディネス確認失敗] {name}: {e}")
+                    report_failure(name, e, at=self.clock())
+        self.checked_at = self.clock()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.error(f"[レディネス確認] 更新に失敗: {e}", exc_info=True)
+            await asyncio.sleep(self.interval_seconds)
+
+    def ensure_started(self):
+        """実行中のイベントループ上で定期更新を開始（開始済みなら何もしない）"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        """定期更新を停止"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def is_ready(self) -> bool:
+        """必須の上流がすべて、有効期限（間隔の3倍）内に成功していれば ready"""
+        stale_after = self.interval_seconds * 3
+        now = self.clock()
+        with _status_lock:
+            for name in self.required:
+                status = _status(name)
+                if not status.ok or status.last_success is None or now - status.last_success > stale_after:
+                    return False
+        return True
+
+    def snapshot(self) -> Dict:
+        """
+        Current readiness (no API calls)
+
+        Returns:
+            dict: {
+                "ready": bool,
+                "checked_at": str | None,
+                "upstreams": {上流名: {"ok", "last_success", "last_failure", "last_error"}}
+            }
+        """
+        return {
+            "ready": self.is_ready(),
+            "checked_at": _isoformat(self.checked_at),
+            "upstreams": {name: upstream_status(name) for name in self.checks}
+        }
@@ -0,0 +1,273 @@
+"""
+Replay module
+売上台帳（src/sales_ledger.py）から月度シート（「N 月度」）を書き直す
+
+    python -m src.replay 12
+    python -m src.replay 12 --store shinjuku --dry-run
+    python -m src.replay 12 --rebuild
+
+- 既定（resync）: シートを1回読み、K列の売上IDで台帳と突き合わせる。
+  値が台帳と違う行（手作業で壊れた行）と、取り消したのにシートに残っている行をまとめて1回の batch_update で
+  書き直し、シートにない売上（書き込み中にプロセスが落ちた分）は record_sales でまとめて書き込む。
+  売上IDのない行（手作業で入力した行）には触れない。SALE_IDS が有効である必要がある
+- --rebuild: 台帳の売上だけで5行目から書き直し、その下の使用済みの行を空にする（1回の batch_update）。
+  SALE_IDS が無効なら record_sales と同じくC〜J列だけを書き、K列・L列と売上索引には触れない。
+  台帳にない行（手作業で入力した行・台帳を入れる前の売上）も消えるため、シートを作り直すときだけ使う
+
+書き込みに失敗した（failed）売上は呼び出し元が再送しているため書き込まない。シートのK列にIDが
+見つかった場合（タイムアウトしたが実際は書き込まれていた）だけ、書き込み済みとして台帳に記録する。
+書き直した行は売上索引・トレーナー索引にも反映する。稼働中のサーバーの書き込みと衝突しないよう、
+店舗の空行割り当てロックの中で書き込む。
+"""
+
+import argparse
+import json
+import logging
+from collections import Counter
+from typing import Dict, List, Optional
+
+import gspread
+
+from .config import Config
+from .google_sheets import FIRST_DATA_ROW, SALE_ID_COLUMN, TRAINER_COLUMN, GoogleSheetsClient, month_sheet_name
+from .row_lock import get_row_lock
+from .sale_index import get_sale_index
+from .sales_ledger import SalesLedger, get_sales_ledger
+from .sheet_mirror import row_to_sale
+from .stores import get_store_registry
+from .structured_logging import configure_logging
+from .trainers import get_trainer_index
+
+logger = logging.getLogger(__name__)
+
+# 1回の record_sales にまとめる売上の上限
+MAX_ROWS_PER_WRITE = 500
+
+# 書き直す列数（C〜L）
+ROW_WIDTH = TRAINER_COLUMN - 2
+# 売上IDを使わない（SALE_IDS=false）ときに書き直す列数（C〜J。K列はテンプレートで使われていることがある）
+DATA_WIDTH = SALE_ID_COLUMN - 3
+
+STAT_KEYS = ("ledger", "unchanged", "corrected", "voided", "written", "adopted", "skipped_failed", "cleared")
+
+
+def row_width() -> int:
+    """書き直す列数（SALE_IDS が有効ならC〜L、無効ならC〜J）"""
+    return ROW_WIDTH if Config.SALE_IDS else DATA_WIDTH
+
+
+def ledger_row_values(sale_id: str, sale: Dict) -> List:
+    """
+    台帳の売上から書き直す行の値を組み立てる
+
+    SALE_IDS が有効ならC〜L列（売上ID・担当トレーナーまで）、無効なら record_sales と同じくC〜J列だけ。
+    """
+    values = GoogleSheetsClient._build_row_data(
+        sale["day"], sale["seller"], sale["payment_method"], sale["product_name"],
+        sale["quantity"], sale["unit_price_excl_tax"], sale.get("unit_price_incl_tax")
+    )
+    if not Config.SALE_IDS:
+        return values
+    return values + [sale_id, sale.get("trainer") or ""]
+
+
+def _cell(value) -> str:
+    """比較用のセル値（"32,000" と 32000、"3.0" と 3 を同じ値として扱う）"""
+    text = str(value).replace(",", "").replace("¥", "").replace("￥", "").strip()
+    try:
+        return str(float(text))
+    except ValueError:
+        return text
+
+
+def same_row(current: List, expected: List) -> bool:
+    """シートの行（表示形式の文字列）が台帳の値と同じか"""
+    current = (list(current) + [""] * ROW_WIDTH)[:ROW_WIDTH]
+    return [_cell(value) for value in current] == [_cell(value) for value in expected]
+
+
+class Replay:
+    """Regenerates a month sheet from the sales ledger"""
+
+    def __init__(
+        self,
+        client: GoogleSheetsClient,
+        store: Optional[str] = None,
+        ledger: Optional[SalesLedger] = None,
+        dry_run: bool = False
+    ):
+        """
+        Initialize replay
+
+        Args:
+            client: 書き込み先のSheetsクライアント
+            store: 台帳の店舗キー（None: デフォルト店舗）
+            ledger: 売上台帳（省略時は SALES_LEDGER_FILE）
+            dry_run: True の場合、突き合わせのみ行い書き込まない
+        """
+        self.client = client
+        self.store = store
+        # 台帳は年ごとのスプレッドシートを区別するため、このスプレッドシートに記帳した売上だけを書き直す
+        self.spreadsheet = client.spreadsheet_id
+        self.ledger = ledger or get_sales_ledger()
+        self.dry_run = dry_run
+        self.stats: Counter = Counter({key: 0 for key in STAT_KEYS})
+
+    def _read(self, month: int) -> List[List[str]]:
+        try:
+            return self.client.get_month_values(month)
+        except gspread.WorksheetNotFound:
+            return []
+
+    def _written(self, sheet_name: str, rows: List[int], entries: List[Dict], values: List[List]):
+        """書き込んだ（見つかった）行を台帳・売上索引（SALE_IDS が有効な場合）・トレーナー索引に反映"""
+        sale_ids = [entry["sale_id"] for entry in entries]
+        self.ledger.written(sheet_name, rows, sale_ids)
+        if Config.SALE_IDS:
+            get_sale_index().add(self.store, sheet_name, rows, sale_ids)
+        # 担当トレーナーは台帳の売上から取る（SALE_IDS が無効ならL列には書かない）
+        get_trainer_index().record(self.store, self.spreadsheet, sheet_name, [
+            {**row_to_sale(row_values), "trainer": entry["sale"].get("trainer"), "sale_id": entry["sale_id"]}
+            for row_values, entry in zip(values, entries)
+        ])
+
+    def resync(self, month: int) -> Dict:
+        """
+        Repair a month sheet in place (rows are matched by sale ID)
+
+        Returns:
+            dict: 件数の内訳（STAT_KEYS）
+        """
+        sheet_name = month_sheet_name(month)
+        entries = self.ledger.entries(self.store, self.spreadsheet, month, include_voided=True)
+        self.stats["ledger"] += len(entries)
+
+        with get_row_lock(self.store).hold():
+            values = self._read(month)
+            rows_by_id = {}
+            for row, line in enumerate(values[FIRST_DATA_ROW - 1:], start=FIRST_DATA_ROW):
+                if len(line) >= SALE_ID_COLUMN and line[SALE_ID_COLUMN - 1]:
+                    rows_by_id[line[SALE_ID_COLUMN - 1]] = (row, line[2:2 + ROW_WIDTH])
+
+            updates: Dict[int, List] = {}
+            found, missing = [], []
+            for entry in entries:
+                sale_id = entry["sale_id"]
+                expected = ledger_row_values(sale_id, entry["sale"])
+                if sale_id not in rows_by_id:
+                    if entry["voided"]:
+                        continue
+                    if entry["failed"]:
+                        self.stats["skipped_failed"] += 1
+                        continue
+                    missing.append((entry, expected))
+                    continue
+
+                row, current = rows_by_id[sale_id]
+                if entry["voided"]:
+                    updates[row] = [""] * ROW_WIDTH
+                    self.stats["voided"] += 1
+                    continue
+                if same_row(current, expected):
+                    self.stats["unchanged"] += 1
+                else:
+                    updates[row] = expected
+                    self.stats["corrected"] += 1
+                if entry["row"] != row or entry["sheet"] != sheet_name:
+                    self.stats["adopted"] += 1
+                    found.append((row, entry, expected))
+
+            if self.dry_run:
+                self.stats["written"] += len(missing)
+                return dict(self.stats)
+
+            self.client.update_sale_rows(sheet_name, updates)
+            for entry in entries:
+                if entry["voided"] and entry["sale_id"] in rows_by_id:
+                    get_sale_index().remove(entry["sale_id"])
+                    get_trainer_index().remove(entry["sale_id"])
+            if found:
+                self._written(sheet_name, [row for row, _, _ in found],
+                              [entry for _, entry, _ in found], [expected for _, _, expected in found])
+
+            for start in range(0, len(missing), MAX_ROWS_PER_WRITE):
+                batch = missing[start:start + MAX_ROWS_PER_WRITE]
+                sales = [{**entry["sale"], "sale_id": entry["sale_id"]} for entry, _ in batch]
+                result = self.client.record_sales(sales, month=month)
+                if not result["success"]:
+                    raise RuntimeError(f"{sheet_name} への書き込みに失敗しました: {result['message']}")
+                self._written(result["sheet_name"], result["rows"], [entry for entry, _ in batch],
+                              [expected for _, expected in batch])
+                self.stats["written"] += len(batch)
+
+        logger.info(f"[台帳から書き直し] {sheet_name}: {dict(self.stats)}")
+        return dict(self.stats)
+
+    def rebuild(self, month: int) -> Dict:
+        """
+        Rewrite a month sheet from the ledger only (destructive for rows not in the ledger)
+
+        Returns:
+            dict: 件数の内訳（STAT_KEYS）
+        """
+        sheet_name = month_sheet_name(month)
+        entries = [entry for entry in self.ledger.entries(self.store, self.spreadsheet, month)
+                   if not entry["failed"]]
+        self.stats["ledger"] += len(entries)
+        new_values = [ledger_row_values(entry["sale_id"], entry["sale"]) for entry in entries]
+        rows = list(range(FIRST_DATA_ROW, FIRST_DATA_ROW + len(entries)))
+
+        width = row_width()
+
+        with get_row_lock(self.store).hold():
+            values = self._read(month)
+            # 書き直す列（C〜L、SALE_IDS が無効ならC〜J）のどこかに値がある最後の行まで空にする
+            last_used = max(
+                (row for row, line in enumerate(values[FIRST_DATA_ROW - 1:], start=FIRST_DATA_ROW)
+                 if any(str(value).strip() for value in line[2:2 + width])),
+                default=0
+            )
+            updates = dict(zip(rows, new_values))
+            for row in range(FIRST_DATA_ROW + len(entries), last_used + 1):
+                updates[row] = [""] * width
+            self.stats["written"] += len(entries)
+            self.stats["cleared"] += max(last_used + 1 - FIRST_DATA_ROW - len(entries), 0)
+            if self.dry_run:
+                return dict(self.stats)
+
+            self.client.get_month_sheet(month)  # シートがなければテンプレートから作る
+            self.client.update_sale_rows(sheet_name, updates)
+            self._written(sheet_name, rows, entries, new_values)
+
+        logger.info(f"[台帳から作り直し] {sheet_name}: {dict(self.stats)}")
+        return dict(self.stats)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Resync or rebuild a month sheet from the sales ledger"""
+    parser = argparse.ArgumentParser(description="売上台帳から月度シートを書き直す")
+    parser.add_argument("month", type=int, help="月（1-12）")
+    parser.add_argument("--store", default=None, help="店舗ID（省略時はデフォルト店舗）")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="台帳の売上だけでシートを作り直す（台帳にない行は消える）")
+    parser.add_argument("--dry-run", action="store_true", help="突き合わせのみ行い、書き込まない")
+    args = parser.parse_args(argv)
+    if not 1 <= args.month <= 12:
+        parser.error("month は 1〜12 で指定してください")
+    if not args.rebuild and not Config.SALE_IDS:
+        parser.error("resync は売上ID（K列）で突き合わせるため SALE_IDS を有効にしてください（または --rebuild）")
+
+    configure_logging()
+
+    from .sheets_service import get_sheets_client
+
+    registry = get_store_registry()
+    registry.get(args.store)  # 登録されていない店舗IDはここでエラー
+    store = None if registry.is_default(args.store) else args.store
+    replay = Replay(get_sheets_client(args.store), store, dry_run=args.dry_run)
+    stats = replay.rebuild(args.month) if args.rebuild else replay.resync(args.month)
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Inter-process row allocation lock
+複数ワーカープロセスで同じ空行に書き込まないための排他ロック
+
+空行の検索から書き込みまでを1つのクリティカルセクションとして扱う。
+ROW_LOCK_FILE が設定されている場合はファイルロック（fcntl.flock）でプロセス間を排他し、
+未設定の場合はプロセス内のロックのみを使う。
+"""
+
+import logging
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows（ローカル開発）ではプロセス間ロックなし
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def file_lock(f):
+    """
+    Hold an exclusive flock() on an open file (no-op where fcntl is unavailable)
+
+    追記のみのJSON Linesファイル（売上索引・保留・台帳など）で、他のプロセスの分の読み込みから
+    追記までを1つのクリティカルセクションにするために使う。
+    """
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class RowAllocationLock:
+    """Process-local lock, optionally backed by an flock()ed file"""
+
+    def __init__(self, lock_file: Optional[str] = None):
+        """
+        Initialize row allocation lock
+
+        Args:
+            lock_file: プロセス間で共有するロックファイルのパス（Noneならプロセス内のみ）
+        """
+        self.lock_file = lock_file
+        self._thread_lock = Lock()
+
+        if self.lock_file and fcntl is None:
+            logger.warning("[行ロック] このOSではファイルロックが使えないため、プロセス内の排他のみ行います")
+            self.lock_file = None
+        if self.lock_file:
+            Path(self.lock_file).parent.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def hold(self):
+        """空行の検索〜書き込みの間ロックを保持する"""
+        with self._thread_lock:
+            if not self.lock_file:
+                yield
+                return
+
+            with open(self.lock_file, "a") as f, file_lock(f):
+                yield
+
+
+def store_lock_file(lock_file: Optional[str], store_id: Optional[str]) -> Optional[str]:
+    """店舗ごとのロックファイル名（例: data/row_allocation.lock -> data/row_allocation.yotsuya.lock）"""
+    if not lock_file or store_id is None:
+        return lock_file
+    path = Path(lock_file)
+    return str(path.with_name(f"{path.stem}.{store_id}{path.suffix}"))
+
+
+# Global lock instances（店舗ごと。Noneはデフォルト店舗）
+_row_lock: Optional[RowAllocationLock] = None
+_store_row_locks: Dict[str, RowAllocationLock] = {}
+_locks_guard = Lock()
+
+
+def get_row_lock(store_id: Optional[str] = None) -> RowAllocationLock:
+    """
+    Get or create the row allocation lock (ROW_LOCK_FILE is read at first use)
+
+    店舗が違えばスプレッドシートも違うため、ロックも店舗ごとに分ける（他店舗の書き込みを待たない）。
+    """
+    global _row_lock
+    if store_id is None:
+        if _row_lock is None:
+            _row_lock = RowAllocationLock(os.getenv("ROW_LOCK_FILE"))
+        return _row_lock
+
+    with _locks_guard:
+        lock = _store_row_locks.get(store_id)
+        if lock is None:
+            lock = RowAllocationLock(store_lock_file(os.getenv("ROW_LOCK_FILE"), store_id))
+            _store_row_locks[store_id] = lock
+        return lock
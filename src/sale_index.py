@@ -0,0 +1,137 @@
+"""
+Sale index module
+売上ID -> 店舗・シート・行番号 の索引
+
+記帳した売上を後から参照・修正・取り消すとき、シート全体を検索せずに行を特定するために使う。
+書き込みのたびに差分だけをJSON Lines（SALE_INDEX_FILE）に追記し、起動時に読み込む。
+別プロセス（バックフィル・台帳からの書き直しなど）が追記した分は、索引にないIDを参照したときに続きから読み込む。
+
+行番号は記録時の値なので、手作業で行が挿入・削除されるとずれる。参照時にK列の売上IDで
+確認し（GoogleSheetsClient.locate_sale）、ずれていれば move() で更新する。
+"""
+
+import json
+import logging
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterable, Optional
+
+from .config import Config
+from .row_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+
+class SaleIndex:
+    """Append-only, incrementally loaded map of sale ID -> location"""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initialize sale index
+
+        Args:
+            path: 索引ファイルのパス（Noneならメモリ上のみ）
+        """
+        self.path = path
+        self._entries: Dict[str, Dict] = {}
+        self._offset = 0  # 読み込み済みのファイル位置
+        self.lock = Lock()
+        if self.path:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._load()
+
+    def _load(self):
+        """ファイルの未読部分を読み込む（lock を保持して呼ぶ）"""
+        path = Path(self.path)
+        if not path.exists():
+            return
+        with open(path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # 他のプロセスが書き込み中の行は次回読む
+                self._offset += len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"[売上索引] 壊れた行を読み飛ばしました: {line[:80]!r}")
+                    continue
+                self._apply(record)
+
+    def _apply(self, record: Dict):
+        sale_id = record.pop("id")
+        if record.get("deleted"):
+            self._entries.pop(sale_id, None)
+        else:
+            self._entries[sale_id] = record
+
+    def _append(self, records: Iterable[Dict]):
+        """変更を反映し、ファイルに追記（lock を保持して呼ぶ）"""
+        records = list(records)
+        if not self.path or not records:
+            for record in records:
+                self._apply(dict(record))
+            return
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        with open(self.path, "ab") as f, file_lock(f):
+            # 追記前に他のプロセスの分を読み込み、自分の追記分は読み込み済みとして扱う
+            # （ファイルロックを保持したまま行うため、間に他のプロセスが追記した行を読み飛ばさない）
+            self._load()
+            for record in records:
+                self._apply(dict(record))
+            f.write(data)
+            f.flush()
+            self._offset = f.tell()
+
+    def add(self, store: Optional[str], sheet_name: str, rows: Iterable[int], sale_ids: Iterable[str]):
+        """記帳した売上を追加"""
+        with self.lock:
+            self._append(
+                {"id": sale_id, "store": store, "sheet": sheet_name, "row": row}
+                for row, sale_id in zip(rows, sale_ids)
+            )
+
+    def get(self, sale_id: str) -> Optional[Dict]:
+        """
+        Return {"store", "sheet", "row"} of a sale (None if unknown)
+
+        索引にないIDは、他のプロセスが追記した分を読み込んでからもう一度探す。
+        """
+        with self.lock:
+            entry = self._entries.get(sale_id)
+            if entry is None and self.path:
+                self._load()
+                entry = self._entries.get(sale_id)
+            return dict(entry) if entry is not None else None
+
+    def move(self, sale_id: str, row: int):
+        """行の挿入・削除でずれた行番号を更新"""
+        with self.lock:
+            entry = self._entries.get(sale_id)
+            if entry is not None and entry["row"] != row:
+                self._append([{"id": sale_id, **entry, "row": row}])
+
+    def remove(self, sale_id: str):
+        """取り消した売上を削除"""
+        with self.lock:
+            if sale_id in self._entries:
+                self._append([{"id": sale_id, "deleted": True}])
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._entries)
+
+
+# Global sale index (lazy initialization)
+_index: Optional[SaleIndex] = None
+_index_lock = Lock()
+
+
+def get_sale_index() -> SaleIndex:
+    """Get or create the shared sale index (SALE_INDEX_FILE is read at first use)"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = SaleIndex(Config.SALE_INDEX_FILE or None)
+    return _index
@@ -0,0 +1,98 @@
+"""
+Sale preview module
+解析結果の確認（プレビュー）と記帳（コミット）を分けるための一時保存
+
+POST /api/preview はテキストを解析・税計算した売上を SalePreviews に保存し、短時間だけ有効な
+コミットトークンを返す。POST /api/commit/{token} は保存した売上（と利用者の修正）をそのまま
+書き込むため、修正してもGeminiの解析をやり直さない。
+
+プレビュー時には書き込み先の行を仮に割り当てる（ミラーの空行のうち、他の有効なプレビューが
+割り当てていない最初の行）。Sheetsへの書き込みやロックは行わない目安なので、実際の行は
+コミット時に書き込みキューが決め、レスポンスで返す。
+"""
+
+import secrets
+import time
+from threading import Lock
+from typing import Callable, Dict, List, Optional
+
+from .config import Config
+from .google_sheets import find_empty_rows
+from .ttl_cache import TTLCache
+
+
+class SalePreviews:
+    """Parsed sales waiting for confirmation, keyed by a short-lived commit token"""
+
+    def __init__(self, ttl_seconds: float = 600.0, max_items: int = 1000, clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize sale previews
+
+        Args:
+            ttl_seconds: コミットトークンの有効期限（秒）
+            max_items: 保持する最大件数（超えたら古いものから破棄）
+            clock: 現在時刻を返す関数（テスト用）
+        """
+        self.ttl_seconds = ttl_seconds
+        self._entries = TTLCache(max_items=max_items, ttl_seconds=ttl_seconds, clock=clock)
+        self._lock = Lock()
+
+    def _reserved_rows(self, store: Optional[str], sheet_name: str) -> set:
+        return {
+            entry["tentative_row"]
+            for entry in self._entries.values()
+            if entry["store"] == store and entry["sheet_name"] == sheet_name
+        }
+
+    def create(self, store: Optional[str], sale: Dict, sheet_name: str, values: List[List]) -> Dict:
+        """
+        Save a parsed sale and tentatively reserve its row
+
+        Args:
+            store: 店舗ID（None: デフォルト店舗）
+            sale: 税抜単価まで計算した売上データ
+            sheet_name: 書き込み先シート名
+            values: 書き込み先シートの値（ミラー。空行の割り当てに使う）
+
+        Returns:
+            dict: {"token", "sale", "sheet_name", "tentative_row", "expires_in"}
+        """
+        with self._lock:
+            reserved = self._reserved_rows(store, sheet_name)
+            candidates = find_empty_rows(values, len(reserved) + 1)
+            row = next(row for row in candidates if row not in reserved)
+            entry = {
+                "token": secrets.token_urlsafe(16),
+                "store": store,
+                "sale": sale,
+                "sheet_name": sheet_name,
+                "tentative_row": row
+            }
+            self._entries.set(entry["token"], entry)
+        return {
+            "token": entry["token"],
+            "sale": sale,
+            "sheet_name": sheet_name,
+            "tentative_row": row,
+            "expires_in": self.ttl_seconds
+        }
+
+    def take(self, token: str) -> Optional[Dict]:
+        """トークンのプレビューを取り出す（1回限り。期限切れ・未登録ならNone）"""
+        return self._entries.pop(token)
+
+    def restore(self, entry: Dict):
+        """書き込みに失敗したプレビューを戻し、同じトークンで再試行できるようにする"""
+        self._entries.set(entry["token"], entry)
+
+
+# Shared previews (lazy initialization)
+_previews: Optional[SalePreviews] = None
+
+
+def get_sale_previews() -> SalePreviews:
+    """Get or create the shared sale previews"""
+    global _previews
+    if _previews is None:
+        _previews = SalePreviews(ttl_seconds=Config.PREVIEW_TTL_SECONDS)
+    return _previews
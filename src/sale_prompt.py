@@ -0,0 +1,69 @@
+"""
+Sale prompt module
+Geminiで売上テキストを解析するための静的な指示（system instruction）を組み立てる
+
+指示・顧客リスト・商品カタログは店舗ごとに固定のため system_instruction としてモデルに持たせ、
+リクエストごとには正規化したメッセージ本文だけを送る（normalize_message）。
+同じ店舗では指示の文字列が毎回同一になるよう、顧客・商品の順序も含めて決定的に組み立てる。
+"""
+
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+from .schema import PAYMENT_METHODS
+
+# 応答をJSONのみにする（```json の囲みや説明文の分だけ出力トークンが減る）
+SALE_GENERATION_CONFIG = {"response_mime_type": "application/json", "temperature": 0}
+
+_INSTRUCTION_TEMPLATE = """あなたはジムの売上記録係です。ユーザーのメッセージ（LINEの売上報告）から売上情報を抽出し、
+次のJSONのみを返してください。
+
+{{"day": 日付（数値、例：28）, "seller": "顧客名", "payment_method": "決済方法", "product_name": "商品・サービス名", "quantity": 数量（数値）, "unit_price_incl_tax": 税込単価（数値、カンマなし）, "trainer": "担当トレーナー名" または null}}
+
+ルール:
+- sellerは「顧客名」を指します（販売者名ではありません）。既知の顧客名に近いものがあればその表記を使ってください
+- payment_methodは次のいずれか: {payment_methods}
+- product_nameは商品カタログに該当するものがあればその名前を使ってください
+- unit_price_incl_taxは税込金額です。「合計」と書かれている場合は数量で割った単価にしてください
+- quantityが明示されていない場合は1を返してください
+- trainerは「担当」「トレーナー」として書かれた名前です（顧客名と混同しないでください）。書かれていなければnullを返してください
+
+既知の顧客名: {customers}
+
+商品カタログ:
+{catalog}"""
+
+
+def _catalog_line(item: Dict) -> str:
+    price = item.get("unit_price_incl_tax")
+    return f"- {item['name']}" + (f"（税込{price:,}円）" if price is not None else "")
+
+
+@lru_cache(maxsize=32)
+def _build(customers: Tuple[str, ...], catalog: Tuple[Tuple[str, Optional[int]], ...]) -> str:
+    catalog_text = "\n".join(
+        _catalog_line({"name": name, "unit_price_incl_tax": price}) for name, price in catalog
+    ) or "（登録なし）"
+    return _INSTRUCTION_TEMPLATE.format(
+        payment_methods=", ".join(PAYMENT_METHODS),
+        customers="、".join(customers),
+        catalog=catalog_text
+    )
+
+
+def build_sale_instruction(customers: Iterable[str], catalog: Optional[Dict[str, Dict]] = None) -> str:
+    """
+    Build the system instruction for one store
+
+    Args:
+        customers: 既知の顧客名
+        catalog: 商品カタログ（StoreConfig.catalog: 商品名 -> {"name", "unit_price_incl_tax", ...}）
+
+    Returns:
+        str: 同じ顧客・カタログなら常に同一の文字列（モデルの使い回し・暗黙的キャッシュのため）
+    """
+    catalog_items = tuple(
+        (name, (catalog[name] or {}).get("unit_price_incl_tax"))
+        for name in sorted(catalog or {})
+    )
+    return _build(tuple(customers), catalog_items)
@@ -0,0 +1,220 @@
+"""
+Sales ledger module
+売上のイベント（記帳・Sheetsへの反映・修正・取り消し）を追記のみのJSON Lines（SALES_LEDGER_FILE）に記録する
+
+売上の正本はこの台帳で、月度シート（「N 月度」）は台帳から作られる投影（projection）として扱う。
+月度シートは年を持たず、年ごとに別のスプレッドシートを使うため、売上は (店舗, スプレッドシートID, 月) で引く。
+
+- recorded: Sheetsに書き込む前に記録する（fsync してから書き込むため、書き込みに失敗しても売上は失われない）
+- written: Sheetsに書き込めた行（シート名・行番号）
+- failed: 書き込みに失敗した（呼び出し元にエラーを返し、再送を任せた）
+- edited / voided: 修正・取り消し（シートを書き換える前に記録する）
+
+written のない売上（書き込み中にプロセスが落ちた）や、手作業で壊れた月度シートは
+`python -m src.replay` で台帳から書き直せる（src/replay.py）。failed の売上は呼び出し元が再送するため、
+シートのK列に売上IDが見つかった場合（タイムアウトしたが実際は書き込まれていた）だけ書き込み済みとして扱う。
+集計・監査はSheetsを読まずに台帳だけで行える。
+"""
+
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .config import Config
+from .row_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+RECORDED = "recorded"
+WRITTEN = "written"
+FAILED = "failed"
+EDITED = "edited"
+VOIDED = "voided"
+
+
+class SalesLedger:
+    """Append-only, incrementally loaded event log of sales (the source of truth)"""
+
+    def __init__(self, path: Optional[str] = None, clock: Callable[[], float] = time.time):
+        """
+        Initialize sales ledger
+
+        Args:
+            path: 台帳ファイルのパス（Noneならメモリ上のみ。テスト用）
+            clock: 現在時刻を返す関数（テスト用）
+        """
+        self.path = path
+        self.clock = clock
+        # 売上ID -> {"store", "spreadsheet", "month", "sale", "sheet", "row", "failed", "voided", "recorded_at"}
+        # （記帳した順）
+        self._sales: "OrderedDict[str, Dict]" = OrderedDict()
+        self._offset = 0  # 読み込み済みのファイル位置
+        self.lock = Lock()
+        if self.path:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._load()
+
+    def _load(self):
+        """ファイルの未読部分を読み込む（lock を保持して呼ぶ）"""
+        path = Path(self.path)
+        if not path.exists():
+            return
+        with open(path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # 他のプロセスが書き込み中の行は次回読む
+                self._offset += len(line)
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"[売上台帳] 壊れた行を読み飛ばしました: {line[:80]!r}")
+                    continue
+                self._apply(event)
+
+    def _apply(self, event: Dict):
+        kind = event["event"]
+        if kind == RECORDED:
+            self._sales.setdefault(event["id"], {
+                "store": event.get("store"), "spreadsheet": event.get("spreadsheet"), "month": event["month"],
+                "sale": event["sale"],
+                "sheet": None, "row": None, "failed": False, "voided": False, "recorded_at": event.get("at")
+            })
+            return
+        entry = self._sales.get(event["id"])
+        if entry is None:
+            return
+        if kind == WRITTEN:
+            entry["sheet"] = event["sheet"]
+            entry["row"] = event["row"]
+            entry["failed"] = False
+        elif kind == FAILED:
+            entry["failed"] = True
+        elif kind == EDITED:
+            entry["sale"] = event["sale"]
+        elif kind == VOIDED:
+            entry["voided"] = True
+
+    def _append(self, events: List[Dict]):
+        """イベントを反映し、ファイルに追記して fsync する（lock を保持して呼ぶ）"""
+        now = self.clock()
+        events = [{**event, "at": now} for event in events]
+        if not self.path or not events:
+            for event in events:
+                self._apply(event)
+            return
+        data = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events).encode("utf-8")
+        with open(self.path, "ab") as f, file_lock(f):
+            # 追記前に他のプロセスの分を読み込み、自分の追記分は読み込み済みとして扱う
+            # （ファイルロックを保持したまま行うため、間に他のプロセスが追記した行を読み飛ばさない）
+            self._load()
+            for event in events:
+                self._apply(event)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            self._offset = f.tell()
+
+    def record(self, store: Optional[str], spreadsheet: Optional[str], month: int, sales: Iterable[Dict]):
+        """
+        Record sales before they are written to Google Sheets
+        Sheetsに書き込む前に売上を記録する（各売上は "sale_id" を持つこと。記録済みのIDは追加しない）
+
+        Args:
+            spreadsheet: 書き込み先のスプレッドシートID（年ごとのスプレッドシートを区別する）
+        """
+        with self.lock:
+            if self.path:
+                self._load()
+            self._append([
+                {"event": RECORDED, "id": sale["sale_id"], "store": store, "spreadsheet": spreadsheet,
+                 "month": month, "sale": sale}
+                for sale in sales if sale["sale_id"] not in self._sales
+            ])
+
+    def written(self, sheet_name: str, rows: Iterable[int], sale_ids: Iterable[str]):
+        """Sheetsに書き込めた行を記録"""
+        with self.lock:
+            self._append([
+                {"event": WRITTEN, "id": sale_id, "sheet": sheet_name, "row": row}
+                for row, sale_id in zip(rows, sale_ids) if sale_id
+            ])
+
+    def failed(self, sale_ids: Iterable[str]):
+        """書き込みに失敗した売上を記録（呼び出し元にはエラーを返している）"""
+        with self.lock:
+            self._append([{"event": FAILED, "id": sale_id} for sale_id in sale_ids])
+
+    def edited(self, sale_id: str, sale: Dict):
+        """修正後の売上を記録（シートを書き換える前に呼ぶ）"""
+        with self.lock:
+            self._append([{"event": EDITED, "id": sale_id, "sale": {**sale, "sale_id": sale_id}}])
+
+    def voided(self, sale_id: str):
+        """取り消しを記録（シートを書き換える前に呼ぶ）"""
+        with self.lock:
+            self._append([{"event": VOIDED, "id": sale_id}])
+
+    def get(self, sale_id: str) -> Optional[Dict]:
+        """売上の現在の状態（台帳になければ None）"""
+        with self.lock:
+            if self.path and sale_id not in self._sales:
+                self._load()
+            entry = self._sales.get(sale_id)
+            return {**entry, "sale_id": sale_id} if entry is not None else None
+
+    def entries(self, store: Optional[str], spreadsheet: Optional[str], month: int,
+                include_voided: bool = False) -> List[Dict]:
+        """
+        Current state of every sale of a store, spreadsheet and month (in recorded order)
+        他のプロセスが追記した分を読み込んでから返す（別の年のスプレッドシートの同じ月は含まない）
+
+        Returns:
+            List[dict]: {"sale_id", "store", "spreadsheet", "month", "sale", "sheet", "row", "failed", "voided",
+                         "recorded_at"}
+        """
+        with self.lock:
+            if self.path:
+                self._load()
+            return [
+                {**entry, "sale_id": sale_id}
+                for sale_id, entry in self._sales.items()
+                if entry["store"] == store and entry["spreadsheet"] == spreadsheet and entry["month"] == month
+                and (include_voided or not entry["voided"])
+            ]
+
+    def unwritten(self, store: Optional[str] = None, spreadsheet: Optional[str] = None) -> List[Dict]:
+        """Sheetsへの書き込みが記録されていない（失敗・取り消しを除く）売上"""
+        with self.lock:
+            if self.path:
+                self._load()
+            return [
+                {**entry, "sale_id": sale_id}
+                for sale_id, entry in self._sales.items()
+                if entry["store"] == store and entry["spreadsheet"] == spreadsheet
+                and entry["row"] is None and not entry["failed"] and not entry["voided"]
+            ]
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._sales)
+
+
+# Global sales ledger (lazy initialization)
+_ledger: Optional[SalesLedger] = None
+_ledger_lock = Lock()
+
+
+def get_sales_ledger() -> SalesLedger:
+    """Get or create the shared sales ledger (SALES_LEDGER_FILE is read at first use)"""
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                _ledger = SalesLedger(Config.SALES_LEDGER_FILE or None)
+    return _ledger
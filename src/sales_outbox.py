@@ -0,0 +1,263 @@
+"""
+Sales outbox module
+Google Sheets の障害中（サーキットブレーカーが開いている間）に届いた売上を保留し、復旧後に記帳する
+
+- SalesOutbox: 保留中の売上を SHEETS_OUTBOX_FILE（追記のみのJSON Lines）に書き、プロセスが
+  再起動しても失われないようにする。記帳し終えた売上は完了の行を追記し、すべて完了したらファイルを空にする
+- OutboxDrainer: 一定間隔ごとにバックグラウンドで確認し、ブレーカーが閉じた（または試しの呼び出しが
+  許される）ときに店舗ごとの書き込みキュー（SaleWriteQueue.drain_outbox）経由で記帳する
+
+保留した売上は受け付けた月の月度シートに記帳する（月をまたいで復旧しても翌月のシートには書かない）。
+売上IDは保留した時点で決まるため、記帳後は応答で返したIDのまま /api/sales/{id} で参照できる。
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .call_accounting import track_calls, use_ledger
+from .circuit_breaker import CircuitBreaker, get_breaker
+from .config import Config
+from .metrics import REGISTRY, Gauge
+from .row_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+# 保留中（未記帳）の売上の件数
+OUTBOX_PENDING = REGISTRY.register(Gauge(
+    "limit_outbox_pending_sales", "Sales held in the local outbox while Google Sheets is unavailable"
+))
+
+
+
+class SalesOutbox:
+    """Durable, append-only queue of sales waiting for Google Sheets"""
+
+    def __init__(self, path: Optional[str] = None, clock: Callable[[], float] = time.time):
+        """
+        Initialize sales outbox
+
+        Args:
+            path: 保留ファイルのパス（Noneならメモリ上のみ。テスト用）
+            clock: 現在時刻を返す関数（テスト用）
+        """
+        self.path = path
+        self.clock = clock
+        # 売上ID -> {"store", "month", "sale", "queued_at"}（保留した順）
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._offset = 0  # 読み込み済みのファイル位置
+        self.lock = Lock()
+        if self.path:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._load()
+
+    def _load(self):
+        """ファイルの未読部分を読み込む（lock を保持して呼ぶ）"""
+        path = Path(self.path)
+        if not path.exists():
+            return
+        if path.stat().st_size < self._offset:
+            # 他のプロセスがすべて記帳してファイルを空にした
+            self._entries.clear()
+            self._offset = 0
+        with open(path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # 他のプロセスが書き込み中の行は次回読む
+                self._offset += len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"[保留] 壊れた行を読み飛ばしました: {line[:80]!r}")
+                    continue
+                self._apply(record)
+        OUTBOX_PENDING.set(len(self._entries))
+
+    def _apply(self, record: Dict):
+        sale_id = record.pop("id")
+        if record.get("done"):
+            self._entries.pop(sale_id, None)
+        else:
+            self._entries.setdefault(sale_id, record)
+
+    def _append(self, records: List[Dict]):
+        """変更を反映し、ファイルに追記（lock を保持して呼ぶ）"""
+        if not self.path or not records:
+            for record in records:
+                self._apply(dict(record))
+            OUTBOX_PENDING.set(len(self._entries))
+            return
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        with open(self.path, "ab") as f, file_lock(f):
+            # 他のプロセスの分の読み込みから追記までファイルロックを保持する（間に追記された行を読み飛ばさない）
+            self._load()
+            for record in records:
+                self._apply(dict(record))
+            f.write(data)
+            f.flush()
+            self._offset = f.tell()
+        OUTBOX_PENDING.set(len(self._entries))
+
+    def add(self, store: Optional[str], month: int, sales: Iterable[Dict]):
+        """
+        売上を保留する（各売上は "sale_id" を持つこと。保留中の同じIDは追加しない）
+        """
+        with self.lock:
+            if self.path:
+                self._load()
+            now = self.clock()
+            self._append([
+                {"id": sale["sale_id"], "store": store, "month": month, "sale": sale, "queued_at": now}
+                for sale in sales if sale["sale_id"] not in self._entries
+            ])
+
+    def pending(self, store: Optional[str] = None) -> Dict[int, List[Dict]]:
+        """
+        Pending sales of a store grouped by month (in queued order)
+
+        他のプロセスが追記・記帳した分を読み込んでから返す。
+        """
+        with self.lock:
+            if self.path:
+                self._load()
+            by_month: Dict[int, List[Dict]] = {}
+            for entry in self._entries.values():
+                if entry["store"] == store:
+                    by_month.setdefault(entry["month"], []).append(dict(entry["sale"]))
+            return by_month
+
+    def stores(self) -> List[Optional[str]]:
+        """保留中の売上がある店舗"""
+        with self.lock:
+            if self.path:
+                self._load()
+            return list(dict.fromkeys(entry["store"] for entry in self._entries.values()))
+
+    def done(self, sale_ids: Iterable[str]):
+        """記帳し終えた売上を取り除く（すべて記帳し終えたらファイルを空にする）"""
+        with self.lock:
+            self._append([{"id": sale_id, "done": True} for sale_id in sale_ids])
+            if self.path and not self._entries:
+                self._compact()
+
+    def _compact(self):
+        """保留中の売上がなければファイルを空にする（lock を保持して呼ぶ）"""
+        with open(self.path, "r+b") as f, file_lock(f):
+            # 他のプロセスが追記していれば空にしない
+            self._load()
+            if not self._entries:
+                f.truncate(0)
+                self._offset = 0
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._entries)
+
+
+# Global sales outbox (lazy initialization)
+_outbox: Optional[SalesOutbox] = None
+_outbox_lock = Lock()
+
+
+def get_sales_outbox() -> Optional[SalesOutbox]:
+    """Get or create the shared sales outbox (None if SHEETS_OUTBOX_FILE is empty: fail fast instead)"""
+    global _outbox
+    if _outbox is None and Config.SHEETS_OUTBOX_FILE:
+        with _outbox_lock:
+            if _outbox is None:
+                _outbox = SalesOutbox(Config.SHEETS_OUTBOX_FILE)
+    return _outbox
+
+
+def drain_store(store_id: Optional[str], outbox: SalesOutbox) -> int:
+    """店舗の保留中の売上を書き込みキュー経由で記帳し、記帳した件数を返す"""
+    from .sheets_service import get_write_queue
+    return get_write_queue(store_id).drain_outbox(outbox)
+
+
+class OutboxDrainer:
+    """Writes held sales once the Google Sheets circuit lets calls through"""
+
+    def __init__(
+        self,
+        outbox_getter: Callable[[], Optional[SalesOutbox]] = get_sales_outbox,
+        drain: Callable[[Optional[str], SalesOutbox], int] = drain_store,
+        breaker: Optional[CircuitBreaker] = None,
+        interval_seconds: float = 5.0
+    ):
+        """
+        Initialize outbox drainer
+
+        Args:
+            outbox_getter: 保留キューを返す関数（Noneなら保留は無効）
+            drain: (店舗ID, 保留キュー) -> 記帳した件数 を行う関数
+            breaker: Sheetsのサーキットブレーカー（省略時は共有の "sheets"）
+            interval_seconds: 確認する間隔（秒、0で無効）
+        """
+        self.outbox_getter = outbox_getter
+        self.drain = drain
+        self.breaker = breaker
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def run_once(self) -> int:
+        """
+        Drain held sales of every store (blocking)
+
+        ブレーカーが開いている間は何もしない（API呼び出しなし）。試しの呼び出しが許される状態なら、
+        最初の書き込みがその試しになる。失敗したら残りは次回に回す。
+
+        Returns:
+            int: 記帳した件数
+        """
+        outbox = self.outbox_getter()
+        if outbox is None or not len(outbox):
+            return 0
+        if (self.breaker or get_breaker("sheets")).is_open:
+            return 0
+        drained = 0
+        # 保留分の記帳のAPI呼び出しはリクエストではなく "outbox" として計上する
+        with use_ledger(None), track_calls("outbox"):
+            for store_id in outbox.stores():
+                try:
+                    drained += self.drain(store_id, outbox)
+                except Exception as e:
+                    logger.warning(f"[保留] 店舗 {store_id} の保留中の売上を記帳できませんでした: {e}")
+                    break
+        if drained:
+            logger.info(f"[保留] 保留中だった売上 {drained} 件を記帳しました（残り {len(outbox)} 件）")
+        return drained
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logger.error(f"[保留] 記帳の確認に失敗: {e}", exc_info=True)
+            await asyncio.sleep(self.interval_seconds)
+
+    def ensure_started(self):
+        """実行中のイベントループ上で定期確認を開始（開始済み・無効なら何もしない）"""
+        if self.interval_seconds <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        """定期確認を停止"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
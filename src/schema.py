@@ -0,0 +1,112 @@
+"""
+Function Calling schema module
+Gemini Function Calling用スキーマの唯一の定義元
+
+`/api/schema` のレスポンスとリポジトリ直下の gemini_function_schema.json は
+どちらもこのモジュールから生成する。JSONファイルの再生成:
+
+    python -m src.schema > gemini_function_schema.json
+"""
+
+import json
+from typing import Dict, List, Optional
+
+# 顧客リスト（最新）
+KNOWN_CUSTOMERS = [
+    "岩佐将平",
+    "堀内さやか",
+    "坂上明彦",
+    "河村直子",
+    "金子弘美",
+    "平安彦",
+    "西島優樹",
+    "桜井彰人",
+    "花田幸典",
+    "大塚由美",
+    "新津七海",
+    "冨田博信",
+    "竹内優馬",
+    "荻野悠加"
+]
+
+# 決済方法
+PAYMENT_METHODS = ["PayPal", "PayPay", "現金", "クレジットカード", "銀行振込"]
+
+
+def build_sale_function_schema(customers: Optional[List[str]] = None) -> Dict:
+    """
+    Build the record_gym_sale function schema
+    record_gym_sale のFunction Callingスキーマを組み立てる
+
+    Args:
+        customers: 顧客名の候補（省略時は KNOWN_CUSTOMERS）
+
+    Returns:
+        dict: Function Calling JSONスキーマ
+    """
+    if customers is None:
+        customers = KNOWN_CUSTOMERS
+
+    return {
+        "name": "record_gym_sale",
+        "description": "リミット四ツ谷店の売上情報をGoogleスプレッドシートに記録します。税抜単価は既に計算済みの値（floor(税込/1.1)）を受け取ります。",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "day": {
+                    "type": "integer",
+                    "description": "日付（数値のみ、例：28）"
+                },
+                "seller": {
+                    "type": "string",
+                    "description": "顧客名（D列）",
+                    "enum": list(customers)
+                },
+                "payment_method": {
+                    "type": "string",
+                    "description": "決済方法（例：PayPal, PayPay, 現金, クレジットカード）",
+                    "enum": list(PAYMENT_METHODS)
+                },
+                "product_name": {
+                    "type": "string",
+                    "description": "商品・サービス名（例：月4回プラン, 月8回プラン, プロテイン）"
+                },
+                "quantity": {
+                    "type": "integer",
+                    "description": "数量（通常は1）",
+                    "default": 1
+                },
+                "unit_price_excl_tax": {
+                    "type": "integer",
+                    "description": "単価（税抜・整数値）。税込金額から floor(税込金額 / 1.1) で計算した値。例: 35,200円 → 32,000円"
+                },
+                "trainer": {
+                    "type": "string",
+                    "description": "担当トレーナー（L列、任意）。シートのM列のトレーナー名簿にある名前"
+                }
+            },
+            "required": [
+                "day",
+                "seller",
+                "payment_method",
+                "product_name",
+                "quantity",
+                "unit_price_excl_tax"
+            ]
+        }
+    }
+
+
+def dump_schema(schema: Dict) -> str:
+    """
+    Serialize a schema the same way as gemini_function_schema.json
+    スキーマをJSON文字列に変換（ファイルと同じ書式）
+    """
+    return json.dumps(schema, ensure_ascii=False, indent=2)
+
+
+SALE_FUNCTION_SCHEMA = build_sale_function_schema()
+
+
+if __name__ == "__main__":
+    print(dump_schema(SALE_FUNCTION_SCHEMA))
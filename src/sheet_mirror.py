@@ -0,0 +1,171 @@
+"""
+Sheet mirror module
+月度シートの内容をメモリ上にキャッシュし、読み取り専用の集計をAPI呼び出しなしで行う
+"""
+
+import logging
+import time
+from collections import defaultdict
+from threading import Lock
+from typing import Callable, Dict, List
+
+from .google_sheets import FIRST_DATA_ROW, GoogleSheetsClient, month_sheet_name
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+
+def _to_number(value) -> float:
+    """セル値（"32,000" や "¥35,200" を含む）を数値に変換。変換できなければ0"""
+    if isinstance(value, (int, float)):
+        return value
+    text = str(value).replace(",", "").replace("¥", "").replace("￥", "").strip()
+    try:
+        return float(text) if "." in text else int(text)
+    except ValueError:
+        return 0
+
+
+def row_to_sale(c_to_j: List) -> Dict:
+    """
+    Convert the C〜J values of one row back to a sale
+    1行分のC列〜J列の値を売上データに戻す（_build_row_data の逆）。L列（担当トレーナー）まであれば trainer も戻す
+
+    Returns:
+        dict: {"day", "seller", "payment_method", "product_name", "quantity",
+               "unit_price_excl_tax", "unit_price_incl_tax", "subtotal_excl_tax", "subtotal_incl_tax", "trainer"}
+    """
+    line = list(c_to_j) + [""] * (10 - len(c_to_j))
+    quantity = _to_number(line[4])
+    subtotal_incl_tax = _to_number(line[7])
+    return {
+        "day": _to_number(line[0]),
+        "seller": line[1],
+        "payment_method": line[2],
+        "product_name": line[3],
+        "quantity": quantity,
+        "unit_price_excl_tax": _to_number(line[5]),
+        "unit_price_incl_tax": subtotal_incl_tax // quantity if quantity else subtotal_incl_tax,
+        "subtotal_excl_tax": _to_number(line[6]),
+        "subtotal_incl_tax": subtotal_incl_tax,
+        "trainer": line[9] or None
+    }
+
+
+def summarize_month(values: List[List]) -> Dict:
+    """
+    Summarize the sale rows of a month sheet
+    月度シートの売上行（C列が入っている行）を集計
+
+    Args:
+        values: get_all_values() 形式のセル値
+
+    Returns:
+        dict: {
+            "count": int,
+            "total_excl_tax": number,
+            "total_incl_tax": number,
+            "by_payment_method": {決済方法: 合計（税込）},
+            "by_product": {商品名: 合計（税込）}
+        }
+    """
+    count = 0
+    total_excl_tax = 0
+    total_incl_tax = 0
+    by_payment_method: Dict[str, float] = defaultdict(int)
+    by_product: Dict[str, float] = defaultdict(int)
+
+    for row in values[FIRST_DATA_ROW - 1:]:
+        if len(row) < 10 or not row[2]:  # C列（日付）が空の行は売上ではない
+            continue
+        excl = _to_number(row[8])  # I列: 合計（税抜）
+        incl = _to_number(row[9])  # J列: 合計（税込）
+        count += 1
+        total_excl_tax += excl
+        total_incl_tax += incl
+        by_payment_method[row[4] or "不明"] += incl  # E列
+        by_product[row[5] or "不明"] += incl  # F列
+
+    return {
+        "count": count,
+        "total_excl_tax": total_excl_tax,
+        "total_incl_tax": total_incl_tax,
+        "by_payment_method": dict(by_payment_method),
+        "by_product": dict(by_product)
+    }
+
+
+class SheetMirror:
+    """In-memory copy of month sheets, refreshed after a TTL and patched on writes"""
+
+    def __init__(
+        self,
+        client_getter: Callable[[], GoogleSheetsClient],
+        ttl_seconds: float = 300.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize sheet mirror
+
+        Args:
+            client_getter: 共有GoogleSheetsClientを返す関数
+            ttl_seconds: シート全体を読み直すまでの秒数（手動編集の取り込み間隔）
+            clock: 現在時刻を返す関数（テスト用）
+        """
+        self.client_getter = client_getter
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._sheets: Dict[str, tuple] = {}  # シート名 -> (読み込み時刻, values)
+        self.lock = Lock()
+
+    def get_month_values(self, month: int) -> List[List]:
+        """
+        Return the cached values of a month sheet, reading it if stale
+        月度シートのキャッシュを返す（期限切れなら1回だけ読み直す）
+        """
+        sheet_name = month_sheet_name(month)
+        with self.lock:
+            cached = self._sheets.get(sheet_name)
+            if cached and self.clock() - cached[0] < self.ttl_seconds:
+                record_cache("sheet_mirror", True)
+                return cached[1]
+        record_cache("sheet_mirror", False)
+
+        logger.info(f"[ミラー更新] '{sheet_name}' を読み込みます")
+        values = self.client_getter().get_month_values(month)
+        with self.lock:
+            self._sheets[sheet_name] = (self.clock(), values)
+        return values
+
+    def apply_rows(self, sheet_name: str, rows: List[int], row_values: List[List]):
+        """
+        Patch written rows into the cached copy
+        書き込んだ行をキャッシュにも反映（キャッシュがないシートは何もしない）
+
+        Args:
+            sheet_name: 書き込み先シート名
+            rows: 行番号（1始まり）
+            row_values: 各行のC列からの値（C〜J、売上ID付きならC〜K）
+        """
+        with self.lock:
+            cached = self._sheets.get(sheet_name)
+            if not cached:
+                return
+            loaded_at, values = cached
+            values = [list(row) for row in values]
+            width = max([len(row) for row in values] + [2 + len(line) for line in row_values])
+            for row, c_to_j in zip(rows, row_values):
+                while len(values) < row:
+                    values.append([""] * width)
+                line = values[row - 1] + [""] * (width - len(values[row - 1]))
+                line[2:2 + len(c_to_j)] = [str(value) for value in c_to_j]
+                values[row - 1] = line
+            self._sheets[sheet_name] = (loaded_at, values)
+
+    def invalidate(self, sheet_name: str = None):
+        """Drop one sheet (or all sheets) from the cache"""
+        with self.lock:
+            if sheet_name is None:
+                self._sheets.clear()
+            else:
+                self._sheets.pop(sheet_name, None)
@@ -0,0 +1,168 @@
+"""
+Sheet provisioning module
+月度シート（「N 月度」）を売上が届く前に作成しておく
+
+- SheetProvisioner: 一定間隔ごとにバックグラウンドで確認し、今月のシートと、月末まで
+  SHEET_PROVISION_LEAD_DAYS 日以内なら翌月のシートを「テンプレート」から作成する。
+  月初の最初の売上がテンプレートの複製（遅く、失敗しうる）を待たずに済む
+- 会計年度分の一括作成（1回の batch_update）:
+
+    python -m src.sheet_provisioning --fiscal-year
+    python -m src.sheet_provisioning --months 4,5,6 --store shinjuku
+
+作成は店舗ごとの空行割り当てロック（ROW_LOCK_FILE）の中で行うため、複数ワーカーが
+同時に同じシートを作成しようとすることはない。
+"""
+
+import argparse
+import asyncio
+import calendar
+import logging
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .call_accounting import track_calls, use_ledger
+from .config import Config
+from .google_sheets import GoogleSheetsClient, fiscal_year_months
+from .row_lock import get_row_lock
+from .stores import get_store_registry
+from .structured_logging import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+def months_to_provision(now: datetime, lead_days: int) -> List[int]:
+    """
+    事前作成の対象月
+
+    今月は常に対象（なければ作成）。月末まで lead_days 日以内なら翌月も対象にする。
+    """
+    months = [now.month]
+    days_in_month = calendar.monthrange(now.year, now.month)[1]
+    if days_in_month - now.day < lead_days:
+        months.append(now.month % 12 + 1)
+    return months
+
+
+def provision_store(store_id: Optional[str], months: Iterable[int],
+                    client: Optional[GoogleSheetsClient] = None) -> List[str]:
+    """
+    Create missing month sheets of one store
+
+    Args:
+        store_id: 店舗ID（None: デフォルト店舗）
+        months: 作成する月
+        client: 使用するクライアント（省略時は店舗の共有クライアント）
+
+    Returns:
+        List[str]: 作成したシート名
+    """
+    if client is None:
+        from .sheets_service import get_sheets_client
+        client = get_sheets_client(store_id)
+    # デフォルト店舗は None として、書き込みキューと同じロックを取る
+    lock_key = None if get_store_registry().is_default(store_id) else store_id
+    with get_row_lock(lock_key).hold():
+        return client.provision_month_sheets(months)
+
+
+class SheetProvisioner:
+    """Creates upcoming month sheets in the background"""
+
+    def __init__(
+        self,
+        provision: Callable[[Optional[str], List[int]], List[str]] = provision_store,
+        store_ids: Optional[Callable[[], Iterable[Optional[str]]]] = None,
+        interval_seconds: float = 21600.0,
+        lead_days: int = 7,
+        clock: Callable[[], datetime] = datetime.now
+    ):
+        """
+        Initialize sheet provisioner
+
+        Args:
+            provision: (店舗ID, 月のリスト) -> 作成したシート名 を行う関数
+            store_ids: 対象の店舗IDを返す関数（省略時は登録されているすべての店舗）
+            interval_seconds: 確認する間隔（秒）
+            lead_days: 月末の何日前から翌月のシートを作成するか
+            clock: 現在時刻を返す関数（テスト用）
+        """
+        self.provision = provision
+        self.store_ids = store_ids or (lambda: list(get_store_registry().stores))
+        self.interval_seconds = interval_seconds
+        self.lead_days = lead_days
+        self.clock = clock
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def run_once(self) -> Dict[str, List[str]]:
+        """
+        Provision upcoming sheets for every store (blocking)
+
+        Returns:
+            dict: 店舗ID -> 作成したシート名（作成しなかった店舗は含まない）
+        """
+        months = months_to_provision(self.clock(), self.lead_days)
+        created = {}
+        # 事前作成のAPI呼び出しはリクエストではなく "provisioning" として計上する
+        with use_ledger(None), track_calls("provisioning"):
+            for store_id in self.store_ids():
+                try:
+                    names = self.provision(store_id, months)
+                except Exception as e:
+                    logger.warning(f"[シート事前作成失敗] 店舗 {store_id}: {e}")
+                    continue
+                if names:
+                    created[store_id] = names
+        return created
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logger.error(f"[シート事前作成] 確認に失敗: {e}", exc_info=True)
+            await asyncio.sleep(self.interval_seconds)
+
+    def ensure_started(self):
+        """実行中のイベントループ上で定期確認を開始（開始済み・無効なら何もしない）"""
+        if self.interval_seconds <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        """定期確認を停止"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def main(argv: Optional[List[str]] = None):
+    """Bulk-create month sheets from the command line"""
+    parser = argparse.ArgumentParser(description="月度シートをテンプレートから一括作成")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--fiscal-year", action="store_true",
+                        help="会計年度（FISCAL_YEAR_START_MONTH から12か月）のシートをすべて作成")
+    target.add_argument("--months", help="作成する月（カンマ区切り、例: 4,5,6）")
+    parser.add_argument("--store", default=None, help="店舗ID（省略時はデフォルト店舗）")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    if args.fiscal_year:
+        months = fiscal_year_months(Config.FISCAL_YEAR_START_MONTH)
+    else:
+        months = [int(month) for month in args.months.split(",") if month.strip()]
+
+    created = provision_store(args.store, months)
+    print(f"作成したシート: {created or 'なし（すべて作成済み）'}")
+
+
+if __name__ == "__main__":
+    main()
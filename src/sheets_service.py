@@ -0,0 +1,501 @@
+"""
+Shared Google Sheets service module
+REST APIサーバーとMCPサーバーが共有するSheetsクライアント・書き込みキュー・ミラー
+
+同一プロセス内では店舗ごとに1つのGoogleSheetsClientを共有し（gspreadの認証・HTTPセッションは
+全店舗で共有）、書き込みは店舗ごとの SaleWriteQueue に集約して、同時に届いた売上を
+1回の空行検索・1回の書き込みにまとめる。店舗が違えば書き込みキューも別なので、互いに待たない。
+
+デフォルト店舗（store 省略時）はモジュール変数のシングルトン、それ以外の店舗は StorePool が
+LRUで保持し、使われなくなった店舗のクライアント・キューは破棄する。
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from typing import Callable, Dict, List, Optional
+
+import gspread
+
+from .call_accounting import CallBudgetExceeded, CallLedger, current_ledger, use_ledger
+from .circuit_breaker import CircuitOpenError
+from .config import Config
+from .google_sheets import GoogleSheetsClient, month_sheet_name, new_sale_id, sale_row_values
+from .row_lock import RowAllocationLock, get_row_lock
+from .sale_index import get_sale_index
+from .sales_ledger import get_sales_ledger
+from .sales_outbox import SalesOutbox, get_sales_outbox
+from .sheet_mirror import SheetMirror, row_to_sale
+from .stores import StoreConfig, get_store_registry
+from .trainers import TrainerRoster, UnknownTrainerError, get_trainer_index
+
+logger = logging.getLogger(__name__)
+
+# Authorized gspread client shared by every store (lazy initialization)
+_gspread_client: Optional[gspread.Client] = None
+_auth_lock = Lock()
+
+# Google Sheets client of the default store (lazy initialization)
+_sheets_client: Optional[GoogleSheetsClient] = None
+_client_lock = Lock()
+
+
+def _get_gspread_client() -> gspread.Client:
+    """サービスアカウントで認証済みのgspreadクライアント（全店舗で共有）"""
+    global _gspread_client
+    if _gspread_client is None:
+        with _auth_lock:
+            if _gspread_client is None:
+                _, _gspread_client = GoogleSheetsClient.authorize()
+    return _gspread_client
+
+
+def _connect(store: StoreConfig) -> GoogleSheetsClient:
+    """店舗のスプレッドシートに接続したクライアントを作成"""
+    client = GoogleSheetsClient(gspread_client=_get_gspread_client(), spreadsheet_id=store.spreadsheet_id)
+    client.connect()
+    return client
+
+
+def get_sheets_client(store_id: Optional[str] = None) -> GoogleSheetsClient:
+    """Get or create the shared Google Sheets client of a store (None -> default store)"""
+    global _sheets_client
+    registry = get_store_registry()
+    if not registry.is_default(store_id):
+        return get_store_pool().get(registry.get(store_id)).get_client()
+
+    if _sheets_client is None:
+        with _client_lock:
+            if _sheets_client is None:
+                client = GoogleSheetsClient(
+                    gspread_client=_get_gspread_client(),
+                    spreadsheet_id=registry.default.spreadsheet_id
+                )
+                client.connect()
+                _sheets_client = client
+    return _sheets_client
+
+
+class SaleWriteQueue:
+    """
+    Coalescing write queue for sales
+
+    売上の書き込み要求を1つのワーカーで直列に処理する。
+    ワーカーが空くまでに溜まった要求（最大 max_batch 件）は record_sales の
+    1回の呼び出しにまとめるため、同時アクセスが増えてもAPI呼び出し回数は増えない。
+    """
+
+    def __init__(
+        self,
+        client_getter=get_sheets_client,
+        mirror: Optional[SheetMirror] = None,
+        max_batch: int = 50,
+        row_lock: Optional[RowAllocationLock] = None,
+        store_id: Optional[str] = None,
+        roster: Optional[TrainerRoster] = None
+    ):
+        """
+        Initialize write queue
+
+        Args:
+            client_getter: GoogleSheetsClientを返す関数
+            mirror: 書き込み結果を反映するミラー（任意）
+            max_batch: 1回の書き込みにまとめる最大件数
+            row_lock: 空行の割り当てに使うロック（省略時はデフォルト店舗のロック）
+            store_id: 売上索引に記録する店舗ID（None: デフォルト店舗）
+            roster: 担当トレーナーの照合に使う名簿（省略時は照合しない）
+        """
+        self.client_getter = client_getter
+        self.mirror = mirror
+        self.max_batch = max_batch
+        self.row_lock = row_lock
+        self.store_id = store_id
+        self.roster = roster
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending = 0  # 結果を待っている売上の件数
+
+    @property
+    def spreadsheet_id(self) -> Optional[str]:
+        """書き込み先のスプレッドシートID（売上台帳で年ごとのスプレッドシートを区別する）"""
+        return get_store_registry().get(self.store_id).spreadsheet_id
+
+    @property
+    def is_idle(self) -> bool:
+        """書き込み待ち・書き込み中の売上がないか"""
+        return self._pending == 0
+
+    def close(self):
+        """ワーカーを停止（書き込み待ちがないときのみ呼ぶ）"""
+        if self._worker is not None and not self._worker.done():
+            self._loop.call_soon_threadsafe(self._worker.cancel)
+        self._worker = None
+
+    def _ensure_worker(self):
+        """実行中のイベントループ上にワーカーを起動（ループが変わったら作り直す）"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, sale: Dict) -> Dict:
+        """
+        Queue one sale and wait for its write result
+
+        Args:
+            sale: GoogleSheetsClient.record_sales と同じキーの売上データ
+
+        Returns:
+            dict: {"success": bool, "row": int, "message": str, "sheet_name": str}
+        """
+        return (await self.submit_many([sale]))[0]
+
+    async def submit_many(self, sales: List[Dict]) -> List[Dict]:
+        """
+        Queue several sales and wait for their write results (same order)
+        """
+        if not sales:
+            return []
+        self._ensure_worker()
+        # 呼び出し元リクエストのledger（API呼び出し回数の計上先）も一緒に渡す
+        ledger = current_ledger()
+        futures = []
+        for sale in sales:
+            future = self._loop.create_future()
+            self._queue.put_nowait((sale, future, ledger))
+            futures.append(future)
+        self._pending += len(sales)
+        try:
+            return list(await asyncio.gather(*futures))
+        finally:
+            self._pending -= len(sales)
+
+    async def _run(self):
+        """Worker loop: drain pending sales and write them in one call"""
+        # ワーカーは最初の呼び出し元のコンテキストを引き継いで起動されるため、計上先を切り離す
+        with use_ledger(None):
+            while True:
+                batch = [await self._queue.get()]
+                while len(batch) < self.max_batch and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                await self._process(batch)
+
+    async def _process(self, batch: List[tuple]):
+        """1バッチ分を書き込み、結果と発生したAPI呼び出しを各呼び出し元に返す"""
+        sales = [sale for sale, _, _ in batch]
+        batch_ledger = CallLedger("write_queue")
+        try:
+            results = await asyncio.to_thread(self._write, sales, batch_ledger)
+        except Exception as e:
+            logger.error(f"[書き込みキュー] {len(sales)} 件の書き込みに失敗: {e}", exc_info=True)
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # まとめて書き込んだ呼び出し回数は、同じバッチに乗った各リクエストにそれぞれ計上する
+        merged = {}
+        for _, future, ledger in batch:
+            if ledger is None or id(ledger) in merged:
+                continue
+            try:
+                ledger.merge(batch_ledger)
+                merged[id(ledger)] = None
+            except CallBudgetExceeded as e:
+                merged[id(ledger)] = e
+
+        for (_, future, ledger), result in zip(batch, results):
+            if future.done():
+                continue
+            error = merged.get(id(ledger)) if ledger is not None else None
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _write(self, sales: List[Dict], ledger: Optional[CallLedger] = None) -> List[Dict]:
+        """
+        record_sales を呼び、1件ごとの結果に分解する（ワーカースレッドで実行）
+
+        書き込む前に売上IDを決めて売上台帳（SALES_LEDGER_FILE）に記録する。
+        Sheetsのサーキットブレーカーが開いていれば、保留キュー（SHEETS_OUTBOX_FILE）に入れて
+        "queued": True の結果を返す。保留キューが無効なら CircuitOpenError をそのまま送出する。
+        """
+        if len(sales) > 1:
+            logger.debug(f"[書き込みキュー] {len(sales)} 件をまとめて書き込みます")
+
+        month = datetime.now().month
+        sales = [{**sale, "sale_id": sale.get("sale_id") or new_sale_id()} for sale in sales]
+        sales_ledger = get_sales_ledger()
+        try:
+            client = self.client_getter()
+            with use_ledger(ledger):
+                sales = self._attribute(sales)
+            sales_ledger.record(self.store_id, self.spreadsheet_id, month, sales)
+            # 複数ワーカー構成でも同じ空行を取り合わないよう、空行検索〜書き込みを排他
+            with (self.row_lock or get_row_lock()).hold(), use_ledger(ledger):
+                record = client.record_sales(sales, month=month)
+        except CircuitOpenError:
+            outbox = get_sales_outbox()
+            if outbox is None:
+                sales_ledger.failed(sale["sale_id"] for sale in sales)
+                raise
+            return self._hold(outbox, sales)
+        except Exception:
+            sales_ledger.failed(sale["sale_id"] for sale in sales)
+            raise
+        if not record.get("success"):
+            sales_ledger.failed(sale["sale_id"] for sale in sales)
+        return self._results(sales, record)
+
+    def _attribute(self, sales: List[Dict]) -> List[Dict]:
+        """担当トレーナーを名簿の表記に揃える（名簿にないトレーナーは警告し、担当なしで記帳）"""
+        if self.roster is None or not any(sale.get("trainer") for sale in sales):
+            return sales
+        attributed = []
+        for sale in sales:
+            if sale.get("trainer"):
+                try:
+                    sale = {**sale, "trainer": self.roster.resolve(sale["trainer"])}
+                except UnknownTrainerError as e:
+                    logger.warning(f"[トレーナー警告] {e}。担当なしで記帳します")
+                    sale = {**sale, "trainer": None}
+            attributed.append(sale)
+        return attributed
+
+    def _hold(self, outbox: SalesOutbox, sales: List[Dict]) -> List[Dict]:
+        """売上を保留キューに入れる（売上IDは保留時に決まり、記帳時もそのIDで書き込む）"""
+        month = datetime.now().month
+        held = [{**sale, "sale_id": sale.get("sale_id") or new_sale_id()} for sale in sales]
+        get_sales_ledger().record(self.store_id, self.spreadsheet_id, month, held)
+        outbox.add(self.store_id, month, held)
+        logger.warning(f"[書き込みキュー] Google Sheetsに接続できないため {len(held)} 件を保留しました")
+        return [
+            {"success": True, "queued": True, "row": None, "sheet_name": month_sheet_name(month),
+             "message": "Google Sheetsに接続できないため売上を保留しました（復旧後に記帳します）",
+             "sale_id": sale["sale_id"] if Config.SALE_IDS else None}
+            for sale in held
+        ]
+
+    def drain_outbox(self, outbox: SalesOutbox) -> int:
+        """
+        Write the held sales of this store, month by month
+
+        空行の割り当てロックの中で保留キューを読み直すため、複数ワーカーが同じ売上を二重に記帳しない。
+        書き込みに失敗した月があれば、その月以降は保留したまま例外を送出する。
+
+        Returns:
+            int: 記帳した件数
+        """
+        client = self.client_getter()
+        drained = 0
+        with (self.row_lock or get_row_lock()).hold():
+            for month, sales in outbox.pending(self.store_id).items():
+                record = client.record_sales(sales, month=month)
+                if not record.get("success"):
+                    raise RuntimeError(record.get("message"))
+                self._results(sales, record)
+                outbox.done(sale["sale_id"] for sale in sales)
+                drained += len(sales)
+        return drained
+
+    def _results(self, sales: List[Dict], record: Dict) -> List[Dict]:
+        """record_sales の結果を1件ごとの結果に分解し、売上索引・ミラーに反映"""
+        sheet_name = record.get("sheet_name")
+
+        if not record.get("success"):
+            return [
+                {"success": False, "row": row, "message": record.get("message"), "sheet_name": sheet_name}
+                for row in record.get("rows") or [0] * len(sales)
+            ]
+
+        sale_ids = record.get("sale_ids") or [None] * len(sales)
+        get_sales_ledger().written(sheet_name, record["rows"], [sale.get("sale_id") for sale in sales])
+        if record.get("sale_ids"):
+            get_sale_index().add(self.store_id, sheet_name, record["rows"], sale_ids)
+
+        row_values = [
+            sale_row_values(
+                GoogleSheetsClient._build_row_data(
+                    sale["day"], sale["seller"], sale["payment_method"], sale["product_name"],
+                    sale["quantity"], sale["unit_price_excl_tax"], sale.get("unit_price_incl_tax")
+                ),
+                sale_id, sale.get("trainer")
+            )
+            for sale, sale_id in zip(sales, sale_ids)
+        ]
+        if self.mirror is not None:
+            self.mirror.apply_rows(sheet_name, record["rows"], row_values)
+        # トレーナー別の集計を差分だけ更新（歩合の集計でSheetsを読まないため）
+        get_trainer_index().record(
+            self.store_id, self.spreadsheet_id, sheet_name,
+            [{**row_to_sale(values), "sale_id": sale_id} for values, sale_id in zip(row_values, sale_ids)]
+        )
+
+        return [
+            {"success": True, "row": row, "message": f"売上を {row} 行目に記録しました", "sheet_name": sheet_name,
+             "sale_id": sale_id}
+            for row, sale_id in zip(record["rows"], sale_ids)
+        ]
+
+
+class StoreServices:
+    """Sheets client, mirror and write queue of one store"""
+
+    def __init__(self, store: StoreConfig, connect: Callable[[StoreConfig], GoogleSheetsClient] = _connect):
+        """
+        Initialize store services
+
+        Args:
+            store: 店舗設定
+            connect: 店舗のGoogleSheetsClientを作成・接続する関数
+        """
+        self.store = store
+        self._connect = connect
+        self._client: Optional[GoogleSheetsClient] = None
+        self._lock = Lock()
+        self.mirror = SheetMirror(self.get_client)
+        self.trainer_roster = TrainerRoster(self.get_client, ttl_seconds=Config.TRAINER_ROSTER_TTL_SECONDS)
+        self.write_queue = SaleWriteQueue(
+            self.get_client, mirror=self.mirror, row_lock=get_row_lock(store.store_id), store_id=store.store_id,
+            roster=self.trainer_roster
+        )
+
+    def get_client(self) -> GoogleSheetsClient:
+        """店舗のGoogleSheetsClient（初回利用時に接続）"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._connect(self.store)
+        return self._client
+
+    @property
+    def spreadsheet_id(self) -> Optional[str]:
+        """書き込み先のスプレッドシートID（売上台帳で年ごとのスプレッドシートを区別する）"""
+        return get_store_registry().get(self.store_id).spreadsheet_id
+
+    @property
+    def is_idle(self) -> bool:
+        return self.write_queue.is_idle
+
+    def close(self):
+        self.write_queue.close()
+
+
+class StorePool:
+    """
+    LRU pool of per-store services
+
+    店舗ごとのクライアント・書き込みキューを最大 max_active 店舗まで保持する。
+    上限を超えた場合や idle_seconds 使われなかった場合は、書き込み中でない店舗から破棄する
+    （破棄した店舗は次のリクエストで作り直す）。
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[StoreConfig], StoreServices] = StoreServices,
+        max_active: int = 8,
+        idle_seconds: float = 1800.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize store pool
+
+        Args:
+            factory: 店舗設定から StoreServices を作る関数
+            max_active: 同時に保持する店舗数の上限
+            idle_seconds: この秒数使われなかった店舗を破棄
+            clock: 現在時刻を返す関数（テスト用）
+        """
+        self.factory = factory
+        self.max_active = max_active
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # 店舗ID -> (最終利用時刻, services)
+        self.lock = Lock()
+
+    def get(self, store: StoreConfig) -> StoreServices:
+        """Return the services of a store, creating them if needed"""
+        with self.lock:
+            entry = self._entries.pop(store.store_id, None)
+            services = entry[1] if entry else self.factory(store)
+            self._entries[store.store_id] = (self.clock(), services)
+            self._evict()
+        return services
+
+    def _evict(self):
+        """古い店舗から、上限超過分と期限切れの店舗を破棄（書き込み中の店舗は残す）"""
+        now = self.clock()
+        for store_id, (last_used, services) in list(self._entries.items())[:-1]:
+            over_capacity = len(self._entries) > self.max_active
+            if not over_capacity and now - last_used < self.idle_seconds:
+                break
+            if not services.is_idle:
+                continue
+            del self._entries[store_id]
+            services.close()
+            logger.info(f"[店舗プール] 店舗 '{store_id}' のクライアントを破棄しました（保持数: {len(self._entries)}）")
+
+    def __contains__(self, store_id: str) -> bool:
+        with self.lock:
+            return store_id in self._entries
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._entries)
+
+
+# Shared instances (lazy initialization)
+_sheet_mirror: Optional[SheetMirror] = None
+_trainer_roster: Optional[TrainerRoster] = None
+_write_queue: Optional[SaleWriteQueue] = None
+_store_pool: Optional[StorePool] = None
+
+
+def get_store_pool() -> StorePool:
+    """Get or create the pool of non-default stores"""
+    global _store_pool
+    if _store_pool is None:
+        _store_pool = StorePool(max_active=Config.MAX_ACTIVE_STORES, idle_seconds=Config.STORE_IDLE_SECONDS)
+    return _store_pool
+
+
+def get_sheet_mirror(store_id: Optional[str] = None) -> SheetMirror:
+    """Get or create the sheet mirror of a store (None -> default store)"""
+    global _sheet_mirror
+    registry = get_store_registry()
+    if not registry.is_default(store_id):
+        return get_store_pool().get(registry.get(store_id)).mirror
+
+    if _sheet_mirror is None:
+        _sheet_mirror = SheetMirror(get_sheets_client)
+    return _sheet_mirror
+
+
+def get_trainer_roster(store_id: Optional[str] = None) -> TrainerRoster:
+    """Get or create the trainer roster of a store (None -> default store)"""
+    global _trainer_roster
+    registry = get_store_registry()
+    if not registry.is_default(store_id):
+        return get_store_pool().get(registry.get(store_id)).trainer_roster
+
+    if _trainer_roster is None:
+        _trainer_roster = TrainerRoster(get_sheets_client, ttl_seconds=Config.TRAINER_ROSTER_TTL_SECONDS)
+    return _trainer_roster
+
+
+def get_write_queue(store_id: Optional[str] = None) -> SaleWriteQueue:
+    """Get or create the sale write queue of a store (None -> default store)"""
+    global _write_queue
+    registry = get_store_registry()
+    if not registry.is_default(store_id):
+        return get_store_pool().get(registry.get(store_id)).write_queue
+
+    if _write_queue is None:
+        _write_queue = SaleWriteQueue(get_sheets_client, mirror=get_sheet_mirror(), roster=get_trainer_roster())
+    return _write_queue
@@ -0,0 +1,100 @@
+// リミット四ツ谷店 売上記帳 - 送信キュー（IndexedDB）
+// ページとService Workerの両方から読み込み、未送信の売上テキストを端末内に保持する。
+// 送信は /api/process_and_record_batch への1リクエストにまとめる。
+
+const SaleQueue = (() => {
+    const DB_NAME = 'limit-sale-queue';
+    const STORE_NAME = 'sales';
+    const BATCH_URL = '/api/process_and_record_batch';
+    const MAX_BATCH_ITEMS = 20;
+    const SYNC_TAG = 'sale-queue';
+
+    function openDb() {
+        return new Promise((resolve, reject) => {
+            const request = indexedDB.open(DB_NAME, 1);
+            request.onupgradeneeded = () => {
+                request.result.createObjectStore(STORE_NAME, { keyPath: 'client_id' });
+            };
+            request.onsuccess = () => resolve(request.result);
+            request.onerror = () => reject(request.error);
+        });
+    }
+
+    async function withStore(mode, callback) {
+        const db = await openDb();
+        return new Promise((resolve, reject) => {
+            const tx = db.transaction(STORE_NAME, mode);
+            const result = callback(tx.objectStore(STORE_NAME));
+            tx.oncomplete = () => {
+                db.close();
+                resolve(result && 'result' in result ? result.result : result);
+            };
+            tx.onerror = () => {
+                db.close();
+                reject(tx.error);
+            };
+        });
+    }
+
+    function newClientId() {
+        if (self.crypto && self.crypto.randomUUID) {
+            return self.crypto.randomUUID();
+        }
+        return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+    }
+
+    async function add(text) {
+        const item = {
+            client_id: newClientId(),
+            text: text,
+            created_at: new Date().toISOString()
+        };
+        await withStore('readwrite', (store) => store.put(item));
+        return item;
+    }
+
+    function all() {
+        return withStore('readonly', (store) => store.getAll());
+    }
+
+    async function count() {
+        return (await all()).length;
+    }
+
+    function remove(clientIds) {
+        return withStore('readwrite', (store) => {
+            clientIds.forEach((id) => store.delete(id));
+        });
+    }
+
+    // 溜まっている売上をまとめて送信し、再送不要になったものをキューから削除する
+    async function flush() {
+        const items = (await all())
+            .sort((a, b) => a.created_at.localeCompare(b.created_at))
+            .slice(0, MAX_BATCH_ITEMS);
+        if (items.length === 0) {
+            return [];
+        }
+
+        const response = await fetch(BATCH_URL, {
+            method: 'POST',
+            // 画面からの送信はバッチ（スクリプト等）より優先して処理される
+            headers: { 'Content-Type': 'application/json', 'X-Client-Priority': 'interactive' },
+            body: JSON.stringify({
+                items: items.map((item) => ({ client_id: item.client_id, text: item.text }))
+            })
+        });
+        if (!response.ok) {
+            throw new Error('HTTP ' + response.status);
+        }
+
+        const data = await response.json();
+        const done = data.results.filter((r) => !r.retryable).map((r) => r.client_id);
+        await remove(done);
+
+        const byId = Object.fromEntries(items.map((item) => [item.client_id, item]));
+        return data.results.map((r) => ({ ...r, text: (byId[r.client_id] || {}).text }));
+    }
+
+    return { add, all, count, remove, flush, SYNC_TAG };
+})();
@@ -0,0 +1,77 @@
+// リミット四ツ谷店 売上記帳 - Service Worker（オフラインシェル + バックグラウンド送信）
+// ページ本体をキャッシュし、電波が悪いときはキャッシュから表示する。
+// サーバー側はETagを返すため、オンライン時の再検証は304でほぼ無料。
+// 未送信の売上はIndexedDB（queue.js）に保持し、Background Syncで送信する。
+
+importScripts('/queue.js');
+
+const SHELL_CACHE = 'limit-shell-__ASSET_VERSION__';
+const SHELL_URLS = ['/', '/queue.js', '/manifest.webmanifest', '/icon.svg'];
+
+self.addEventListener('install', (event) => {
+    event.waitUntil(
+        caches.open(SHELL_CACHE)
+            .then((cache) => cache.addAll(SHELL_URLS))
+            .then(() => self.skipWaiting())
+    );
+});
+
+self.addEventListener('activate', (event) => {
+    // 古いバージョンのキャッシュを削除
+    event.waitUntil(
+        caches.keys()
+            .then((keys) => Promise.all(
+                keys.filter((key) => key.startsWith('limit-shell-') && key !== SHELL_CACHE)
+                    .map((key) => caches.delete(key))
+            ))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', (event) => {
+    const request = event.request;
+    if (request.method !== 'GET') {
+        return;
+    }
+
+    const url = new URL(request.url);
+    if (url.origin !== self.location.origin || !SHELL_URLS.includes(url.pathname)) {
+        return;
+    }
+
+    // stale-while-revalidate: キャッシュを即座に返し、裏で更新する
+    event.respondWith(
+        caches.open(SHELL_CACHE).then((cache) =>
+            cache.match(request).then((cached) => {
+                const network = fetch(request)
+                    .then((response) => {
+                        if (response.ok) {
+                            cache.put(request, response.clone());
+                        }
+                        return response;
+                    })
+                    .catch(() => cached);
+                return cached || network;
+            })
+        )
+    );
+});
+
+self.addEventListener('sync', (event) => {
+    if (event.tag === SaleQueue.SYNC_TAG) {
+        event.waitUntil(flushAndNotify());
+    }
+});
+
+async function flushAndNotify() {
+    const results = await SaleQueue.flush();
+    if (results.length === 0) {
+        return;
+    }
+    const windows = await self.clients.matchAll({ type: 'window' });
+    windows.forEach((client) => client.postMessage({ type: 'sale-queue-flushed', results }));
+    // 再送待ちが残っていれば例外にしてブラウザに再試行させる
+    if (results.some((r) => !r.success && r.retryable)) {
+        throw new Error('retryable items remain');
+    }
+}
@@ -0,0 +1,170 @@
+"""
+Precompiled static assets module
+フロントエンド（PWA一式）・スキーマを起動時に一度だけエンコード・圧縮し、
+ETag / Cache-Control / gzip・brotli付きで配信する
+"""
+
+import gzip
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotliは任意依存（未インストール時はgzipのみ）
+    brotli = None
+
+from .metrics import record_cache
+
+STATIC_DIR = Path(__file__).parent / "static"
+
+# HTML・Service Workerは毎回ETagで再検証（変更がなければ304で本文なし）
+CACHE_REVALIDATE = "no-cache"
+# スキーマはデプロイ単位でしか変わらないので1時間キャッシュ
+CACHE_SCHEMA = "public, max-age=3600"
+
+
+class StaticAsset:
+    """Pre-encoded response body with precompressed variants"""
+
+    def __init__(self, body: bytes, media_type: str, cache_control: str = CACHE_REVALIDATE):
+        """
+        Initialize static asset
+
+        Args:
+            body: レスポンス本文（エンコード済み）
+            media_type: Content-Type
+            cache_control: Cache-Control ヘッダー値
+        """
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+        # エンコーディング名 -> 本文（identityは必ず存在）
+        self.variants: Dict[str, bytes] = {"identity": body}
+        gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(gzipped) < len(body):
+            self.variants["gzip"] = gzipped
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=11)
+            if len(compressed) < len(body):
+                self.variants["br"] = compressed
+
+    @classmethod
+    def from_text(cls, text: str, media_type: str, cache_control: str = CACHE_REVALIDATE) -> "StaticAsset":
+        """Create an asset from a UTF-8 string"""
+        return cls(text.encode("utf-8"), media_type, cache_control)
+
+    @classmethod
+    def from_json(cls, data: Dict, cache_control: str = CACHE_SCHEMA) -> "StaticAsset":
+        """Create an asset from a JSON-serializable object"""
+        body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return cls(body, "application/json", cache_control)
+
+    def choose_encoding(self, accept_encoding: Optional[str]) -> str:
+        """
+        Pick the best precompressed variant for an Accept-Encoding header
+        Accept-Encodingから最適な圧縮形式を選ぶ（br > gzip > identity）
+
+        Args:
+            accept_encoding: Accept-Encoding ヘッダー値
+
+        Returns:
+            str: "br", "gzip" または "identity"
+        """
+        accepted = set()
+        for part in (accept_encoding or "").split(","):
+            token, _, params = part.strip().partition(";")
+            token = token.strip().lower()
+            if not token:
+                continue
+            # q=0 は明示的な拒否
+            if params.replace(" ", "").lower() in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                continue
+            accepted.add(token)
+
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and (encoding in accepted or "*" in accepted):
+                return encoding
+        return "identity"
+
+    def render(self, accept_encoding: Optional[str], if_none_match: Optional[str]) -> Tuple[int, bytes, Dict[str, str]]:
+        """
+        Build status, body and headers for a request
+        リクエストヘッダーに応じてステータス・本文・ヘッダーを組み立てる
+
+        Args:
+            accept_encoding: Accept-Encoding ヘッダー値
+            if_none_match: If-None-Match ヘッダー値
+
+        Returns:
+            tuple: (status_code, body, headers)
+        """
+        headers = {
+            "ETag": self.etag,
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding",
+        }
+
+        if if_none_match:
+            candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            if self.etag in candidates or "*" in candidates:
+                record_cache("static_etag", True)
+                return 304, b"", headers
+            record_cache("static_etag", False)
+
+        encoding = self.choose_encoding(accept_encoding)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return 200, self.variants[encoding], headers
+
+    def response(self, request):
+        """
+        Build a Starlette response for the given request
+        FastAPIのRequestからレスポンスを生成する
+        """
+        from fastapi.responses import Response
+
+        status_code, body, headers = self.render(
+            request.headers.get("accept-encoding"),
+            request.headers.get("if-none-match"),
+        )
+        if status_code == 304:
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, status_code=status_code, headers=headers, media_type=self.media_type)
+
+
+def load_text(name: str) -> str:
+    """Read a file from the static directory"""
+    return (STATIC_DIR / name).read_text(encoding="utf-8")
+
+
+def build_frontend_assets(schema: Dict) -> Dict[str, StaticAsset]:
+    """
+    Build every static asset served by the API server
+    APIサーバーが配信する静的アセットを起動時に一括生成
+
+    Args:
+        schema: /api/schema で返すFunction Callingスキーマ
+
+    Returns:
+        dict: パス -> StaticAsset
+    """
+    js = "application/javascript; charset=utf-8"
+    shell = {
+        "/": StaticAsset.from_text(load_text("index.html"), "text/html; charset=utf-8"),
+        "/queue.js": StaticAsset.from_text(load_text("queue.js"), js),
+        "/manifest.webmanifest": StaticAsset.from_text(load_text("manifest.webmanifest"), "application/manifest+json"),
+        "/icon.svg": StaticAsset.from_text(load_text("icon.svg"), "image/svg+xml"),
+    }
+
+    # Service Workerのキャッシュ名をシェル一式のETagに連動させ、デプロイ時に古いシェルを破棄する
+    version = hashlib.sha256("".join(asset.etag for asset in shell.values()).encode("utf-8")).hexdigest()[:12]
+    service_worker = StaticAsset.from_text(load_text("sw.js").replace("__ASSET_VERSION__", version), js)
+
+    return {
+        **shell,
+        "/sw.js": service_worker,
+        "/api/schema": StaticAsset.from_json(schema),
+    }
@@ -0,0 +1,163 @@
+"""
+Store registry module
+店舗ID -> スプレッドシートID・顧客リスト・商品カタログ・税率 の対応を管理する
+
+STORES_FILE（JSON）で複数店舗を登録できる。未設定の場合は従来どおり
+GOOGLE_SHEET_ID と KNOWN_CUSTOMERS による1店舗（DEFAULT_STORE_ID）として動作する。
+
+STORES_FILE の例（stores.example.json）:
+    {
+        "stores": [
+            {
+                "id": "yotsuya",
+                "name": "リミット四ツ谷店",
+                "spreadsheet_id": "1okl...",
+                "customers": ["岩佐将平", ...],
+                "catalog": [{"name": "月4回プラン", "unit_price_incl_tax": 35200}],
+                "tax_rate": 0.1
+            }
+        ]
+    }
+"""
+
+import json
+import logging
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional
+
+from .config import Config
+from .schema import KNOWN_CUSTOMERS
+
+logger = logging.getLogger(__name__)
+
+# 標準の消費税率
+DEFAULT_TAX_RATE = 0.1
+
+
+class UnknownStoreError(KeyError):
+    """Raised when a store ID is not registered"""
+
+
+class StoreConfig:
+    """Settings of one store (branch)"""
+
+    def __init__(
+        self,
+        store_id: str,
+        spreadsheet_id: Optional[str],
+        name: Optional[str] = None,
+        customers: Optional[List[str]] = None,
+        catalog: Optional[List[Dict]] = None,
+        tax_rate: float = DEFAULT_TAX_RATE
+    ):
+        """
+        Initialize store config
+
+        Args:
+            store_id: 店舗ID（APIの store パラメータ）
+            spreadsheet_id: 店舗の売上スプレッドシートID
+            name: 表示名
+            customers: 既知の顧客名（省略時は KNOWN_CUSTOMERS）
+            catalog: 商品カタログ [{"name": str, "unit_price_incl_tax": int（任意）, "tax_rate": float（任意）}]
+            tax_rate: 標準税率（商品ごとの tax_rate がない場合に使用）
+        """
+        self.store_id = store_id
+        self.spreadsheet_id = spreadsheet_id
+        self.name = name or store_id
+        self.customers = list(customers) if customers is not None else list(KNOWN_CUSTOMERS)
+        self.catalog = {item["name"]: item for item in (catalog or [])}
+        self.tax_rate = tax_rate
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "StoreConfig":
+        """Create a store config from one entry of STORES_FILE"""
+        return cls(
+            store_id=data["id"],
+            spreadsheet_id=data.get("spreadsheet_id"),
+            name=data.get("name"),
+            customers=data.get("customers"),
+            catalog=data.get("catalog"),
+            tax_rate=data.get("tax_rate", DEFAULT_TAX_RATE)
+        )
+
+    def tax_rate_for(self, product_name: str) -> float:
+        """商品に適用する税率（カタログに個別の税率があればそれを優先）"""
+        item = self.catalog.get(product_name)
+        if item and item.get("tax_rate") is not None:
+            return item["tax_rate"]
+        return self.tax_rate
+
+    def price_excl_tax(self, product_name: str, price_incl_tax: float) -> int:
+        """税込単価から税抜単価を計算（floor）"""
+        # 3240 / 1.08 = 2999.9999... のような浮動小数点誤差で1円ずれないよう、丸めてから切り捨てる
+        return int(round(price_incl_tax / (1 + self.tax_rate_for(product_name)), 6))
+
+
+class StoreRegistry:
+    """Store ID -> StoreConfig lookup"""
+
+    def __init__(self, stores: List[StoreConfig], default_store_id: str):
+        """
+        Initialize store registry
+
+        Args:
+            stores: 登録する店舗
+            default_store_id: store パラメータ省略時の店舗ID
+        """
+        self.stores: Dict[str, StoreConfig] = {store.store_id: store for store in stores}
+        self.default_store_id = default_store_id
+
+    @classmethod
+    def load(cls, path: Optional[str] = None, default_store_id: Optional[str] = None) -> "StoreRegistry":
+        """
+        Load stores from STORES_FILE
+
+        デフォルト店舗がファイルにない場合は GOOGLE_SHEET_ID から作成する（従来の1店舗構成）。
+        """
+        default_store_id = default_store_id or Config.DEFAULT_STORE_ID
+        stores = []
+        if path:
+            data = json.loads(Path(path).read_text(encoding="utf-8"))
+            stores = [StoreConfig.from_dict(entry) for entry in data.get("stores", [])]
+            logger.info(f"[店舗設定] {path} から {len(stores)} 店舗を読み込みました")
+
+        if all(store.store_id != default_store_id for store in stores):
+            stores.insert(0, StoreConfig(default_store_id, Config.GOOGLE_SHEET_ID))
+        return cls(stores, default_store_id)
+
+    @property
+    def default(self) -> StoreConfig:
+        return self.stores[self.default_store_id]
+
+    def is_default(self, store_id: Optional[str]) -> bool:
+        return store_id is None or store_id == self.default_store_id
+
+    def get(self, store_id: Optional[str] = None) -> StoreConfig:
+        """
+        Look up a store (None -> default store)
+
+        Raises:
+            UnknownStoreError: 登録されていない店舗ID
+        """
+        if store_id is None:
+            return self.default
+        store = self.stores.get(store_id)
+        if store is None:
+            raise UnknownStoreError(store_id)
+        return store
+
+
+# Global registry instance (lazy initialization)
+_store_registry: Optional[StoreRegistry] = None
+_registry_lock = Lock()
+
+
+def get_store_registry() -> StoreRegistry:
+    """Get or create the store registry (STORES_FILE is read at first use)"""
+    global _store_registry
+    if _store_registry is None:
+        with _registry_lock:
+            if _store_registry is None:
+                _store_registry = StoreRegistry.load(Config.STORES_FILE)
+    return _store_registry
@@ -0,0 +1,228 @@
+"""
+Structured logging module
+ログの出力をリクエスト処理から切り離し、1リクエストにつき1件の構造化ログ（JSON）にまとめる
+
+- configure_logging(): ルートロガーに QueueHandler を付け、実際の書き込み（フォーマット・stderr）は
+  QueueListener のスレッドで行う。リクエスト側のコストはキューへの追加だけになる
+- request_scope(): リクエストごとのコンテキスト。stage() の所要時間や annotate() の項目を集め、
+  api_server のミドルウェアが最後に1件の "request" ログとして出力する
+- log_payload(): 入力テキスト・解析結果などの詳細ログ。LOG_PAYLOAD_SAMPLE_RATE の割合だけ出力し、
+  顧客名・ユーザーID・本文はマスクする（DEBUGレベルでは毎回出力）
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Any, Dict, Optional
+
+from .config import Config
+
+# マスクする項目（顧客名・LINEのユーザーID・メッセージ本文・返信トークン・Geminiの応答本文）
+REDACT_KEYS = {"seller", "user_id", "line_user_id", "text", "reply_token", "customer", "customers", "response"}
+
+# LogRecord の標準属性（これ以外は extra として JSON に含める）
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_configure_lock = Lock()
+
+payload_logger = logging.getLogger("limit.payload")
+
+
+class RequestContext:
+    """Per-request fields collected for the single request log record"""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.stages: Dict[str, float] = {}
+        self.fields: Dict[str, Any] = {}
+        self.lock = Lock()
+
+    def add_stage(self, name: str, seconds: float):
+        with self.lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def annotate(self, **fields):
+        with self.lock:
+            self.fields.update(fields)
+
+    def as_dict(self) -> Dict:
+        with self.lock:
+            return {
+                "request_id": self.request_id,
+                "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()},
+                **self.fields
+            }
+
+
+_current_request: contextvars.ContextVar[Optional[RequestContext]] = contextvars.ContextVar(
+    "current_request", default=None
+)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_request() -> Optional[RequestContext]:
+    """処理中のリクエストのコンテキスト（リクエスト外ではNone）"""
+    return _current_request.get()
+
+
+@contextmanager
+def request_scope(request_id: Optional[str] = None):
+    """リクエストのコンテキストを開始（to_thread で実行される処理にも引き継がれる）"""
+    context = RequestContext(request_id or new_request_id())
+    token = _current_request.set(context)
+    try:
+        yield context
+    finally:
+        _current_request.reset(token)
+
+
+def add_stage(name: str, seconds: float):
+    """処理段階の所要時間を現在のリクエストに加算（metrics.stage から呼ばれる）"""
+    context = _current_request.get()
+    if context is not None:
+        context.add_stage(name, seconds)
+
+
+def annotate(**fields):
+    """現在のリクエストのログに項目を追加（例: annotate(gemini_model="gemini-2.5-flash")）"""
+    context = _current_request.get()
+    if context is not None:
+        context.annotate(**fields)
+
+
+def _mask(value: str) -> str:
+    text = str(value)
+    if len(text) <= 1:
+        return "*"
+    return f"{text[0]}***（{len(text)}文字）"
+
+
+def _mask_all(value: Any) -> Any:
+    """REDACT_KEYS の値（文字列・文字列のリスト）をマスク"""
+    if isinstance(value, str):
+        return _mask(value)
+    if isinstance(value, (list, tuple)):
+        return [_mask_all(item) for item in value]
+    return redact(value)
+
+
+def redact(value: Any) -> Any:
+    """REDACT_KEYS の値をマスクしたコピーを返す（LOG_REDACT=false ならそのまま）"""
+    if not Config.LOG_REDACT:
+        return value
+    if isinstance(value, dict):
+        return {key: (_mask_all(item) if key in REDACT_KEYS else redact(item)) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+def log_payload(label: str, payload: Any):
+    """
+    Sampled, redacted verbose log
+
+    LOG_PAYLOAD_SAMPLE_RATE の割合（DEBUGレベルでは毎回）だけ出力し、顧客名などはマスクする。
+
+    Args:
+        label: ログの見出し（例: "[Gemini応答]"）
+        payload: 出力する値（dict / list / str）
+    """
+    if payload_logger.isEnabledFor(logging.DEBUG):
+        sampled = True
+    else:
+        rate = Config.LOG_PAYLOAD_SAMPLE_RATE
+        sampled = rate > 0 and (rate >= 1 or random.random() < rate)
+    if not sampled or not payload_logger.isEnabledFor(logging.INFO):
+        return
+    if isinstance(payload, str):
+        payload = {"text": payload}
+    context = _current_request.get()
+    payload_logger.info(label, extra={
+        "payload": redact(payload),
+        "request_id": context.request_id if context else None
+    })
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line (time, level, logger, message and extra fields)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable format with extra fields appended as JSON"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        extra = {key: value for key, value in vars(record).items()
+                 if key not in _RECORD_ATTRS and not key.startswith("_")}
+        if extra:
+            text += " " + json.dumps(extra, ensure_ascii=False, default=str)
+        return text
+
+
+def configure_logging(level: Optional[str] = None, log_format: Optional[str] = None, stream=None):
+    """
+    Route logging through a QueueHandler / QueueListener
+
+    ルートロガーにハンドラーが既にある場合（テスト・他のアプリが設定済み）は何もしない
+    （logging.basicConfig と同じ動作）。
+
+    Args:
+        level: ログレベル（省略時は LOG_LEVEL）
+        log_format: "json" または "text"（省略時は LOG_FORMAT）
+        stream: 出力先（省略時は stderr。MCPのstdioモードでは stdout を使えないため）
+    """
+    global _listener
+    with _configure_lock:
+        root = logging.getLogger()
+        if _listener is not None or root.handlers:
+            return
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JsonFormatter() if (log_format or Config.LOG_FORMAT) == "json" else TextFormatter())
+
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        root.setLevel(getattr(logging, (level or Config.LOG_LEVEL).upper(), logging.INFO))
+
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging():
+    """キューに残っているログを書き出してリスナーを停止（終了時）"""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
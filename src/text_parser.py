@@ -0,0 +1,138 @@
+"""
+Regex sale text parser
+Geminiを使わずに正規表現だけで売上テキストを解析する（Gemini障害時の最終フォールバック）
+
+定型的な書き方（例:「12/28 PayPalで月4回プラン 35,200円 販売しました。顧客: 服部誉也」）のみ対応。
+「担当: 〇〇」「トレーナー: 〇〇」があれば担当トレーナーとして取り出す（名簿との照合は記帳時に行う）。
+項目を特定できない場合は ValueError を送出する。
+"""
+
+import re
+import unicodedata
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from .schema import KNOWN_CUSTOMERS, PAYMENT_METHODS
+
+# 表記ゆれ -> 決済方法
+PAYMENT_ALIASES = {
+    "paypay": "PayPay",
+    "paypal": "PayPal",
+    "現金": "現金",
+    "クレジットカード": "クレジットカード",
+    "クレカ": "クレジットカード",
+    "カード": "クレジットカード",
+    "銀行振込": "銀行振込",
+    "振込": "銀行振込",
+    "振り込み": "銀行振込",
+}
+
+DATE_PATTERN = re.compile(r"(\d{1,2})\s*/\s*(\d{1,2})")
+DAY_PATTERN = re.compile(r"(\d{1,2})\s*日")
+PRICE_PATTERN = re.compile(r"[¥￥]\s*([\d,]+)|([\d,]+)\s*円")
+CUSTOMER_PATTERN = re.compile(r"(?:顧客|お客様|会員)\s*(?:名)?\s*[:：]\s*([^\s、。,]+)")
+TRAINER_PATTERN = re.compile(r"(?:担当|トレーナー)\s*(?:者)?\s*[:：]\s*([^\s、。,]+)")
+QUANTITY_PATTERN = re.compile(r"[x×＊*]\s*(\d+)|(\d+)\s*(?:個|点|本|枚|袋)")
+PRODUCT_AFTER_PAYMENT = re.compile(r"で\s*(.+?)\s*(?:[x×＊*]\s*\d+\s*)?(?:合計\s*)?(?:[¥￥]\s*)?[\d,]+\s*円")
+
+
+def normalize_message(text: str) -> str:
+    """
+    Normalize a sale message before parsing
+
+    全角英数字・記号を半角に揃え（NFKC）、改行・連続する空白を1つの空白にまとめる。
+    Geminiに送るトークン数を減らし、正規表現でも同じ表記で照合できるようにする。
+    """
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def _to_int(text: str) -> int:
+    return int(text.replace(",", ""))
+
+
+def _longest_match(text: str, candidates: Iterable[str]) -> Optional[str]:
+    found = [name for name in candidates if name and name in text]
+    return max(found, key=len) if found else None
+
+
+def parse_sale_text_regex(
+    text: str,
+    customers: Optional[Iterable[str]] = None,
+    products: Optional[Iterable[str]] = None,
+    today: Optional[datetime] = None
+) -> Dict:
+    """
+    Parse a sale message without Gemini
+
+    Args:
+        text: LINEメッセージ
+        customers: 既知の顧客名（省略時は KNOWN_CUSTOMERS）
+        products: 既知の商品名（店舗カタログ）
+        today: 日付が書かれていない場合に使う日（テスト用）
+
+    Returns:
+        dict: parse_sale_text_with_gemini と同じ形式
+            {"day", "seller", "payment_method", "product_name", "quantity", "unit_price_incl_tax"}
+            担当トレーナーが書かれていれば "trainer" も付く
+
+    Raises:
+        ValueError: 必要な項目を特定できない
+    """
+    customers = list(customers) if customers is not None else KNOWN_CUSTOMERS
+
+    # 日付: "12/28" -> 28、"28日" -> 28、なければ今日
+    date_match = DATE_PATTERN.search(text)
+    if date_match:
+        day = int(date_match.group(2))
+    else:
+        day_match = DAY_PATTERN.search(text)
+        day = int(day_match.group(1)) if day_match else (today or datetime.now()).day
+
+    # 金額
+    price_match = PRICE_PATTERN.search(text)
+    if not price_match:
+        raise ValueError("金額を特定できません")
+    price = _to_int(price_match.group(1) or price_match.group(2))
+
+    # 決済方法（長い表記から順に照合）
+    lowered = text.lower()
+    payment_method = None
+    for alias in sorted(PAYMENT_ALIASES, key=len, reverse=True):
+        if alias in lowered:
+            payment_method = PAYMENT_ALIASES[alias]
+            break
+    if payment_method not in PAYMENT_METHODS:
+        raise ValueError("決済方法を特定できません")
+
+    # 顧客名:「顧客: 〇〇」、なければ既知の顧客名が含まれているか
+    customer_match = CUSTOMER_PATTERN.search(text)
+    seller = customer_match.group(1) if customer_match else _longest_match(text, customers)
+    if not seller:
+        raise ValueError("顧客名を特定できません")
+
+    # 商品名: カタログの商品名、なければ「〇〇で」と金額の間
+    product_name = _longest_match(text, products or [])
+    if not product_name:
+        product_match = PRODUCT_AFTER_PAYMENT.search(text)
+        product_name = product_match.group(1).strip() if product_match else None
+    if not product_name:
+        raise ValueError("商品名を特定できません")
+
+    quantity_match = QUANTITY_PATTERN.search(text)
+    quantity = int(quantity_match.group(1) or quantity_match.group(2)) if quantity_match else 1
+
+    # 「合計」と書かれていれば数量で割って単価にする
+    unit_price = price // quantity if "合計" in text and quantity > 1 else price
+
+    result = {
+        "day": day,
+        "seller": seller,
+        "payment_method": payment_method,
+        "product_name": product_name,
+        "quantity": quantity,
+        "unit_price_incl_tax": unit_price
+    }
+    trainer_match = TRAINER_PATTERN.search(text)
+    if trainer_match:
+        result["trainer"] = trainer_match.group(1)
+    return result
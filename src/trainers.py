@@ -0,0 +1,264 @@
+"""
+Trainers module
+トレーナー名簿（月度シートのM列）のキャッシュと、トレーナー別の売上集計の索引
+
+- TrainerRoster: 名簿を TRAINER_ROSTER_TTL_SECONDS ごとに1回だけ読み（記帳のたびには読まない）、
+  読み直したときに内容が変わっていれば version を上げてログに残す。売上の担当トレーナーを名簿の表記に揃える
+- TrainerIndex: 記帳・修正・取り消しのたびに、売上ID -> 担当トレーナー・金額 を差分だけ
+  JSON Lines（TRAINER_INDEX_FILE）に追記し、店舗・スプレッドシート・シート・トレーナーごとの合計をメモリ上で更新する。
+  月度シートは年を持たず年ごとに別のスプレッドシートを使うため、スプレッドシートIDで前年の同じ月と分ける。
+  歩合の集計（GET /api/trainers/report）はこの合計を返すだけで、Sheetsは読まない
+
+索引に載るのはこの仕組みを入れた後に記帳した売上のみ（手作業で入力した行は含まない）。
+"""
+
+import json
+import logging
+import time
+import unicodedata
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .config import Config
+from .metrics import record_cache
+from .row_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+
+class UnknownTrainerError(ValueError):
+    """The trainer is not on the roster (column M)"""
+
+
+def _normalize(name: str) -> str:
+    return "".join(unicodedata.normalize("NFKC", name or "").split())
+
+
+class TrainerRoster:
+    """Trainer roster of a store, cached with a TTL and change detection"""
+
+    def __init__(
+        self,
+        client_getter: Callable,
+        ttl_seconds: float = 600.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize trainer roster
+
+        Args:
+            client_getter: 店舗のGoogleSheetsClientを返す関数
+            ttl_seconds: 名簿を読み直すまでの秒数（M列を手作業で編集した分の取り込み間隔）
+            clock: 現在時刻を返す関数（テスト用）
+        """
+        self.client_getter = client_getter
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.version = 0  # 名簿の内容が変わるたびに増える
+        self._names: Optional[Tuple[str, ...]] = None
+        self._loaded_at = 0.0
+        self.lock = Lock()
+
+    def names(self) -> List[str]:
+        """
+        Return the cached roster, reading column M only if stale
+        名簿を返す（期限切れなら1回だけ読み直す。読めなければ前回の名簿のまま）
+        """
+        with self.lock:
+            if self._names is not None and self.clock() - self._loaded_at < self.ttl_seconds:
+                record_cache("trainer_roster", True)
+                return list(self._names)
+        record_cache("trainer_roster", False)
+
+        try:
+            names = tuple(self.client_getter().read_trainers())
+        except Exception as e:
+            if self._names is None:
+                raise
+            logger.warning(f"[トレーナー名簿] 読み直しに失敗したため前回の名簿を使います: {e}")
+            return list(self._names)
+        self.update(names)
+        return list(names)
+
+    def update(self, names: Iterable[str]):
+        """読み込んだ名簿を反映（内容が変わっていれば version を上げる）"""
+        names = tuple(names)
+        with self.lock:
+            previous = self._names
+            self._names = names
+            self._loaded_at = self.clock()
+            if previous is not None and previous != names:
+                self.version += 1
+                added = [name for name in names if name not in previous]
+                removed = [name for name in previous if name not in names]
+                logger.info(f"[トレーナー名簿] 名簿が変わりました（追加: {added}、削除: {removed}）")
+
+    def invalidate(self):
+        """次回の参照で名簿を読み直す"""
+        with self.lock:
+            self._loaded_at = float("-inf")
+
+    def resolve(self, name: str) -> str:
+        """
+        Match a trainer name against the roster
+        担当トレーナーを名簿の表記に揃える（全角・空白の違い、名字だけの指定も1人に決まれば可）
+
+        名簿を一度も読めていない（Google Sheetsの障害中など）場合は照合せずにそのまま返す。
+
+        Raises:
+            UnknownTrainerError: 名簿にない、または複数のトレーナーに当てはまる
+        """
+        try:
+            roster = self.names()
+        except Exception as e:
+            logger.warning(f"[トレーナー名簿] 名簿を読めないため '{name}' を照合せずに記録します: {e}")
+            return name
+        key = _normalize(name)
+        exact = [trainer for trainer in roster if _normalize(trainer) == key]
+        if exact:
+            return exact[0]
+        partial = [trainer for trainer in roster if key and key in _normalize(trainer)]
+        if len(partial) == 1:
+            return partial[0]
+        raise UnknownTrainerError(f"トレーナー '{name}' は名簿（M列）にありません。名簿: {'、'.join(roster) or '（なし）'}")
+
+
+def _empty_totals() -> Dict:
+    return {"count": 0, "subtotal_excl_tax": 0, "subtotal_incl_tax": 0}
+
+
+class TrainerIndex:
+    """Append-only, incrementally loaded per-trainer sales aggregate"""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initialize trainer index
+
+        Args:
+            path: 索引ファイルのパス（Noneならメモリ上のみ）
+        """
+        self.path = path
+        self._sales: Dict[str, Dict] = {}  # 売上ID -> {"store", "spreadsheet", "sheet", "trainer", 金額}
+        # (店舗, スプレッドシートID, シート) -> トレーナー（None: 担当なし） -> 合計
+        self._totals: Dict[tuple, Dict[Optional[str], Dict]] = {}
+        self._offset = 0  # 読み込み済みのファイル位置
+        self.lock = Lock()
+        if self.path:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._load()
+
+    def _load(self):
+        """ファイルの未読部分を読み込む（lock を保持して呼ぶ）"""
+        path = Path(self.path)
+        if not path.exists():
+            return
+        with open(path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # 他のプロセスが書き込み中の行は次回読む
+                self._offset += len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"[トレーナー索引] 壊れた行を読み飛ばしました: {line[:80]!r}")
+                    continue
+                self._apply(record)
+
+    def _add(self, entry: Dict, sign: int):
+        totals = self._totals.setdefault((entry["store"], entry.get("spreadsheet"), entry["sheet"]), {})
+        bucket = totals.setdefault(entry["trainer"], _empty_totals())
+        bucket["count"] += sign
+        bucket["subtotal_excl_tax"] += sign * entry["subtotal_excl_tax"]
+        bucket["subtotal_incl_tax"] += sign * entry["subtotal_incl_tax"]
+        if not bucket["count"]:
+            del totals[entry["trainer"]]
+
+    def _apply(self, record: Dict):
+        sale_id = record.pop("id")
+        previous = self._sales.pop(sale_id, None) if sale_id else None
+        if previous is not None:
+            self._add(previous, -1)
+        if record.get("deleted"):
+            return
+        self._add(record, 1)
+        if sale_id:
+            self._sales[sale_id] = record
+
+    def _append(self, records: List[Dict]):
+        """変更を反映し、ファイルに追記（lock を保持して呼ぶ）"""
+        if not self.path or not records:
+            for record in records:
+                self._apply(dict(record))
+            return
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        with open(self.path, "ab") as f, file_lock(f):
+            # 追記前に他のプロセスの分を読み込み、自分の追記分は読み込み済みとして扱う
+            # （ファイルロックを保持したまま行うため、間に他のプロセスが追記した行を読み飛ばさない）
+            self._load()
+            for record in records:
+                self._apply(dict(record))
+            f.write(data)
+            f.flush()
+            self._offset = f.tell()
+
+    def record(self, store: Optional[str], spreadsheet: Optional[str], sheet_name: str, sales: Iterable[Dict]):
+        """
+        記帳・修正した売上を反映（同じ売上IDは置き換え）
+
+        Args:
+            spreadsheet: 記帳したスプレッドシートID（年ごとのスプレッドシートを区別する）
+            sales: "sale_id", "trainer", "subtotal_excl_tax", "subtotal_incl_tax" を持つ辞書
+                （row_to_sale の結果 + sale_id）
+        """
+        with self.lock:
+            self._append([
+                {"id": sale.get("sale_id"), "store": store, "spreadsheet": spreadsheet, "sheet": sheet_name,
+                 "trainer": sale.get("trainer") or None,
+                 "subtotal_excl_tax": sale["subtotal_excl_tax"], "subtotal_incl_tax": sale["subtotal_incl_tax"]}
+                for sale in sales
+            ])
+
+    def remove(self, sale_id: str):
+        """取り消した売上を集計から除く"""
+        with self.lock:
+            if sale_id in self._sales:
+                self._append([{"id": sale_id, "deleted": True}])
+
+    def report(self, store: Optional[str], spreadsheet: Optional[str], sheet_name: str) -> Dict:
+        """
+        Per-trainer totals of one month sheet (no Sheets API call)
+        トレーナー別の件数・合計（他のプロセスが追記した分を読み込んでから返す）
+
+        Returns:
+            dict: {"trainers": [{"trainer", "count", "subtotal_excl_tax", "subtotal_incl_tax"}, ...],
+                   "unassigned": {"count", "subtotal_excl_tax", "subtotal_incl_tax"}}
+        """
+        with self.lock:
+            if self.path:
+                self._load()
+            totals = {
+                trainer: dict(bucket)
+                for trainer, bucket in self._totals.get((store, spreadsheet, sheet_name), {}).items()
+            }
+        unassigned = totals.pop(None, _empty_totals())
+        return {
+            "trainers": [{"trainer": trainer, **totals[trainer]} for trainer in sorted(totals)],
+            "unassigned": unassigned
+        }
+
+
+# Global trainer index (lazy initialization)
+_index: Optional[TrainerIndex] = None
+_index_lock = Lock()
+
+
+def get_trainer_index() -> TrainerIndex:
+    """Get or create the shared trainer index (TRAINER_INDEX_FILE is read at first use)"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = TrainerIndex(Config.TRAINER_INDEX_FILE or None)
+    return _index
@@ -0,0 +1,79 @@
+"""
+TTL cache module
+有効期限・最大件数つきのスレッドセーフなインメモリキャッシュ
+"""
+
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Hashable, List, Optional
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a fixed time"""
+
+    def __init__(self, max_items: int = 500, ttl_seconds: float = 600.0, clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize TTL cache
+
+        Args:
+            max_items: 保持する最大件数（超えたら古いものから削除）
+            ttl_seconds: エントリの有効期限（秒）
+            clock: 現在時刻を返す関数（テスト用に差し替え可能）
+        """
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._items: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a live entry or default"""
+        with self.lock:
+            entry = self._items.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._items[key]
+                return default
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None):
+        """Store an entry, evicting the least recently used ones if full"""
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self.lock:
+            self._items[key] = (self.clock() + ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove and return a live entry"""
+        with self.lock:
+            entry = self._items.pop(key, None)
+            if entry is None or entry[0] <= self.clock():
+                return default
+            return entry[1]
+
+    def values(self) -> List[Any]:
+        """Return the live entries (oldest first)"""
+        with self.lock:
+            now = self.clock()
+            return [value for expires_at, value in self._items.values() if expires_at > now]
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._items)
+
+    def clear(self):
+        """Remove all entries"""
+        with self.lock:
+            self._items.clear()
+
+
+_MISSING = object()
@@ -10,20 +10,35 @@ import logging
 from typing import List
 
 from fastapi import FastAPI, Request, HTTPException, Header
-from linebot import WebhookParser
-from linebot.models import MessageEvent, TextMessage
-from linebot.exceptions import InvalidSignatureError
 
 from .config import Config
+from .line_replies import get_reply_tokens
 from .message_store import get_message_store
+from .structured_logging import configure_logging, log_payload
 
 logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
 app = FastAPI(title="LINE Webhook Server for Limit Yotsuya")
 
-# Initialize LINE webhook parser
-parser = WebhookParser(Config.LINE_CHANNEL_SECRET)
+# LINE webhook parser (lazy initialization)
+# linebot SDKはインポートに時間がかかるため、最初のWebhook受信（またはwarm_up）まで読み込まない
+_parser = None
+
+
+def get_parser():
+    """Get or create the LINE webhook parser"""
+    global _parser
+    if _parser is None:
+        from linebot import WebhookParser
+        _parser = WebhookParser(Config.LINE_CHANNEL_SECRET)
+    return _parser
+
+
+def warm_up():
+    """Import the linebot SDK ahead of the first webhook (run in the background at startup)"""
+    get_parser()
+    import linebot.models  # noqa: F401
 
 
 def verify_signature(body: bytes, signature: str) -> bool:
@@ -84,6 +99,8 @@ async def webhook(
     LINE Webhook endpoint
     LINEからのWebhookを受信してメッセージを保存する
 
+    返信トークンはユーザーごとに保持し、記帳確認の送信（line_replies）で返信に使う。
+
     Args:
         request: FastAPI Request object
         x_line_signature: LINE signature header
@@ -100,18 +117,23 @@ async def webhook(
         logger.error("Invalid signature")
         raise HTTPException(status_code=400, detail="Invalid signature")
 
+    from linebot.exceptions import InvalidSignatureError
+    from linebot.models import MessageEvent, TextMessage
+
     # Parse webhook events
     try:
-        events = parser.parse(body.decode('utf-8'), x_line_signature)
+        events = get_parser().parse(body.decode('utf-8'), x_line_signature)
     except InvalidSignatureError:
         logger.error("Invalid signature from parser")
         raise HTTPException(status_code=400, detail="Invalid signature")
 
     # Process events
     message_store = get_message_store()
+    reply_tokens = get_reply_tokens()
 
     for event in events:
-        logger.info(f"Received event: {event}")
+        # イベント全体（本文・ユーザーIDを含む）は出力せず、種類だけ記録する
+        logger.debug(f"Received event: {type(event).__name__}")
 
         # Handle text messages
         if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
@@ -119,7 +141,7 @@ async def webhook(
             text = event.message.text
             message_id = event.message.id
 
-            logger.info(f"Text message from {user_id}: {text}")
+            log_payload("[LINEメッセージ]", {"user_id": user_id, "text": text})
 
             # Store message
             message_store.add_message(
@@ -127,6 +149,8 @@ async def webhook(
                 text=text,
                 message_id=message_id
             )
+            # 記帳確認を返信で送れるよう、返信トークンを保持（プッシュより速く、通数にも数えない）
+            reply_tokens.put(user_id, event.reply_token)
 
     return {"status": "ok", "events_processed": len(events)}
 
@@ -177,10 +201,7 @@ def run_server(host: str = "0.0.0.0", port: int = 8000):
 
 if __name__ == "__main__":
     # Configure logging
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
+    configure_logging()
 
     # Validate config
     Config.validate()
@@ -0,0 +1,43 @@
+"""
+Performance budgets
+ベンチマークの上限値。超えた場合はテスト失敗（＝ビルド失敗）とする
+
+API呼び出し回数は決定的なので厳密に、レイテンシはCI環境の揺れを見込んだ上限にする。
+"""
+
+# 1件の記帳（record_sale）で発生するSheets API呼び出し回数
+# row_values + get_all_values + update（M列のトレーナー名簿は記帳のたびには読まない）
+SHEETS_CALLS_PER_SALE = 3
+
+# まとめて記帳（record_sales）は件数によらず一定
+SHEETS_CALLS_PER_BATCH = 3
+
+# SHEETS_WRITE_STRATEGY=append では読み取りなしの values.append 1回のみ
+SHEETS_CALLS_PER_APPEND = 1
+
+# record_sale のp95レイテンシ上限（秒）: 偽バックエンドの遅延を除いたPython側の処理時間
+RECORD_SALE_P95_SECONDS = {
+    100: 0.010,
+    1000: 0.025,
+    10000: 0.250,
+}
+
+# MessageStore.add_message の1件あたりp95（秒）
+ADD_MESSAGE_P95_SECONDS = 0.0005
+ADD_MESSAGE_PERSISTED_P95_SECONDS = 0.020
+
+# 20イベントのWebhook処理のp95（秒）
+WEBHOOK_20_EVENTS_P95_SECONDS = 0.100
+
+# /api/process_and_record を50件同時に投げたときの全体時間の上限（秒）
+# Gemini 20ms・Sheets 5ms/回の偽遅延で、直列なら 50 × (20ms + 20ms) = 2秒かかる
+CONCURRENT_50_REQUESTS_SECONDS = 1.0
+
+# `import src.api_server` の累積インポート時間の上限（秒、-X importtime で計測）
+API_SERVER_IMPORT_SECONDS = 1.2
+
+# コールドスタート（プロセス起動〜インポート〜/livez の応答）までの上限（秒）
+COLD_START_FIRST_BYTE_SECONDS = 1.5
+
+# 起動時にインポートしてはいけない重いSDK（初回利用時・warm_upで読み込む）
+DEFERRED_MODULES = ("google.generativeai", "linebot")
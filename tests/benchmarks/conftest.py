@@ -0,0 +1,62 @@
+"""
+Shared fixtures for benchmarks
+"""
+
+import time
+
+import pytest
+
+import src.sheets_service as sheets_service
+from src.config import Config
+from tests.fakes import make_sheets_client
+
+
+def percentile(durations, q):
+    """q（0〜100）パーセンタイル（最近傍法）"""
+    ordered = sorted(durations)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def timed_rounds(benchmark, func, rounds, setup=None):
+    """
+    Run func through pytest-benchmark and return the raw durations
+
+    pytest-benchmarkのレポートに載せつつ、p95判定用に各回の所要時間を自前でも記録する。
+    """
+    durations = []
+
+    def wrapper(*args):
+        start = time.perf_counter()
+        func(*args)
+        durations.append(time.perf_counter() - start)
+
+    if setup is None:
+        benchmark.pedantic(wrapper, rounds=rounds, iterations=1, warmup_rounds=1)
+    else:
+        benchmark.pedantic(wrapper, setup=setup, rounds=rounds, warmup_rounds=1)
+    return durations
+
+
+@pytest.fixture(autouse=True)
+def strict_call_budgets(monkeypatch):
+    """ベンチマーク中は宣言したAPI呼び出し回数の上限を超えたら失敗させる"""
+    monkeypatch.setattr(Config, "SHEETS_CALL_BUDGET_MODE", "raise")
+    monkeypatch.setattr(Config, "SHEETS_CALLS_HEADER", True)
+
+
+@pytest.fixture
+def shared_sheets(monkeypatch):
+    """
+    Install a fake-backed GoogleSheetsClient as the process-wide client
+
+    Returns a factory: shared_sheets(data_rows=0, latency=0.0) -> (client, spreadsheet)
+    """
+    def install(data_rows=0, latency=0.0):
+        client, spreadsheet = make_sheets_client(data_rows=data_rows, latency=latency)
+        monkeypatch.setattr(sheets_service, "_sheets_client", client)
+        monkeypatch.setattr(sheets_service, "_sheet_mirror", None)
+        monkeypatch.setattr(sheets_service, "_write_queue", None)
+        return client, spreadsheet
+
+    return install
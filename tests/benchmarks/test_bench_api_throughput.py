@@ -0,0 +1,58 @@
+"""
+Benchmarks for concurrent /api/process_and_record through httpx's ASGI transport
+"""
+
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import src.api_server as api_server
+from src.gemini_client import GeminiClient
+from tests.benchmarks import budgets
+from tests.fakes import StubGeminiModel
+
+CONCURRENCY = 50
+
+
+@pytest.fixture
+def stub_gemini(monkeypatch):
+    model = StubGeminiModel(latency=0.020)
+    client = GeminiClient([model.model_name], lambda name, system_instruction=None: model)
+    monkeypatch.setattr(api_server, "gemini_client", client)
+    return model
+
+
+async def _burst(count: int):
+    transport = httpx.ASGITransport(app=api_server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        responses = await asyncio.gather(*(
+            client.post("/api/process_and_record", json={"text": f"12/28 PayPalで月4回プラン 35,200円 #{i}"})
+            for i in range(count)
+        ))
+    return responses
+
+
+def test_concurrent_process_and_record(benchmark, shared_sheets, stub_gemini):
+    """50 concurrent parse-and-record calls are coalesced into few sheet writes"""
+    client, spreadsheet = shared_sheets(data_rows=500, latency=0.005)
+    client.get_current_month_sheet()
+    spreadsheet.calls.clear()
+
+    def run():
+        start = time.perf_counter()
+        responses = asyncio.run(_burst(CONCURRENCY))
+        return responses, time.perf_counter() - start
+
+    responses, elapsed = benchmark.pedantic(run, rounds=1, iterations=1)
+
+    assert all(response.status_code == 200 for response in responses)
+    assert all(response.json()["success"] for response in responses)
+    # まとめて書き込んだ分も各リクエストに計上され、宣言した上限内に収まる
+    assert all(response.headers["X-Sheets-Calls"].startswith("total=") for response in responses)
+    rows = sorted(response.json()["row"] for response in responses)
+    assert rows == list(range(505, 505 + CONCURRENCY))  # 重複・欠番なし
+    # 書き込みキューでまとめられるため、API呼び出しは1件ずつ書く場合より必ず少ない
+    assert spreadsheet.api_calls < budgets.SHEETS_CALLS_PER_SALE * CONCURRENCY
+    assert elapsed <= budgets.CONCURRENT_50_REQUESTS_SECONDS
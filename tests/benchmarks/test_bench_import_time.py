@@ -0,0 +1,62 @@
+"""
+Import-time and cold-start checks (-X importtime in a fresh interpreter)
+"""
+
+import subprocess
+import sys
+from pathlib import Path
+
+from tests.benchmarks import budgets
+
+ROOT = Path(__file__).resolve().parents[2]
+
+COLD_START = """
+import time
+start = time.perf_counter()
+import asyncio
+import httpx
+import src.api_server as api_server
+
+async def first_byte():
+    transport = httpx.ASGITransport(app=api_server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://cold") as client:
+        response = await client.get("/livez")
+        assert response.status_code == 200
+
+asyncio.run(first_byte())
+print(time.perf_counter() - start)
+"""
+
+
+def _python(*args):
+    return subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True, check=True)
+
+
+def _import_times(stderr: str):
+    """-X importtime の出力 -> {モジュール名: 累積秒}"""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1_000_000
+    return times
+
+
+def test_api_server_import_time(benchmark):
+    """Heavy SDKs are not imported with api_server"""
+    result = benchmark.pedantic(lambda: _python("-X", "importtime", "-c", "import src.api_server"),
+                                rounds=1, iterations=1)
+    times = _import_times(result.stderr)
+
+    for module in budgets.DEFERRED_MODULES:
+        assert module not in times, f"{module} is imported at startup"
+    if not (ROOT / ".env").exists():
+        assert "dotenv" not in times
+    assert times["src.api_server"] <= budgets.API_SERVER_IMPORT_SECONDS
+
+
+def test_cold_start_first_byte(benchmark):
+    """Fresh interpreter -> import -> first /livez response"""
+    result = benchmark.pedantic(lambda: _python("-c", COLD_START), rounds=1, iterations=1)
+    assert float(result.stdout.strip().splitlines()[-1]) <= budgets.COLD_START_FIRST_BYTE_SECONDS
@@ -0,0 +1,37 @@
+"""
+Benchmarks for MessageStore.add_message
+"""
+
+from src.message_store import MessageStore
+from tests.benchmarks import budgets
+from tests.benchmarks.conftest import percentile, timed_rounds
+
+
+def test_add_message_in_memory(benchmark):
+    """In-memory add_message throughput"""
+    store = MessageStore(max_messages=100, persist_file=None)
+    counter = iter(range(10 ** 9))
+
+    durations = timed_rounds(
+        benchmark,
+        lambda: store.add_message("U1234", f"12/28 PayPalで月4回プラン 35,200円 #{next(counter)}", "msg"),
+        rounds=500
+    )
+
+    assert percentile(durations, 95) <= budgets.ADD_MESSAGE_P95_SECONDS
+
+
+def test_add_message_persisted(benchmark, tmp_path):
+    """add_message with a persist file (rewrites JSON on every message)"""
+    store = MessageStore(max_messages=100, persist_file=str(tmp_path / "messages.json"))
+    for i in range(100):
+        store.add_message("U1234", f"warmup {i}", f"w{i}")
+    counter = iter(range(10 ** 9))
+
+    durations = timed_rounds(
+        benchmark,
+        lambda: store.add_message("U1234", f"12/28 PayPalで月4回プラン 35,200円 #{next(counter)}", "msg"),
+        rounds=100
+    )
+
+    assert percentile(durations, 95) <= budgets.ADD_MESSAGE_PERSISTED_P95_SECONDS
@@ -0,0 +1,75 @@
+"""
+Benchmarks for GoogleSheetsClient.record_sale / record_sales
+"""
+
+import pytest
+
+from src.config import Config
+from tests.benchmarks import budgets
+from tests.benchmarks.conftest import percentile, timed_rounds
+from tests.fakes import make_sheets_client
+
+SALE = {
+    "day": 28,
+    "seller": "岩佐将平",
+    "payment_method": "PayPal",
+    "product_name": "月4回プラン",
+    "quantity": 1,
+    "unit_price_excl_tax": 32000,
+    "unit_price_incl_tax": 35200,
+}
+
+
+@pytest.mark.parametrize("data_rows", sorted(budgets.RECORD_SALE_P95_SECONDS))
+def test_record_sale_latency_by_sheet_size(benchmark, data_rows):
+    """record_sale latency as the month sheet grows (100 → 10k rows)"""
+    client, spreadsheet = make_sheets_client(data_rows=data_rows)
+    client.get_current_month_sheet()
+    before = spreadsheet.api_calls
+
+    durations = timed_rounds(benchmark, lambda: client.record_sale(**SALE), rounds=20)
+
+    calls_per_sale = (spreadsheet.api_calls - before) / (len(durations) + 1)  # +1: warmup
+    assert calls_per_sale <= budgets.SHEETS_CALLS_PER_SALE
+    assert percentile(durations, 95) <= budgets.RECORD_SALE_P95_SECONDS[data_rows]
+
+
+def test_record_sale_call_breakdown():
+    """Each sale issues exactly the budgeted Sheets API calls"""
+    client, spreadsheet = make_sheets_client(data_rows=100)
+    client.get_current_month_sheet()
+    spreadsheet.calls.clear()
+
+    result = client.record_sale(**SALE)
+
+    assert result["success"] is True
+    assert result["row"] == 105
+    assert sum(spreadsheet.calls.values()) == budgets.SHEETS_CALLS_PER_SALE
+
+
+def test_record_sales_batch_calls_are_constant(benchmark):
+    """record_sales writes N sales with a constant number of calls"""
+    client, spreadsheet = make_sheets_client(data_rows=1000)
+    client.get_current_month_sheet()
+    spreadsheet.calls.clear()
+
+    result = benchmark.pedantic(lambda: client.record_sales([SALE] * 20), rounds=1, iterations=1)
+
+    assert result["success"] is True
+    assert len(result["rows"]) == 20
+    assert spreadsheet.api_calls == budgets.SHEETS_CALLS_PER_BATCH
+
+
+def test_record_sale_append_strategy_is_independent_of_sheet_size(benchmark, monkeypatch):
+    """append strategy: one call per sale and no full-sheet read, even with 10k rows"""
+    monkeypatch.setattr(Config, "SHEETS_WRITE_STRATEGY", "append")
+    monkeypatch.setattr(Config, "SHEETS_APPEND_MAX_ROW", 20000)
+    client, spreadsheet = make_sheets_client(data_rows=10000)
+    client.get_current_month_sheet()
+    spreadsheet.calls.clear()
+
+    durations = timed_rounds(benchmark, lambda: client.record_sale(**SALE), rounds=20)
+
+    # durations にはウォームアップの1回も含まれる
+    assert spreadsheet.api_calls == budgets.SHEETS_CALLS_PER_APPEND * len(durations)
+    assert set(spreadsheet.calls) == {"append_rows"}
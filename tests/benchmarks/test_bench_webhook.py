@@ -0,0 +1,69 @@
+"""
+Benchmarks for the LINE webhook with multi-event payloads
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.config import Config
+from src.message_store import MessageStore
+from tests.benchmarks import budgets
+from tests.benchmarks.conftest import percentile, timed_rounds
+
+CHANNEL_SECRET = "benchmark-channel-secret"
+
+
+def _payload(events: int) -> bytes:
+    return json.dumps({
+        "destination": "Uxxxxxxxx",
+        "events": [
+            {
+                "type": "message",
+                "mode": "active",
+                "timestamp": 1735000000000 + i,
+                "source": {"type": "user", "userId": f"U{i:032d}"},
+                "webhookEventId": f"01H{i:023d}",
+                "deliveryContext": {"isRedelivery": False},
+                "replyToken": f"reply-token-{i}",
+                "message": {"id": str(10 ** 12 + i), "type": "text", "quoteToken": f"q{i}",
+                            "text": f"12/{i % 28 + 1} PayPalで月4回プラン 35,200円 販売しました"},
+            }
+            for i in range(events)
+        ],
+    }).encode("utf-8")
+
+
+def _signature(body: bytes) -> str:
+    digest = hmac.new(CHANNEL_SECRET.encode("utf-8"), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+@pytest.fixture
+def webhook_client(monkeypatch):
+    monkeypatch.setattr(Config, "LINE_CHANNEL_SECRET", CHANNEL_SECRET)
+    import src.message_store as message_store
+    import src.webhook_server as webhook_server
+
+    monkeypatch.setattr(message_store, "_message_store", MessageStore(max_messages=100, persist_file=None))
+    monkeypatch.setattr(webhook_server, "_parser", None)  # テスト用のシークレットで作り直す
+    return TestClient(webhook_server.app)
+
+
+def test_webhook_multi_event_payload(benchmark, webhook_client):
+    """20 text events in one webhook call"""
+    body = _payload(20)
+    headers = {"X-Line-Signature": _signature(body), "Content-Type": "application/json"}
+
+    def send():
+        response = webhook_client.post("/webhook", content=body, headers=headers)
+        assert response.status_code == 200
+        assert response.json()["events_processed"] == 20
+
+    durations = timed_rounds(benchmark, send, rounds=20)
+
+    assert percentile(durations, 95) <= budgets.WEBHOOK_20_EVENTS_P95_SECONDS
@@ -0,0 +1,50 @@
+"""
+Shared fixtures
+"""
+
+import pytest
+
+from src import sale_index, sales_ledger, sales_outbox, sheets_service, trainers
+from src.circuit_breaker import get_breaker
+from src.config import Config
+
+
+@pytest.fixture(autouse=True)
+def memory_sale_index(monkeypatch):
+    """テスト中の記帳で data/sale_index.jsonl を作らないよう、売上索引をメモリ上のみにする"""
+    index = sale_index.SaleIndex()
+    monkeypatch.setattr(sale_index, "_index", index)
+    return index
+
+
+@pytest.fixture(autouse=True)
+def memory_sales_ledger(monkeypatch):
+    """テスト中の記帳で data/sales_ledger.jsonl を作らないよう、売上台帳をメモリ上のみにする"""
+    ledger = sales_ledger.SalesLedger()
+    monkeypatch.setattr(sales_ledger, "_ledger", ledger)
+    return ledger
+
+
+@pytest.fixture(autouse=True)
+def memory_trainer_index(monkeypatch):
+    """トレーナー索引をメモリ上のみにし、トレーナー名簿のキャッシュを持ち越さない"""
+    index = trainers.TrainerIndex()
+    monkeypatch.setattr(trainers, "_index", index)
+    monkeypatch.setattr(sheets_service, "_trainer_roster", None)
+    return index
+
+
+@pytest.fixture
+def sale_ids(monkeypatch):
+    """売上ID（K列）を有効にする（デフォルトは無効。ID・索引・台帳との突き合わせを使うテスト用）"""
+    monkeypatch.setattr(Config, "SALE_IDS", True)
+
+
+@pytest.fixture(autouse=True)
+def memory_outbox(monkeypatch):
+    """保留キューをメモリ上のみにし、Sheetsのサーキットブレーカーを閉じた状態から始める"""
+    outbox = sales_outbox.SalesOutbox()
+    monkeypatch.setattr(sales_outbox, "_outbox", outbox)
+    get_breaker("sheets").reset()
+    yield outbox
+    get_breaker("sheets").reset()
@@ -0,0 +1,288 @@
+"""
+In-memory fakes for gspread and Gemini
+オフラインでテスト・ベンチマークを行うための偽のgspread / Geminiバックエンド
+
+FakeGspreadClient は gspread.Client の代わりに GoogleSheetsClient(gspread_client=...) に渡す。
+呼び出しごとに latency 秒スリープし、メソッド別の呼び出し回数を calls に記録する。
+"""
+
+import json
+import time
+from collections import Counter
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+import gspread
+from gspread.utils import a1_to_rowcol, rowcol_to_a1
+
+# M列（トレーナー名）まで持つ
+SHEET_WIDTH = 13
+
+TRAINERS = ["服部誉也", "田中一郎", "佐藤花子"]
+
+
+def _parse_range(range_name: str):
+    """'C5:J7' -> ((5, 3), (7, 10))"""
+    start, _, end = range_name.partition(":")
+    return a1_to_rowcol(start), a1_to_rowcol(end or start)
+
+
+class FakeWorksheet:
+    """Grid-backed stand-in for gspread.Worksheet"""
+
+    def __init__(self, spreadsheet: "FakeSpreadsheet", title: str, rows: List[List], sheet_id: int):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.rows = [list(row) + [""] * (SHEET_WIDTH - len(row)) for row in rows]
+
+    def _tick(self, method: str):
+        self.spreadsheet.tick(method)
+
+    def _ensure(self, row: int, col: int):
+        while len(self.rows) < row:
+            self.rows.append([""] * SHEET_WIDTH)
+        for line in self.rows:
+            if len(line) < col:
+                line.extend([""] * (col - len(line)))
+
+    def _write(self, range_name: str, values: List[List]):
+        (row, col), _ = _parse_range(range_name)
+        for r, line in enumerate(values):
+            self._ensure(row + r, col + len(line) - 1)
+            for c, value in enumerate(line):
+                self.rows[row + r - 1][col + c - 1] = "" if value is None else str(value)
+
+    def _used_rows(self) -> List[List[str]]:
+        last = len(self.rows)
+        while last > 0 and not any(self.rows[last - 1]):
+            last -= 1
+        return [list(row) for row in self.rows[:last]]
+
+    def row_values(self, row: int) -> List[str]:
+        self._tick("row_values")
+        values = list(self.rows[row - 1]) if row <= len(self.rows) else []
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def col_values(self, col: int) -> List[str]:
+        self._tick("col_values")
+        values = [row[col - 1] if len(row) >= col else "" for row in self.rows]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def get_all_values(self) -> List[List[str]]:
+        self._tick("get_all_values")
+        return self._used_rows()
+
+    def get(self, range_name: str) -> List[List[str]]:
+        self._tick("get")
+        (row1, col1), (row2, col2) = _parse_range(range_name)
+        result = [list(line[col1 - 1:col2]) for line in self.rows[row1 - 1:row2]]
+        while result and not any(result[-1]):
+            result.pop()
+        return result
+
+    def update(self, *args, **kwargs):
+        self._tick("update")
+        # gspread 5（range_name, values）と 6（values, range_name）の両方の引数順に対応
+        values = kwargs.get("values")
+        range_name = kwargs.get("range_name")
+        for arg in args:
+            if isinstance(arg, str):
+                range_name = arg
+            else:
+                values = arg
+        self._write(range_name, values)
+        return {"updatedRange": f"'{self.title}'!{range_name}"}
+
+    def batch_update(self, data: List[Dict], **kwargs):
+        self._tick("batch_update")
+        for item in data:
+            self._write(item["range"], item["values"])
+        return {"totalUpdatedRows": len(data)}
+
+    def append_rows(self, values: List[List], insert_data_option=None, table_range: str = None, **kwargs) -> Dict:
+        """values.append: table_range 内の最初の表（連続した非空行）の次の行に書き込む"""
+        self._tick("append_rows")
+        start, _, end = (table_range or "A1").partition(":")
+        first_row, first_col = a1_to_rowcol(start)
+        last_col = a1_to_rowcol(end.rstrip("0123456789") + "1")[1] if end else first_col
+
+        def filled(row: int) -> bool:
+            if row > len(self.rows):
+                return False
+            return any(self.rows[row - 1][first_col - 1:last_col])
+
+        row = first_row
+        while row <= len(self.rows) and not filled(row):
+            row += 1
+        if row > len(self.rows):
+            row = first_row  # 表がなければ範囲の先頭行
+        else:
+            while filled(row):
+                row += 1
+
+        start = f"{rowcol_to_a1(row, first_col)}"
+        end = f"{rowcol_to_a1(row + len(values) - 1, first_col + len(values[0]) - 1)}"
+        self._write(start, values)
+        return {"updates": {"updatedRange": f"'{self.title}'!{start}:{end}", "updatedRows": len(values)}}
+
+    def duplicate(self, new_sheet_name: str = None, **kwargs) -> "FakeWorksheet":
+        self._tick("duplicate")
+        return self.spreadsheet.add_worksheet_copy(self, new_sheet_name)
+
+
+class FakeSpreadsheet:
+    """Stand-in for gspread.Spreadsheet holding several worksheets"""
+
+    def __init__(self, title: str = "2025年店舗管理シート", latency: float = 0.0):
+        self.title = title
+        self.id = "fake-spreadsheet"
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.sheets: Dict[str, FakeWorksheet] = {}
+        self._next_id = 1
+
+    def tick(self, method: str):
+        self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def add_sheet(self, title: str, rows: List[List]) -> FakeWorksheet:
+        sheet = FakeWorksheet(self, title, rows, self._next_id)
+        self._next_id += 1
+        self.sheets[title] = sheet
+        return sheet
+
+    def add_worksheet_copy(self, source: FakeWorksheet, title: str) -> FakeWorksheet:
+        return self.add_sheet(title, [list(row) for row in source.rows])
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        self.tick("worksheet")
+        if title not in self.sheets:
+            raise gspread.WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def worksheets(self) -> List[FakeWorksheet]:
+        self.tick("worksheets")
+        return list(self.sheets.values())
+
+    def fetch_sheet_metadata(self, params: Optional[Dict] = None) -> Dict:
+        self.tick("fetch_sheet_metadata")
+        return {
+            "properties": {"title": self.title},
+            "sheets": [
+                {"properties": {"sheetId": sheet.id, "title": sheet.title, "index": index}}
+                for index, sheet in enumerate(self.sheets.values())
+            ]
+        }
+
+    def batch_update(self, body: Dict) -> Dict:
+        self.tick("spreadsheet_batch_update")
+        replies = []
+        for request in body.get("requests", []):
+            if "duplicateSheet" in request:
+                spec = request["duplicateSheet"]
+                source = next(s for s in self.sheets.values() if s.id == spec["sourceSheetId"])
+                sheet = self.add_worksheet_copy(source, spec["newSheetName"])
+                replies.append({"duplicateSheet": {"properties": {"sheetId": sheet.id, "title": sheet.title}}})
+            else:
+                replies.append({})
+        return {"replies": replies}
+
+    @property
+    def api_calls(self) -> int:
+        """Total number of fake API calls so far"""
+        return sum(self.calls.values())
+
+
+class FakeGspreadClient:
+    """Stand-in for gspread.Client"""
+
+    def __init__(self, spreadsheet: FakeSpreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        self.spreadsheet.tick("open_by_key")
+        return self.spreadsheet
+
+    def set_timeout(self, timeout=None):
+        self.timeout = timeout
+
+
+def header_rows() -> List[List[str]]:
+    """1〜4行目（タイトル・ヘッダー）"""
+    return [
+        ["2025年店舗管理シート"],
+        [],
+        [],
+        ["No.", "決済", "日", "顧客名", "決済方法", "商品・サービス名", "数量", "単価（税抜）",
+         "合計（税抜）", "合計（税込）", "", "", "トレーナー"],
+    ]
+
+
+def sale_row(index: int) -> List[str]:
+    """ダミーの売上行（A〜M列）"""
+    trainer = TRAINERS[index % len(TRAINERS)] if index < len(TRAINERS) else ""
+    return [str(index + 1), "", str(index % 28 + 1), "岩佐将平", "PayPal", "月4回プラン", "1",
+            "32000", "32000", "35200", "", "", trainer]
+
+
+def make_spreadsheet(data_rows: int = 0, latency: float = 0.0, month: Optional[int] = None,
+                     with_template: bool = True) -> FakeSpreadsheet:
+    """
+    Build a fake spreadsheet with the current month sheet
+
+    Args:
+        data_rows: 今月シートに入っている売上行の数
+        latency: API呼び出し1回あたりの遅延（秒）
+        month: 作成する月度シート（省略時は今月）
+        with_template: 「テンプレート」シートも作成するか
+    """
+    spreadsheet = FakeSpreadsheet(latency=latency)
+    if with_template:
+        spreadsheet.add_sheet("テンプレート", header_rows())
+    month = month or datetime.now().month
+    spreadsheet.add_sheet(f"{month} 月度", header_rows() + [sale_row(i) for i in range(data_rows)])
+    return spreadsheet
+
+
+def make_sheets_client(data_rows: int = 0, latency: float = 0.0):
+    """GoogleSheetsClient backed by a fake spreadsheet -> (client, spreadsheet)"""
+    from src.google_sheets import GoogleSheetsClient
+
+    spreadsheet = make_spreadsheet(data_rows=data_rows, latency=latency)
+    client = GoogleSheetsClient(gspread_client=FakeGspreadClient(spreadsheet))
+    client.connect()
+    return client, spreadsheet
+
+
+class StubGeminiModel:
+    """Stand-in for google.generativeai.GenerativeModel returning a fixed JSON answer"""
+
+    def __init__(self, latency: float = 0.0, answer: Optional[Dict] = None, model_name: str = "models/stub-flash"):
+        self.latency = latency
+        self.model_name = model_name
+        self.calls = 0
+        self.answer = answer or {
+            "day": 28,
+            "seller": "岩佐将平",
+            "payment_method": "PayPal",
+            "product_name": "月4回プラン",
+            "quantity": 1,
+            "unit_price_incl_tax": 35200
+        }
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return SimpleNamespace(
+            text=json.dumps(self.answer, ensure_ascii=False),
+            usage_metadata=SimpleNamespace(prompt_token_count=100, candidates_token_count=40,
+                                           cached_content_token_count=0, total_token_count=140)
+        )
@@ -0,0 +1,113 @@
+"""
+Tests for admission control module
+"""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.api_server as api_server
+from src import admission
+from src.admission import BATCH, INTERACTIVE, AdmissionController, AdmissionRejected, client_priority
+
+
+def test_priority_header():
+    """Only the page's explicit header counts as interactive"""
+    assert client_priority("interactive") == INTERACTIVE
+    assert client_priority(" Interactive ") == INTERACTIVE
+    assert client_priority(None) == BATCH
+    assert client_priority("urgent") == BATCH
+
+
+def test_waiting_interactive_calls_run_before_batch():
+    """Freed slots go to interactive waiters first, whatever the arrival order"""
+    controller = AdmissionController("test", max_concurrent=2, max_queue=8, max_wait_seconds=5)
+    order = []
+
+    async def call(name, priority, release=None):
+        async with controller.admit(priority):
+            order.append(name)
+            if release is not None:
+                await release.wait()
+
+    async def main():
+        release = asyncio.Event()
+        holders = [asyncio.create_task(call(f"hold{i}", INTERACTIVE, release)) for i in range(2)]
+        await asyncio.sleep(0)
+        waiters = [asyncio.create_task(call("batch1", BATCH)), asyncio.create_task(call("batch2", BATCH))]
+        await asyncio.sleep(0)
+        waiters.append(asyncio.create_task(call("page", INTERACTIVE)))
+        await asyncio.sleep(0)
+        assert controller.waiting == 3
+        release.set()
+        await asyncio.gather(*holders, *waiters)
+
+    asyncio.run(main())
+    assert order == ["hold0", "hold1", "page", "batch1", "batch2"]
+    assert controller.in_flight == 0
+
+
+def test_batch_is_rejected_first_when_saturated():
+    """Batch may use half of the queue and all but one slot; interactive still gets in"""
+    controller = AdmissionController("test", max_concurrent=2, max_queue=2, max_wait_seconds=5)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def hold(priority):
+            async with controller.admit(priority):
+                await release.wait()
+
+        batch = asyncio.create_task(hold(BATCH))
+        queued = asyncio.create_task(hold(BATCH))  # 2つ目のバッチは空き枠があっても待つ
+        await asyncio.sleep(0)
+        assert (controller.in_flight, controller.waiting) == (1, 1)
+        with pytest.raises(AdmissionRejected):
+            await hold(BATCH)  # バッチが使える待ち行列（半分）は一杯
+
+        page = asyncio.create_task(hold(INTERACTIVE))  # 空けておいた枠で実行
+        await asyncio.sleep(0)
+        assert controller.in_flight == 2
+        release.set()
+        await asyncio.gather(batch, queued, page)
+
+    asyncio.run(main())
+
+
+def test_waiting_past_the_deadline_is_rejected():
+    """A call that cannot get a slot in time leaves the queue with a Retry-After estimate"""
+    controller = AdmissionController("test", max_concurrent=1, max_queue=4, max_wait_seconds=0.05)
+
+    async def main():
+        release = asyncio.Event()
+
+        async def hold():
+            async with controller.admit(INTERACTIVE):
+                await release.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as error:
+            async with controller.admit(INTERACTIVE):
+                pass
+        assert error.value.retry_after >= 1
+        assert controller.waiting == 0
+        release.set()
+        await holder
+
+    asyncio.run(main())
+
+
+def test_saturated_endpoint_returns_429(monkeypatch):
+    """process_and_record answers 429 with Retry-After instead of piling up Gemini calls"""
+    controller = AdmissionController("gemini", max_concurrent=1, max_queue=0)
+    controller.active[INTERACTIVE] = 1  # 実行枠を使い切った状態
+    monkeypatch.setitem(admission._controllers, "gemini", controller)
+
+    response = TestClient(api_server.app).post(
+        "/api/process_and_record", json={"text": "12/28 PayPalで月4回プラン 35,200円"},
+        headers={"X-Client-Priority": "interactive"}
+    )
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
@@ -0,0 +1,184 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from src.backfill import Backfill, load_checkpoint, read_jsonl, read_line_export, sale_period
+from src.circuit_breaker import CircuitOpenError
+from src.google_sheets import GoogleSheetsClient
+from src.sale_index import get_sale_index
+from src.sales_ledger import get_sales_ledger
+from src.stores import StoreConfig
+from src.trainers import get_trainer_index
+from tests.fakes import FakeGspreadClient, make_spreadsheet
+
+LINE_EXPORT = """[LINE] 売上報告のトーク履歴
+保存日時：2025/01/05 12:00
+
+2024/12/27(金)
+10:15\t服部\t12/27 PayPalで月4回プラン 35,200円 販売しました。顧客: 岩佐将平
+10:20\t服部\tお疲れさまです
+2024/12/28(土)
+09:00\t田中\t"28日 現金で
+プロテイン×2 合計 6,480円 顧客: 堀内さやか"
+09:05\t田中\t坂上さんのチケット 11000円 よろしく
+2025/01/04(土)
+18:00\t服部\t12/30 PayPayで月8回プラン 61,600円 顧客: 河村直子
+"""
+
+
+@pytest.fixture
+def export_file(tmp_path):
+    path = tmp_path / "chat.txt"
+    path.write_text(LINE_EXPORT, encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def sheets():
+    spreadsheet = make_spreadsheet(month=datetime.now().month)
+    client = GoogleSheetsClient(gspread_client=FakeGspreadClient(spreadsheet))
+    return client, spreadsheet
+
+
+def gemini_stub(calls):
+    def parse(text, store):
+        calls.append(text)
+        return {"day": 28, "seller": "坂上明彦", "payment_method": "現金", "product_name": "チケット",
+                "quantity": 1, "unit_price_incl_tax": 11000}
+    return parse
+
+
+def _data_rows(sheet):
+    return [row[2:10] for row in sheet.rows[4:] if row[2]]
+
+
+def test_read_line_export_joins_multiline_messages(export_file):
+    messages = list(read_line_export(export_file))
+
+    assert len(messages) == 5
+    assert messages[0]["posted_at"] == datetime(2024, 12, 27, 10, 15)
+    assert messages[2]["text"] == "28日 現金で\nプロテイン×2 合計 6,480円 顧客: 堀内さやか"
+
+
+def test_sale_period_uses_previous_year_for_december_reported_in_january():
+    assert sale_period("12/30 PayPay", datetime(2025, 1, 4)) == (2024, 12)
+    assert sale_period("28日 現金", datetime(2024, 12, 28)) == (2024, 12)
+
+
+def test_backfill_writes_per_month_and_dedupes_on_rerun(export_file, sheets, tmp_path):
+    client, spreadsheet = sheets
+    gemini_calls = []
+    store = StoreConfig("default", "sheet")
+
+    stats = Backfill(client, store, year=2024, parse_with_gemini=gemini_stub(gemini_calls)).run(
+        read_line_export(export_file)
+    )
+
+    assert stats["fast_path"] == 3
+    assert stats["gemini"] == 1  # 正規表現で解析できないメッセージだけGeminiへ
+    assert stats["skipped"] == 1  # 金額のない雑談
+    assert stats["written"] == 4
+    assert gemini_calls == ["坂上さんのチケット 11000円 よろしく"]
+    rows = _data_rows(spreadsheet.sheets["12 月度"])
+    assert [row[1] for row in rows] == ["岩佐将平", "堀内さやか", "坂上明彦", "河村直子"]
+    assert rows[1][4:6] == ["2", "2945"]  # 合計6,480円 ÷ 2 → 税込3,240円 → floor(3240 / 1.1)
+
+    # 同じファイルをもう一度取り込んでも書き込まない
+    spreadsheet.calls.clear()
+    stats = Backfill(client, store, year=2024, parse_with_gemini=gemini_stub([])).run(read_line_export(export_file))
+    assert stats["duplicates"] == 4 and stats["written"] == 0
+    assert "batch_update" not in spreadsheet.calls and "update" not in spreadsheet.calls
+
+
+def test_default_store_is_keyed_like_the_write_queue(export_file, sheets, sale_ids):
+    """Backfilled sales land under None in the sale index, ledger and trainer totals"""
+    client, _ = sheets
+    Backfill(client, StoreConfig("default", "sheet"), year=2024, parse_with_gemini=gemini_stub([])).run(
+        read_line_export(export_file)
+    )
+
+    [entry, *_] = get_sales_ledger().entries(None, None, 12)
+    assert get_sale_index().get(entry["sale_id"])["store"] is None
+    report = get_trainer_index().report(None, None, "12 月度")
+    assert report["unassigned"]["count"] == 4
+    assert report["unassigned"]["subtotal_incl_tax"] == 35200 + 6480 + 11000 + 61600
+
+
+def test_backfill_resumes_from_checkpoint(export_file, sheets, tmp_path):
+    client, spreadsheet = sheets
+    checkpoint = str(tmp_path / "chat.checkpoint.json")
+    store = StoreConfig("default", "sheet")
+
+    Backfill(client, store, chunk_size=2, checkpoint_path=checkpoint,
+             parse_with_gemini=gemini_stub([])).run(read_line_export(export_file))
+    assert load_checkpoint(checkpoint)["position"] == 5
+
+    # 3件目から再開すると、それより前のメッセージは解析しない
+    gemini_calls = []
+    stats = Backfill(client, store, parse_with_gemini=gemini_stub(gemini_calls)).run(
+        read_line_export(export_file), start=4
+    )
+    assert stats["messages"] == 1 and gemini_calls == []
+
+
+def test_failed_messages_are_written_to_file(tmp_path, sheets):
+    client, _ = sheets
+    source = tmp_path / "sales.jsonl"
+    source.write_text("\n".join([
+        json.dumps({"text": "謎のメモ 500円", "timestamp": "2024-12-01T10:00:00"}, ensure_ascii=False),
+        json.dumps({"day": 3, "seller": "岩佐将平", "payment_method": "PayPal", "product_name": "月4回プラン",
+                    "quantity": 1, "unit_price_excl_tax": 32000, "month": 12}, ensure_ascii=False),
+    ]), encoding="utf-8")
+    failed = tmp_path / "sales.failed.jsonl"
+
+    def failing_gemini(text, store):
+        raise RuntimeError("Gemini APIエラー")
+
+    stats = Backfill(client, StoreConfig("default", "sheet"), failed_path=str(failed),
+                     parse_with_gemini=failing_gemini).run(read_jsonl(str(source)))
+
+    assert stats["failed"] == 1 and stats["structured"] == 1 and stats["written"] == 1
+    assert json.loads(failed.read_text(encoding="utf-8"))["text"] == "謎のメモ 500円"
+
+
+def test_sales_missing_fields_fail_one_message_only(tmp_path, sheets):
+    """A structured line or a Gemini answer without a price is counted as failed, not fatal"""
+    client, _ = sheets
+    source = tmp_path / "sales.jsonl"
+    source.write_text("\n".join([
+        json.dumps({"day": 3, "seller": "岩佐将平", "payment_method": "PayPal", "product_name": "月4回プラン",
+                    "month": 12}, ensure_ascii=False),
+        json.dumps({"text": "坂上さんのチケット 11000円", "timestamp": "2024-12-01T10:00:00"}, ensure_ascii=False),
+        json.dumps({"day": 4, "seller": "岩佐将平", "payment_method": "PayPal", "product_name": "月4回プラン",
+                    "unit_price_incl_tax": 35200, "month": 12}, ensure_ascii=False),
+    ]), encoding="utf-8")
+    failed = tmp_path / "sales.failed.jsonl"
+
+    def gemini_without_price(text, store):
+        return {"day": 1, "seller": "坂上明彦", "payment_method": "現金", "product_name": "チケット"}
+
+    stats = Backfill(client, StoreConfig("default", "sheet"), failed_path=str(failed),
+                     parse_with_gemini=gemini_without_price).run(read_jsonl(str(source)))
+
+    assert stats["failed"] == 2 and stats["written"] == 1
+    errors = [json.loads(line)["error"] for line in failed.read_text(encoding="utf-8").splitlines()]
+    assert all("unit_price_incl_tax" in error for error in errors)
+
+
+def test_interrupted_write_is_marked_failed_in_the_ledger(export_file, sheets, monkeypatch):
+    """An open circuit aborts the import, but the batch is not left as unwritten for replay"""
+    client, _ = sheets
+
+    def circuit_open(sales, month=None):
+        raise CircuitOpenError("sheets", 30)
+
+    monkeypatch.setattr(client, "record_sales", circuit_open)
+    with pytest.raises(CircuitOpenError):
+        Backfill(client, StoreConfig("default", "sheet"), year=2024, parse_with_gemini=gemini_stub([])).run(
+            read_line_export(export_file)
+        )
+
+    entries = get_sales_ledger().entries(None, None, 12)
+    assert entries and all(entry["failed"] for entry in entries)
+    assert get_sales_ledger().unwritten() == []
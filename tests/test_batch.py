@@ -0,0 +1,106 @@
+"""
+Tests for /api/process_and_record_batch (idempotency by client_id and retryable errors)
+"""
+
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.api_server as api_server
+import src.sheets_service as sheets_service
+from src.api_server import BatchItem, ProcessBatchRequest
+from tests.fakes import make_sheets_client
+
+pytestmark = pytest.mark.usefixtures("sale_ids")
+
+SALE = {"day": 28, "seller": "岩佐将平", "payment_method": "PayPal", "product_name": "月4回プラン",
+        "quantity": 1, "unit_price_excl_tax": 32000, "unit_price_incl_tax": 35200}
+
+
+@pytest.fixture
+def spreadsheet(monkeypatch):
+    """Fake spreadsheet behind the default store, with empty idempotency state"""
+    client, spreadsheet = make_sheets_client(data_rows=3)
+    monkeypatch.setattr(sheets_service, "_sheets_client", client)
+    monkeypatch.setattr(sheets_service, "_sheet_mirror", None)
+    monkeypatch.setattr(sheets_service, "_write_queue", None)
+    monkeypatch.setattr(api_server, "batch_in_flight", {})
+    api_server.batch_results.clear()
+    yield spreadsheet
+    api_server.batch_results.clear()
+
+
+def written_rows(spreadsheet) -> int:
+    return sum(1 for sheet in spreadsheet.sheets.values() for row in sheet.rows[4:] if row[10])
+
+
+def test_resent_item_returns_the_previous_result(spreadsheet, monkeypatch):
+    monkeypatch.setattr(api_server, "build_sale_from_text", lambda text, store=None: dict(SALE))
+    http = TestClient(api_server.app)
+    body = {"items": [{"client_id": "c1", "text": "月4回プラン 35,200円"}]}
+
+    first = http.post("/api/process_and_record_batch", json=body).json()
+    second = http.post("/api/process_and_record_batch", json=body).json()
+    assert first["success"] and second == first
+    assert written_rows(spreadsheet) == 1
+
+
+def test_concurrent_duplicates_are_written_once(spreadsheet, monkeypatch):
+    """The page and the service worker flushing the same item at once produce one row"""
+    started, release = threading.Event(), threading.Event()
+    parses = []
+
+    def slow_parse(text, store=None):
+        parses.append(text)
+        started.set()
+        release.wait(5)
+        return dict(SALE)
+
+    monkeypatch.setattr(api_server, "build_sale_from_text", slow_parse)
+    request = ProcessBatchRequest(items=[BatchItem(client_id="c1", text="月4回プラン 35,200円")])
+
+    def send():
+        return asyncio.create_task(api_server.process_and_record_batch(request, store=None, x_client_priority=None))
+
+    async def main():
+        first = send()
+        await asyncio.to_thread(started.wait, 5)
+        second = send()
+        await asyncio.sleep(0.05)
+        assert not second.done()  # 処理中の項目は解析せずに結果を待つ
+        release.set()
+        return await first, await second
+
+    first, second = asyncio.run(main())
+    assert first["results"] == second["results"]
+    assert first["success"]
+    assert len(parses) == 1
+    assert written_rows(spreadsheet) == 1
+
+
+def test_parse_errors_are_split_into_retryable_and_not(spreadsheet, monkeypatch):
+    """Bad Gemini output needs a new text; transport errors stay queued and are not cached"""
+    def parse(text, store=None):
+        if text == "壊れた":
+            raise ValueError("JSON不正")
+        if text == "通信エラー":
+            raise ConnectionError("reset")
+        return dict(SALE)
+
+    monkeypatch.setattr(api_server, "build_sale_from_text", parse)
+    http = TestClient(api_server.app)
+    response = http.post("/api/process_and_record_batch", json={"items": [
+        {"client_id": "ok", "text": "月4回プラン 35,200円"},
+        {"client_id": "bad", "text": "壊れた"},
+        {"client_id": "net", "text": "通信エラー"},
+    ]}).json()
+
+    results = {result["client_id"]: result for result in response["results"]}
+    assert not response["success"]
+    assert results["ok"]["success"]
+    assert (results["bad"]["success"], results["bad"]["retryable"]) == (False, False)
+    assert (results["net"]["success"], results["net"]["retryable"]) == (False, True)
+    assert "net" not in api_server.batch_results
+    assert api_server.batch_in_flight == {}
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from src.call_accounting import (
+    CallBudgetExceeded,
+    CallLedger,
+    ENDPOINT_SHEETS_CALLS,
+    call_budget,
+    current_ledger,
+    record_call,
+    track_calls,
+)
+from src.config import Config
+from src.sheets_service import SaleWriteQueue
+from tests.fakes import make_sheets_client
+
+
+def _sale(day=1):
+    return {"day": day, "seller": "岩佐将平", "payment_method": "PayPal", "product_name": "月4回プラン",
+            "quantity": 1, "unit_price_excl_tax": 32000}
+
+
+def test_track_calls_counts_per_method_and_updates_metrics():
+    ENDPOINT_SHEETS_CALLS.reset()
+    with track_calls("/api/test") as ledger:
+        record_call("get_all_values")
+        record_call("batch_update")
+        record_call("batch_update")
+    assert ledger.as_dict() == {"get_all_values": 1, "batch_update": 2}
+    assert ENDPOINT_SHEETS_CALLS.get(endpoint="/api/test", method="batch_update") == 2
+    assert current_ledger() is None
+
+
+def test_record_call_outside_scope_is_ignored():
+    record_call("update")
+    assert current_ledger() is None
+
+
+def test_budget_warns_by_default(monkeypatch, caplog):
+    monkeypatch.setattr(Config, "SHEETS_CALL_BUDGET_MODE", "warn")
+    ledger = CallLedger("/api/test", budget=1)
+    ledger.add("row_values")
+    ledger.add("update")
+    assert "上限超過" in caplog.text
+
+
+def test_budget_raises_in_raise_mode(monkeypatch):
+    monkeypatch.setattr(Config, "SHEETS_CALL_BUDGET_MODE", "raise")
+    ledger = CallLedger("/api/test", budget=1)
+    ledger.add("row_values")
+    with pytest.raises(CallBudgetExceeded):
+        ledger.add("update")
+
+
+def test_header_value():
+    ledger = CallLedger("/api/test", budget=4)
+    ledger.add("update")
+    ledger.add("get_all_values")
+    assert ledger.header_value() == "total=2; get_all_values=1; update=1; budget=4"
+
+
+def test_call_budget_sets_scope_budget():
+    @call_budget(3)
+    async def endpoint():
+        return current_ledger().budget
+
+    async def run():
+        with track_calls("/api/test"):
+            return await endpoint()
+
+    assert asyncio.run(run()) == 3
+    assert endpoint.sheets_call_budget == 3
+
+
+def test_write_queue_charges_batch_calls_to_each_submitter():
+    client, spreadsheet = make_sheets_client(data_rows=3)
+    client.get_current_month_sheet()
+    spreadsheet.calls.clear()
+    queue = SaleWriteQueue(lambda: client)
+
+    async def submit(day):
+        with track_calls(f"/api/{day}") as ledger:
+            await queue.submit(_sale(day))
+        return ledger
+
+    async def run():
+        return await asyncio.gather(submit(1), submit(2))
+
+    ledgers = asyncio.run(run())
+    # 2件は1回の書き込みにまとめられ、その呼び出しが両方のリクエストに計上される
+    assert ledgers[0].as_dict() == ledgers[1].as_dict()
+    assert ledgers[0].total == spreadsheet.api_calls
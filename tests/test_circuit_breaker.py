@@ -0,0 +1,136 @@
+"""
+Tests for circuit breaker, sales outbox and Sheets degraded mode
+"""
+
+import pytest
+import requests
+from fastapi.testclient import TestClient
+
+import src.api_server as api_server
+import src.sheets_service as sheets_service
+from src import sales_outbox
+from src.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CIRCUIT_STATE, CircuitBreaker, CircuitOpenError, get_breaker
+from src.metrics import REGISTRY
+from src.sales_outbox import OutboxDrainer, SalesOutbox
+from tests.fakes import make_sheets_client
+
+SALE = {"day": 28, "seller": "岩佐将平", "payment_method": "PayPal", "product_name": "月4回プラン",
+        "quantity": 1, "unit_price_excl_tax": 32000, "unit_price_incl_tax": 35200}
+
+
+def _unavailable(*args, **kwargs):
+    raise requests.exceptions.ConnectTimeout("connect timeout")
+
+
+def test_breaker_opens_after_consecutive_failures_and_probes_once():
+    """closed -> open after the threshold; one half-open trial decides the next state"""
+    now = [0.0]
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=30, clock=lambda: now[0])
+
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert CIRCUIT_STATE.get(upstream="test") == 2
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_after == 30
+
+    now[0] = 30
+    breaker.before_call()  # 試しの呼び出し
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # 試し中は他の呼び出しを通さない
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    now[0] = 60
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert CIRCUIT_STATE.get(upstream="test") == 0
+
+
+def test_open_circuit_skips_the_api_call():
+    """Once tripped, the client fails without calling gspread"""
+    client, spreadsheet = make_sheets_client()
+    client.breaker = CircuitBreaker("test-client", failure_threshold=3)
+    spreadsheet.fetch_sheet_metadata = _unavailable
+
+    for _ in range(3):
+        with pytest.raises(requests.exceptions.ConnectTimeout):
+            client.ping()
+    calls = spreadsheet.api_calls
+    with pytest.raises(CircuitOpenError):
+        client.ping()
+    assert spreadsheet.api_calls == calls
+    assert client.breaker.state == OPEN
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """API client backed by a fake spreadsheet -> (http, spreadsheet)"""
+    client, spreadsheet = make_sheets_client(data_rows=3)
+    monkeypatch.setattr(sheets_service, "_sheets_client", client)
+    monkeypatch.setattr(sheets_service, "_sheet_mirror", None)
+    monkeypatch.setattr(sheets_service, "_write_queue", None)
+    return TestClient(api_server.app), spreadsheet
+
+
+def _trip():
+    breaker = get_breaker("sheets")
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+
+
+def test_open_circuit_without_outbox_returns_503(api, monkeypatch):
+    """Without an outbox, writes fail fast with 503 and Retry-After"""
+    http, spreadsheet = api
+    monkeypatch.setattr(sales_outbox, "_outbox", None)
+    monkeypatch.setattr(sales_outbox.Config, "SHEETS_OUTBOX_FILE", "")
+    _trip()
+    calls = spreadsheet.api_calls
+
+    response = http.post("/api/record_sale", json=SALE)
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert spreadsheet.api_calls == calls
+    assert "limit_circuit_breaker_state{upstream=\"sheets\"} 2" in REGISTRY.render()
+
+
+@pytest.mark.usefixtures("sale_ids")
+def test_sales_are_held_and_written_when_the_circuit_closes(api, memory_outbox, memory_sale_index):
+    """An open circuit queues the sale (202); the drainer writes it with the same ID"""
+    http, spreadsheet = api
+    _trip()
+
+    response = http.post("/api/record_sale", json=SALE)
+    assert response.status_code == 202
+    body = response.json()
+    assert body["queued"] and body["row"] is None
+    assert len(memory_outbox) == 1
+
+    drainer = OutboxDrainer()
+    assert drainer.run_once() == 0  # 開いている間は何もしない
+
+    get_breaker("sheets").reset()
+    assert drainer.run_once() == 1
+    assert len(memory_outbox) == 0
+    entry = memory_sale_index.get(body["sale_id"])
+    assert entry["row"] == 8
+    assert spreadsheet.sheets[entry["sheet"]].rows[7][10] == body["sale_id"]
+
+
+def test_outbox_survives_restart_and_is_emptied(tmp_path):
+    """Held sales are read back by a new process; the file is truncated once drained"""
+    path = tmp_path / "outbox.jsonl"
+    SalesOutbox(str(path)).add("shinjuku", 12, [{**SALE, "sale_id": "a1"}, {**SALE, "sale_id": "b2"}])
+
+    restarted = SalesOutbox(str(path))
+    assert restarted.stores() == ["shinjuku"]
+    assert [sale["sale_id"] for sale in restarted.pending("shinjuku")[12]] == ["a1", "b2"]
+
+    restarted.add("shinjuku", 12, [{**SALE, "sale_id": "a1"}])  # 保留中のIDは追加しない
+    restarted.done(["a1", "b2"])
+    assert len(restarted) == 0
+    assert path.stat().st_size == 0
@@ -0,0 +1,101 @@
+"""
+Tests for sales export module and GET /api/export
+"""
+
+import csv
+import io
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.api_server as api_server
+import src.sheets_service as sheets_service
+from src.config import Config
+from src.export import export_months, iter_sale_records, stream_export
+from src.google_sheets import GoogleSheetsClient
+from tests.fakes import FakeGspreadClient, FakeSpreadsheet, header_rows, sale_row
+
+
+def make_year(rows_per_month=25, months=range(1, 13), latency=0.0):
+    """月度シートを複数持つ偽スプレッドシート -> (client, spreadsheet)"""
+    spreadsheet = FakeSpreadsheet(latency=latency)
+    for month in months:
+        spreadsheet.add_sheet(f"{month} 月度", header_rows() + [sale_row(i) for i in range(rows_per_month)])
+    client = GoogleSheetsClient(gspread_client=FakeGspreadClient(spreadsheet))
+    client.connect()
+    return client, spreadsheet
+
+
+def test_export_months_follow_the_fiscal_year():
+    """Ranges are ordered from the fiscal year start and may wrap"""
+    assert export_months(4, 3, start_month=4) == [4, 5, 6, 7, 8, 9, 10, 11, 12, 1, 2, 3]
+    assert export_months(11, 2) == [11, 12, 1, 2]
+    with pytest.raises(ValueError):
+        export_months(0, 3)
+
+
+def test_records_are_read_in_chunks_and_yielded_in_month_order():
+    """Each month is read with chunked range gets, never get_all_values"""
+    client, spreadsheet = make_year(rows_per_month=25, months=[1, 2, 3])
+    spreadsheet.calls.clear()
+
+    chunks = list(iter_sale_records(client, [3, 1, 2], chunk_rows=10, concurrency=3))
+
+    months = [record["month"] for chunk in chunks for record in chunk]
+    assert months == [3] * 25 + [1] * 25 + [2] * 25
+    assert max(len(chunk) for chunk in chunks) <= 10
+    assert "get_all_values" not in spreadsheet.calls
+    assert spreadsheet.calls["get"] == 3 * 3  # 25行 = 10 + 10 + 5（最後は短いので終了）
+
+
+def test_readers_stop_when_their_queue_is_full():
+    """Read-ahead is bounded by the per-month queue, so memory stays flat"""
+    client, spreadsheet = make_year(rows_per_month=200, months=[1, 2])
+    spreadsheet.calls.clear()
+
+    records = iter_sale_records(client, [1, 2], chunk_rows=10, concurrency=2, queue_chunks=1)
+    next(records)
+    time.sleep(0.3)
+    # 各月: 送信待ちキュー1 + put待ち1 + 受け取り済み（1月のみ）1 まで
+    assert spreadsheet.calls["get"] <= 5
+    records.close()
+
+
+def test_months_are_read_concurrently():
+    """A year export takes about one month's read time with enough concurrency"""
+    client, _ = make_year(rows_per_month=5, latency=0.05)
+
+    start = time.perf_counter()
+    list(iter_sale_records(client, list(range(1, 13)), chunk_rows=10, concurrency=12))
+    assert time.perf_counter() - start < 12 * 0.05
+
+
+def test_export_endpoint_streams_csv(monkeypatch):
+    """GET /api/export returns CSV with a BOM for the requested months"""
+    client, _ = make_year(rows_per_month=3, months=[4, 5])
+    monkeypatch.setattr(sheets_service, "_sheets_client", client)
+
+    response = TestClient(api_server.app).get("/api/export", params={"from": 4, "to": 5})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    text = response.content.decode("utf-8")
+    assert text.startswith("\ufeff")
+    rows = list(csv.DictReader(io.StringIO(text.lstrip("\ufeff"))))
+    assert [row["month"] for row in rows] == ["4"] * 3 + ["5"] * 3
+    assert rows[0]["subtotal_incl_tax"] == "35200"
+
+    assert TestClient(api_server.app).get("/api/export", params={"format": "xlsx"}).status_code == 400
+
+
+def test_parquet_export_round_trips():
+    """Parquet output is written row group by row group and reads back"""
+    pq = pytest.importorskip("pyarrow.parquet")
+    client, _ = make_year(rows_per_month=30, months=[1, 2])
+
+    data = b"".join(stream_export(client, [1, 2], "parquet", chunk_rows=10, with_sale_ids=Config.SALE_IDS))
+
+    parquet = pq.ParquetFile(io.BytesIO(data))
+    assert parquet.metadata.num_rows == 60
+    assert parquet.metadata.num_row_groups == 6
+    assert parquet.read().column("month").to_pylist() == [1] * 30 + [2] * 30
@@ -0,0 +1,138 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.gemini_client import GeminiClient, GeminiUnavailableError, record_usage
+
+
+class ScriptedModel:
+    """Model whose generate_content follows a script of ("ok" | exception | seconds to sleep)"""
+
+    def __init__(self, name, script):
+        self.name = name
+        self.script = list(script)
+        self.calls = 0
+        self.kwargs = []
+        self.lock = threading.Lock()
+
+    def generate_content(self, contents, **kwargs):
+        with self.lock:
+            self.kwargs.append(kwargs)
+            step = self.script[min(self.calls, len(self.script) - 1)]
+            self.calls += 1
+        if isinstance(step, Exception):
+            raise step
+        if isinstance(step, (int, float)):
+            time.sleep(step)
+        return SimpleNamespace(text=f"{self.name}:{contents}")
+
+
+class ServiceUnavailable(Exception):
+    code = 503
+
+
+class InvalidArgument(Exception):
+    code = 400
+
+
+def make_client(models, **kwargs):
+    kwargs.setdefault("backoff_seconds", 0)
+    return GeminiClient(list(models), lambda name, system_instruction=None: models[name], **kwargs)
+
+
+def test_timeout_falls_back_to_next_model():
+    models = {"flash": ScriptedModel("flash", [0.5]), "lite": ScriptedModel("lite", ["ok"])}
+    client = make_client(models, deadline_seconds=0.05, max_retries=0)
+
+    response, name = client.generate_content("msg")
+
+    assert name == "lite"
+    assert response.text == "lite:msg"
+
+
+def test_sdk_request_is_bounded_by_the_remaining_deadline():
+    """The SDK call itself times out, so an abandoned attempt does not hold a worker thread"""
+    models = {"flash": ScriptedModel("flash", ["ok"])}
+    client = make_client(models, deadline_seconds=2.0, max_retries=0)
+
+    client.generate_content("msg", request_options={"retry": None})
+
+    [kwargs] = models["flash"].kwargs
+    assert 0 < kwargs["request_options"]["timeout"] <= 2.0
+    assert kwargs["request_options"]["retry"] is None
+
+
+def test_retryable_error_is_retried_on_same_model():
+    models = {"flash": ScriptedModel("flash", [ServiceUnavailable("busy"), "ok"]), "lite": ScriptedModel("lite", ["ok"])}
+    client = make_client(models, max_retries=1)
+
+    _, name = client.generate_content("msg")
+
+    assert name == "flash"
+    assert models["flash"].calls == 2
+    assert models["lite"].calls == 0
+
+
+def test_non_retryable_error_skips_to_next_model():
+    models = {"flash": ScriptedModel("flash", [InvalidArgument("bad")]), "lite": ScriptedModel("lite", ["ok"])}
+    client = make_client(models, max_retries=2)
+
+    _, name = client.generate_content("msg")
+
+    assert name == "lite"
+    assert models["flash"].calls == 1
+
+
+def test_all_models_failing_raises_unavailable():
+    models = {"flash": ScriptedModel("flash", [ServiceUnavailable("busy")]),
+              "lite": ScriptedModel("lite", [ServiceUnavailable("busy")])}
+    client = make_client(models, max_retries=1)
+
+    with pytest.raises(GeminiUnavailableError):
+        client.generate_content("msg")
+    assert models["flash"].calls == 2
+    assert models["lite"].calls == 2
+
+
+def test_hedge_sends_second_request_after_p90():
+    # 1本目だけ遅く、2本目（ヘッジ）はすぐ返る
+    model = ScriptedModel("flash", [0.5, "ok"])
+    client = make_client({"flash": model}, deadline_seconds=2, hedge=True, hedge_min_samples=5)
+    for _ in range(5):
+        client._latency["flash"].add(0.01)
+
+    start = time.monotonic()
+    _, name = client.generate_content("msg")
+
+    assert name == "flash"
+    assert model.calls == 2
+    assert time.monotonic() - start < 0.4
+
+
+def test_models_are_cached_per_system_instruction():
+    created = []
+
+    def factory(name, system_instruction=None):
+        created.append((name, system_instruction))
+        return ScriptedModel(name, ["ok"])
+
+    client = GeminiClient(["flash"], factory)
+    client.generate_content("a", system_instruction="store-1")
+    client.generate_content("b", system_instruction="store-1")
+    client.generate_content("c", system_instruction="store-2")
+
+    assert created == [("flash", "store-1"), ("flash", "store-2")]
+
+
+def test_record_usage_estimates_cost_with_cached_tokens():
+    usage = SimpleNamespace(prompt_token_count=1000, cached_content_token_count=800,
+                            candidates_token_count=40, total_token_count=1040)
+
+    result = record_usage("models/gemini-2.5-flash", usage)
+
+    # 200 * 0.30 + 800 * 0.075 + 40 * 2.50 (USD / 1M tokens)
+    assert result["cost_usd"] == pytest.approx((200 * 0.30 + 800 * 0.075 + 40 * 2.50) / 1_000_000)
+    assert result["cached_tokens"] == 800
+    assert record_usage("unknown-model", usage)["cost_usd"] is None
@@ -0,0 +1,158 @@
+"""
+Tests for google_sheets module
+"""
+
+from datetime import datetime
+
+import pytest
+
+from src import google_sheets
+from src.config import Config
+from src.google_sheets import find_empty_rows, fiscal_year_months, parse_updated_range
+from tests.fakes import make_sheets_client
+
+
+def _sheet(c_values):
+    """Build get_all_values() output: 4 header rows + data rows (C column only)"""
+    header = [["", "", "", ""] for _ in range(4)]
+    return header + [["", "", value, ""] for value in c_values]
+
+
+def test_find_empty_rows_first_gap():
+    """The first blank C cell from row 5 is the next row"""
+    assert find_empty_rows(_sheet(["1", "2", "", "4"])) == [7]
+
+
+def test_find_empty_rows_appends_after_last_row():
+    """When every row is filled, rows continue after the last one"""
+    assert find_empty_rows(_sheet(["1", "2"]), count=3) == [7, 8, 9]
+
+
+def test_find_empty_rows_skips_filled_rows():
+    """Multiple rows follow gaps, not a contiguous block"""
+    assert find_empty_rows(_sheet(["", "2", "", "4"]), count=3) == [5, 7, 9]
+
+
+def test_find_empty_rows_short_sheet():
+    """A sheet without data rows starts at row 5"""
+    assert find_empty_rows([["title"]]) == [5]
+
+
+def test_parse_updated_range():
+    assert parse_updated_range("'12 月度'!C10:J11") == ([10, 11], 3)
+    assert parse_updated_range("'12 月度'!C7") == ([7], 3)
+    assert parse_updated_range("") == ([], 0)
+
+
+SALE = {"day": 28, "seller": "岩佐将平", "payment_method": "PayPal", "product_name": "月4回プラン",
+        "quantity": 1, "unit_price_excl_tax": 32000, "unit_price_incl_tax": 35200}
+
+
+@pytest.fixture
+def append_strategy(monkeypatch):
+    monkeypatch.setattr(Config, "SHEETS_WRITE_STRATEGY", "append")
+    monkeypatch.setattr(Config, "SHEETS_APPEND_MAX_ROW", 100)
+
+
+def test_append_strategy_writes_without_reading(append_strategy):
+    """append方式は読み取りなし・1回の呼び出しで表の末尾に書き込む"""
+    client, spreadsheet = make_sheets_client(data_rows=3)
+    client.get_current_month_sheet()
+    spreadsheet.calls.clear()
+
+    result = client.record_sales([SALE, SALE])
+
+    assert result["rows"] == [8, 9]
+    assert dict(spreadsheet.calls) == {"append_rows": 1}
+    sheet = client.current_sheet
+    assert sheet.rows[7][2:10] == ["28", "岩佐将平", "PayPal", "月4回プラン", "1", "32000", "32000", "35200"]
+
+
+def test_append_strategy_falls_back_when_footer_breaks_detection(append_strategy, monkeypatch):
+    """数式・フッター行で表の検出がずれたら書き込みを取り消し、空行検索で書き直す"""
+    monkeypatch.setattr(Config, "SHEETS_APPEND_MAX_ROW", 20)
+    client, spreadsheet = make_sheets_client(data_rows=2)
+    sheet = client.get_current_month_sheet()
+    # 7〜20行目はI・J列に数式の結果（0）、21行目に合計行 → 表は5〜21行目と検出され、22行目に追記される
+    sheet.rows.extend([[""] * 8 + ["0", "0", "", "", ""] for _ in range(14)])
+    sheet.rows.append(["", "", "", "", "", "", "", "合計", "64000", "70400", "", "", ""])
+
+    result = client.record_sale(**SALE)
+
+    assert result["success"] and result["row"] == 7
+    assert not any(sheet.rows[21][2:10])  # 22行目は元どおり空
+    assert sheet.title in client._append_unsafe
+
+    spreadsheet.calls.clear()
+    assert client.record_sale(**SALE)["row"] == 8
+    assert "append_rows" not in spreadsheet.calls
+
+
+def test_append_strategy_needs_the_last_data_row(append_strategy, monkeypatch):
+    """Without SHEETS_APPEND_MAX_ROW a footer cannot be detected: refuse at startup, scan when writing"""
+    monkeypatch.setattr(Config, "SHEETS_APPEND_MAX_ROW", 0)
+    monkeypatch.setattr(Config, "GOOGLE_SHEET_ID", "sheet")
+    monkeypatch.setattr(Config, "GEMINI_API_KEY", "key")
+    monkeypatch.setattr(Config, "get_google_credentials", classmethod(lambda cls: {}))
+    with pytest.raises(ValueError, match="SHEETS_APPEND_MAX_ROW"):
+        Config.validate()
+
+    client, spreadsheet = make_sheets_client(data_rows=3)
+    client.get_current_month_sheet()
+    spreadsheet.calls.clear()
+    assert client.record_sale(**SALE)["row"] == 8
+    assert "append_rows" not in spreadsheet.calls
+
+
+def test_sheet_lookups_use_cached_index():
+    """シートの存在確認はシート一覧のキャッシュを見るだけで、記帳ごとにAPIを呼ばない"""
+    client, spreadsheet = make_sheets_client(data_rows=1)
+    client.get_current_month_sheet()
+    assert spreadsheet.calls["worksheets"] == 1
+
+    spreadsheet.calls.clear()
+    client.record_sale(**SALE)
+    client.get_month_values(datetime.now().month)
+
+    assert "worksheets" not in spreadsheet.calls
+    assert "worksheet" not in spreadsheet.calls
+
+
+def test_current_sheet_follows_month_change(monkeypatch):
+    """月が変わったら次の記帳から新しい月度シートに書き込む"""
+    client, spreadsheet = make_sheets_client(data_rows=1)
+    client.get_current_month_sheet()
+    next_month = datetime.now().month % 12 + 1
+    client.provision_month_sheets([next_month])
+
+    class NextMonth(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return datetime(2025, next_month, 1)
+
+    monkeypatch.setattr(google_sheets, "datetime", NextMonth)
+    result = client.record_sale(**SALE)
+
+    assert result["sheet_name"] == f"{next_month} 月度"
+    assert result["row"] == 5
+
+
+def test_provision_month_sheets_creates_missing_in_one_batch_update():
+    """会計年度分の不足シートを1回の batch_update でまとめて作成する"""
+    client, spreadsheet = make_sheets_client()
+    spreadsheet.calls.clear()
+
+    created = client.provision_month_sheets(fiscal_year_months(4))
+
+    # 今月のシートは作成済みなので残りの11か月分（会計年度の順）
+    current = f"{datetime.now().month} 月度"
+    assert created == [f"{month} 月度" for month in fiscal_year_months(4) if f"{month} 月度" != current]
+    assert spreadsheet.calls["spreadsheet_batch_update"] == 1
+    assert "duplicate" not in spreadsheet.calls
+    assert all(f"{month} 月度" in spreadsheet.sheets for month in range(1, 13))
+    assert client.provision_month_sheets(range(1, 13)) == []
+
+
+def test_fiscal_year_months():
+    assert fiscal_year_months(4) == [4, 5, 6, 7, 8, 9, 10, 11, 12, 1, 2, 3]
+    assert fiscal_year_months() == list(range(1, 13))
@@ -0,0 +1,138 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+
+from fastapi.testclient import TestClient
+from linebot.exceptions import LineBotApiError
+from linebot.models.error import Error
+
+from src.config import Config
+from src.line_api import LineClient
+from src.line_replies import ConfirmationSender, ReplyTokenStore, pack_messages
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeLineBotApi:
+    def __init__(self, reply_error=None):
+        self.reply_error = reply_error
+        self.calls = []
+
+    def reply_message(self, reply_token, messages):
+        self.calls.append(("reply", reply_token, [m.text for m in messages]))
+        if self.reply_error is not None:
+            raise self.reply_error
+
+    def push_message(self, to, messages):
+        self.calls.append(("push", to, [m.text for m in messages]))
+
+
+def test_reply_token_is_used_once_and_expires():
+    clock = FakeClock()
+    tokens = ReplyTokenStore(ttl_seconds=50, clock=clock)
+
+    tokens.put("U1", "token-1")
+    assert tokens.take("U1") == "token-1"
+    assert tokens.take("U1") is None  # 返信トークンは1回しか使えない
+
+    tokens.put("U1", "token-2")
+    clock.now += 51
+    assert tokens.take("U1") is None
+
+
+def test_send_messages_replies_with_valid_token():
+    tokens = ReplyTokenStore(ttl_seconds=50)
+    tokens.put("U1", "token-1")
+    api = FakeLineBotApi()
+
+    assert LineClient(api=api, reply_tokens=tokens).send_messages("U1", ["a", "b"]) == "reply"
+    assert api.calls == [("reply", "token-1", ["a", "b"])]
+
+
+def test_sent_messages_are_logged_redacted(monkeypatch, caplog):
+    """Neither the user ID nor the message text reaches the logs unmasked"""
+    caplog.set_level(logging.INFO)
+    monkeypatch.setattr(Config, "LOG_REDACT", True)
+    monkeypatch.setattr(Config, "LOG_PAYLOAD_SAMPLE_RATE", 1.0)
+    LineClient(api=FakeLineBotApi(), reply_tokens=ReplyTokenStore(ttl_seconds=50)).send_messages(
+        "U1234567890", ["岩佐将平 様 35,200円 記帳しました"]
+    )
+
+    assert caplog.records
+    for record in caplog.records:
+        logged = record.getMessage() + repr(getattr(record, "payload", ""))
+        assert "U1234567890" not in logged and "岩佐将平" not in logged
+
+
+def test_send_messages_falls_back_to_push():
+    tokens = ReplyTokenStore(ttl_seconds=50)
+    tokens.put("U1", "stale-token")
+    api = FakeLineBotApi(reply_error=LineBotApiError(400, {}, error=Error(message="Invalid reply token")))
+    client = LineClient(api=api, reply_tokens=tokens)
+
+    assert client.send_messages("U1", ["a"]) == "push"
+    assert [call[0] for call in api.calls] == ["reply", "push"]
+
+    api.calls.clear()
+    assert client.send_messages("U2", ["b"]) == "push"  # 返信トークンがないユーザー
+    assert api.calls == [("push", "U2", ["b"])]
+
+
+def test_pack_messages_respects_line_limit():
+    assert pack_messages(["1", "2"]) == ["1", "2"]
+    assert pack_messages([str(i) for i in range(7)]) == ["0", "1", "2", "3", "4\n5\n6"]
+
+
+def test_confirmations_within_window_are_coalesced():
+    delivered = []
+    sender = ConfirmationSender(lambda user_id, texts: delivered.append((user_id, texts)), window_seconds=0.05)
+
+    async def scenario():
+        await sender.send("U1", "1件目")
+        await sender.send("U2", "別のユーザー")
+        await sender.send("U1", "2件目")
+        await asyncio.sleep(0.1)
+        await sender.send("U1", "3件目")
+        await sender.close()
+
+    asyncio.run(scenario())
+
+    assert delivered == [("U1", ["1件目", "2件目"]), ("U2", ["別のユーザー"]), ("U1", ["3件目"])]
+
+
+def test_webhook_keeps_reply_token(monkeypatch):
+    import src.line_replies as line_replies
+    import src.message_store as message_store
+    import src.webhook_server as webhook_server
+    from src.message_store import MessageStore
+
+    secret = "test-channel-secret"
+    monkeypatch.setattr(Config, "LINE_CHANNEL_SECRET", secret)
+    monkeypatch.setattr(message_store, "_message_store", MessageStore(max_messages=10, persist_file=None))
+    monkeypatch.setattr(webhook_server, "_parser", None)
+    tokens = ReplyTokenStore(ttl_seconds=50)
+    monkeypatch.setattr(line_replies, "_reply_tokens", tokens)
+
+    body = json.dumps({"destination": "Uxxxxxxxx", "events": [{
+        "type": "message", "mode": "active", "timestamp": 1735000000000,
+        "source": {"type": "user", "userId": "U1"}, "webhookEventId": "01H0", "replyToken": "token-1",
+        "deliveryContext": {"isRedelivery": False},
+        "message": {"id": "1", "type": "text", "quoteToken": "q", "text": "12/28 PayPalで月4回プラン 35,200円"},
+    }]}).encode("utf-8")
+    signature = base64.b64encode(hmac.new(secret.encode(), body, hashlib.sha256).digest()).decode()
+
+    response = TestClient(webhook_server.app).post(
+        "/webhook", content=body, headers={"X-Line-Signature": signature, "Content-Type": "application/json"}
+    )
+
+    assert response.status_code == 200
+    assert tokens.take("U1") == "token-1"
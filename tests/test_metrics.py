@@ -0,0 +1,51 @@
+"""
+Tests for metrics module
+"""
+
+import pytest
+
+from src.metrics import Counter, Histogram, Registry, stage, STAGE_SECONDS, ERRORS
+
+
+def test_counter_renders_prometheus_text():
+    """Counters render HELP/TYPE lines and escaped labels"""
+    registry = Registry()
+    counter = registry.register(Counter("calls_total", "API calls", ["method"]))
+
+    counter.inc(method="get_all_values")
+    counter.inc(2, method='up"date')
+
+    text = registry.render()
+    assert "# TYPE calls_total counter" in text
+    assert 'calls_total{method="get_all_values"} 1' in text
+    assert 'calls_total{method="up\\"date"} 2' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    """Histogram buckets count observations at or below each bound"""
+    histogram = Histogram("latency_seconds", "Latency", ["stage"], buckets=(0.1, 1.0))
+
+    histogram.observe(0.05, stage="write")
+    histogram.observe(0.5, stage="write")
+    histogram.observe(5, stage="write")
+
+    lines = histogram.collect()
+    assert 'latency_seconds_bucket{stage="write",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="write",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="write",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{stage="write"} 3' in lines
+
+
+def test_stage_records_duration_and_errors():
+    """stage() observes the duration and counts errors"""
+    before = STAGE_SECONDS.count(stage="test_stage")
+    errors_before = ERRORS.get(stage="test_stage")
+
+    with stage("test_stage"):
+        pass
+    with pytest.raises(RuntimeError):
+        with stage("test_stage"):
+            raise RuntimeError("boom")
+
+    assert STAGE_SECONDS.count(stage="test_stage") == before + 2
+    assert ERRORS.get(stage="test_stage") == errors_before + 1
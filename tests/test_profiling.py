@@ -0,0 +1,104 @@
+"""
+Tests for the per-request profiler
+"""
+
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import src.api_server as api_server
+from src import profiling
+from src.config import Config
+from src.metrics import stage
+from src.profiling import SamplingProfiler, should_profile
+
+
+@pytest.fixture
+def profile_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr(Config, "PROFILE_TOKEN", "secret")
+    monkeypatch.setattr(Config, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(Config, "PROFILE_INTERVAL_MS", 1.0)
+    monkeypatch.setattr(profiling, "_store", None)
+    return tmp_path
+
+
+def busy_gemini_call():
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_only_the_admin_token_or_the_sample_rate_selects_a_request(monkeypatch):
+    monkeypatch.setattr(Config, "PROFILE_TOKEN", "secret")
+    monkeypatch.setattr(Config, "PROFILE_SAMPLE_RATE", 0.0)
+    assert should_profile("secret")
+    assert not should_profile("wrong")
+    assert not should_profile(None)
+
+    monkeypatch.setattr(Config, "PROFILE_TOKEN", "")
+    assert not should_profile("")  # トークン未設定ならヘッダーでは有効にならない
+    monkeypatch.setattr(Config, "PROFILE_SAMPLE_RATE", 0.1)
+    assert should_profile(None, sample=lambda: 0.05)
+    assert not should_profile(None, sample=lambda: 0.5)
+
+
+def test_sampler_sees_worker_threads():
+    """Work done in to_thread workers is attributed; the sampler itself is not"""
+    profiler = SamplingProfiler(interval_seconds=0.001)
+    profiler.start()
+
+    async def main():
+        await asyncio.to_thread(busy_gemini_call)
+
+    asyncio.run(main())
+    profiler.stop()
+    functions = [line["function"] for line in profiler.top_functions()["total"]]
+    assert any(function.startswith("busy_gemini_call") for function in functions)
+    assert not any(stack.startswith("profiler;") for stack in profiler.stacks)
+
+
+def test_selected_request_is_saved_with_its_request_id(profile_dir):
+    """The middleware stores the stack samples next to the request's stage timings"""
+    app = FastAPI()
+
+    @app.get("/slow")
+    async def slow():
+        with stage("gemini"):
+            await asyncio.to_thread(busy_gemini_call)
+        return {"ok": True}
+
+    app.middleware("http")(api_server.profile_requests)
+    app.middleware("http")(api_server.record_request_metrics)
+    http = TestClient(app)
+
+    http.get("/slow")  # ヘッダーなしはプロファイルしない
+    assert list(profile_dir.glob("*.json")) == []
+
+    response = http.get("/slow", headers={"X-Profile": "secret", "X-Request-ID": "../req-1"})
+    assert response.status_code == 200
+    [saved] = profile_dir.glob("*.json")
+    assert saved.name.endswith("-___req-1.json")
+    assert saved.with_suffix(".folded").read_text(encoding="utf-8")
+
+    [profile] = api_server.get_profile_store().recent()
+    assert profile["request_id"] == "../req-1"
+    assert profile["path"] == "/slow"
+    assert profile["stages_ms"]["gemini"] >= 40
+    assert any(line["function"].startswith("busy_gemini_call") for line in profile["top"]["total"])
+
+
+def test_admin_endpoint_lists_recent_profiles(profile_dir):
+    profiler = SamplingProfiler()
+    profiler.samples, profiler.elapsed = 1, 0.01
+    for request_id in ("old", "new"):
+        profiling.get_profile_store().save({"request_id": request_id, "path": "/api/record_sale"}, profiler)
+        time.sleep(0.01)
+
+    http = TestClient(api_server.app)
+    assert http.get("/api/admin/profiles").status_code == 403
+    assert http.get("/api/admin/profiles", headers={"X-Profile": "wrong"}).status_code == 403
+    profiles = http.get("/api/admin/profiles", headers={"X-Profile": "secret"}).json()["profiles"]
+    assert [profile["request_id"] for profile in profiles] == ["new", "old"]
@@ -0,0 +1,125 @@
+import asyncio
+import json
+
+import gspread
+import httpx
+import pytest
+import requests
+
+import src.api_server as api_server
+from src import readiness as readiness_module
+from src.readiness import ReadinessMonitor, report_failure, report_success, upstream_status
+from tests.fakes import make_sheets_client
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def clean_statuses():
+    readiness_module.reset_statuses()
+    yield
+    readiness_module.reset_statuses()
+
+
+def test_not_ready_until_checked():
+    monitor = ReadinessMonitor({"sheets": lambda: None})
+    assert monitor.snapshot()["ready"] is False
+
+
+def test_refresh_skips_upstreams_with_recent_success():
+    clock = FakeClock()
+    calls = []
+    monitor = ReadinessMonitor({"sheets": lambda: calls.append("sheets")}, interval_seconds=60, clock=clock)
+
+    report_success("sheets", at=clock.now - 10)
+    monitor.refresh()
+    assert calls == []
+    assert monitor.is_ready()
+
+    clock.now += 60
+    monitor.refresh()
+    assert calls == ["sheets"]
+
+
+def test_failed_check_marks_not_ready():
+    clock = FakeClock()
+
+    def failing():
+        raise ConnectionError("quota exceeded")
+
+    monitor = ReadinessMonitor({"sheets": failing}, clock=clock)
+    monitor.refresh()
+    snapshot = monitor.snapshot()
+    assert snapshot["ready"] is False
+    assert snapshot["upstreams"]["sheets"]["last_error"] == "quota exceeded"
+
+
+def test_stale_success_is_not_ready():
+    clock = FakeClock()
+    monitor = ReadinessMonitor({"sheets": lambda: None}, interval_seconds=60, clock=clock)
+    report_success("sheets", at=clock.now)
+    clock.now += 181
+    assert not monitor.is_ready()
+
+
+def test_optional_upstream_does_not_block_readiness():
+    clock = FakeClock()
+    monitor = ReadinessMonitor({"sheets": lambda: None, "gemini": lambda: None}, clock=clock)
+    report_success("sheets", at=clock.now)
+    report_failure("gemini", "503", at=clock.now)
+    snapshot = monitor.snapshot()
+    assert snapshot["ready"] is True
+    assert snapshot["upstreams"]["gemini"]["ok"] is False
+
+
+def test_probes_make_no_api_calls(monkeypatch):
+    checks = []
+    monitor = ReadinessMonitor({"sheets": lambda: checks.append(1)}, interval_seconds=3600)
+    monitor.ensure_started = lambda: None
+    monkeypatch.setattr(api_server, "readiness", monitor)
+
+    async def probe():
+        transport = httpx.ASGITransport(app=api_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [await client.get(path) for path in ("/livez", "/readyz", "/readyz")]
+
+    live, not_ready, _ = asyncio.run(probe())
+    assert live.json() == {"status": "alive"}
+    assert not_ready.status_code == 503
+    assert checks == []
+
+    report_success("sheets")
+    _, _, ready = asyncio.run(probe())
+    assert ready.status_code == 200
+    assert ready.json()["upstreams"]["sheets"]["last_success"] is not None
+
+
+def _api_error(status: int) -> gspread.exceptions.APIError:
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps({"error": {"code": status, "message": "error", "status": "ERROR"}}).encode()
+    return gspread.exceptions.APIError(response)
+
+
+def test_only_outages_mark_sheets_not_ready():
+    """A 400 (bad range) is the request's fault: readiness stays ok, like the circuit breaker"""
+    client, _ = make_sheets_client()
+
+    def failing(error):
+        def call():
+            raise error
+        return call
+
+    with pytest.raises(gspread.exceptions.APIError):
+        client._call("values_get", failing(_api_error(400)))
+    assert upstream_status("sheets")["ok"] is True
+
+    with pytest.raises(gspread.exceptions.APIError):
+        client._call("values_get", failing(_api_error(503)))
+    assert upstream_status("sheets")["ok"] is False
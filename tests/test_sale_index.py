@@ -0,0 +1,95 @@
+"""
+Tests for sale index module and the /api/sales/{id} endpoints
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.api_server as api_server
+import src.sheets_service as sheets_service
+from src.sale_index import SaleIndex
+from tests.fakes import make_sheets_client
+
+pytestmark = pytest.mark.usefixtures("sale_ids")
+
+SALE = {"day": 28, "seller": "岩佐将平", "payment_method": "PayPal", "product_name": "月4回プラン",
+        "quantity": 1, "unit_price_excl_tax": 32000, "unit_price_incl_tax": 35200}
+
+
+def test_index_is_persisted_and_loaded_incrementally(tmp_path):
+    """Another process's index sees appended entries on a miss"""
+    path = str(tmp_path / "sale_index.jsonl")
+    writer = SaleIndex(path)
+    reader = SaleIndex(path)
+
+    writer.add(None, "12 月度", [5, 6], ["a1", "b2"])
+    assert reader.get("b2") == {"store": None, "sheet": "12 月度", "row": 6}
+
+    writer.move("a1", 7)
+    writer.remove("b2")
+    reloaded = SaleIndex(path)
+    assert reloaded.get("a1")["row"] == 7
+    assert reloaded.get("b2") is None
+    assert len(reloaded) == 1
+
+
+@pytest.fixture
+def recorded(monkeypatch, memory_sale_index):
+    """A sale recorded through the write queue -> (http, spreadsheet, sale_id, row)"""
+    client, spreadsheet = make_sheets_client(data_rows=3)
+    monkeypatch.setattr(sheets_service, "_sheets_client", client)
+    monkeypatch.setattr(sheets_service, "_sheet_mirror", None)
+    monkeypatch.setattr(sheets_service, "_write_queue", None)
+
+    http = TestClient(api_server.app)
+    result = http.post("/api/record_sale", json={k: v for k, v in SALE.items() if k != "unit_price_incl_tax"}).json()
+    assert memory_sale_index.get(result["sale_id"])["row"] == result["row"]
+    spreadsheet.calls.clear()
+    return http, spreadsheet, result["sale_id"], result["row"]
+
+
+def test_get_reads_only_the_indexed_row(recorded):
+    """GET reads one row range, not the whole sheet"""
+    http, spreadsheet, sale_id, row = recorded
+
+    body = http.get(f"/api/sales/{sale_id}").json()
+    assert body["row"] == row
+    assert body["sale"]["seller"] == "岩佐将平"
+    assert dict(spreadsheet.calls) == {"get": 1}
+
+
+def test_patch_is_one_read_and_one_targeted_update(recorded):
+    """PATCH recomputes the totals and writes only that row"""
+    http, spreadsheet, sale_id, row = recorded
+
+    body = http.patch(f"/api/sales/{sale_id}", json={"quantity": 2}).json()
+    assert body["sale"]["quantity"] == 2
+    assert body["sale"]["subtotal_excl_tax"] == 64000
+    assert dict(spreadsheet.calls) == {"get": 1, "update": 1}
+
+    sheet = spreadsheet.sheets[body["sheet_name"]]
+    assert sheet.rows[row - 1][2:11] == ["28", "岩佐将平", "PayPal", "月4回プラン", "2",
+                                         "32000", "64000", "70400", sale_id]
+
+
+def test_moved_row_is_found_by_id_column(recorded):
+    """Inserted rows shift the sale; the ID column finds it and the index is updated"""
+    http, spreadsheet, sale_id, row = recorded
+    sheet = spreadsheet.sheets[http.get(f"/api/sales/{sale_id}").json()["sheet_name"]]
+    sheet.rows.insert(4, [""] * len(sheet.rows[0]))  # 5行目に1行挿入
+    spreadsheet.calls.clear()
+
+    body = http.get(f"/api/sales/{sale_id}").json()
+    assert body["row"] == row + 1
+    assert dict(spreadsheet.calls) == {"get": 2, "col_values": 1}
+
+
+def test_delete_clears_the_row_and_forgets_the_id(recorded):
+    """DELETE blanks C〜K of the row; the ID is gone afterwards"""
+    http, spreadsheet, sale_id, row = recorded
+
+    response = http.delete(f"/api/sales/{sale_id}")
+    assert response.status_code == 200
+    sheet = spreadsheet.sheets[response.json()["sheet_name"]]
+    assert not any(sheet.rows[row - 1][2:11])
+    assert http.get(f"/api/sales/{sale_id}").status_code == 404
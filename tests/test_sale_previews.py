@@ -0,0 +1,90 @@
+"""
+Tests for sale preview module and the preview/commit API
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.api_server as api_server
+import src.sheets_service as sheets_service
+from src import sale_previews
+from src.gemini_client import GeminiClient
+from src.sale_previews import SalePreviews
+from tests.fakes import StubGeminiModel, make_sheets_client
+
+SALE = {"day": 28, "seller": "岩佐将平", "payment_method": "PayPal", "product_name": "月4回プラン",
+        "quantity": 1, "unit_price_incl_tax": 35200, "unit_price_excl_tax": 32000}
+
+
+def _values(filled_rows):
+    """C列が埋まっている行（5行目以降）を持つシートの値"""
+    values = [[""] * 10 for _ in range(4)]
+    for row in range(5, filled_rows + 5):
+        values.append(["", "", "28", "顧客"] + [""] * 6)
+    return values
+
+
+def test_previews_reserve_distinct_rows():
+    """Live previews of the same sheet get different tentative rows"""
+    previews = SalePreviews()
+    values = _values(3)
+
+    first = previews.create(None, SALE, "12 月度", values)
+    second = previews.create(None, SALE, "12 月度", values)
+    other_store = previews.create("shinjuku", SALE, "12 月度", values)
+
+    assert first["tentative_row"] == 8
+    assert second["tentative_row"] == 9
+    assert other_store["tentative_row"] == 8
+    assert first["token"] != second["token"]
+
+
+def test_preview_token_is_single_use_and_expires():
+    """take() returns an entry once; expired tokens are gone and free their row"""
+    now = [0.0]
+    previews = SalePreviews(ttl_seconds=60, clock=lambda: now[0])
+    token = previews.create(None, SALE, "12 月度", [])["token"]
+
+    entry = previews.take(token)
+    assert entry["sale"] == SALE
+    assert previews.take(token) is None
+
+    previews.restore(entry)
+    now[0] = 61
+    assert previews.take(token) is None
+    assert previews.create(None, SALE, "12 月度", [])["tentative_row"] == entry["tentative_row"]
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """API client backed by a fake spreadsheet and a stub Gemini model"""
+    client, spreadsheet = make_sheets_client(data_rows=10)
+    monkeypatch.setattr(sheets_service, "_sheets_client", client)
+    monkeypatch.setattr(sheets_service, "_sheet_mirror", None)
+    monkeypatch.setattr(sheets_service, "_write_queue", None)
+    monkeypatch.setattr(sale_previews, "_previews", None)
+
+    model = StubGeminiModel()
+    monkeypatch.setattr(api_server, "gemini_client",
+                        GeminiClient([model.model_name], lambda name, system_instruction=None: model))
+    return TestClient(api_server.app), model
+
+
+def test_commit_with_edits_does_not_parse_again(api):
+    """A corrected preview is written without a second Gemini call"""
+    http, model = api
+
+    preview = http.post("/api/preview", json={"text": "12/28 PayPalで月4回プラン 35,200円"}).json()
+    assert preview["parsed_data"]["unit_price_excl_tax"] == 32000
+    assert preview["tentative_row"] == 15
+
+    response = http.post(f"/api/commit/{preview['token']}", json={"unit_price_incl_tax": 33000})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["success"]
+    assert body["row"] == 15
+    assert body["parsed_data"]["unit_price_excl_tax"] == 30000
+    assert model.calls == 1
+
+    # トークンは1回限り
+    assert http.post(f"/api/commit/{preview['token']}").status_code == 404
@@ -0,0 +1,181 @@
+"""
+Tests for the sales ledger and replaying it into month sheets
+"""
+
+import multiprocessing
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.api_server as api_server
+import src.sheets_service as sheets_service
+from src.config import Config
+from src.google_sheets import GoogleSheetsClient, month_sheet_name
+from src.replay import Replay
+from src.sale_index import get_sale_index
+from src.sales_ledger import SalesLedger, get_sales_ledger
+from tests.fakes import FakeGspreadClient, make_sheets_client, make_spreadsheet
+
+pytestmark = pytest.mark.usefixtures("sale_ids")
+
+SALE = {"day": 28, "seller": "岩佐将平", "payment_method": "PayPal", "product_name": "月4回プラン",
+        "quantity": 1, "unit_price_excl_tax": 32000, "unit_price_incl_tax": 35200}
+
+
+def test_ledger_is_persisted_and_reloaded(tmp_path):
+    """Events survive a restart; a half-written last line is left for the next read"""
+    path = tmp_path / "sales_ledger.jsonl"
+    ledger = SalesLedger(str(path))
+    ledger.record(None, None, 12, [{**SALE, "sale_id": "a1"}, {**SALE, "sale_id": "b2"}, {**SALE, "sale_id": "c3"}])
+    ledger.record(None, None, 12, [{**SALE, "sale_id": "a1", "seller": "重複"}])  # 記録済みのIDは追加しない
+    ledger.written("12 月度", [5, 6], ["a1", "b2"])
+    ledger.edited("b2", {**SALE, "quantity": 2})
+    ledger.voided("a1")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"event": "voided", "id": "b2"')  # 書き込み途中の行
+
+    reloaded = SalesLedger(str(path))
+    entries = reloaded.entries(None, None, 12)
+    assert [(entry["sale_id"], entry["row"]) for entry in entries] == [("b2", 6), ("c3", None)]
+    assert entries[0]["sale"]["quantity"] == 2
+    assert reloaded.get("a1")["sale"]["seller"] == "岩佐将平"
+    assert reloaded.get("a1")["voided"]
+    assert [entry["sale_id"] for entry in reloaded.unwritten()] == ["c3"]
+
+
+def record_from_worker(path, worker, count):
+    ledger = SalesLedger(path)
+    for n in range(count):
+        ledger.record(None, None, 12, [{**SALE, "sale_id": f"w{worker}-{n}"}])
+    ledger.written("12 月度", [5], [f"w{worker}-0"])
+    return len(ledger.entries(None, None, 12))
+
+
+def test_workers_appending_at_once_see_every_event(tmp_path):
+    """Loading the other writers' lines and appending happen under one file lock"""
+    path = str(tmp_path / "sales_ledger.jsonl")
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        seen = pool.starmap(record_from_worker, [(path, worker, 25) for worker in range(4)])
+
+    reloaded = SalesLedger(path)
+    assert len(reloaded.entries(None, None, 12)) == 100
+    assert sum(1 for entry in reloaded.entries(None, None, 12) if entry["row"] == 5) == 4
+    assert all(count >= 25 for count in seen)
+    # 最後に書いたワーカーは他のワーカーの分を1行も読み飛ばしていない
+    assert max(seen) == 100
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """API client backed by a fake spreadsheet -> (http, client, spreadsheet)"""
+    client, spreadsheet = make_sheets_client(data_rows=3)
+    monkeypatch.setattr(sheets_service, "_sheets_client", client)
+    monkeypatch.setattr(sheets_service, "_sheet_mirror", None)
+    monkeypatch.setattr(sheets_service, "_write_queue", None)
+    return TestClient(api_server.app), client, spreadsheet
+
+
+def test_sale_is_recorded_before_the_sheets_write(api, monkeypatch):
+    """A failed write is still in the ledger (marked failed); queries need no Sheets call"""
+    http, client, spreadsheet = api
+    month = datetime.now().month
+    written = http.post("/api/record_sale", json=SALE).json()
+
+    def broken(sales, month=None):
+        assert get_sales_ledger().get(sales[0]["sale_id"]) is not None  # 書き込む前に記録済み
+        raise RuntimeError("timeout")
+
+    monkeypatch.setattr(client, "record_sales", broken)
+    assert http.post("/api/record_sale", json={**SALE, "seller": "田中"}).status_code == 500
+
+    entries = get_sales_ledger().entries(None, None, month)
+    assert [(entry["sale_id"] == written["sale_id"], entry["failed"]) for entry in entries] == [
+        (True, False), (False, True)
+    ]
+    assert entries[0]["row"] == written["row"]
+
+    spreadsheet.calls.clear()
+    listing = http.get("/api/ledger/sales").json()
+    assert spreadsheet.api_calls == 0
+    assert (listing["count"], listing["subtotal_incl_tax"], listing["unwritten"]) == (1, 35200, 0)
+
+
+def test_resync_repairs_the_sheet_with_batched_writes(api):
+    """Damaged and voided rows are fixed in one batch_update; lost sales are appended in one write"""
+    http, client, spreadsheet = api
+    month = datetime.now().month
+    sheet = spreadsheet.sheets[month_sheet_name(month)]
+    sales = [http.post("/api/record_sale", json={**SALE, "day": day}).json() for day in (1, 2, 3)]
+    voided_row = list(sheet.rows[sales[2]["row"] - 1])
+    http.delete(f"/api/sales/{sales[2]['sale_id']}")
+
+    sheet.rows[sales[0]["row"] - 1][3] = "壊れた名前"  # 手作業で上書きされた
+    sheet.rows[sales[2]["row"] - 1] = voided_row  # 取り消したのに元に戻された
+    get_sales_ledger().record(None, None, month, [{**SALE, "day": 4, "sale_id": "lost1"},
+                                                  {**SALE, "day": 5, "sale_id": "lost2"}])  # 書き込み前に落ちた
+    manual_row = list(sheet.rows[4])
+
+    spreadsheet.calls.clear()
+    stats = Replay(client).resync(month)
+    assert (stats["corrected"], stats["voided"], stats["written"], stats["unchanged"]) == (1, 1, 2, 1)
+    # 突き合わせの読み取り1回・書き直し1回 + 書き込めていなかった2件の record_sales 1回（scan方式: 空行検索と書き込み）
+    assert spreadsheet.calls["batch_update"] == 2
+    assert spreadsheet.calls["get_all_values"] == 2
+
+    assert sheet.rows[sales[0]["row"] - 1][3] == "岩佐将平"
+    assert sheet.rows[4] == manual_row  # 売上IDのない行には触れない
+    assert get_sales_ledger().unwritten() == []
+    listing = http.get("/api/ledger/sales").json()
+    assert listing["count"] == 4
+
+
+def test_rebuild_rewrites_the_month_from_the_ledger(api):
+    """Rows not in the ledger are cleared and ledger sales are written from row 5 in one batch"""
+    http, client, spreadsheet = api
+    month = datetime.now().month
+    sheet = spreadsheet.sheets[month_sheet_name(month)]
+    sales = [http.post("/api/record_sale", json={**SALE, "day": day}).json() for day in (1, 2)]
+    assert sales[0]["row"] == 8  # テスト用の3行の下
+
+    spreadsheet.calls.clear()
+    stats = Replay(client).rebuild(month)
+    assert (stats["written"], stats["cleared"]) == (2, 3)
+    assert spreadsheet.api_calls == 2  # 読み取り1回・書き直し1回
+    assert [row[2] for row in sheet.rows[4:9]] == ["1", "2", "", "", ""]
+    assert [row[12] for row in sheet.rows[4:7]] != ["", "", ""]  # M列（トレーナー名簿）は残す
+
+    moved = http.get(f"/api/sales/{sales[1]['sale_id']}").json()
+    assert moved["row"] == 6
+
+
+def test_replay_ignores_last_years_sales_of_the_same_month():
+    """Each year has its own spreadsheet; last year's month-N sales are not replayed into this year's sheet"""
+    month = datetime.now().month
+    ledger = get_sales_ledger()
+    ledger.record(None, "sheet-last-year", month, [{**SALE, "sale_id": "lastyear"}])
+    ledger.written(month_sheet_name(month), [5], ["lastyear"])
+
+    spreadsheet = make_spreadsheet()
+    client = GoogleSheetsClient(gspread_client=FakeGspreadClient(spreadsheet), spreadsheet_id="sheet-this-year")
+    assert Replay(client).resync(month)["written"] == 0
+    assert Replay(client).rebuild(month)["written"] == 0
+    assert not any(row[2] for row in spreadsheet.sheets[month_sheet_name(month)].rows[4:])
+    assert ledger.entries(None, "sheet-this-year", month) == []
+    assert [entry["sale_id"] for entry in ledger.entries(None, "sheet-last-year", month)] == ["lastyear"]
+
+
+def test_rebuild_without_sale_ids_writes_only_c_to_j(monkeypatch):
+    """With SALE_IDS off, column K belongs to the template: rebuild neither writes nor clears it"""
+    monkeypatch.setattr(Config, "SALE_IDS", False)
+    month = datetime.now().month
+    get_sales_ledger().record(None, None, month, [{**SALE, "trainer": "山田", "sale_id": "s1"}])
+    client, spreadsheet = make_sheets_client(data_rows=2)
+    sheet = spreadsheet.sheets[month_sheet_name(month)]
+    for line in sheet.rows[4:6]:
+        line[10] = "テンプレートの値"
+
+    assert Replay(client).rebuild(month)["written"] == 1
+    assert [line[10] for line in sheet.rows[4:6]] == ["テンプレートの値", "テンプレートの値"]
+    assert sheet.rows[4][2:4] == ["28", "岩佐将平"] and sheet.rows[5][2] == ""
+    assert get_sale_index().get("s1") is None
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import src.sheets_service as sheets_service
+from src.row_lock import get_row_lock
+from src.sheet_provisioning import SheetProvisioner, months_to_provision, provision_store
+from tests.fakes import FakeGspreadClient, make_spreadsheet
+
+
+def test_next_month_is_provisioned_within_lead_days():
+    assert months_to_provision(datetime(2025, 1, 20), lead_days=7) == [1]
+    assert months_to_provision(datetime(2025, 1, 25), lead_days=7) == [1, 2]
+    assert months_to_provision(datetime(2025, 12, 31), lead_days=7) == [12, 1]
+
+
+def test_run_once_provisions_every_store_and_skips_failures():
+    calls = []
+
+    def provision(store_id, months):
+        calls.append((store_id, months))
+        if store_id == "broken":
+            raise RuntimeError("template missing")
+        return [f"{month} 月度" for month in months[1:]]
+
+    provisioner = SheetProvisioner(
+        provision=provision,
+        store_ids=lambda: ["default", "broken", "shinjuku"],
+        lead_days=7,
+        clock=lambda: datetime(2025, 3, 28)
+    )
+
+    assert provisioner.run_once() == {"default": ["4 月度"], "shinjuku": ["4 月度"]}
+    assert [store_id for store_id, _ in calls] == ["default", "broken", "shinjuku"]
+
+
+def test_provision_store_creates_next_month_from_template():
+    from src.google_sheets import GoogleSheetsClient
+
+    spreadsheet = make_spreadsheet(month=3)
+    client = GoogleSheetsClient(gspread_client=FakeGspreadClient(spreadsheet))
+
+    assert provision_store(None, [3, 4], client=client) == ["4 月度"]
+    assert spreadsheet.sheets["4 月度"].rows[3] == spreadsheet.sheets["テンプレート"].rows[3]
+
+
+def test_provisioner_and_write_queue_share_the_default_store_lock(monkeypatch):
+    """Sheets created for the concrete default id are made under the write queue's row lock"""
+    monkeypatch.setattr(sheets_service, "_write_queue", None)
+    monkeypatch.setattr(sheets_service, "_sheet_mirror", None)
+    monkeypatch.setattr(sheets_service, "_trainer_roster", None)
+    queue = sheets_service.get_write_queue("default")
+    queue_lock = queue.row_lock or get_row_lock()
+    held = []
+
+    class Client:
+        def provision_month_sheets(self, months):
+            held.append(queue_lock._thread_lock.locked())
+            return []
+
+    provision_store("default", [3], client=Client())
+    assert held == [True]
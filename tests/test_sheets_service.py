@@ -0,0 +1,79 @@
+"""
+Tests for sheets_service and sheet_mirror modules
+"""
+
+import asyncio
+
+from src.sheet_mirror import SheetMirror, summarize_month
+from src.sheets_service import SaleWriteQueue
+
+
+def _sale(day, price=1000):
+    return {
+        "day": day,
+        "seller": "岩佐将平",
+        "payment_method": "現金",
+        "product_name": "プロテイン",
+        "quantity": 1,
+        "unit_price_excl_tax": price
+    }
+
+
+class FakeClient:
+    """Records record_sales calls instead of talking to Google"""
+
+    def __init__(self):
+        self.calls = []
+        self.next_row = 5
+        self.values = [[""] * 10 for _ in range(4)]
+
+    def record_sales(self, sales, month=None):
+        self.calls.append(len(sales))
+        rows = list(range(self.next_row, self.next_row + len(sales)))
+        self.next_row += len(sales)
+        return {"success": True, "rows": rows, "message": "ok", "sheet_name": "1 月度"}
+
+    def get_month_values(self, month):
+        return self.values
+
+
+def test_write_queue_coalesces_concurrent_sales():
+    """Sales submitted at the same time are written with one call"""
+    client = FakeClient()
+    queue = SaleWriteQueue(lambda: client)
+
+    async def run():
+        return await asyncio.gather(*(queue.submit(_sale(day)) for day in range(1, 6)))
+
+    results = asyncio.run(run())
+
+    assert [result["row"] for result in results] == [5, 6, 7, 8, 9]
+    assert client.calls == [5]
+
+
+def test_write_queue_patches_mirror():
+    """Written rows show up in the mirror without another read"""
+    client = FakeClient()
+    mirror = SheetMirror(lambda: client)
+    queue = SaleWriteQueue(lambda: client, mirror=mirror)
+
+    assert summarize_month(mirror.get_month_values(1))["count"] == 0
+    asyncio.run(queue.submit_many([_sale(1, 1000), _sale(2, 2000)]))
+
+    summary = summarize_month(mirror.get_month_values(1))
+    assert summary["count"] == 2
+    assert summary["total_excl_tax"] == 3000
+    assert summary["by_product"] == {"プロテイン": 3300}
+
+
+def test_summarize_month_parses_formatted_numbers():
+    """Formatted cell values like '32,000' are summed"""
+    values = [[""] * 10 for _ in range(4)] + [
+        ["1", "", "28", "岩佐将平", "PayPal", "月4回プラン", "1", "32,000", "32,000", "35,200"],
+        ["2", "", "", "", "", "", "", "", "", ""],
+    ]
+
+    summary = summarize_month(values)
+    assert summary["count"] == 1
+    assert summary["total_incl_tax"] == 35200
+    assert summary["by_payment_method"] == {"PayPal": 35200}
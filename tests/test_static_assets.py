@@ -0,0 +1,52 @@
+"""
+Tests for static_assets and schema modules
+"""
+
+import gzip
+import json
+from pathlib import Path
+
+from src.schema import SALE_FUNCTION_SCHEMA, dump_schema
+from src.static_assets import StaticAsset, build_frontend_assets
+
+
+def test_schema_file_matches_source():
+    """gemini_function_schema.json must be generated from src/schema.py"""
+    path = Path(__file__).parent.parent / "gemini_function_schema.json"
+    assert path.read_text(encoding="utf-8").strip() == dump_schema(SALE_FUNCTION_SCHEMA)
+
+
+def test_static_asset_etag_and_not_modified():
+    """Matching If-None-Match returns 304 without body"""
+    asset = StaticAsset.from_text("<html>" + "x" * 1000 + "</html>", "text/html")
+
+    status, body, headers = asset.render(None, None)
+    assert status == 200
+    assert headers["ETag"] == asset.etag
+
+    status, body, headers = asset.render("gzip", asset.etag)
+    assert status == 304
+    assert body == b""
+
+
+def test_static_asset_gzip_negotiation():
+    """gzip variant is chosen when accepted and decompresses to the original"""
+    text = "売上記帳" * 500
+    asset = StaticAsset.from_text(text, "text/html")
+
+    status, body, headers = asset.render("gzip, deflate", None)
+    assert headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(body).decode("utf-8") == text
+
+    status, body, headers = asset.render("gzip;q=0", None)
+    assert "Content-Encoding" not in headers
+    assert body.decode("utf-8") == text
+
+
+def test_build_frontend_assets():
+    """Schema asset is pre-encoded JSON and service worker is versioned"""
+    assets = build_frontend_assets(SALE_FUNCTION_SCHEMA)
+
+    assert json.loads(assets["/api/schema"].variants["identity"]) == SALE_FUNCTION_SCHEMA
+    assert b"__ASSET_VERSION__" not in assets["/sw.js"].variants["identity"]
+    assert b"serviceWorker" in assets["/"].variants["identity"]
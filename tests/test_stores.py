@@ -0,0 +1,136 @@
+"""
+Tests for stores module and the per-store pool in sheets_service
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from src.schema import KNOWN_CUSTOMERS
+from src.sheets_service import StorePool
+from src.stores import StoreConfig, StoreRegistry, UnknownStoreError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeServices:
+    def __init__(self, store):
+        self.store = store
+        self.is_idle = True
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _write_stores(tmp_path, stores):
+    path = tmp_path / "stores.json"
+    path.write_text(json.dumps({"stores": stores}, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def test_registry_without_file_is_single_default_store():
+    registry = StoreRegistry.load(None, default_store_id="default")
+    store = registry.get()
+    assert store.store_id == "default"
+    assert store.customers == KNOWN_CUSTOMERS
+    assert registry.is_default(None) and registry.is_default("default")
+
+
+def test_registry_loads_stores_from_file(tmp_path):
+    path = _write_stores(tmp_path, [
+        {"id": "yotsuya", "spreadsheet_id": "sheet-a", "customers": ["岩佐将平"]},
+        {"id": "shinjuku", "spreadsheet_id": "sheet-b", "tax_rate": 0.08},
+    ])
+    registry = StoreRegistry.load(path, default_store_id="yotsuya")
+
+    assert registry.get().spreadsheet_id == "sheet-a"
+    assert registry.get("shinjuku").tax_rate == 0.08
+    assert set(registry.stores) == {"yotsuya", "shinjuku"}
+    with pytest.raises(UnknownStoreError):
+        registry.get("ikebukuro")
+
+
+def test_catalog_tax_rate_overrides_store_rate():
+    store = StoreConfig("s", "sheet", catalog=[{"name": "プロテイン", "tax_rate": 0.08}])
+    assert store.price_excl_tax("プロテイン", 3240) == 3000
+    assert store.price_excl_tax("月4回プラン", 35200) == 32000
+
+
+def test_store_pool_reuses_and_evicts_least_recently_used():
+    pool = StorePool(factory=FakeServices, max_active=2, idle_seconds=3600, clock=FakeClock())
+    a, b, c = (StoreConfig(store_id, f"sheet-{store_id}") for store_id in "abc")
+
+    services_a = pool.get(a)
+    assert pool.get(a) is services_a
+    pool.get(b)
+    pool.get(a)  # a を最近使ったことにする
+    pool.get(c)
+
+    assert "b" not in pool and "a" in pool and "c" in pool
+    assert len(pool) == 2
+
+
+def test_store_pool_keeps_busy_stores_and_drops_idle_ones():
+    clock = FakeClock()
+    pool = StorePool(factory=FakeServices, max_active=8, idle_seconds=60, clock=clock)
+    busy = pool.get(StoreConfig("busy", "sheet-1"))
+    idle = pool.get(StoreConfig("idle", "sheet-2"))
+    busy.is_idle = False
+
+    clock.now = 120
+    pool.get(StoreConfig("other", "sheet-3"))
+
+    assert "busy" in pool
+    assert "idle" not in pool and idle.closed
+
+
+def test_store_write_queues_do_not_wait_for_each_other():
+    """店舗ごとのキューは独立して書き込む（遅い店舗が他店舗を待たせない）"""
+    from src.sheets_service import SaleWriteQueue
+    from src.row_lock import RowAllocationLock
+
+    class SlowClient:
+        def __init__(self, delay):
+            self.delay = delay
+
+        def record_sales(self, sales, month=None):
+            import time
+            time.sleep(self.delay)
+            return {"success": True, "rows": [5] * len(sales), "message": "ok", "sheet_name": "1 月度"}
+
+    slow = SaleWriteQueue(lambda: SlowClient(0.3), row_lock=RowAllocationLock())
+    fast = SaleWriteQueue(lambda: SlowClient(0.0), row_lock=RowAllocationLock())
+    sale = {"day": 1, "seller": "岩佐将平", "payment_method": "現金", "product_name": "プロテイン",
+            "quantity": 1, "unit_price_excl_tax": 1000}
+
+    async def run():
+        slow_task = asyncio.ensure_future(slow.submit(sale))
+        await asyncio.sleep(0.01)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await fast.submit(sale)
+        elapsed = loop.time() - start
+        await slow_task
+        return elapsed
+
+    assert asyncio.run(run()) < 0.2
+
+
+def test_unknown_store_is_404():
+    import httpx
+    import src.api_server as api_server
+
+    async def request():
+        transport = httpx.ASGITransport(app=api_server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/api/schema", params={"store": "no-such-store"})
+
+    assert asyncio.run(request()).status_code == 404
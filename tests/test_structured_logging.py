@@ -0,0 +1,140 @@
+"""
+Tests for structured logging module
+"""
+
+import io
+import json
+import logging
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import src.api_server as api_server
+
+from src import structured_logging
+from src.config import Config
+from src.metrics import stage
+from src.structured_logging import (
+    JsonFormatter, annotate, configure_logging, log_payload, redact, request_scope, stop_logging
+)
+
+
+def test_json_formatter_includes_extra_fields():
+    """Extra fields are emitted as top-level JSON keys"""
+    record = logging.LogRecord("limit", logging.INFO, __file__, 1, "request", (), None)
+    record.status = 200
+    record.stages_ms = {"write": 12.5}
+
+    data = json.loads(JsonFormatter().format(record))
+    assert data["message"] == "request"
+    assert data["level"] == "INFO"
+    assert data["status"] == 200
+    assert data["stages_ms"] == {"write": 12.5}
+
+
+def test_request_scope_collects_stages_and_fields():
+    """stage() timings and annotate() fields accumulate in the current request"""
+    with request_scope("abc") as context:
+        with stage("tax"):
+            pass
+        with stage("tax"):
+            pass
+        annotate(gemini_model="gemini-2.5-flash")
+
+    data = context.as_dict()
+    assert data["request_id"] == "abc"
+    assert set(data["stages_ms"]) == {"tax"}
+    assert data["gemini_model"] == "gemini-2.5-flash"
+
+    # リクエスト外では何もしない
+    annotate(ignored=True)
+    with stage("tax"):
+        pass
+
+
+def test_redact_masks_personal_fields(monkeypatch):
+    """Customer names, user IDs and message text are masked recursively"""
+    monkeypatch.setattr(Config, "LOG_REDACT", True)
+    value = redact({"seller": "服部誉也", "items": [{"text": "12/28 PayPal 35,200円"}], "quantity": 2,
+                    "text": ["岩佐将平 様 記帳しました"], "response": '{"seller": "岩佐将平"}'})
+
+    assert value["seller"] == "服***（4文字）"
+    assert "PayPal" not in value["items"][0]["text"]
+    assert value["quantity"] == 2
+    assert "岩佐" not in value["text"][0]  # LINEへの送信本文（リスト）
+    assert "岩佐" not in value["response"]  # Geminiの応答本文
+
+
+def test_log_payload_is_sampled(monkeypatch, caplog):
+    """Payload logs are skipped at rate 0 and emitted (redacted) at rate 1"""
+    caplog.set_level(logging.INFO, logger="limit.payload")
+    monkeypatch.setattr(Config, "LOG_REDACT", True)
+
+    monkeypatch.setattr(Config, "LOG_PAYLOAD_SAMPLE_RATE", 0.0)
+    log_payload("[入力]", {"seller": "服部誉也"})
+    assert not caplog.records
+
+    monkeypatch.setattr(Config, "LOG_PAYLOAD_SAMPLE_RATE", 1.0)
+    with request_scope("req-1"):
+        log_payload("[入力]", {"seller": "服部誉也"})
+    record = caplog.records[-1]
+    assert record.request_id == "req-1"
+    assert record.payload == {"seller": "服***（4文字）"}
+
+
+def test_configure_logging_writes_through_queue(monkeypatch):
+    """Records are formatted and written by the QueueListener thread"""
+    root = logging.getLogger()
+    monkeypatch.setattr(root, "handlers", [])
+    monkeypatch.setattr(root, "level", root.level)
+    stream = io.StringIO()
+
+    configure_logging(level="INFO", log_format="json", stream=stream)
+    try:
+        assert isinstance(root.handlers[0], logging.handlers.QueueHandler)
+        logging.getLogger("limit.test").info("hello", extra={"status": 201})
+    finally:
+        stop_logging()
+
+    data = json.loads(stream.getvalue().strip())
+    assert data["message"] == "hello"
+    assert data["status"] == 201
+    assert structured_logging._listener is None
+
+
+def test_request_log_has_request_id_and_timing(caplog):
+    """The API emits one request record and echoes X-Request-ID"""
+    from src import api_server
+
+    caplog.set_level(logging.INFO, logger="src.api_server")
+    response = TestClient(api_server.app).get("/livez", headers={"X-Request-ID": "trace-42"})
+
+    assert response.headers["X-Request-ID"] == "trace-42"
+    records = [record for record in caplog.records if record.getMessage() == "request"]
+    assert len(records) == 1
+    assert records[0].request_id == "trace-42"
+    assert records[0].path == "/livez"
+    assert records[0].status == 200
+    assert records[0].duration_ms >= 0
+
+
+@pytest.mark.parametrize("response", [
+    SimpleNamespace(text="岩佐将平 様 35,200円 の売上です"),  # JSONではない
+    SimpleNamespace(candidates=["岩佐将平 様 35,200円"]),  # text がない
+])
+def test_unparsable_gemini_response_is_logged_redacted(monkeypatch, caplog, response):
+    """The error path does not dump the raw answer (it holds the customer name) unmasked"""
+    caplog.set_level(logging.INFO)
+    monkeypatch.setattr(Config, "LOG_REDACT", True)
+    monkeypatch.setattr(Config, "LOG_PAYLOAD_SAMPLE_RATE", 1.0)
+    client = SimpleNamespace(generate_content=lambda *args, **kwargs: (response, "stub-model"))
+    monkeypatch.setattr(api_server, "get_gemini_client", lambda: client)
+
+    with pytest.raises(HTTPException):
+        api_server.build_sale_from_text("月4回プラン 35,200円 顧客: 岩佐将平")
+
+    assert any(getattr(record, "payload", None) for record in caplog.records)
+    for record in caplog.records:
+        assert "岩佐将平" not in record.getMessage() + repr(getattr(record, "payload", ""))
@@ -0,0 +1,60 @@
+from datetime import datetime
+
+import pytest
+
+from src.sale_prompt import build_sale_instruction
+from src.text_parser import normalize_message, parse_sale_text_regex
+
+
+def test_parses_standard_message():
+    result = parse_sale_text_regex("12/28 PayPalで月4回プラン 35,200円 販売しました。顧客: 服部誉也")
+
+    assert result == {
+        "day": 28,
+        "seller": "服部誉也",
+        "payment_method": "PayPal",
+        "product_name": "月4回プラン",
+        "quantity": 1,
+        "unit_price_incl_tax": 35200
+    }
+
+
+def test_uses_catalog_and_known_customers():
+    result = parse_sale_text_regex(
+        "岩佐将平さん 現金 プロテイン×2 合計 6,480円",
+        customers=["岩佐将平"],
+        products=["プロテイン"],
+        today=datetime(2025, 1, 15)
+    )
+
+    assert result["day"] == 15
+    assert result["seller"] == "岩佐将平"
+    assert result["payment_method"] == "現金"
+    assert result["product_name"] == "プロテイン"
+    assert result["quantity"] == 2
+    assert result["unit_price_incl_tax"] == 3240
+
+
+@pytest.mark.parametrize("text", [
+    "12/28 PayPalで月4回プラン 販売しました。顧客: 服部誉也",  # 金額なし
+    "12/28 月4回プラン 35,200円 顧客: 服部誉也",  # 決済方法なし
+    "12/28 PayPalで月4回プラン 35,200円",  # 顧客名なし
+])
+def test_missing_field_raises(text):
+    with pytest.raises(ValueError):
+        parse_sale_text_regex(text, customers=[])
+
+
+def test_normalize_message_folds_width_and_whitespace():
+    assert normalize_message("１２／２８　ＰａｙＰａｌで\n月４回プラン  ３５，２００円") == "12/28 PayPalで 月4回プラン 35,200円"
+
+
+def test_sale_instruction_is_stable_per_store():
+    catalog = {"プロテイン": {"name": "プロテイン", "unit_price_incl_tax": 3240}, "月4回プラン": {"name": "月4回プラン"}}
+
+    first = build_sale_instruction(["岩佐将平"], catalog)
+    second = build_sale_instruction(["岩佐将平"], dict(reversed(list(catalog.items()))))
+
+    assert first == second
+    assert "- プロテイン（税込3,240円）" in first
+    assert "岩佐将平" in first
@@ -0,0 +1,121 @@
+"""
+Tests for trainer roster, trainer index and the trainer report endpoint
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.api_server as api_server
+import src.sheets_service as sheets_service
+from src.text_parser import parse_sale_text_regex
+from src.trainers import TrainerIndex, TrainerRoster, UnknownTrainerError, get_trainer_index
+from tests.fakes import TRAINERS, make_sheets_client
+
+pytestmark = pytest.mark.usefixtures("sale_ids")
+
+SALE = {"day": 28, "seller": "岩佐将平", "payment_method": "PayPal", "product_name": "月4回プラン",
+        "quantity": 1, "unit_price_excl_tax": 32000}
+
+
+def test_roster_is_cached_and_changes_are_detected():
+    """Column M is read once per TTL; a changed roster bumps the version"""
+    client, spreadsheet = make_sheets_client(data_rows=3)
+    now = [0.0]
+    roster = TrainerRoster(lambda: client, ttl_seconds=600, clock=lambda: now[0])
+
+    assert roster.names() == TRAINERS
+    assert roster.resolve("服部") == "服部誉也"  # 名字だけでも1人に決まれば可
+    assert roster.resolve("田中 一郎") == "田中一郎"
+    with pytest.raises(UnknownTrainerError):
+        roster.resolve("山田")
+    assert spreadsheet.calls["col_values"] == 1
+
+    client.get_current_month_sheet().rows[6][12] = "山田太郎"  # 佐藤花子 -> 山田太郎
+    now[0] = 601
+    assert roster.resolve("山田") == "山田太郎"
+    assert roster.version == 1
+    assert spreadsheet.calls["col_values"] == 2
+
+
+def test_index_is_persisted_and_replaced_by_sale_id(tmp_path):
+    """Edits replace a sale's attribution, voids subtract it, and a new process sees the same totals"""
+    path = str(tmp_path / "trainer_index.jsonl")
+    index = TrainerIndex(path)
+    index.record(None, None, "12 月度", [
+        {"sale_id": "a1", "trainer": "服部誉也", "subtotal_excl_tax": 32000, "subtotal_incl_tax": 35200},
+        {"sale_id": "b2", "trainer": "服部誉也", "subtotal_excl_tax": 3000, "subtotal_incl_tax": 3240},
+        {"sale_id": "c3", "trainer": None, "subtotal_excl_tax": 1000, "subtotal_incl_tax": 1100},
+    ])
+    index.record(None, None, "12 月度", [
+        {"sale_id": "b2", "trainer": "田中一郎", "subtotal_excl_tax": 3000, "subtotal_incl_tax": 3240}
+    ])
+    index.remove("c3")
+
+    report = TrainerIndex(path).report(None, None, "12 月度")
+    assert report["trainers"] == [
+        {"trainer": "服部誉也", "count": 1, "subtotal_excl_tax": 32000, "subtotal_incl_tax": 35200},
+        {"trainer": "田中一郎", "count": 1, "subtotal_excl_tax": 3000, "subtotal_incl_tax": 3240},
+    ]
+    assert report["unassigned"]["count"] == 0
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """API client backed by a fake spreadsheet -> (http, spreadsheet)"""
+    client, spreadsheet = make_sheets_client(data_rows=3)
+    monkeypatch.setattr(sheets_service, "_sheets_client", client)
+    monkeypatch.setattr(sheets_service, "_sheet_mirror", None)
+    monkeypatch.setattr(sheets_service, "_write_queue", None)
+    return TestClient(api_server.app), spreadsheet
+
+
+def test_sale_is_credited_to_a_roster_trainer(api):
+    """The trainer goes to column L and into the report; the roster is not re-read per sale"""
+    http, spreadsheet = api
+
+    first = http.post("/api/record_sale", json={**SALE, "trainer": "服部"}).json()
+    second = http.post("/api/record_sale", json={**SALE, "trainer": "服部誉也"}).json()
+    sheet = spreadsheet.sheets[first["sheet_name"]]
+    assert sheet.rows[first["row"] - 1][11] == "服部誉也"
+    assert spreadsheet.calls["col_values"] == 1
+    assert second["success"]
+
+    spreadsheet.calls.clear()
+    report = http.get("/api/trainers/report", params={"rate": 0.1}).json()
+    assert spreadsheet.api_calls == 0
+    assert report["trainers"] == [{"trainer": "服部誉也", "count": 2, "subtotal_excl_tax": 64000,
+                                   "subtotal_incl_tax": 70400, "commission": 6400}]
+
+    http.patch(f"/api/sales/{second['sale_id']}", json={"trainer": "佐藤花子"})
+    http.delete(f"/api/sales/{first['sale_id']}")
+    trainers = http.get("/api/trainers/report").json()["trainers"]
+    assert [(line["trainer"], line["count"]) for line in trainers] == [("佐藤花子", 1)]
+    assert sheet.rows[first["row"] - 1][11] == ""
+
+
+def test_report_leaves_out_last_years_spreadsheet(api):
+    """The same month of last year's spreadsheet is not added to this year's commission"""
+    http, _ = api
+    sheet_name = http.post("/api/record_sale", json={**SALE, "trainer": "服部"}).json()["sheet_name"]
+    get_trainer_index().record(None, "sheet-last-year", sheet_name, [
+        {"sale_id": "lastyear", "trainer": "服部誉也", "subtotal_excl_tax": 99000, "subtotal_incl_tax": 108900}
+    ])
+
+    report = http.get("/api/trainers/report").json()
+    assert [(line["trainer"], line["count"], line["subtotal_excl_tax"]) for line in report["trainers"]] == [
+        ("服部誉也", 1, 32000)
+    ]
+
+
+def test_unknown_trainer_is_rejected(api):
+    """An explicit trainer that is not on the roster is a 400, not a mis-credited sale"""
+    http, spreadsheet = api
+    response = http.post("/api/record_sale", json={**SALE, "trainer": "山田"})
+    assert response.status_code == 400
+    assert "update" not in spreadsheet.calls
+
+
+def test_regex_parser_reads_the_trainer():
+    result = parse_sale_text_regex("12/28 PayPalで月4回プラン 35,200円 顧客: 岩佐将平 担当: 服部", customers=[])
+    assert result["seller"] == "岩佐将平"
+    assert result["trainer"] == "服部"
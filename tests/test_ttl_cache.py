@@ -0,0 +1,41 @@
+"""
+Tests for ttl_cache module
+"""
+
+from src.ttl_cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_expires():
+    """Entries disappear after their TTL"""
+    clock = FakeClock()
+    cache = TTLCache(max_items=10, ttl_seconds=5, clock=clock)
+
+    cache.set("a", 1)
+    assert cache.get("a") == 1
+
+    clock.now = 6
+    assert cache.get("a") is None
+    assert "a" not in cache
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    """The least recently used entry is evicted when full"""
+    cache = TTLCache(max_items=2, ttl_seconds=60)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.pop("c") == 3
+    assert len(cache) == 1